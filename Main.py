@@ -1,24 +1,74 @@
-from utils import Authenticate, AutoCatch, Register
+from utils import (AuditLog, Authenticate, AutoCatch, FeatureExtractor, FingerprintDB, FolderWatch, Hotplug,
+                   Metrics, MultiCapture, Profiler, Register, Retention, Tracing)
+import argparse
+import contextlib
+import json
 import os
 import sys
+import time
 
 # ================= 全局配置 =================
-# 1. Wireshark Tshark 路径
-TSHARK_PATH = r"C:\Program Files\Wireshark\tshark.exe"
+# 1. Wireshark Tshark 路径 (Windows: C:\Program Files\Wireshark\tshark.exe, Linux: /usr/bin/tshark)
+TSHARK_PATH = AutoCatch.DEFAULT_TSHARK_PATH
 
-# 2. 【关键】已验证的正确接口 (根据你刚才的测试结果)
-INTERFACE = "USBPcap3"
+# 2. 【关键】已验证的正确接口 (Windows: USBPcap3, Linux: usbmon0 或 usbmonN)
+INTERFACE = AutoCatch.DEFAULT_INTERFACE
 
 # 3. 数据存储配置
 BASE_FOLDER = "devices"
 DB_FILE = "usb_fingerprint_db.json"
+AUDIT_DB = "auth_audit.db"  # 认证审计日志 (SQLite)
 
 # 4. 认证阈值配置
 AUTH_THRESHOLD = 70.0  # 相似度阈值（0-100），超过此值认为匹配成功
 
+# 5. 采集文件保留策略 (超出预算时删除最旧的 pcapng，保留提取出的特征)
+RETENTION = {"max_mb": 2048, "max_age_days": 30, "keep_features": True}
+
+# 6. 实时特征提取 (抓包同时通过管道解析，采集结束即可认证)
+LIVE_EXTRACTION = False
+
+# 7. 抓包后端: "tshark"，或 Linux 下直接读取 /dev/usbmonN 的 "usbmon"
+CAPTURE_BACKEND = "tshark"
+
+# 8. 只保存被测设备的 USB 包头 (采集文件从数十 MB 缩小到数百 KB)
+HEADER_ONLY = False
+DEVICE_FILTER = False
+
+# 9. 采集阶段的 I/O 负载 (预置名称或参数字典，见 utils/Workload.py 的 PRESETS)
+WORKLOAD = "legacy"
+
+# 10. 自适应采集长度: 特征置信区间足够窄即停止 (True 默认条件 / 参数字典 / None 固定 50MB，见 utils/Convergence.py)
+ADAPTIVE_CAPTURE = None
+
+# 11. 模式2 只启动一次抓包，按提示连续拔插，结束后按插拔切分为多个样本 (省去每次重启 tshark)
+#     每次插拔设备地址都会变化，该方式不做实时设备过滤与自适应长度，由切分时按设备分离
+SESSION_CAPTURE = False
+
+# 12. 多端口并发采集的资源限制 (同时进行 I/O 测试的设备数 / 每个控制器的并发数)
+MAX_ACTIVE_IO = 2
+PER_CONTROLLER_IO = 1
+
 
 # ===========================================
 
+def ask_capture_target():
+    """
+    询问 U 盘位置：Windows 为盘符，Linux 为挂载点（留空按新插入设备自动识别）
+
+    返回:
+    - dict: 传给 AutoCatch.run_single_capture 的参数；取消时返回 None
+    """
+    if AutoCatch.IS_WINDOWS:
+        user_drive = input("请输入目标 U 盘盘符 (例如 E): ").strip().upper()
+        if not user_drive:
+            print("[取消] 未输入盘符。")
+            return None
+        return {"drive_letter": user_drive}
+    mount_point = input("请输入 U 盘挂载点 (留空则自动识别): ").strip()
+    return {"mount_point": mount_point or None, "backend": CAPTURE_BACKEND}
+
+
 def main():
     print("=" * 60)
     print("      USB 设备指纹识别系统 (Main Controller)")
@@ -26,7 +76,7 @@ def main():
     print("=" * 60)
 
     # 0. 基础环境检查
-    if not os.path.exists(TSHARK_PATH):
+    if CAPTURE_BACKEND == "tshark" and not os.path.exists(TSHARK_PATH):
         print(f"[错误] 找不到 Tshark: {TSHARK_PATH}")
         return
 
@@ -47,9 +97,21 @@ def main():
     print("3. [设备认证] - 验证未知设备身份")
     print("   适用于: 验证U盘是否为已注册设备")
     print("   流程: 从 devices/auth/*.pcapng 提取特征 → 匹配数据库")
+    print("")
+    print("4. [批量注册] - 一次性注册多个设备")
+    print("   适用于: 根目录下每个子文件夹存放一个设备的 pcapng 文件")
+    print("   流程: 多进程并行解析 → 单次写入数据库")
+    print("")
+    print("5. [多端口采集+注册] - 同时录入多个新设备")
+    print("   适用于: 工位上多个 USB 端口/接口同时插入待录入的 U 盘")
+    print("   流程: 各端口并发采集 → 批量生成指纹")
+    print("")
+    print("6. [无人值守认证] - 插入即自动采集并认证 (Linux)")
+    print("   适用于: 闸机/工位常驻运行，无需人工确认插拔")
+    print("   流程: 热插拔事件 → 采集 → 认证 → 等待拔出 → 循环")
     print("-" * 60)
 
-    mode = input("请选择模式 (1/2/3): ").strip()
+    mode = input("请选择模式 (1/2/3/4/5/6): ").strip()
 
     # ================= 模式 1: 直接从文件注册 =================
     if mode == '1':
@@ -60,7 +122,7 @@ def main():
             print("[错误] 文件夹不存在，请先采集数据。")
             return
 
-        files = [f for f in os.listdir(enroll_path) if f.endswith(".pcapng")]
+        files = FeatureExtractor.list_samples(enroll_path)
         if not files:
             print("[错误] 文件夹为空，没有找到 .pcapng 文件。")
             print(f"提示: 请将采集的pcapng文件放入 {enroll_path}")
@@ -88,9 +150,8 @@ def main():
         print(f"\n>>> 【模式2: 采集+注册】")
         print("\n=== 步骤 1/2: 数据采集 ===")
         
-        user_drive = input("请输入目标 U 盘盘符 (例如 E): ").strip().upper()
-        if not user_drive:
-            print("[取消] 未输入盘符。")
+        target = ask_capture_target()
+        if target is None:
             return
 
         device_name = input("请输入设备名称 (ID): ").strip()
@@ -106,24 +167,50 @@ def main():
         except:
             count = 3
 
-        # 循环调用 AutoCatch
-        for i in range(1, count + 1):
-            print(f"\n--- 采集进度: {i}/{count} ---")
+        if SESSION_CAPTURE and count > 1:
+            # 一次抓包完成全部插拔，结束后切分为 capture_1 ... capture_N
             success = AutoCatch.run_single_capture(
                 tshark_path=TSHARK_PATH,
                 interface=INTERFACE,
                 output_base_folder=BASE_FOLDER,
-                sub_folder="enroll",  # 存入注册文件夹
-                file_name=f"capture_{i}.pcapng",
+                sub_folder="enroll",
+                file_name="capture.pcapng",
                 target_size_mb=50,
-                drive_letter=user_drive
+                live=LIVE_EXTRACTION,
+                header_only=HEADER_ONLY,
+                workload=WORKLOAD,
+                cycles=count,
+                **target
             )
-            # 如果某次采集失败，询问是否继续
             if not success:
-                retry = input("采集出错。是否终止流程? (y/n): ")
-                if retry.lower() == 'y':
-                    print("[终止] 用户取消流程。")
-                    return
+                print("[终止] 连续采集失败。")
+                return
+        else:
+            # 循环调用 AutoCatch
+            for i in range(1, count + 1):
+                print(f"\n--- 采集进度: {i}/{count} ---")
+                success = AutoCatch.run_single_capture(
+                    tshark_path=TSHARK_PATH,
+                    interface=INTERFACE,
+                    output_base_folder=BASE_FOLDER,
+                    sub_folder="enroll",  # 存入注册文件夹
+                    file_name=f"capture_{i}.pcapng",
+                    target_size_mb=50,
+                    live=LIVE_EXTRACTION,
+                    header_only=HEADER_ONLY,
+                    device_filter=DEVICE_FILTER,
+                    workload=WORKLOAD,
+                    adaptive=ADAPTIVE_CAPTURE,
+                    **target
+                )
+                # 如果某次采集失败，询问是否继续
+                if not success:
+                    retry = input("采集出错。是否终止流程? (y/n): ")
+                    if retry.lower() == 'y':
+                        print("[终止] 用户取消流程。")
+                        return
+
+        Retention.from_config(os.path.join(base_dir, BASE_FOLDER), RETENTION).enforce()
 
         print("\n=== 步骤 2/2: 生成指纹 ===")
         do_reg = input("采集完成，是否立即注册? (y/n): ").lower()
@@ -162,7 +249,7 @@ def main():
                 print(f"提示: 请将待验证的pcapng文件放入该文件夹")
                 return
             
-            files = [f for f in os.listdir(auth_path) if f.endswith(".pcapng")]
+            files = FeatureExtractor.list_samples(auth_path)
             if not files:
                 print(f"[错误] {auth_path} 中没有 .pcapng 文件。")
                 return
@@ -172,9 +259,8 @@ def main():
         elif auth_mode == 'B':
             # 实时采集
             print("\n=== 实时采集验证数据 ===")
-            user_drive = input("请输入 U 盘盘符 (例如 E): ").strip().upper()
-            if not user_drive:
-                print("[取消] 未输入盘符。")
+            target = ask_capture_target()
+            if target is None:
                 return
             
             print("提示: 建议采集 1-2 次即可")
@@ -187,12 +273,19 @@ def main():
                 sub_folder="auth",  # 存入认证文件夹
                 file_name=f"auth_verify.pcapng",
                 target_size_mb=50,
-                drive_letter=user_drive
+                live=LIVE_EXTRACTION,
+                header_only=HEADER_ONLY,
+                device_filter=DEVICE_FILTER,
+                workload=WORKLOAD,
+                adaptive=ADAPTIVE_CAPTURE,
+                **target
             )
             
             if not success:
                 print("[错误] 采集失败，无法继续认证。")
                 return
+
+            Retention.from_config(os.path.join(base_dir, BASE_FOLDER), RETENTION).enforce()
         else:
             print("[错误] 无效的选项。")
             return
@@ -203,12 +296,17 @@ def main():
         if not device_id:
             device_id = None
         
-        passed, match_id, score = Authenticate.authenticate_device(
-            auth_folder=auth_path,
-            db_file=DB_FILE,
-            device_id=device_id,
-            threshold=AUTH_THRESHOLD
-        )
+        audit_log = AuditLog.AuditLog(AUDIT_DB)
+        try:
+            passed, match_id, score = Authenticate.authenticate_device(
+                auth_folder=auth_path,
+                db_file=DB_FILE,
+                device_id=device_id,
+                threshold=AUTH_THRESHOLD,
+                audit_log=audit_log
+            )
+        finally:
+            audit_log.close()
         
         # 显示建议操作
         if passed:
@@ -216,11 +314,566 @@ def main():
         else:
             print("\n建议操作: 阻止该设备，可能是未授权设备")
 
+    # ================= 模式 4: 批量注册 =================
+    elif mode == '4':
+        print(f"\n>>> 【模式4: 批量注册】")
+        root_folder = input("请输入根目录 (子文件夹名即设备ID): ").strip()
+        if not root_folder:
+            print("[取消] 未输入根目录。")
+            return
+
+        summary = Register.run_bulk_registration(
+            root_folder=root_folder,
+            db_file=DB_FILE
+        )
+        registered = [d for d, info in summary.items() if info["status"] == "registered"]
+        if registered:
+            print(f"\n提示: 已注册 {len(registered)} 个设备，可以使用模式3进行设备认证测试。")
+
+    # ================= 模式 5: 多端口并发采集 + 注册 =================
+    elif mode == '5':
+        print(f"\n>>> 【模式5: 多端口采集+注册】")
+        ports = []
+        while True:
+            device_name = input(f"端口 {len(ports) + 1} 的设备名称 (ID，留空结束): ").strip()
+            if not device_name:
+                break
+            interface = input(f"    抓包接口 (默认 {INTERFACE}): ").strip() or INTERFACE
+            if AutoCatch.IS_WINDOWS:
+                drive = input("    U 盘盘符 (例如 E): ").strip().upper()
+                ports.append(MultiCapture.PortSpec(device_name, interface, drive_letter=drive))
+            else:
+                usb_port = input("    sysfs 物理端口 (例如 1-2，单端口可留空): ").strip() or None
+                mount_point = input("    挂载点 (留空则自动识别): ").strip() or None
+                ports.append(MultiCapture.PortSpec(device_name, interface, mount_point=mount_point,
+                                                   usb_port=usb_port))
+        if not ports:
+            print("[取消] 未添加端口。")
+            return
+
+        try:
+            count = int(input("请输入每个设备的采集次数 (建议 3-5 次): "))
+            if count < 1 or count > 10:
+                count = 3
+        except:
+            count = 3
+        for port in ports:
+            port.count = count
+
+        try:
+            orch = MultiCapture.MultiCaptureOrchestrator(
+                ports,
+                base_folder=os.path.join(base_dir, BASE_FOLDER),
+                max_active_io=MAX_ACTIVE_IO,
+                per_controller_io=PER_CONTROLLER_IO,
+                capture_kwargs={
+                    "tshark_path": TSHARK_PATH,
+                    "backend": CAPTURE_BACKEND,
+                    "live": LIVE_EXTRACTION,
+                    "header_only": HEADER_ONLY,
+                    "device_filter": DEVICE_FILTER,
+                    "workload": WORKLOAD,
+                    "adaptive": ADAPTIVE_CAPTURE
+                }
+            )
+        except ValueError as e:
+            print(f"[错误] {e}")
+            return
+        orch.run()
+        Retention.from_config(os.path.join(base_dir, BASE_FOLDER), RETENTION).enforce()
+        orch.register(DB_FILE)
+
+    # ================= 模式 6: 无人值守认证 =================
+    elif mode == '6':
+        print(f"\n>>> 【模式6: 无人值守认证】")
+        if AutoCatch.IS_WINDOWS:
+            print("[错误] 无人值守认证依赖内核热插拔事件，仅支持 Linux。")
+            return
+        if not os.path.exists(DB_FILE):
+            print("[错误] 指纹数据库不存在，请先使用模式1或2注册设备。")
+            return
+        usb_port = input("只响应的 sysfs 物理端口 (例如 1-2，留空则响应所有端口): ").strip() or None
+        mount_point = input("U 盘挂载点 (留空则自动识别): ").strip() or None
+
+        daemon = Hotplug.HotplugDaemon(
+            DB_FILE,
+            base_folder=os.path.join(base_dir, BASE_FOLDER),
+            threshold=AUTH_THRESHOLD,
+            usb_port=usb_port,
+            audit_db=AUDIT_DB,
+            retention=RETENTION,
+            capture_kwargs={
+                "tshark_path": TSHARK_PATH,
+                "interface": INTERFACE,
+                "backend": CAPTURE_BACKEND,
+                "mount_point": mount_point,
+                "live": LIVE_EXTRACTION,
+                "header_only": HEADER_ONLY,
+                "device_filter": DEVICE_FILTER,
+                "workload": WORKLOAD,
+                "adaptive": ADAPTIVE_CAPTURE
+            }
+        )
+        print("提示: 按 Ctrl+C 停止。")
+        results = daemon.run()
+        passed = sum(1 for r in results if r["passed"])
+        print(f"\n[完成] 共认证 {len(results)} 次, 放行 {passed} 次。")
+
+    else:
+        print("[错误] 无效选项，请选择 1、2、3、4、5 或 6。")
+
+
+# ================= 命令行子命令 (非交互，可用于脚本/cron/管道) =================
+# 退出码: 0 认证通过/操作成功, 1 认证未通过, 2 错误
+EXIT_OK, EXIT_REJECTED, EXIT_ERROR = 0, 1, 2
+
+
+def _sample_paths(path):
+    """ 文件 -> [文件]；文件夹 -> 其中的全部样本；不存在返回 None """
+    if os.path.isdir(path):
+        return [os.path.join(path, f) for f in FeatureExtractor.list_samples(path)]
+    if os.path.exists(path) or os.path.exists(FeatureExtractor.feature_cache_path(path)):
+        return [path]
+    return None
+
+
+def _read_paths(paths):
+    """ 参数中的 '-' 表示从标准输入逐行读取路径 """
+    result = []
+    for path in paths:
+        if path == "-":
+            result.extend(line.strip() for line in sys.stdin if line.strip())
+        else:
+            result.append(path)
+    return result
+
+
+def _score_probe(results, db, args):
+    """ 由一个验证样本组的解析结果构建指纹并比对，返回 (是否通过, 匹配ID, 分数, 详情) 或 None (无特征) """
+    all_enum_times = []
+    all_transfer_data = {}
+    for e_time, t_data in results:
+        if e_time:
+            all_enum_times.append(e_time)
+        for length, times in (t_data or {}).items():
+            all_transfer_data.setdefault(length, []).extend(times)
+    fingerprint = Authenticate.build_auth_fingerprint(all_enum_times, all_transfer_data, verbose=not args.quiet)
+    if not fingerprint["enumeration"] and not fingerprint["transfers"]:
+        return None
+    return Authenticate.match_fingerprint(fingerprint, db, device_id=args.device_id, threshold=args.threshold,
+                                          verbose=not args.quiet)
+
+
+def _capture_target(args):
+    if AutoCatch.IS_WINDOWS:
+        if not args.drive:
+            raise ValueError("Windows 下必须用 --drive 指定 U 盘盘符")
+        return {"drive_letter": args.drive.upper()}
+    return {"mount_point": args.mount_point, "backend": CAPTURE_BACKEND}
+
+
+def _capture(args, sub_folder, file_names):
+    """ 依次采集 file_names 中的每个样本，任一次失败即返回 False """
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    target = _capture_target(args)
+    for i, file_name in enumerate(file_names, 1):
+        if not args.quiet:
+            print(f"\n--- 采集进度: {i}/{len(file_names)} ---")
+        success = AutoCatch.run_single_capture(
+            tshark_path=TSHARK_PATH,
+            interface=args.interface,
+            output_base_folder=BASE_FOLDER,
+            sub_folder=sub_folder,
+            file_name=file_name,
+            target_size_mb=50,
+            live=LIVE_EXTRACTION,
+            header_only=HEADER_ONLY,
+            device_filter=DEVICE_FILTER,
+            workload=WORKLOAD,
+            adaptive=ADAPTIVE_CAPTURE,
+            **target
+        )
+        if not success:
+            return False
+    Retention.from_config(os.path.join(base_dir, BASE_FOLDER), RETENTION).enforce()
+    return True
+
+
+def cmd_register(args, out):
+    if args.root:
+        summary = Register.run_bulk_registration(args.root, args.db, workers=args.jobs, devices=args.devices,
+                                                 verbose=not args.quiet)
+        registered = sum(1 for info in summary.values() if info["status"] == "registered")
+        if args.json:
+            out.write(json.dumps({"command": "register", "devices": summary}, ensure_ascii=False) + "\n")
+        else:
+            out.write(f"registered {registered}/{len(summary)}\n")
+        return EXIT_OK if summary and registered == len(summary) else EXIT_ERROR
+
+    if not args.device_id:
+        raise ValueError("需要设备ID，或用 --root 批量注册")
+    folder = args.folder or os.path.join(BASE_FOLDER, "enroll")
+    with Profiler.profiling() if args.profile else contextlib.nullcontext() as profile:
+        success = Register.run_registration(args.device_id, folder, args.db, workers=args.jobs,
+                                            verbose=not args.quiet)
+    if args.json:
+        record = {"command": "register", "device_id": args.device_id, "registered": success}
+        if args.profile:
+            record["profile"] = profile.as_dict()
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
     else:
-        print("[错误] 无效选项，请选择 1、2 或 3。")
+        out.write(f"{args.device_id}\t{'registered' if success else 'failed'}\n")
+    return EXIT_OK if success else EXIT_ERROR
+
+
+def cmd_capture(args, out):
+    if args.count < 1:
+        raise ValueError("--count 至少为 1")
+    names = [f"capture_{i}.pcapng" for i in range(1, args.count + 1)]
+    if not _capture(args, "enroll", names):
+        print("[错误] 采集失败。")
+        return EXIT_ERROR
+    success = True
+    if args.register:
+        success = Register.run_registration(args.device_id, os.path.join(BASE_FOLDER, "enroll"), args.db,
+                                            workers=args.jobs, verbose=not args.quiet)
+    if args.json:
+        out.write(json.dumps({"command": "capture", "device_id": args.device_id, "captured": len(names),
+                              "registered": bool(args.register and success)}, ensure_ascii=False) + "\n")
+    else:
+        out.write(f"{args.device_id}\tcaptured {len(names)}" + ("\tregistered" if args.register and success else "")
+                  + "\n")
+    return EXIT_OK if success else EXIT_ERROR
+
+
+def _auth_probes(args, out, probes):
+    """
+    认证多个验证样本组（所有文件在同一进程池中并行解析），每组输出一行结果
+
+    参数:
+    - probes: [(名称, 样本路径列表 或 None)]
+    """
+    if not os.path.exists(args.db):
+        print(f"[错误] 数据库文件不存在: {args.db}")
+        if args.audit_db:
+            audit_log = AuditLog.AuditLog(args.audit_db)
+            for _, paths in probes:
+                audit_log.record_rejection([os.path.basename(p) for p in paths or []], args.device_id,
+                                           args.threshold, "数据库文件不存在")
+            audit_log.close()
+        return EXIT_ERROR
+    files = [path for _, paths in probes for path in (paths or [])]
+    file_profiles = []
+    with Tracing.span("extract_many", "extract", files=len(files), workers=args.jobs):
+        results = iter(FeatureExtractor.extract_many(files, workers=args.jobs, verbose=not args.quiet,
+                                                     profiles=file_profiles))
+    file_profiles = iter(file_profiles)
+
+    worst = EXIT_OK
+    audit_log = AuditLog.AuditLog(args.audit_db) if args.audit_db else None
+    try:
+        with FingerprintDB.get_store(args.db).snapshot() as db:
+            for name, paths in probes:
+                parsed = [next(results) for _ in paths or []]
+                record = {"probe": name, "passed": False, "match_id": None, "score": 0.0}
+                # --profile: 本组文件的解析计时 + 本组评分计时，附在结果中
+                probe_profile = None
+                if args.profile:
+                    probe_profile = Profiler.Profile()
+                    for _ in parsed:
+                        probe_profile.merge(next(file_profiles))
+                if not paths:
+                    record["error"] = "找不到验证样本"
+                    code = EXIT_ERROR
+                elif not db:
+                    record["error"] = "数据库为空"
+                    code = EXIT_ERROR
+                elif args.device_id and args.device_id not in db:
+                    record["error"] = "设备不在数据库中"
+                    code = EXIT_ERROR
+                else:
+                    with Profiler.profiling() if args.profile else contextlib.nullcontext() as scored, \
+                            Tracing.span("score", "auth", probe=name):
+                        match = _score_probe(parsed, db, args)
+                    if args.profile:
+                        probe_profile.merge(scored)
+                    if match is None:
+                        record["error"] = "未能提取到任何有效特征"
+                        code = EXIT_ERROR
+                    else:
+                        passed, match_id, score, details = match
+                        record.update(passed=bool(passed), match_id=match_id, score=float(score))
+                        if args.details:
+                            record["details"] = details
+                        if audit_log is not None:
+                            audit_log.record([os.path.basename(p) for p in paths], args.device_id, match_id,
+                                             score, args.threshold, passed, details)
+                        code = EXIT_OK if passed else EXIT_REJECTED
+                if "error" in record and audit_log is not None:
+                    audit_log.record_rejection([os.path.basename(p) for p in paths or []], args.device_id,
+                                               args.threshold, record["error"])
+                worst = max(worst, code)
+                Metrics.record_auth("cli", None if "error" in record else record["passed"])
+                if args.profile:
+                    record["profile"] = probe_profile.as_dict()
+                if args.json:
+                    out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                else:
+                    verdict = record.get("error") or ("PASS" if record["passed"] else "REJECT")
+                    out.write(f"{name}\t{verdict}\t{record['match_id'] or '-'}\t{record['score']:.1f}\n")
+                    if args.profile and not args.quiet:
+                        Profiler.print_report(probe_profile, f"性能分析: {name}")
+                out.flush()
+    finally:
+        if audit_log is not None:
+            audit_log.close()
+    return worst
+
+
+def cmd_auth(args, out):
+    if args.capture:
+        if not _capture(args, "auth", ["auth_verify.pcapng"]):
+            print("[错误] 采集失败，无法继续认证。")
+            return EXIT_ERROR
+    paths = _read_paths(args.paths) or [os.path.join(BASE_FOLDER, "auth")]
+    # 所有路径合并为一个验证样本组（与模式3相同）
+    samples = []
+    for path in paths:
+        found = _sample_paths(path)
+        if found is None:
+            print(f"[错误] 找不到验证样本: {path}")
+            return EXIT_ERROR
+        samples.extend(found)
+    return _auth_probes(args, out, [(",".join(paths), samples)])
+
+
+def cmd_batch_auth(args, out):
+    paths = _read_paths(args.paths)
+    if not paths:
+        print("[错误] 没有验证样本 (可用 '-' 从标准输入读取路径)")
+        return EXIT_ERROR
+    # 每个路径是一个独立的验证样本组：文件夹 (一次插入的多个样本) 或单个文件
+    return _auth_probes(args, out, [(path, _sample_paths(path)) for path in paths])
+
+
+def cmd_watch(args, out):
+    folder = args.folder or os.path.join(BASE_FOLDER, "auth")
+    if not os.path.isdir(folder):
+        print(f"[错误] 找不到监视文件夹: {folder}")
+        return EXIT_ERROR
+    if not os.path.exists(args.db):
+        print(f"[错误] 数据库文件不存在: {args.db}")
+        return EXIT_ERROR
+
+    def emit(result):
+        if args.json:
+            if not args.details:
+                result = {k: v for k, v in result.items() if k != "details"}
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+        else:
+            verdict = result.get("error") or ("PASS" if result["passed"] else "REJECT")
+            out.write(f"{','.join(result['files'])}\t{verdict}\t{result['match_id'] or '-'}\t"
+                      f"{result['score']:.1f}\t{result['latency_ms']:.0f}ms\n")
+        out.flush()
+
+    audit_log = AuditLog.AuditLog(args.audit_db) if args.audit_db else None
+    try:
+        watcher = FolderWatch.FolderWatcher(folder, args.db, device_id=args.device_id, threshold=args.threshold,
+                                            session=args.session, settle=args.settle, session_gap=args.session_gap,
+                                            include_existing=args.include_existing, audit_log=audit_log,
+                                            verbose=not args.quiet)
+        if not args.quiet:
+            print(f"[-] 正在监视 {folder} (Ctrl+C 退出)")
+        watcher.run(max_results=args.max_results, on_result=emit)
+    finally:
+        if audit_log is not None:
+            audit_log.close()
+    return EXIT_OK
+
+
+def cmd_db(args, out):
+    store = FingerprintDB.get_store(args.db)
+    if args.action == "remove":
+        if not args.device_id:
+            raise ValueError("remove 需要设备ID")
+        removed = store.update(lambda db: db.pop(args.device_id, None) is not None)
+        if args.json:
+            out.write(json.dumps({"device_id": args.device_id, "removed": removed}, ensure_ascii=False) + "\n")
+        else:
+            out.write(f"{args.device_id}\t{'removed' if removed else 'not found'}\n")
+        return EXIT_OK if removed else EXIT_ERROR
+
+    with store.snapshot() as db:
+        if args.action == "show":
+            entry = db.get(args.device_id)
+            if entry is None:
+                print(f"[错误] 设备 '{args.device_id}' 不在数据库中。")
+                return EXIT_ERROR
+            out.write(json.dumps({args.device_id: db.to_dict()[args.device_id]}, ensure_ascii=False,
+                                 indent=None if args.json else 2) + "\n")
+            return EXIT_OK
+        for dev_id, entry in db.items():
+            fp = entry.get("fingerprint") or {}
+            if args.json:
+                out.write(json.dumps({"device_id": dev_id, "reg_time": entry.get("reg_time"),
+                                      "samples": entry.get("samples_count"),
+                                      "endpoints": sorted((fp.get("transfers") or {}).keys())},
+                                     ensure_ascii=False) + "\n")
+            else:
+                out.write(f"{dev_id}\t{entry.get('reg_time', '-')}\t{entry.get('samples_count', '-')}\t"
+                          f"{','.join(sorted((fp.get('transfers') or {}).keys())) or '-'}\n")
+    return EXIT_OK
+
+
+def cmd_bench(args, out):
+    files = [f for path in _read_paths(args.paths) for f in (_sample_paths(path) or [])]
+    if not files:
+        print("[错误] 没有可用的测试文件")
+        return EXIT_ERROR
+    size = sum(os.path.getsize(f) for f in files if os.path.exists(f))
+    jobs = files * args.rounds
+
+    start = time.perf_counter()
+    results = FeatureExtractor.extract_many(jobs, workers=args.jobs, verbose=False, use_cache=False)
+    parse_seconds = time.perf_counter() - start
+
+    score_ms = None
+    if os.path.exists(args.db):
+        with FingerprintDB.get_store(args.db).snapshot() as db:
+            start = time.perf_counter()
+            for result in results:
+                fingerprint = Authenticate.build_auth_fingerprint([result[0]] if result[0] else [], result[1] or {},
+                                                                  verbose=False)
+                Authenticate.match_fingerprint(fingerprint, db, threshold=args.threshold, verbose=False)
+            score_ms = (time.perf_counter() - start) * 1000 / len(results)
+
+    report = {"files": len(jobs), "workers": args.jobs or os.cpu_count(), "parse_seconds": parse_seconds,
+              "files_per_second": len(jobs) / parse_seconds if parse_seconds else 0.0,
+              "mb_per_second": size * args.rounds / 1024 / 1024 / parse_seconds if parse_seconds else 0.0,
+              "failed": sum(1 for r in results if r[1] is None), "score_ms": score_ms}
+    if args.json:
+        out.write(json.dumps(report) + "\n")
+    else:
+        score = f", 评分 {score_ms:.2f} ms/次" if score_ms is not None else ""
+        out.write(f"解析 {report['files']} 个文件 ({report['workers']} 进程): {parse_seconds:.2f}s, "
+                  f"{report['files_per_second']:.1f} 文件/秒, {report['mb_per_second']:.1f} MB/秒{score}\n")
+    return EXIT_OK if not report["failed"] else EXIT_ERROR
+
+
+def build_parser():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--db", default=DB_FILE, help=f"指纹数据库 (默认 {DB_FILE})")
+    common.add_argument("--jobs", "-j", type=int, default=None, help="并行解析进程数 (默认全部 CPU 核心)")
+    common.add_argument("--json", action="store_true", help="结果以 JSON 行输出到 stdout，过程信息改到 stderr")
+    common.add_argument("--quiet", "-q", action="store_true", help="不输出解析过程与调试信息")
+    common.add_argument("--threshold", type=float, default=AUTH_THRESHOLD, help="认证阈值")
+    common.add_argument("--metrics-port", type=int,
+                        help="在本地该端口提供 Prometheus 指标 (GET /metrics)，适合 watch 等长时间运行的命令")
+    common.add_argument("--metrics-textfile",
+                        help="把 Prometheus 指标写入该文件 (node_exporter textfile collector)，运行期间定期更新")
+    common.add_argument("--trace", metavar="PATH",
+                        help="保存本次运行的时间线 (Chrome trace-event JSON)；PATH 为文件夹时自动命名")
+    common.add_argument("--profile", action="store_true",
+                        help="记录各阶段耗时与计数，结束时输出汇总报告 (stderr)；--json 时每条结果附带 profile")
+
+    capture = argparse.ArgumentParser(add_help=False)
+    capture.add_argument("--drive", help="U 盘盘符 (Windows)")
+    capture.add_argument("--mount-point", help="U 盘挂载点 (Linux，默认自动识别)")
+    capture.add_argument("--interface", default=INTERFACE, help=f"抓包接口 (默认 {INTERFACE})")
+
+    parser = argparse.ArgumentParser(description="USB 设备指纹识别系统 (无参数运行进入交互模式)",
+                                     epilog="退出码: 0 通过/成功, 1 认证未通过, 2 错误")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("register", parents=[common], help="从采集文件注册设备")
+    p.add_argument("device_id", nargs="?", help="设备ID")
+    p.add_argument("--folder", help="样本文件夹 (默认 devices/enroll)")
+    p.add_argument("--root", help="批量注册：子文件夹名即设备ID")
+    p.add_argument("--devices", nargs="+", help="批量注册时只注册这些设备")
+    p.set_defaults(func=cmd_register)
+
+    p = sub.add_parser("capture", parents=[common, capture], help="采集注册样本 (可选立即注册)")
+    p.add_argument("device_id", help="设备ID")
+    p.add_argument("--count", type=int, default=3, help="采集次数")
+    p.add_argument("--register", action="store_true", help="采集后立即注册")
+    p.set_defaults(func=cmd_capture)
+
+    p = sub.add_parser("auth", parents=[common, capture], help="认证一个设备 (所有路径合并为一组样本)")
+    p.add_argument("paths", nargs="*", help="验证样本文件或文件夹 (默认 devices/auth，'-' 从 stdin 读取)")
+    p.add_argument("--device-id", help="只与该设备比对 (一对一)")
+    p.add_argument("--capture", action="store_true", help="先实时采集一个验证样本到 devices/auth")
+    p.add_argument("--details", action="store_true", help="输出各设备的逐项得分")
+    p.add_argument("--audit-db", default=AUDIT_DB, help="审计日志 (空字符串表示不记录)")
+    p.set_defaults(func=cmd_auth)
+
+    p = sub.add_parser("batch-auth", parents=[common], help="批量认证 (每个文件或文件夹为一组样本)")
+    p.add_argument("paths", nargs="*", default=["-"], help="验证样本文件或文件夹 ('-' 从 stdin 读取，默认)")
+    p.add_argument("--device-id", help="只与该设备比对 (一对一)")
+    p.add_argument("--details", action="store_true", help="输出各设备的逐项得分")
+    p.add_argument("--audit-db", default=AUDIT_DB, help="审计日志 (空字符串表示不记录)")
+    p.set_defaults(func=cmd_batch_auth)
+
+    p = sub.add_parser("watch", parents=[common], help="监视文件夹，对新写完的验证文件增量认证")
+    p.add_argument("folder", nargs="?", help="监视的文件夹 (默认 devices/auth)")
+    p.add_argument("--device-id", help="只与该设备比对 (一对一)")
+    p.add_argument("--session", action="store_true", help="按会话合并认证 (默认每个文件单独认证)")
+    p.add_argument("--settle", type=float, default=2.0, help="文件大小保持不变多少秒视为写完")
+    p.add_argument("--session-gap", type=float, default=5.0, help="会话内文件的最大间隔 (秒)")
+    p.add_argument("--include-existing", action="store_true", help="也处理启动时已存在的文件")
+    p.add_argument("--max-results", type=int, help="产出该数量的结果后退出")
+    p.add_argument("--details", action="store_true", help="输出各设备的逐项得分")
+    p.add_argument("--audit-db", default=AUDIT_DB, help="审计日志 (空字符串表示不记录)")
+    p.set_defaults(func=cmd_watch)
+
+    p = sub.add_parser("db", parents=[common], help="查看/管理指纹数据库")
+    p.add_argument("action", choices=["list", "show", "remove"])
+    p.add_argument("device_id", nargs="?", help="设备ID (show/remove)")
+    p.set_defaults(func=cmd_db)
+
+    p = sub.add_parser("bench", parents=[common], help="解析与评分吞吐测试 (不使用特征缓存)")
+    p.add_argument("paths", nargs="+", help="测试文件或文件夹")
+    p.add_argument("--rounds", type=int, default=1, help="每个文件解析的次数")
+    p.set_defaults(func=cmd_bench)
+    return parser
+
+
+def cli(argv):
+    """ 子命令入口，返回退出码 """
+    args = build_parser().parse_args(argv)
+    out = sys.stdout
+    # --json 时 stdout 只输出结果，库函数的过程信息转到 stderr
+    redirect = contextlib.redirect_stdout(sys.stderr) if args.json else contextlib.nullcontext()
+    profiler = Profiler.profiling() if args.profile else contextlib.nullcontext()
+    tracer = Tracing.tracing(args.trace, name=args.command) if args.trace else contextlib.nullcontext()
+    metrics_server = textfile = None
+    if args.metrics_port is not None or args.metrics_textfile:
+        Metrics.track_db(args.db)
+    if args.metrics_port is not None:
+        metrics_server = Metrics.start_http_server(args.metrics_port)
+    if args.metrics_textfile:
+        textfile = Metrics.TextfileExporter(args.metrics_textfile)
+    try:
+        with redirect, profiler as profile, tracer:
+            return args.func(args, out)
+    except ValueError as e:
+        print(f"[错误] {e}", file=sys.stderr)
+        return EXIT_ERROR
+    finally:
+        if args.profile:
+            Profiler.print_report(profile, f"性能分析汇总: {args.command}", file=sys.stderr)
+        if textfile is not None:
+            textfile.stop()
+        if metrics_server is not None:
+            metrics_server.shutdown()
 
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        try:
+            sys.exit(cli(sys.argv[1:]))
+        except KeyboardInterrupt:
+            print("\n[中断] 用户取消操作。", file=sys.stderr)
+            sys.exit(130)
     try:
         main()
     except KeyboardInterrupt:
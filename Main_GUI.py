@@ -11,9 +11,11 @@ from ttkbootstrap.constants import *
 import json
 import os
 import sys
+import threading
+import time
 
 # 导入后端模块
-from utils import Authenticate, AutoCatch, gui_utils, Register
+from utils import AuditLog, Authenticate, AutoCatch, FeatureExtractor, FingerprintDB, gui_utils, Register, Retention, Tracing
 
 
 class USBFingerprintGUI:
@@ -31,15 +33,22 @@ class USBFingerprintGUI:
         )
         self.root.position_center()
         
-        # 初始化变量
-        self.is_processing = False
+        # 认证审计日志（后台批量落盘）
+        self.audit_log = AuditLog.AuditLog(self.config['audit_db'])
         
         # 构建界面
         self.setup_ui()
         
-        # 重定向stdout到日志窗口
-        sys.stdout = gui_utils.TextRedirector(self.log_text, "stdout")
-        sys.stderr = gui_utils.TextRedirector(self.log_text, "stderr")
+        # 任务队列：注册/认证任务排队在有界线程池中执行，回调只在 Tk 线程执行
+        self.jobs = gui_utils.JobManager(
+            self.root,
+            max_workers=self.config.get('max_jobs', 2),
+            on_change=self.refresh_job_list
+        )
+        
+        # 重定向stdout到日志窗口（写入队列，由 Tk 线程批量刷新）
+        sys.stdout = gui_utils.TextRedirector(self.log_sink, "stdout")
+        sys.stderr = gui_utils.TextRedirector(self.log_sink, "stderr")
         
         # 初始化状态栏
         self.update_status_bar()
@@ -48,10 +57,22 @@ class USBFingerprintGUI:
         """加载配置文件"""
         config_file = "config.json"
         default_config = {
-            "tshark_path": r"C:\Program Files\Wireshark\tshark.exe",
-            "interface": "USBPcap3",
+            "tshark_path": AutoCatch.DEFAULT_TSHARK_PATH,
+            "interface": AutoCatch.DEFAULT_INTERFACE,
+            "capture_backend": "tshark",
             "base_folder": "devices",
             "db_file": "usb_fingerprint_db.json",
+            "audit_db": "auth_audit.db",
+            "retention": {"max_mb": 2048, "max_age_days": 30, "keep_features": True},
+            "live_extraction": False,
+            "header_only": False,
+            "device_filter": False,
+            "workload": "legacy",
+            "adaptive": None,
+            "max_jobs": 2,
+            "log_max_lines": 5000,
+            "log_level": "debug",
+            "trace_dir": "",
             "auth_threshold": 70.0,
             "theme": "darkly",
             "window_geometry": "1100x750"
@@ -93,6 +114,9 @@ class USBFingerprintGUI:
         # 创建主选项卡区域
         self.create_tabs()
         
+        # 创建任务队列面板
+        self.create_job_panel()
+        
         # 创建底部日志面板
         self.create_log_panel()
         
@@ -613,6 +637,38 @@ class USBFingerprintGUI:
             width=20
         ).pack(side=LEFT, padx=5)
     
+    def create_job_panel(self):
+        """创建任务队列面板"""
+        job_frame = ttk_bs.Labelframe(
+            self.root,
+            text="🗂 任务队列",
+            bootstyle="secondary",
+            padding=10
+        )
+        job_frame.pack(fill=X, padx=10, pady=5)
+        
+        columns = ("id", "name", "state", "progress")
+        self.job_tree = ttk_bs.Treeview(job_frame, columns=columns, show='headings', height=4)
+        for col, text, width in (("id", "#", 40), ("name", "任务", 360), ("state", "状态", 80), ("progress", "进度", 360)):
+            self.job_tree.heading(col, text=text)
+            self.job_tree.column(col, width=width, anchor=W if col in ("name", "progress") else CENTER)
+        self.job_tree.pack(side=LEFT, fill=X, expand=YES)
+        
+        btn_col = ttk_bs.Frame(job_frame)
+        btn_col.pack(side=RIGHT, padx=(10, 0))
+        ttk_bs.Button(
+            btn_col,
+            text="取消所选",
+            bootstyle="danger-outline",
+            command=self.cancel_selected_job
+        ).pack(fill=X, pady=2)
+        ttk_bs.Button(
+            btn_col,
+            text="清除已完成",
+            bootstyle="secondary-outline",
+            command=lambda: self.jobs.clear_finished()
+        ).pack(fill=X, pady=2)
+    
     def create_log_panel(self):
         """创建日志显示面板"""
         log_frame = ttk_bs.Labelframe(
@@ -644,7 +700,14 @@ class USBFingerprintGUI:
         
         self.log_text.pack(fill=BOTH, expand=YES)
         
-        # 清空日志按钮
+        # 日志输出：工作线程只入队，Tk 线程定时批量写入并裁剪到最大行数
+        self.log_sink = gui_utils.LogSink(
+            self.log_text,
+            max_lines=self.config.get('log_max_lines', 5000),
+            level=self.config.get('log_level', 'debug')
+        )
+        
+        # 显示级别与清空日志按钮
         btn_row = ttk_bs.Frame(log_frame)
         btn_row.pack(fill=X, pady=(5, 0))
         
@@ -652,8 +715,29 @@ class USBFingerprintGUI:
             btn_row,
             text="清空日志",
             bootstyle="secondary-outline",
-            command=lambda: gui_utils.clear_log_widget(self.log_text)
+            command=lambda: self.log_sink.clear()
         ).pack(side=RIGHT)
+        
+        self.log_level_names = {"调试": "debug", "信息": "info", "警告": "warning", "错误": "error"}
+        current = next((k for k, v in self.log_level_names.items() if v == self.log_sink.level), "调试")
+        self.log_level_var = tk.StringVar(value=current)
+        level_box = ttk_bs.Combobox(
+            btn_row,
+            textvariable=self.log_level_var,
+            values=list(self.log_level_names),
+            state="readonly",
+            width=6
+        )
+        level_box.pack(side=RIGHT, padx=5)
+        level_box.bind("<<ComboboxSelected>>", self.change_log_level)
+        ttk_bs.Label(btn_row, text="显示级别:").pack(side=RIGHT)
+    
+    def change_log_level(self, event=None):
+        """切换日志显示级别"""
+        level = self.log_level_names[self.log_level_var.get()]
+        self.log_sink.set_level(level)
+        self.config['log_level'] = level
+        self.save_config()
     
     def create_status_bar(self):
         """创建状态栏"""
@@ -678,27 +762,79 @@ class USBFingerprintGUI:
     
     # ==================== 事件处理方法 ====================
     
-    def gui_confirm_callback(self, title, message):
+    def gui_confirm_callback(self, title, message, job=None):
         """
-        GUI模式下的确认回调函数
-        在主线程中显示确认对话框，使用Event同步
+        GUI模式下的确认回调函数（在任务的工作线程中调用）
+        通过任务队列在 Tk 线程中显示确认对话框，使用Event同步；任务被取消时返回 False
         """
-        import threading
-        
         result = [False]
         event = threading.Event()
         
         def show_dialog():
-            result[0] = messagebox.askokcancel(title, message)
+            if job is None or not job.cancelled:
+                text = f"[{job.name}]\n{message}" if job is not None else message
+                result[0] = messagebox.askokcancel(title, text)
             event.set()  # 标记对话框已关闭
         
         # 在主线程中执行对话框
-        self.root.after(0, show_dialog)
+        self.jobs.call_in_tk(show_dialog)
         
-        # 等待用户响应（最多5分钟）
-        event.wait(timeout=300)
+        # 等待用户响应（最多5分钟），期间响应取消
+        deadline = time.monotonic() + 300
+        while not event.wait(timeout=0.1):
+            if (job is not None and job.cancelled) or time.monotonic() > deadline:
+                return False
         
-        return result[0]
+        return result[0] and not (job is not None and job.cancelled)
+    
+    def refresh_job_list(self, job=None):
+        """任务状态变化时刷新任务列表与状态栏（Tk 线程）"""
+        if job is None:
+            for item in self.job_tree.get_children():
+                self.job_tree.delete(item)
+            jobs = self.jobs.jobs()
+        else:
+            jobs = [job]
+        
+        for j in jobs:
+            progress = j.message
+            if j.progress is not None and not j.finished:
+                progress = f"{j.progress:.0%}  {j.message}"
+            elif j.state == gui_utils.Job.FAILED:
+                progress = str(j.error)
+            values = (j.id, j.name, j.state, progress)
+            iid = str(j.id)
+            if self.job_tree.exists(iid):
+                self.job_tree.item(iid, values=values)
+            elif job is None or self.jobs.get(j.id) is not None:
+                self.job_tree.insert('', 'end', iid=iid, values=values)
+        
+        active = self.jobs.active()
+        self.status_label.config(text=f"任务进行中: {active} 个" if active else "就绪")
+    
+    def traced_task(self, name, task):
+        """配置了 trace_dir 时，每个任务的采集/解析/评分时间线单独保存为一个 trace 文件"""
+        trace_dir = self.config.get('trace_dir')
+        if not trace_dir:
+            return task
+        
+        def run(job):
+            os.makedirs(trace_dir, exist_ok=True)
+            with Tracing.tracing(trace_dir, name=name):
+                return task(job)
+        return run
+    
+    def cancel_selected_job(self):
+        """取消任务列表中选中的任务"""
+        selection = self.job_tree.selection()
+        if not selection:
+            messagebox.showwarning("警告", "请先选择要取消的任务")
+            return
+        for iid in selection:
+            job = self.jobs.get(int(iid))
+            if job is not None and not job.finished:
+                self.jobs.cancel(job)
+                print(f"[-] 已请求取消任务: {job.name}")
     
     def toggle_register_mode(self):
         """切换注册模式显示"""
@@ -753,12 +889,13 @@ class USBFingerprintGUI:
         if file:
             self.tshark_path_var.set(file)
     
-    def clear_enroll_folder(self):
-        """清空enroll文件夹中的所有pcapng文件"""
+    def clear_enroll_folder(self, enroll_path=None):
+        """清空enroll文件夹（或某个采集任务的子文件夹）中的所有pcapng文件及其特征缓存"""
         try:
-            enroll_path = os.path.join(self.config['base_folder'], 'enroll')
+            enroll_path = enroll_path or os.path.join(self.config['base_folder'], 'enroll')
             if os.path.exists(enroll_path):
-                files = [f for f in os.listdir(enroll_path) if f.endswith('.pcapng')]
+                files = [f for f in os.listdir(enroll_path)
+                         if f.endswith(('.pcapng', FeatureExtractor.FEATURE_SUFFIX))]
                 for file in files:
                     file_path = os.path.join(enroll_path, file)
                     try:
@@ -772,14 +909,17 @@ class USBFingerprintGUI:
         except Exception as e:
             print(f"[警告] 清空enroll文件夹时出错: {e}")
     
+    def enforce_retention(self):
+        """按存储预算清理采集文件（保留特征缓存），在后台线程中调用"""
+        try:
+            Retention.from_config(self.config['base_folder'], self.config.get('retention')).enforce()
+        except Exception as e:
+            print(f"[警告] 执行保留策略时出错: {e}")
+    
     # ==================== 业务逻辑方法 ====================
     
     def run_file_registration(self):
-        """执行文件注册"""
-        if self.is_processing:
-            messagebox.showwarning("警告", "系统正在处理中，请稍候...")
-            return
-        
+        """执行文件注册（加入任务队列）"""
         folder = self.reg_folder_var.get().strip()
         device_name = self.reg_device_name_var.get().strip()
         
@@ -794,53 +934,50 @@ class USBFingerprintGUI:
             return
         
         # 检查文件夹中是否有pcapng文件
-        files = [f for f in os.listdir(folder) if f.endswith('.pcapng')]
+        files = FeatureExtractor.list_samples(folder)
         if not files:
             messagebox.showerror("错误", f"文件夹中没有 .pcapng 文件\n{folder}")
             return
         
-        # 在后台线程执行
-        self.is_processing = True
-        self.status_label.config(text="正在注册设备...")
-        
-        def task():
+        def task(job):
+            job.report(None, f"解析 {len(files)} 个样本...")
             success = Register.run_registration(
                 device_id=device_name,
                 enroll_folder=folder,
                 db_file=self.config['db_file']
             )
+            if success:
+                # 清空enroll文件夹（在任务内完成，不与之后的任务重叠）
+                self.clear_enroll_folder()
             return success
         
         def on_complete(success):
-            self.is_processing = False
             if success:
                 messagebox.showinfo("成功", f"设备 '{device_name}' 注册成功！")
                 self.load_database_list()
                 self.update_status_bar()
-                # 清空enroll文件夹
-                self.clear_enroll_folder()
             else:
                 messagebox.showerror("失败", "设备注册失败，请查看日志")
-            self.status_label.config(text="就绪")
         
         def on_error(e):
-            self.is_processing = False
             messagebox.showerror("错误", f"注册过程出错: {e}")
-            self.status_label.config(text="就绪")
         
-        gui_utils.run_in_thread(task, on_complete, on_error)
+        name = f"注册 {device_name}"
+        self.jobs.submit(name, self.traced_task(name, task), on_complete, on_error)
+    
+    def capture_target(self, drive):
+        """ U 盘位置参数：Windows 为盘符，Linux 下输入框填写挂载点（留空则按新插入设备自动识别） """
+        if AutoCatch.IS_WINDOWS:
+            return {"drive_letter": drive.upper()}
+        return {"mount_point": drive or None, "backend": self.config.get('capture_backend', 'tshark')}
     
     def run_capture_and_register(self):
-        """执行采集+注册"""
-        if self.is_processing:
-            messagebox.showwarning("警告", "系统正在处理中，请稍候...")
-            return
-        
-        drive = self.capture_drive_var.get().strip().upper()
+        """执行采集+注册（加入任务队列，采集任务之间互斥）"""
+        drive = self.capture_drive_var.get().strip()
         device_name = self.capture_device_name_var.get().strip()
         count = self.capture_count_var.get()
         
-        if not drive:
+        if not drive and AutoCatch.IS_WINDOWS:
             messagebox.showerror("错误", "请输入U盘盘符")
             return
         
@@ -852,72 +989,73 @@ class USBFingerprintGUI:
         if not messagebox.askyesno("确认", f"即将开始采集 {count} 次\n请确保U盘盘符为 {drive}:\n准备好了吗？"):
             return
         
-        self.is_processing = True
-        self.status_label.config(text=f"采集中 (0/{count})...")
+        # 每个采集任务使用自己的子文件夹 enroll/<设备名>，排队的任务之间不会互相覆盖或删除样本
+        sub_folder = os.path.join("enroll", "".join(c if c.isalnum() or c in "-_" else "_" for c in device_name))
         
-        def task():
-            enroll_path = os.path.join(self.config['base_folder'], 'enroll')
+        def task(job):
+            enroll_path = os.path.join(self.config['base_folder'], sub_folder)
             
-            # 循环采集
+            # 循环采集（每次采集前响应取消）
             for i in range(1, count + 1):
+                job.check_cancelled()
                 print(f"\n=== 采集进度: {i}/{count} ===")
-                # 更新状态栏 - 正确捕获循环变量
-                self.root.after(
-                    0,
-                    lambda current=i, total=count: self.status_label.config(text=f"采集中 ({current}/{total})...")
-                )
+                job.report((i - 1) / (count + 1), f"采集中 ({i}/{count})")
                 
                 success = AutoCatch.run_single_capture(
                     tshark_path=self.config['tshark_path'],
                     interface=self.config['interface'],
                     output_base_folder=self.config['base_folder'],
-                    sub_folder="enroll",
+                    sub_folder=sub_folder,
                     file_name=f"capture_{i}.pcapng",
                     target_size_mb=50,
-                    drive_letter=drive,
-                    confirm_callback=self.gui_confirm_callback  # GUI模式回调
+                    confirm_callback=lambda title, message: self.gui_confirm_callback(title, message, job),
+                    live=self.config.get('live_extraction', False),
+                    header_only=self.config.get('header_only', False),
+                    device_filter=self.config.get('device_filter', False),
+                    workload=self.config.get('workload'),
+                    adaptive=self.config.get('adaptive'),
+                    **self.capture_target(drive)
                 )
                 
                 if not success:
+                    job.check_cancelled()
                     print(f"[警告] 第 {i} 次采集失败")
             
+            self.enforce_retention()
+            
             # 采集完成，开始注册
+            job.check_cancelled()
             print("\n=== 开始生成指纹 ===")
-            self.root.after(0, lambda: self.status_label.config(text="生成指纹中..."))
+            job.report(count / (count + 1), "生成指纹中")
             
             success = Register.run_registration(
                 device_id=device_name,
                 enroll_folder=enroll_path,
                 db_file=self.config['db_file']
             )
+            if success:
+                # 清空本任务的采集文件夹（仍持有采集互斥时完成）
+                self.clear_enroll_folder(enroll_path)
             return success
         
         def on_complete(success):
-            self.is_processing = False
             if success:
                 messagebox.showinfo("成功", f"设备 '{device_name}' 录入成功！")
                 self.load_database_list()
                 self.update_status_bar()
-                # 清空enroll文件夹
-                self.clear_enroll_folder()
             else:
                 messagebox.showwarning("警告", "采集完成，但注册失败，请查看日志")
-            self.status_label.config(text="就绪")
         
         def on_error(e):
-            self.is_processing = False
             messagebox.showerror("错误", f"采集过程出错: {e}")
-            self.status_label.config(text="就绪")
         
-        gui_utils.run_in_thread(task, on_complete, on_error)
+        name = f"采集+注册 {device_name} ({count} 次)"
+        self.jobs.submit(name, self.traced_task(name, task), on_complete, on_error, exclusive="capture")
     
     def run_authentication(self):
-        """执行设备认证"""
-        if self.is_processing:
-            messagebox.showwarning("警告", "系统正在处理中，请稍候...")
-            return
-        
+        """执行设备认证（加入任务队列）"""
         auth_mode = self.auth_mode.get()
+        auth_type = self.auth_type.get()  # 提交时确定认证模式，排队期间切换不影响本任务
         device_id = self.auth_device_id_var.get().strip() or None
         threshold = self.auth_threshold_var.get()
         
@@ -930,17 +1068,13 @@ class USBFingerprintGUI:
         
         # 如果是实时采集模式
         if auth_mode == "live":
-            drive = self.auth_drive_var.get().strip().upper()
-            if not drive:
+            drive = self.auth_drive_var.get().strip()
+            if not drive and AutoCatch.IS_WINDOWS:
                 messagebox.showerror("错误", "请输入U盘盘符")
                 return
             
             if not messagebox.askyesno("确认", f"即将采集U盘 {drive}: 的流量\n准备好了吗？"):
                 return
-            
-            # 标记正在处理，但采集操作在后台线程中进行
-            self.is_processing = True
-            self.status_label.config(text="准备采集验证数据...")
         else:
             # 文件模式
             auth_folder = self.auth_folder_var.get().strip()
@@ -949,21 +1083,19 @@ class USBFingerprintGUI:
                 messagebox.showerror("错误", msg)
                 return
             
-            files = [f for f in os.listdir(auth_folder) if f.endswith('.pcapng')]
+            files = FeatureExtractor.list_samples(auth_folder)
             if not files:
                 messagebox.showerror("错误", f"文件夹中没有 .pcapng 文件\n{auth_folder}")
                 return
         
         # 执行认证（包括实时采集，如果需要）
-        self.is_processing = True
-        self.status_label.config(text="正在认证...")
         self.auth_result_label.config(text="认证中...", bootstyle="warning")
         
-        def task():
+        def task(job):
             # 如果是实时模式，先在后台线程中采集
             if auth_mode == "live":
                 print("\n=== 开始采集验证数据 ===")
-                self.root.after(0, lambda: self.status_label.config(text="正在采集验证数据..."))
+                job.report(0.0, "正在采集验证数据")
                 
                 success = AutoCatch.run_single_capture(
                     tshark_path=self.config['tshark_path'],
@@ -972,42 +1104,48 @@ class USBFingerprintGUI:
                     sub_folder="auth",
                     file_name="auth_verify.pcapng",
                     target_size_mb=50,
-                    drive_letter=drive,
-                    confirm_callback=self.gui_confirm_callback  # GUI模式回调
+                    confirm_callback=lambda title, message: self.gui_confirm_callback(title, message, job),
+                    live=self.config.get('live_extraction', False),
+                    header_only=self.config.get('header_only', False),
+                    device_filter=self.config.get('device_filter', False),
+                    workload=self.config.get('workload'),
+                    adaptive=self.config.get('adaptive'),
+                    **self.capture_target(drive)
                 )
                 
                 if not success:
+                    job.check_cancelled()
                     return None, None, None  # 采集失败
                 
+                self.enforce_retention()
+                
                 # 采集成功，使用默认auth文件夹
                 actual_auth_folder = os.path.join(self.config['base_folder'], 'auth')
             else:
                 actual_auth_folder = auth_folder
             
             # 执行认证
+            job.check_cancelled()
             print("\n=== 开始设备认证 ===")
-            self.root.after(0, lambda: self.status_label.config(text="正在认证..."))
+            job.report(0.5, "正在认证")
             
             passed, match_id, score = Authenticate.authenticate_device(
                 auth_folder=actual_auth_folder,
                 db_file=self.config['db_file'],
                 device_id=device_id,
-                threshold=threshold
+                threshold=threshold,
+                audit_log=self.audit_log
             )
             return passed, match_id, score
         
         def on_complete(result):
-            self.is_processing = False
-            
             # 检查采集失败的情况
             if result is None or result[0] is None:
                 messagebox.showerror("错误", "采集失败，无法继续认证")
                 self.auth_result_label.config(text="采集失败", bootstyle="danger")
-                self.status_label.config(text="就绪")
                 return
             
             passed, match_id, score = result
-            auth_type = self.auth_type.get()  # 获取认证模式
             
             if passed:
                 # 认证通过
@@ -1048,16 +1186,19 @@ class USBFingerprintGUI:
                     messagebox.showwarning("认证失败", "不是指定设备，可能是未授权设备")
                 else:
                     messagebox.showwarning("认证失败", "未在数据库中找到匹配设备")
-            
-            self.status_label.config(text="就绪")
         
         def on_error(e):
-            self.is_processing = False
             messagebox.showerror("错误", f"认证过程出错: {e}")
             self.auth_result_label.config(text="认证出错", bootstyle="danger")
-            self.status_label.config(text="就绪")
         
-        gui_utils.run_in_thread(task, on_complete, on_error)
+        def on_cancel(job):
+            self.auth_result_label.config(text="认证已取消", bootstyle="secondary")
+        
+        name = f"认证 {os.path.basename(auth_folder.rstrip(os.sep)) if auth_mode != 'live' else '实时采集'}"
+        if device_id:
+            name += f" → {device_id}"
+        self.jobs.submit(name, self.traced_task(name, task), on_complete, on_error, on_cancel,
+                         exclusive="capture" if auth_mode == "live" else None)
     
     def load_database_list(self):
         """加载并显示数据库中的设备列表"""
@@ -1070,19 +1211,17 @@ class USBFingerprintGUI:
             return
         
         try:
-            with open(self.config['db_file'], 'r', encoding='utf-8') as f:
-                db = json.load(f)
-            
-            for device_id, info in db.items():
-                reg_time = info.get('reg_time', 'N/A')
-                samples = info.get('samples_count', 0)
-                files = len(info.get('source_files', []))
-                
-                self.db_tree.insert(
-                    '',
-                    'end',
-                    values=(device_id, reg_time, samples, files)
-                )
+            with FingerprintDB.get_store(self.config['db_file']).snapshot() as db:
+                for device_id, info in db.items():
+                    reg_time = info.get('reg_time', 'N/A')
+                    samples = info.get('samples_count', 0)
+                    files = len(info.get('source_files', []))
+                    
+                    self.db_tree.insert(
+                        '',
+                        'end',
+                        values=(device_id, reg_time, samples, files)
+                    )
         except Exception as e:
             print(f"[错误] 加载数据库失败: {e}")
     
@@ -1099,16 +1238,12 @@ class USBFingerprintGUI:
         if not messagebox.askyesno("确认删除", f"确定要删除设备 '{device_id}' 吗？"):
             return
         
+        def apply(db):
+            return db.pop(device_id, None) is not None
+        
         try:
-            with open(self.config['db_file'], 'r', encoding='utf-8') as f:
-                db = json.load(f)
-            
-            if device_id in db:
-                del db[device_id]
-                
-                with open(self.config['db_file'], 'w', encoding='utf-8') as f:
-                    json.dump(db, f, indent=2, ensure_ascii=False)
-                
+            # 写时复制删除：认证线程持有的旧快照不受影响
+            if FingerprintDB.get_store(self.config['db_file']).update(apply):
                 self.db_tree.delete(item)
                 self.update_status_bar()
                 messagebox.showinfo("成功", f"设备 '{device_id}' 已删除")
@@ -1149,10 +1284,8 @@ class USBFingerprintGUI:
         """更新状态栏信息"""
         try:
             if os.path.exists(self.config['db_file']):
-                with open(self.config['db_file'], 'r', encoding='utf-8') as f:
-                    db = json.load(f)
-                    count = len(db)
-                    self.db_count_label.config(text=f"已注册设备: {count}")
+                count = len(FingerprintDB.get_store(self.config['db_file']).current())
+                self.db_count_label.config(text=f"已注册设备: {count}")
             else:
                 self.db_count_label.config(text="已注册设备: 0")
         except:
@@ -1165,6 +1298,10 @@ class USBFingerprintGUI:
         print(f"数据库: {os.path.abspath(self.config['db_file'])}")
         print("=" * 50)
         self.root.mainloop()
+        self.log_sink.close()
+        sys.stdout, sys.stderr = sys.__stdout__, sys.__stderr__
+        self.jobs.shutdown()
+        self.audit_log.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,82 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from utils import AuditLog, Authenticate, Register, Synth
+
+
+class AuditRejectionTest(unittest.TestCase):
+    """ 无法完成比对的认证同样写入审计记录，拒绝原因在 error 字段 """
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.root = self._tmp.name
+        self.db_file = os.path.join(self.root, "db.json")
+        self.audit_path = os.path.join(self.root, "audit.db")
+        data = os.path.join(self.root, "data")
+        Synth.generate_dataset(data, ["usb2_stick"], captures=2, size="256KB", seed=3, verbose=False,
+                               header_only=True)
+        self.samples = os.path.join(data, "usb2_stick")
+        self.assertTrue(Register.run_registration("usb2_stick", self.samples, self.db_file, verbose=False))
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _events(self, audit):
+        audit.flush()
+        return sorted(audit.query(), key=lambda r: r["id"])
+
+    def test_rejections_are_recorded(self):
+        audit = AuditLog.AuditLog(self.audit_path)
+        try:
+            empty = os.path.join(self.root, "empty")
+            os.makedirs(empty)
+            cases = [
+                (os.path.join(self.root, "missing"), self.db_file, None),
+                (empty, self.db_file, None),
+                (self.samples, os.path.join(self.root, "missing.json"), None),
+                (self.samples, self.db_file, "unknown"),
+            ]
+            for folder, db_file, device_id in cases:
+                result = Authenticate.authenticate_device(folder, db_file, device_id=device_id, audit_log=audit)
+                self.assertEqual(result, (False, None, 0.0))
+            events = self._events(audit)
+        finally:
+            audit.close()
+
+        self.assertEqual(len(events), len(cases))
+        for event in events:
+            self.assertFalse(event["passed"])
+            self.assertIsNone(event["match_id"])
+            self.assertTrue(event["error"])
+        self.assertEqual(events[2]["probe_files"], ["capture_1.pcapng", "capture_2.pcapng"])
+        self.assertIn("unknown", events[3]["error"])
+
+    def test_verdict_has_no_error(self):
+        audit = AuditLog.AuditLog(self.audit_path)
+        try:
+            passed, match_id, _ = Authenticate.authenticate_device(self.samples, self.db_file, audit_log=audit)
+            events = self._events(audit)
+        finally:
+            audit.close()
+        self.assertTrue(passed)
+        self.assertEqual([(e["match_id"], e["error"]) for e in events], [(match_id, None)])
+
+    def test_legacy_database_gains_error_column(self):
+        conn = sqlite3.connect(self.audit_path)
+        conn.execute("CREATE TABLE auth_events (id INTEGER PRIMARY KEY AUTOINCREMENT, ts REAL NOT NULL, "
+                     "device_id TEXT, match_id TEXT, score REAL NOT NULL, threshold REAL NOT NULL, "
+                     "passed INTEGER NOT NULL, probe_files TEXT NOT NULL, details TEXT NOT NULL)")
+        conn.close()
+        audit = AuditLog.AuditLog(self.audit_path)
+        try:
+            audit.record_rejection([], None, 70.0, "数据库为空")
+            events = self._events(audit)
+        finally:
+            audit.close()
+        self.assertEqual([e["error"] for e in events], ["数据库为空"])
+
+
+if __name__ == "__main__":
+    unittest.main()
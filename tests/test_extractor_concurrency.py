@@ -0,0 +1,61 @@
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import FeatureExtractor, Synth
+
+
+def _normalized(result):
+    enum_val, transfer_data = result
+    return enum_val, {int(k): list(v) for k, v in (transfer_data or {}).items()}
+
+
+class ExtractorConcurrencyTest(unittest.TestCase):
+    """ 同一个 PcapExtractor 在线程池中并发提取，结果须与顺序提取完全一致 """
+
+    WORKERS = 8
+    ROUNDS = 4
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.paths = []
+        for i, (profile, fmt) in enumerate([("usb2_stick", "usbpcap"), ("usb3_stick", "usbmon"),
+                                            ("slow_stick", "usbmon-mmapped"), ("card_reader", "usbpcap")]):
+            path = os.path.join(self._tmp.name, f"capture_{i}.pcapng")
+            Synth.generate(path, profile, size="256KB", fmt=fmt, seed=[42, i], start_time=0.0)
+            self.paths.append(path)
+        quiet = FeatureExtractor.PcapExtractor(verbose=False)
+        self.baseline = {path: _normalized(quiet.process(path)) for path in self.paths}
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _run(self, job):
+        jobs = [path for _ in range(self.ROUNDS) for path in self.paths]
+        with ThreadPoolExecutor(max_workers=self.WORKERS) as pool:
+            return list(zip(jobs, pool.map(job, jobs)))
+
+    def test_parallel_process_matches_sequential(self):
+        messages = []
+        extractor = FeatureExtractor.PcapExtractor(log=messages.append, verbose=False)
+        for path, result in self._run(extractor.process):
+            self.assertEqual(_normalized(result), self.baseline[path], path)
+        self.assertEqual(messages, [])
+
+    def test_parallel_extract_through_cache(self):
+        messages = []
+        extractor = FeatureExtractor.PcapExtractor(log=messages.append, verbose=False)
+        for path, result in self._run(lambda path: extractor.extract(path, use_cache=True)):
+            self.assertEqual(_normalized(result), self.baseline[path], path)
+        self.assertEqual(messages, [])
+        for path in self.paths:
+            cached = FeatureExtractor.load_cached_features(path)
+            self.assertIsNotNone(cached)
+            self.assertEqual(_normalized(cached), self.baseline[path])
+        leftovers = [f for f in os.listdir(self._tmp.name) if f.endswith(".tmp")]
+        self.assertEqual(leftovers, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
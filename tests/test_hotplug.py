@@ -0,0 +1,88 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from utils import Hotplug, Register, Synth
+
+
+class HotplugDaemonTest(unittest.TestCase):
+    """ 用模拟事件源驱动守护进程；抓包由合成文件代替（无需 tshark / usbmon） """
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.root = self._tmp.name
+        self.db_file = os.path.join(self.root, "db.json")
+        enroll = os.path.join(self.root, "enroll")
+        Synth.generate_dataset(enroll, ["usb2_stick"], captures=3, size="256KB", seed=1, verbose=False,
+                               header_only=True)
+        self.assertTrue(Register.run_registration("usb2_stick", os.path.join(enroll, "usb2_stick"),
+                                                  self.db_file, verbose=False))
+        self.source = Hotplug.SimulatedEventSource()
+        self.devnum = 5
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _daemon(self, **kwargs):
+        return Hotplug.HotplugDaemon(self.db_file, base_folder=os.path.join(self.root, "devices"),
+                                     source=self.source, arm_timeout=2.0, **kwargs)
+
+    def _capture(self, output_base_folder, sub_folder, file_name, confirm_callback, insert_timeout,
+                 usb_port, wait_device, **kwargs):
+        """ 代替 AutoCatch.run_single_capture：布防后模拟插入，写出合成抓包 """
+        if not confirm_callback("", ""):
+            return False
+        self.source.add(1, self.devnum)
+        device = wait_device(set(), insert_timeout, usb_port)
+        if device is None:
+            return False
+        folder = os.path.join(output_base_folder, sub_folder)
+        os.makedirs(folder, exist_ok=True)
+        Synth.generate(os.path.join(folder, file_name), "usb2_stick", size="256KB", seed=[2, self.devnum],
+                       header_only=True)
+        return True
+
+    def test_authenticates_each_insertion(self):
+        def on_result(result):
+            # 认证后拔出，下一次布防时插入新的设备地址
+            self.source.remove(*result["device"])
+            self.devnum += 1
+
+        daemon = self._daemon(on_result=on_result)
+        with mock.patch.object(Hotplug.AutoCatch, "run_single_capture", side_effect=self._capture):
+            results = daemon.run(max_captures=2)
+
+        self.assertEqual(len(results), 2)
+        self.assertEqual([r["device"] for r in results], [(1, 5), (1, 6)])
+        for result in results:
+            self.assertTrue(result["passed"])
+            self.assertEqual(result["match_id"], "usb2_stick")
+            self.assertTrue(os.path.isfile(os.path.join(result["folder"], "capture.pcapng")))
+
+    def test_failed_capture_is_removed_and_backs_off(self):
+        daemon = self._daemon(retry_delay=0.01, max_retry_delay=0.04)
+        calls = []
+
+        def failing_capture(output_base_folder, sub_folder, **kwargs):
+            folder = os.path.join(output_base_folder, sub_folder)
+            os.makedirs(folder)
+            with open(os.path.join(folder, "capture.pcapng"), "wb") as f:
+                f.write(b"\0" * 1024)
+            calls.append(folder)
+            if len(calls) == 4:
+                daemon.stop()
+            return False
+
+        with mock.patch.object(Hotplug.AutoCatch, "run_single_capture", side_effect=failing_capture), \
+                mock.patch.object(daemon.stop_event, "wait", wraps=daemon.stop_event.wait) as wait:
+            self.assertEqual(daemon.run(), [])
+
+        self.assertEqual(len(calls), 4)
+        self.assertFalse(any(os.path.exists(folder) for folder in calls))
+        self.assertEqual([c.args[0] for c in wait.call_args_list], [0.01, 0.02, 0.04])
+        self.assertEqual(daemon.failures, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import io
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from utils import FeatureExtractor, LiveExtractor, Replay, Synth
+
+
+class LiveExtractorReplayTest(unittest.TestCase):
+    """ 把录制文件渲染成 tshark 字段行送入管道，实时路径须与离线解析一致 """
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.target = os.path.join(self._tmp.name, "target.pcapng")
+        self.other = os.path.join(self._tmp.name, "other.pcapng")
+        Synth.generate(self.target, "usb2_stick", size="256KB", header_only=True, seed=7, address=5,
+                       start_time=1000.0)
+        Synth.generate(self.other, "card_reader", size="64KB", header_only=True, seed=8, address=9,
+                       start_time=1000.0)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def assertSameFeatures(self, live, offline):
+        # 字段行中的时间戳保留 9 位小数，间隔只在浮点舍入范围内不同
+        self.assertAlmostEqual(live[0], offline[0], places=8)
+        self.assertEqual(sorted(live[1]), sorted(offline[1]))
+        for endpoint, intervals in offline[1].items():
+            np.testing.assert_allclose(live[1][endpoint], intervals, atol=1e-8)
+
+    def test_stream_matches_offline_extraction(self):
+        recording = Replay.Recording.load(self.target)
+        extractor = LiveExtractor.LiveExtractor()
+        extractor.start_stream(io.StringIO("".join(recording.lines)))
+        live = extractor.finish()
+
+        offline = FeatureExtractor.PcapExtractor(verbose=False).process(self.target)
+        self.assertIsNotNone(live[0])
+        self.assertSameFeatures(live, offline)
+        self.assertEqual(extractor.activity.count, len(recording.lines))
+
+    def test_device_filter_drops_other_devices(self):
+        target = Replay.Recording.load(self.target)
+        other = Replay.Recording.load(self.other)
+        # 两个设备在同一总线上交错到达
+        lines = sorted(target.lines + other.lines, key=lambda line: float(line.split("\t", 1)[0]))
+
+        extractor = LiveExtractor.LiveExtractor(device_filter=True)
+        for line in lines:
+            extractor.feed_line(line)
+        self.assertEqual(extractor.set_device(), (1, 5))
+        live = extractor.finish()
+
+        offline = FeatureExtractor.PcapExtractor(verbose=False).process(self.target)
+        self.assertSameFeatures(live, offline)
+
+
+if __name__ == "__main__":
+    unittest.main()
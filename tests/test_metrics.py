@@ -0,0 +1,46 @@
+import threading
+import unittest
+import urllib.request
+
+from utils import Metrics
+
+
+class MetricsTest(unittest.TestCase):
+
+    def test_scrape_http_endpoint(self):
+        registry = Metrics.Registry()
+        counter = registry.counter("usb_test_total", "测试计数", ("result",))
+        histogram = registry.histogram("usb_test_seconds", "测试延迟", buckets=(0.1, 1.0))
+        counter.labels("pass").inc(3)
+        histogram.observe(0.5)
+
+        server = Metrics.start_http_server(0, registry=registry)
+        try:
+            host, port = server.server_address[:2]
+            with urllib.request.urlopen(f"http://{host}:{port}/metrics", timeout=5) as response:
+                self.assertEqual(response.status, 200)
+                self.assertEqual(response.headers["Content-Type"], Metrics.CONTENT_TYPE)
+                body = response.read().decode("utf-8")
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertIn("# TYPE usb_test_total counter", body)
+        self.assertIn('usb_test_total{result="pass"} 3', body)
+        self.assertIn('usb_test_seconds_bucket{le="0.1"} 0', body)
+        self.assertIn('usb_test_seconds_bucket{le="1.0"} 1', body)
+        self.assertIn("usb_test_seconds_count 1", body)
+
+    def test_thread_cells_do_not_grow_without_export(self):
+        counter = Metrics.Registry().counter("usb_threads_total", "测试计数")
+        for _ in range(200):
+            thread = threading.Thread(target=counter.inc)
+            thread.start()
+            thread.join()
+        cells = counter._default()._cells
+        self.assertLessEqual(len(cells._cells), 1)
+        self.assertEqual(counter.value(), 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,33 @@
+import unittest
+from unittest import mock
+
+from utils import AutoCatch, MultiCapture
+
+
+class PortValidationTest(unittest.TestCase):
+    """ Linux 下新设备识别不分总线，多端口采集必须指定物理端口 """
+
+    def _orchestrator(self, ports):
+        return MultiCapture.MultiCaptureOrchestrator([MultiCapture.PortSpec(*port[:2], usb_port=port[2])
+                                                      for port in ports])
+
+    @mock.patch.object(AutoCatch, "IS_WINDOWS", False)
+    def test_linux_requires_usb_port(self):
+        for ports in ([("a", "usbmon1", "1-1"), ("b", "usbmon1", None)],
+                      [("a", "usbmon1", None), ("b", "usbmon2", None)]):
+            with self.subTest(ports=ports), self.assertRaises(ValueError) as ctx:
+                self._orchestrator(ports)
+            self.assertIn("usb_port", str(ctx.exception))
+
+    @mock.patch.object(AutoCatch, "IS_WINDOWS", False)
+    def test_linux_ports_accepted(self):
+        self._orchestrator([("a", "usbmon1", "1-1"), ("b", "usbmon1", "1-2")])
+        self._orchestrator([("a", "usbmon1", None)])
+
+    @mock.patch.object(AutoCatch, "IS_WINDOWS", True)
+    def test_windows_uses_drive_letters(self):
+        self._orchestrator([("a", "USBPcap1", None), ("b", "USBPcap1", None)])
+
+
+if __name__ == "__main__":
+    unittest.main()
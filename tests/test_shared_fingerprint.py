@@ -0,0 +1,69 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 发布者进程：spawn 子进程（共用 resource_tracker）与独立进程（各自的 resource_tracker）轮流挂载
+SCRIPT = textwrap.dedent("""
+    import multiprocessing as mp
+    import subprocess
+    import sys
+    from utils import FingerprintDB, SharedFingerprint
+
+    def child(name, queue):
+        reader = SharedFingerprint.FingerprintMatrixReader(name)
+        queue.put(list(reader.matrix().device_ids))
+        reader.close()
+
+    if __name__ == "__main__":
+        mp.set_start_method("spawn")
+        publisher = SharedFingerprint.FingerprintMatrixPublisher()
+        publisher.sync(FingerprintDB.get_store(sys.argv[1]))
+        queue = mp.Queue()
+        for _ in range(2):
+            proc = mp.Process(target=child, args=(publisher.control_name, queue))
+            proc.start()
+            print(queue.get())
+            proc.join()
+        code = ("from utils import SharedFingerprint as S; r = S.FingerprintMatrixReader(%r); "
+                "print(list(r.matrix().device_ids)); r.close()" % publisher.control_name)
+        for _ in range(2):
+            print(subprocess.run([sys.executable, "-c", code], check=True, capture_output=True,
+                                 text=True).stdout.strip())
+        reader = SharedFingerprint.FingerprintMatrixReader(publisher.control_name)
+        print(list(reader.matrix().device_ids))
+        reader.close()
+        publisher.publish({}, publisher.version + 1)  # 旧块解除链接
+        publisher.close()
+""")
+
+
+class SharedMatrixLifetimeTest(unittest.TestCase):
+    """ 读者退出不会解除发布者的共享内存，发布者关闭时也不产生 resource_tracker 警告 """
+
+    def test_readers_do_not_unlink_blocks(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_file = os.path.join(tmp, "db.json")
+            with open(db_file, "w", encoding="utf-8") as f:
+                json.dump({"stick": {"fingerprint": {"enumeration": {"mean": 0.12, "std": 0.01},
+                                                     "transfers": {}}}}, f)
+            script = os.path.join(tmp, "publisher.py")
+            with open(script, "w", encoding="utf-8") as f:
+                f.write(SCRIPT)
+            env = dict(os.environ, PYTHONPATH=ROOT)
+            result = subprocess.run([sys.executable, script, db_file], cwd=ROOT, env=env,
+                                    capture_output=True, text=True, timeout=120)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        lines = [line for line in result.stdout.splitlines() if line.startswith("[")
+                 and not line.startswith("[-]")]
+        self.assertEqual(lines, ["['stick']"] * 5)
+        self.assertEqual(result.stderr, "")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import filecmp
+import os
+import tempfile
+import unittest
+
+from utils import Authenticate, FeatureExtractor, PcapFile, Register, Synth
+
+
+class SynthRoundTripTest(unittest.TestCase):
+    """ 合成抓包经过特征提取后，得到的特征与生成时的画像参数一致 """
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.root = self._tmp.name
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    def test_same_seed_same_bytes(self):
+        kwargs = dict(size="128KB", seed=[1, 2], start_time=1000.0)
+        Synth.generate(self._path("a.pcapng"), "usb3_stick", **kwargs)
+        Synth.generate(self._path("b.pcapng"), "usb3_stick", **kwargs)
+        Synth.generate(self._path("c.pcapng"), "usb3_stick", **dict(kwargs, seed=[1, 3]))
+        self.assertTrue(filecmp.cmp(self._path("a.pcapng"), self._path("b.pcapng"), shallow=False))
+        self.assertFalse(filecmp.cmp(self._path("a.pcapng"), self._path("c.pcapng"), shallow=False))
+
+    def test_extraction_recovers_generated_features(self):
+        for fmt in Synth.FORMATS:
+            for tsresol in (6, 9):
+                with self.subTest(fmt=fmt, tsresol=tsresol):
+                    path = self._path(f"{fmt}_{tsresol}.pcapng")
+                    info = Synth.generate(path, "card_reader", size="256KB", fmt=fmt, seed=4, header_only=True,
+                                          start_time=1000.0, tsresol=tsresol)
+                    enum_val, transfer_data = FeatureExtractor.PcapExtractor(verbose=False).process(path)
+
+                    self.assertAlmostEqual(enum_val, info["enumeration"], delta=2 * 10.0 ** -tsresol)
+                    expected = {int(ep, 16): stats["transfers"] for ep, stats in info["endpoints"].items()}
+                    self.assertEqual(sorted(transfer_data), sorted(expected))
+                    # 每次传输提交/完成两个包，间隔数最多为包数 - 1（个别异常间隔被过滤）
+                    for endpoint, count in expected.items():
+                        self.assertLessEqual(len(transfer_data[endpoint]), 2 * count - 1)
+                        self.assertGreaterEqual(len(transfer_data[endpoint]), (2 * count - 1) * 0.99)
+                    self.assertEqual(info["packets"], sum(1 for _ in PcapFile.iter_packets(path)))
+
+    def test_size_and_header_only(self):
+        info = Synth.generate(self._path("full.pcapng"), "usb2_stick", size="512KB", seed=5, start_time=1000.0)
+        self.assertGreaterEqual(info["bytes"], 512 * 1024)
+        self.assertLess(info["bytes"], 512 * 1024 + 64 * 1024)
+
+        info = Synth.generate(self._path("header.pcapng"), "usb2_stick", size="64KB", seed=5, header_only=True,
+                              start_time=1000.0)
+        truncated = 0
+        for _, _, data, orig_len in PcapFile.iter_packets(info["path"]):
+            self.assertLessEqual(len(data), PcapFile.HEADER_SNAPLEN)
+            truncated += orig_len > len(data)
+        self.assertGreater(truncated, 0)
+
+    def test_registered_profiles_authenticate(self):
+        enroll = self._path("enroll")
+        probes = self._path("probes")
+        profiles = ["usb2_stick", "slow_stick", "card_reader"]
+        Synth.generate_dataset(enroll, profiles, captures=3, size="256KB", seed=0, verbose=False,
+                               header_only=True)
+        Synth.generate_dataset(probes, profiles, captures=1, size="256KB", seed=1, verbose=False,
+                               header_only=True)
+        db_file = self._path("db.json")
+        summary = Register.run_bulk_registration(enroll, db_file, workers=1, verbose=False)
+        self.assertEqual({name: result["status"] for name, result in summary.items()},
+                         {name: "registered" for name in profiles})
+
+        for name in profiles:
+            passed, match_id, score = Authenticate.authenticate_device(os.path.join(probes, name), db_file)
+            self.assertTrue(passed, f"{name}: {match_id} {score:.1f}")
+            self.assertEqual(match_id, name)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,182 @@
+import os
+import struct
+import tempfile
+import unittest
+from unittest import mock
+
+from utils import FeatureExtractor, PcapFile, Synth, Usbmon
+
+
+def _usbmon_header(event, xfer_type, epnum, devnum, busnum, ts, length=0):
+    ts_sec, ts_usec = int(ts), round((ts - int(ts)) * 1e6)
+    return PcapFile.USBMON_HEADER.pack(1, ord(event), xfer_type, epnum, devnum, busnum, b"-", b"<",
+                                       ts_sec, ts_usec, 0, length, 0, b"\0" * 8)
+
+
+# (时间戳, 事件, 传输类型, endpoint, 设备地址)：枚举控制传输后跟 Bulk 读
+PACKETS = [
+    (100.000000, "S", 2, 0x80, 5),
+    (100.000250, "C", 2, 0x80, 5),
+    (100.010000, "S", 3, 0x81, 5),
+    (100.011000, "C", 3, 0x81, 5),
+    (100.012000, "S", 3, 0x81, 5),
+    (100.013500, "C", 3, 0x81, 5),
+    (100.014000, "S", 3, 0x02, 7),
+]
+
+
+class PcapFileUsbmonTest(unittest.TestCase):
+    """ 解析 usbmon (48 字节包头) 与 usbmon mmap (64 字节包头) 录制文件 """
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.root = self._tmp.name
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _write(self, name, linktype, pad=0):
+        path = os.path.join(self.root, name)
+        with PcapFile.PcapngWriter(path, linktype) as writer:
+            for ts, event, xfer_type, epnum, devnum in PACKETS:
+                writer.write(ts, _usbmon_header(event, xfer_type, epnum, devnum, 2, ts) + b"\0" * pad)
+        return path
+
+    def _assert_decoded(self, path):
+        packets = list(PcapFile.iter_usb_packets(path))
+        self.assertEqual(len(packets), len(PACKETS))
+        for (timestamp, usb), (ts, event, xfer_type, epnum, devnum) in zip(packets, PACKETS):
+            self.assertAlmostEqual(timestamp, ts, places=6)
+            self.assertEqual(usb["event"], event)
+            self.assertEqual(usb["t_type"], FeatureExtractor.transfer_type_name(xfer_type))
+            self.assertEqual(usb["endpoint"], f"0x{epnum:02x}")
+            self.assertEqual((usb["bus"], usb["device"]), (2, devnum))
+
+    def test_usbmon_fixture(self):
+        path = self._write("usbmon.pcapng", PcapFile.LINKTYPE_USB_LINUX)
+        self.assertEqual(PcapFile.read_linktypes(path), {PcapFile.LINKTYPE_USB_LINUX})
+        self._assert_decoded(path)
+        self.assertEqual(PcapFile.dominant_device(path), (2, 5))
+
+    def test_mmapped_fixture(self):
+        pad = PcapFile.USBMON_MMAPPED_HEADER_LEN - PcapFile.USBMON_HEADER.size
+        path = self._write("mmapped.pcapng", PcapFile.LINKTYPE_USB_LINUX_MMAPPED, pad=pad)
+        self._assert_decoded(path)
+        data = next(PcapFile.iter_packets(path))[2]
+        self.assertEqual(PcapFile.usb_header_length(PcapFile.LINKTYPE_USB_LINUX_MMAPPED, data),
+                         PcapFile.USBMON_MMAPPED_HEADER_LEN)
+
+    def test_classic_pcap(self):
+        path = os.path.join(self.root, "usbmon.pcap")
+        with open(path, "wb") as f:
+            f.write(struct.pack("<IHHiIII", 0xa1b2c3d4, 2, 4, 0, 0, 65535, PcapFile.LINKTYPE_USB_LINUX))
+            for ts, event, xfer_type, epnum, devnum in PACKETS:
+                data = _usbmon_header(event, xfer_type, epnum, devnum, 2, ts)
+                f.write(struct.pack("<IIII", int(ts), round((ts - int(ts)) * 1e6), len(data), len(data)) + data)
+        self._assert_decoded(path)
+
+    def test_truncated_header_is_skipped(self):
+        path = os.path.join(self.root, "short.pcapng")
+        with PcapFile.PcapngWriter(path, PcapFile.LINKTYPE_USB_LINUX) as writer:
+            writer.write(1.0, b"\0" * 20)
+        self.assertEqual(list(PcapFile.iter_usb_packets(path)), [(1.0, None)])
+
+    def test_undefined_interface_raises_format_error(self):
+        path = self._write("bad_if.pcapng", PcapFile.LINKTYPE_USB_LINUX)
+        with open(path, "ab") as f:
+            body = struct.pack("<IIIII", 3, 0, 0, 0, 0)
+            f.write(struct.pack("<II", 6, 12 + len(body)) + body + struct.pack("<I", 12 + len(body)))
+        with self.assertRaises(PcapFile.PcapFormatError):
+            list(PcapFile.iter_packets(path))
+
+    def test_unknown_format_raises_format_error(self):
+        path = os.path.join(self.root, "junk.pcapng")
+        with open(path, "wb") as f:
+            f.write(b"not a capture")
+        with self.assertRaises(PcapFile.PcapFormatError):
+            list(PcapFile.iter_packets(path))
+
+    def test_synthetic_formats_extract_alike(self):
+        results = {}
+        for fmt in ("usbpcap", "usbmon", "usbmon-mmapped"):
+            path = os.path.join(self.root, f"{fmt}.pcapng")
+            Synth.generate(path, "usb2_stick", size="64KB", fmt=fmt, seed=11, header_only=True,
+                           start_time=1000.0)
+            results[fmt] = FeatureExtractor.PcapExtractor(verbose=False).process(path)
+        enum_val, transfers = results["usbpcap"]
+        self.assertIsNotNone(enum_val)
+        for fmt in ("usbmon", "usbmon-mmapped"):
+            self.assertAlmostEqual(results[fmt][0], enum_val, places=6)
+            self.assertEqual(sorted(results[fmt][1]), sorted(transfers))
+
+
+class UsbmonSysfsTest(unittest.TestCase):
+    """ 用临时目录模拟 sysfs 与 /proc/self/mounts """
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        root = self._tmp.name
+        usb = os.path.join(root, "devices", "pci0000:00", "usb2")
+        self.stick = os.path.join(usb, "2-1")
+        self._node(usb, busnum="2", devnum="1", bDeviceClass="09")
+        self._node(self.stick, busnum="2", devnum="5", bDeviceClass="00", idVendor="0781",
+                   idProduct="5567", serial="4C530001", product="Cruzer Blade")
+        disk = os.path.join(self.stick, "2-1:1.0", "host0", "target0:0:0", "0:0:0:0", "block", "sdb")
+        os.makedirs(os.path.join(disk, "sdb1"))
+
+        bus_devices = os.path.join(root, "bus", "usb", "devices")
+        os.makedirs(bus_devices)
+        os.symlink(usb, os.path.join(bus_devices, "usb2"))
+        os.symlink(self.stick, os.path.join(bus_devices, "2-1"))
+        os.symlink(os.path.join(self.stick, "2-1:1.0"), os.path.join(bus_devices, "2-1:1.0"))
+        block = os.path.join(root, "block")
+        os.makedirs(block)
+        os.symlink(disk, os.path.join(block, "sdb"))
+        mounts = os.path.join(root, "mounts")
+        with open(mounts, "w", encoding="utf-8") as f:
+            f.write("/dev/sda1 / ext4 rw 0 0\n")
+            f.write("/dev/sdb1 /media/user/U\\040盘 vfat rw 0 0\n")
+
+        self._patches = [mock.patch.object(Usbmon, "SYSFS_USB_DEVICES", bus_devices),
+                         mock.patch.object(Usbmon, "SYSFS_BLOCK", block),
+                         mock.patch.object(Usbmon, "MOUNTS_FILE", mounts)]
+        for patch in self._patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self._patches:
+            patch.stop()
+        self._tmp.cleanup()
+
+    @staticmethod
+    def _node(path, **attrs):
+        os.makedirs(path, exist_ok=True)
+        for name, value in attrs.items():
+            with open(os.path.join(path, name), "w", encoding="utf-8") as f:
+                f.write(value + "\n")
+
+    def test_lists_devices_without_hubs(self):
+        devices = Usbmon.list_usb_devices()
+        self.assertEqual(list(devices), [(2, 5)])
+        device = devices[(2, 5)]
+        self.assertEqual((device.vendor_id, device.product_id, device.serial), ("0781", "5567", "4C530001"))
+        self.assertEqual(device.sysfs_path, os.path.realpath(self.stick))
+
+    def test_finds_block_devices_and_mount_point(self):
+        device = Usbmon.list_usb_devices()[(2, 5)]
+        self.assertEqual(Usbmon.block_devices(device), ["sdb", "sdb1"])
+        self.assertEqual(Usbmon.find_mount_point(device), "/media/user/U 盘")
+
+    def test_waits_for_device_on_port(self):
+        self.assertEqual(Usbmon.wait_for_new_device({}, timeout=1.0, port="2-1").devnum, 5)
+        self.assertIsNone(Usbmon.wait_for_new_device({}, timeout=0.2, port="2-2"))
+        self.assertIsNone(Usbmon.wait_for_new_device(Usbmon.list_usb_devices(), timeout=0.2))
+
+    def test_bus_of_interface(self):
+        self.assertEqual(Usbmon.bus_of_interface("usbmon3"), 3)
+        self.assertEqual(Usbmon.bus_of_interface("usbmon0"), 0)
+        self.assertEqual(Usbmon.bus_of_interface("USBPcap1"), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from utils import Workload
+
+
+class WorkloadTest(unittest.TestCase):
+    """ 在本地临时目录执行各种负载 """
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.folder = self._tmp.name
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _run(self, workload, **kwargs):
+        spec = Workload.resolve(workload, total_mb=2)
+        return Workload.run_workload(self.folder, spec, **kwargs)
+
+    def test_presets(self):
+        for name in Workload.PRESETS:
+            with self.subTest(name):
+                stats = self._run(name)
+                spec = Workload.resolve(name, total_mb=2)
+                self.assertEqual(stats["errors"], [])
+                self.assertEqual(stats["passes"], 1)
+                self.assertEqual(stats["bytes_written"], 2 * Workload.MB)
+                self.assertEqual(stats["bytes_read"], 2 * Workload.MB if spec.mode == "readback" else 0)
+                self.assertFalse(os.path.exists(stats["path"]))
+                self.assertLessEqual(stats["start"], stats["end"])
+
+    def test_legacy_appends_without_preallocating(self):
+        sizes = []
+        real_write = os.write
+
+        def write(fd, data):
+            n = real_write(fd, data)
+            sizes.append(os.fstat(fd).st_size)
+            return n
+
+        with mock.patch.object(Workload.os, "posix_fallocate", create=True) as fallocate, \
+                mock.patch.object(Workload.os, "ftruncate") as ftruncate, \
+                mock.patch.object(Workload.os, "write", side_effect=write):
+            stats = self._run("legacy", keep_file=True)
+        fallocate.assert_not_called()
+        ftruncate.assert_not_called()
+        self.assertEqual(sizes, [Workload.MB, 2 * Workload.MB])
+        self.assertEqual(os.path.getsize(stats["path"]), 2 * Workload.MB)
+
+        # 再次执行从空文件开始，而不是覆盖已有内容
+        stats = self._run("legacy", keep_file=True)
+        self.assertEqual(os.path.getsize(stats["path"]), 2 * Workload.MB)
+
+    def test_append_requires_sequential_single_queue(self):
+        with self.assertRaises(ValueError):
+            Workload.WorkloadSpec(pattern="random", preallocate=False)
+        with self.assertRaises(ValueError):
+            Workload.WorkloadSpec(queue_depth=4, preallocate=False)
+
+    def test_random_readback_covers_every_block(self):
+        spec = {"mode": "readback", "pattern": "random", "block_size": 64 * 1024, "queue_depth": 4,
+                "sync": "end"}
+        stats = self._run(spec, keep_file=True)
+        self.assertEqual(stats["errors"], [])
+        self.assertEqual(stats["bytes_read"], stats["bytes_written"])
+        self.assertEqual(os.path.getsize(stats["path"]), 2 * Workload.MB)
+
+    def test_repeat_until_stopped(self):
+        stop_event = threading.Event()
+        timer = threading.Timer(0.2, stop_event.set)
+        timer.start()
+        try:
+            stats = self._run({"block_size": 256 * 1024, "sync": "end"}, stop_event=stop_event, repeat=True)
+        finally:
+            timer.cancel()
+        self.assertTrue(stats["stopped"])
+        self.assertGreaterEqual(stats["passes"], 1)
+        self.assertEqual(stats["errors"], [])
+        with self.assertRaises(ValueError):
+            self._run("legacy", repeat=True)
+
+    def test_open_failure_is_reported(self):
+        spec = Workload.resolve("seq_readback", total_mb=1)
+        path = os.path.join(self.folder, "missing.dat")
+        buffers = [Workload._alloc_buffer(spec.block_size, fill=False)]
+        try:
+            done, _, errors = Workload._run_phase(path, spec, [0], buffers, False, None)
+        finally:
+            buffers[0].close()
+        self.assertEqual(done, 0)
+        self.assertEqual(len(errors), 1)
+        self.assertIsInstance(errors[0], FileNotFoundError)
+
+
+if __name__ == "__main__":
+    unittest.main()
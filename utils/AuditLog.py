@@ -0,0 +1,234 @@
+"""
+认证审计日志模块
+持久化记录每一次认证判定（时间、验证文件、最佳匹配、分数、阈值、各特征得分、拒绝原因），
+供事后调查使用：
+- 写入: record() 只把记录放入队列立即返回，后台线程批量写入并一次提交 (组提交 fsync)，
+        不增加认证路径的延迟
+- 查询: query() 按设备ID / 时间范围 / 结果过滤，均走 SQLite 索引而非扫描文本日志
+"""
+
+import json
+import queue
+import sqlite3
+import threading
+import time
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS auth_events (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts          REAL    NOT NULL,
+    device_id   TEXT,
+    match_id    TEXT,
+    score       REAL    NOT NULL,
+    threshold   REAL    NOT NULL,
+    passed      INTEGER NOT NULL,
+    probe_files TEXT    NOT NULL,
+    details     TEXT    NOT NULL,
+    error       TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_auth_ts        ON auth_events (ts);
+CREATE INDEX IF NOT EXISTS idx_auth_match_ts  ON auth_events (match_id, ts);
+CREATE INDEX IF NOT EXISTS idx_auth_device_ts ON auth_events (device_id, ts);
+CREATE INDEX IF NOT EXISTS idx_auth_passed_ts ON auth_events (passed, ts);
+"""
+
+_COLUMNS = ("id", "ts", "device_id", "match_id", "score", "threshold",
+            "passed", "probe_files", "details", "error")
+
+
+class AuditLog:
+    """
+    认证审计日志
+
+    用法:
+        audit = AuditLog("auth_audit.db")
+        audit.record(probe_files, device_id, match_id, score, threshold, passed, details)
+        audit.record_rejection(probe_files, device_id, threshold, "数据库为空")
+        audit.query(device_id="SanDisk_32G", since=time.time() - 86400, passed=False)
+        audit.close()
+    """
+
+    def __init__(self, db_path, batch_size=256, flush_interval=0.5):
+        """
+        参数:
+        - db_path: SQLite 数据库文件路径
+        - batch_size: 单次提交的最大记录数
+        - flush_interval: 后台线程的最长攒批等待时间（秒）
+        """
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._closed = False
+
+        conn = self._connect()
+        # 旧版数据库没有 error 列：先补列，再建索引
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(auth_events)")]
+        if columns and "error" not in columns:
+            conn.execute("ALTER TABLE auth_events ADD COLUMN error TEXT")
+        conn.executescript(_SCHEMA)
+        conn.close()
+
+        self._writer = threading.Thread(target=self._writer_loop, name="AuditLogWriter", daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=FULL")
+        return conn
+
+    # ==================== 写入 ====================
+
+    def record(self, probe_files, device_id, match_id, score, threshold, passed, details=None, ts=None,
+               error=None):
+        """
+        记录一次认证判定（非阻塞，只入队）
+
+        参数:
+        - probe_files: 验证样本文件名列表
+        - device_id: 一对一模式的目标设备ID，一对多为 None
+        - match_id: 最佳匹配设备ID
+        - score / threshold / passed: 综合相似度、阈值、是否通过
+        - details: 各设备、各特征的比对详情 (Authenticate.match_fingerprint 返回的第4项)
+        - error: 未能完成比对时的拒绝原因，正常判定为 None
+        """
+        if self._closed:
+            print("[警告] 审计日志已关闭，记录被丢弃")
+            return
+        self._queue.put((
+            ts if ts is not None else time.time(),
+            device_id,
+            match_id,
+            float(score),
+            float(threshold),
+            1 if passed else 0,
+            json.dumps(list(probe_files), ensure_ascii=False),
+            json.dumps(details or {}, ensure_ascii=False, default=float),
+            error,
+        ))
+
+    def record_rejection(self, probe_files, device_id, threshold, error, ts=None):
+        """
+        记录一次未能完成比对的认证（找不到样本、数据库为空、无有效特征等）
+
+        以未通过、分数 0 记录，拒绝原因写入 error 列
+        """
+        self.record(probe_files, device_id, None, 0.0, threshold, False, ts=ts, error=error)
+
+    def _writer_loop(self):
+        conn = self._connect()
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                if isinstance(item, threading.Event):
+                    item.set()  # flush 请求：之前的记录都已提交
+                    continue
+
+                batch = [item]
+                stop = False
+                deadline = time.monotonic() + self.flush_interval
+                # 攒批：等到达到批量上限或超时，一次事务提交 = 一次 fsync
+                while len(batch) < self.batch_size:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = self._queue.get(timeout=timeout)
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stop = True
+                        break
+                    if isinstance(item, threading.Event):
+                        self._queue.put(item)  # 本批提交后再响应 flush
+                        break
+                    batch.append(item)
+
+                try:
+                    with conn:
+                        conn.executemany(
+                            "INSERT INTO auth_events (ts, device_id, match_id, score, threshold, "
+                            "passed, probe_files, details, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            batch
+                        )
+                except Exception as e:
+                    print(f"[警告] 审计日志写入失败 ({len(batch)} 条): {e}")
+                if stop:
+                    break
+        finally:
+            conn.close()
+
+    def flush(self, timeout=10):
+        """ 阻塞直到此前入队的记录全部落盘 """
+        if self._closed:
+            return True
+        event = threading.Event()
+        self._queue.put(event)
+        return event.wait(timeout)
+
+    def close(self):
+        """ 写完剩余记录并停止后台线程 """
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._writer.join(timeout=10)
+
+    # ==================== 查询 ====================
+
+    def query(self, device_id=None, since=None, until=None, passed=None, limit=100):
+        """
+        按索引查询认证历史（按时间倒序）
+
+        参数:
+        - device_id: 目标设备或最佳匹配设备为该ID的记录
+        - since / until: 时间范围 (Unix 时间戳)
+        - passed: True/False 只看通过/失败，None 不过滤
+        - limit: 最多返回条数
+
+        返回:
+        - list[dict]: 每条记录，probe_files / details 已解析为 Python 对象
+        """
+        conds = []
+        cond_args = []
+        if since is not None:
+            conds.append("ts >= ?")
+            cond_args.append(since)
+        if until is not None:
+            conds.append("ts <= ?")
+            cond_args.append(until)
+        if passed is not None:
+            conds.append("passed = ?")
+            cond_args.append(1 if passed else 0)
+
+        select = f"SELECT {', '.join(_COLUMNS)} FROM auth_events"
+        if device_id is not None:
+            # 拆成两个走索引的子查询再合并，避免 OR 退化为全表扫描
+            parts = []
+            args = []
+            for column in ("match_id", "device_id"):
+                parts.append(f"{select} WHERE " + " AND ".join([f"{column} = ?"] + conds))
+                args.extend([device_id] + cond_args)
+            sql = " UNION ".join(parts) + " ORDER BY ts DESC LIMIT ?"
+        else:
+            sql = select + (" WHERE " + " AND ".join(conds) if conds else "") + " ORDER BY ts DESC LIMIT ?"
+            args = cond_args
+        args.append(limit)
+
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            rows = conn.execute(sql, args).fetchall()
+        finally:
+            conn.close()
+
+        results = []
+        for row in rows:
+            rec = dict(zip(_COLUMNS, row))
+            rec["passed"] = bool(rec["passed"])
+            rec["probe_files"] = json.loads(rec["probe_files"])
+            rec["details"] = json.loads(rec["details"])
+            results.append(rec)
+        return results
@@ -0,0 +1,480 @@
+"""
+常驻认证服务
+每次运行 Main.py / GUI 认证都要重新导入模块、加载数据库、启动解析进程。本服务常驻并保持：
+- 编译好的指纹矩阵 (SharedFingerprint)，数据库文件变化时自动重新发布
+- 预热的解析进程池（启动时即完成进程创建与模块导入）
+- 特征缓存：内存 LRU (按文件路径 + 大小 + 修改时间) 叠加磁盘 *.features.json
+因此单次请求的耗时只剩解析 + 评分，多个请求由线程并发处理。
+
+接口 (HTTP/1.1 JSON，监听本地 TCP 端口或 Unix socket):
+    GET  /health   服务状态、数据库版本、缓存命中率
+    GET  /metrics  Prometheus 文本格式指标 (见 utils/Metrics.py)
+    POST /auth     {"files": [pcapng 路径...]} 或 {"folder": 路径}
+                   或 {"features": {"enum_times": [...], "transfers": {endpoint: [包间隔...]}}}
+                   可选 "device_id"、"threshold"
+                   返回判定结果与各设备的逐项得分
+
+用法:
+    python -m utils.AuthServer usb_fingerprint_db.json --port 8765
+    python -m utils.AuthServer usb_fingerprint_db.json --unix /run/usb_auth.sock
+"""
+
+import argparse
+import http.client
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from utils import AuditLog, Authenticate, FeatureExtractor, FingerprintDB, Metrics, Profiler, SharedFingerprint
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+MAX_BODY = 64 * 1024 * 1024
+# 空闲指纹矩阵读者的上限（超出的读者用完即关闭）
+MAX_IDLE_READERS = 8
+
+
+def _parse_probe(path):
+    """
+    进程池工作函数：解析单个验证文件（带磁盘特征缓存）
+
+    返回 (enum_val, transfer_data, profile_dict)：工作进程的指标不在服务进程的注册表中，
+    解析计时随结果传回后由服务进程计入指标
+    """
+    with Profiler.profiling(detached=True) as profile:
+        e_time, t_data = FeatureExtractor.extract_features(path)
+    return e_time, dict(t_data) if t_data else None, profile.as_dict()
+
+
+def _warm_up(_):
+    """ 进程池预热：触发进程创建与模块导入（短暂占用，使每个任务落到不同进程） """
+    time.sleep(0.05)
+    return os.getpid()
+
+
+def _file_key(path):
+    """ 内存缓存键：源文件（或原始文件已删除时的特征缓存）的路径、大小与修改时间 """
+    for candidate in (path, FeatureExtractor.feature_cache_path(path)):
+        try:
+            st = os.stat(candidate)
+        except OSError:
+            continue
+        return os.path.realpath(candidate), st.st_size, st.st_mtime_ns
+    return None
+
+
+def _endpoint_key(key):
+    """ 载荷中的 endpoint: 129 / "129" / "0x81" -> 129 """
+    if isinstance(key, int):
+        return key
+    return int(key, 16) if str(key).lower().startswith("0x") else int(key)
+
+
+class FeatureCache:
+    """ 线程安全的 LRU 特征缓存 """
+
+    def __init__(self, size=256):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key is None or key not in self._items:
+                self.misses += 1
+                Metrics.record_cache("memory", False)
+                return None
+            self.hits += 1
+            Metrics.record_cache("memory", True)
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value):
+        if key is None or self.size <= 0:
+            return
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {"entries": len(self._items), "hits": self.hits, "misses": self.misses,
+                    "hit_rate": self.hits / total if total else 0.0}
+
+
+class AuthService:
+    """
+    认证服务的常驻状态（与传输层无关，可直接在进程内调用）
+
+    用法:
+        service = AuthService("usb_fingerprint_db.json")
+        result = service.authenticate({"files": ["devices/auth/capture_1.pcapng"]})
+        service.close()
+    """
+
+    def __init__(self, db_file, workers=None, threshold=70.0, audit_db=None, cache_size=256):
+        """
+        参数:
+        - db_file: 指纹数据库
+        - workers: 解析进程数，None 表示全部 CPU 核心
+        - threshold: 默认认证阈值（请求可覆盖）
+        - audit_db: 审计日志 SQLite 路径，None 表示不记录
+        - cache_size: 内存特征缓存的文件数
+        """
+        self.db_file = db_file
+        self.threshold = threshold
+        self.workers = workers or os.cpu_count() or 1
+        self.store = FingerprintDB.get_store(db_file)
+        self.cache = FeatureCache(cache_size)
+        self.audit = AuditLog.AuditLog(audit_db) if audit_db else None
+        self.started = time.time()
+        self.requests = 0
+        self.errors = 0
+
+        self._publisher = SharedFingerprint.FingerprintMatrixPublisher()
+        self._sync_lock = threading.Lock()
+        self._idle_readers = []
+        self._readers_lock = threading.Lock()
+        self._count_lock = threading.Lock()
+        self.sync()
+        Metrics.track_db(db_file)
+
+        self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        list(self._pool.map(_warm_up, range(self.workers)))
+        print(f"[√] 认证服务就绪: {self.workers} 个解析进程, 数据库版本 {self._publisher.version}")
+
+    # ==================== 数据库 ====================
+
+    def sync(self):
+        """ 数据库文件变化时重新发布指纹矩阵（未变化时只有一次 stat） """
+        with self._sync_lock:
+            return self._publisher.sync(self.store)
+
+    @contextmanager
+    def _matrix(self):
+        """
+        借用一个读者并返回当前指纹矩阵
+
+        HTTP 服务每个连接一个线程，因此读者不按线程持有，而是放在有界的空闲池中复用：
+        使用期间读者归当前请求独占（版本切换时关闭旧块不影响其他请求），
+        空闲读者超过 MAX_IDLE_READERS 时直接关闭，共享内存映射与文件描述符数量有上限。
+        """
+        with self._readers_lock:
+            reader = self._idle_readers.pop() if self._idle_readers else None
+        if reader is None:
+            reader = SharedFingerprint.FingerprintMatrixReader(self._publisher.control_name)
+        try:
+            yield reader.matrix()
+        finally:
+            with self._readers_lock:
+                if len(self._idle_readers) < MAX_IDLE_READERS:
+                    self._idle_readers.append(reader)
+                    reader = None
+            if reader is not None:
+                reader.close()
+
+    # ==================== 特征 ====================
+
+    def _probe_files(self, payload):
+        if "folder" in payload:
+            folder = payload["folder"]
+            if not os.path.isdir(folder):
+                raise ValueError(f"找不到验证数据文件夹: {folder}")
+            return [os.path.join(folder, f) for f in FeatureExtractor.list_samples(folder)]
+        files = payload.get("files")
+        if not isinstance(files, list) or not files:
+            raise ValueError("files 必须是非空列表")
+        return files
+
+    def extract(self, files):
+        """
+        解析验证文件（内存缓存 → 进程池），返回 (all_enum_times, all_transfer_data)
+        """
+        parsed = {}
+        pending = {}
+        for path in files:
+            key = _file_key(path)
+            if key is None:
+                raise ValueError(f"找不到验证文件: {path}")
+            cached = self.cache.get(key)
+            if cached is not None:
+                parsed[path] = cached
+            else:
+                pending[path] = (key, self._pool.submit(_parse_probe, path))
+        for path, (key, future) in pending.items():
+            e_time, t_data, profile = future.result()
+            Metrics.record_profile(profile)
+            result = (e_time, t_data)
+            parsed[path] = result
+            if result[1] is not None:
+                self.cache.put(key, result)
+
+        all_enum_times = []
+        all_transfer_data = defaultdict(list)
+        for path in files:
+            e_time, t_data = parsed[path]
+            if e_time:
+                all_enum_times.append(e_time)
+            for length, times in (t_data or {}).items():
+                all_transfer_data[length].extend(times)
+        return all_enum_times, all_transfer_data
+
+    @staticmethod
+    def _payload_features(features):
+        enum_times = [float(v) for v in features.get("enum_times") or []]
+        transfer_data = defaultdict(list)
+        for ep, times in (features.get("transfers") or {}).items():
+            transfer_data[_endpoint_key(ep)].extend(float(v) for v in times)
+        return enum_times, transfer_data
+
+    # ==================== 认证 ====================
+
+    def authenticate(self, payload):
+        """
+        执行一次认证
+
+        返回:
+        - dict: {"passed", "match_id", "score", "threshold", "device_id", "db_version",
+                 "fingerprint", "details": {device_id: 逐项得分}, "timing": {"parse_ms", "score_ms"}}
+        """
+        with self._count_lock:
+            self.requests += 1
+        threshold = float(payload.get("threshold", self.threshold))
+        device_id = payload.get("device_id")
+
+        t0 = time.perf_counter()
+        if "features" in payload:
+            files = []
+            all_enum_times, all_transfer_data = self._payload_features(payload["features"])
+        else:
+            files = []
+            try:
+                files = self._probe_files(payload)
+                all_enum_times, all_transfer_data = self.extract(files)
+            except ValueError as e:
+                self._reject(files, device_id, threshold, str(e))
+                raise
+        t_parse = time.perf_counter()
+
+        fingerprint = Authenticate.build_auth_fingerprint(all_enum_times, all_transfer_data, verbose=False)
+        if not fingerprint["enumeration"] and not fingerprint["transfers"]:
+            self._reject(files, device_id, threshold, "未能提取到任何有效特征")
+            raise ValueError("未能提取到任何有效特征")
+        version = self.sync()
+        error = None
+        with self._matrix() as matrix:
+            if matrix is None or not matrix.device_ids:
+                error = "数据库为空"
+            elif device_id and device_id not in matrix.device_ids:
+                error = "设备不在数据库中"
+            passed, match_id, score, details = SharedFingerprint.match_with_matrix(
+                fingerprint, matrix, device_id=device_id, threshold=threshold)
+        t_score = time.perf_counter()
+        Metrics.record_auth("server", passed, t_score - t0)
+
+        if error is not None:
+            self._reject(files, device_id, threshold, error)
+        elif self.audit is not None:
+            self.audit.record([os.path.basename(f) for f in files], device_id, match_id, score,
+                              threshold, passed, details)
+        return {"passed": bool(passed), "match_id": match_id, "score": score, "threshold": threshold,
+                "device_id": device_id, "db_version": version, "fingerprint": fingerprint,
+                "details": details,
+                "timing": {"parse_ms": (t_parse - t0) * 1000, "score_ms": (t_score - t_parse) * 1000}}
+
+    def _reject(self, files, device_id, threshold, error):
+        """ 无法完成比对的请求也写入审计记录 """
+        if self.audit is not None:
+            self.audit.record_rejection([os.path.basename(f) for f in files], device_id, threshold, error)
+
+    def count_error(self):
+        with self._count_lock:
+            self.errors += 1
+        Metrics.record_auth("server", None)
+
+    def health(self):
+        snap = self.store.current()
+        return {"status": "ok", "uptime": time.time() - self.started, "db_file": self.db_file,
+                "db_version": self._publisher.version, "devices": len(snap), "workers": self.workers,
+                "requests": self.requests, "errors": self.errors, "cache": self.cache.stats()}
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+        with self._readers_lock:
+            for reader in self._idle_readers:
+                reader.close()
+            self._idle_readers.clear()
+        self._publisher.close()
+        if self.audit is not None:
+            self.audit.close()
+
+
+# ==================== 传输层 ====================
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "USBAuth/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def address_string(self):
+        # Unix socket 的 client_address 为空字符串
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            print(f"[-] {self.address_string()} {fmt % args}")
+
+    def _reply_text(self, status, text, content_type):
+        data = text.encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _reply(self, status, body):
+        self._reply_text(status, json.dumps(body, ensure_ascii=False), "application/json; charset=utf-8")
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._reply(200, self.server.service.health())
+        elif self.path == "/metrics":
+            self._reply_text(200, Metrics.REGISTRY.expose(), Metrics.CONTENT_TYPE)
+        else:
+            self._reply(404, {"error": f"未知路径: {self.path}"})
+
+    def do_POST(self):
+        if self.path != "/auth":
+            self._reply(404, {"error": f"未知路径: {self.path}"})
+            return
+        service = self.server.service
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            if length > MAX_BODY:
+                raise ValueError(f"请求体过大: {length} 字节")
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(payload, dict):
+                raise ValueError("请求体必须是 JSON 对象")
+            self._reply(200, service.authenticate(payload))
+        except ValueError as e:  # 包括 JSONDecodeError
+            service.count_error()
+            self._reply(400, {"error": str(e)})
+        except Exception as e:
+            service.count_error()
+            print(f"[错误] 认证请求处理失败: {e}")
+            self._reply(500, {"error": str(e)})
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT, unix_socket=None, verbose=False):
+    """
+    创建 HTTP 服务（尚未开始监听循环，调用 serve_forever() 启动）
+
+    参数:
+    - unix_socket: 不为 None 时监听该 Unix socket 路径，否则监听 host:port
+    """
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.unlink(unix_socket)  # 上次异常退出遗留的 socket 文件
+        server = _UnixHTTPServer(unix_socket, _Handler)
+    else:
+        server = ThreadingHTTPServer((host, port), _Handler)
+        server.daemon_threads = True
+    server.service = service
+    server.verbose = verbose
+    return server
+
+
+def serve(db_file, host=DEFAULT_HOST, port=DEFAULT_PORT, unix_socket=None, workers=None, threshold=70.0,
+          audit_db=None, cache_size=256, verbose=False):
+    """ 启动认证服务并阻塞运行，Ctrl+C 退出 """
+    service = AuthService(db_file, workers=workers, threshold=threshold, audit_db=audit_db, cache_size=cache_size)
+    server = make_server(service, host, port, unix_socket, verbose)
+    where = unix_socket or f"http://{host}:{server.server_address[1]}"
+    print(f"[-] 认证服务监听 {where} (Ctrl+C 退出)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n[-] 正在停止认证服务...")
+    finally:
+        server.server_close()
+        if unix_socket and os.path.exists(unix_socket):
+            os.unlink(unix_socket)
+        service.close()
+
+
+# ==================== 客户端 ====================
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout):
+        super().__init__("localhost", timeout=timeout)
+        self._path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self._path)
+
+
+def request(address, path="/auth", payload=None, timeout=120):
+    """
+    向认证服务发送请求
+
+    参数:
+    - address: "host:port"，或 Unix socket 路径（含 '/' 的地址）
+    - payload: None 时发送 GET，否则 POST JSON
+
+    返回:
+    - (HTTP 状态码, 响应 JSON)；非 JSON 响应（如 /metrics）返回文本
+    """
+    if "/" in address:
+        conn = _UnixHTTPConnection(address, timeout)
+    else:
+        host, _, port = address.rpartition(":")
+        conn = http.client.HTTPConnection(host or DEFAULT_HOST, int(port), timeout=timeout)
+    try:
+        if payload is None:
+            conn.request("GET", path)
+        else:
+            conn.request("POST", path, body=json.dumps(payload).encode('utf-8'),
+                         headers={"Content-Type": "application/json"})
+        response = conn.getresponse()
+        body = response.read()
+        if not response.getheader("Content-Type", "").startswith("application/json"):
+            return response.status, body.decode('utf-8')
+        return response.status, json.loads(body or b"{}")
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="常驻 USB 指纹认证服务")
+    parser.add_argument("db_file", help="指纹数据库")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix", help="监听 Unix socket 路径（代替 TCP 端口）")
+    parser.add_argument("--workers", type=int, help="解析进程数（默认全部 CPU 核心）")
+    parser.add_argument("--threshold", type=float, default=70.0, help="默认认证阈值")
+    parser.add_argument("--audit-db", help="审计日志 SQLite 路径")
+    parser.add_argument("--cache-size", type=int, default=256, help="内存特征缓存的文件数")
+    parser.add_argument("--verbose", action="store_true", help="打印每个请求")
+    args = parser.parse_args(argv)
+    serve(args.db_file, args.host, args.port, args.unix, args.workers, args.threshold,
+          args.audit_db, args.cache_size, args.verbose)
+
+
+if __name__ == "__main__":
+    main()
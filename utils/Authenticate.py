@@ -1,7 +1,7 @@
-import json
 import os
+import time
 import numpy as np
-from utils import FeatureExtractor
+from utils import FeatureExtractor, FingerprintDB, Metrics, Profiler, Tracing
 from collections import defaultdict
 
 
@@ -68,7 +68,17 @@ def calculate_similarity(feature1, feature2):
     return similarity
 
 
-def authenticate_device(auth_folder, db_file, device_id=None, threshold=70.0):
+def _reject(error, probe_files, device_id, threshold, audit_log):
+    """ 认证无法完成：输出原因、计入指标，并写入审计记录 """
+    print(f"[错误] {error}")
+    Metrics.record_auth("local", None)
+    if audit_log is not None:
+        audit_log.record_rejection(probe_files, device_id, threshold, error)
+    return False, None, 0.0
+
+
+@Tracing.traced("authenticate", "auth")
+def authenticate_device(auth_folder, db_file, device_id=None, threshold=70.0, audit_log=None):
     """
     [接口函数] 执行设备认证流程
     
@@ -77,31 +87,33 @@ def authenticate_device(auth_folder, db_file, device_id=None, threshold=70.0):
     - db_file: 指纹数据库文件路径
     - device_id: 要验证的设备ID（None则与所有已注册设备对比）
     - threshold: 相似度阈值（0-100），超过此值认为匹配成功
+    - audit_log: AuditLog 实例，不为 None 时记录本次判定（包括无法完成比对的拒绝）
     
     返回:
     - tuple: (是否通过, 匹配的设备ID, 相似度分数)
     """
     print(f"\n>>> 开始设备认证流程 ...")
+    t0 = time.perf_counter()
     
     # 1. 检查验证数据文件
     if not os.path.exists(auth_folder):
-        print(f"[错误] 找不到验证数据文件夹: {auth_folder}")
-        return False, None, 0.0
+        return _reject(f"找不到验证数据文件夹: {auth_folder}", [], device_id, threshold, audit_log)
     
-    files = [f for f in os.listdir(auth_folder) if f.endswith(".pcapng")]
+    # 包括原始 pcapng 已被保留策略删除、仅剩特征缓存的样本
+    files = FeatureExtractor.list_samples(auth_folder)
     if not files:
-        print(f"[错误] {auth_folder} 中没有 pcapng 文件。")
-        return False, None, 0.0
+        return _reject(f"{auth_folder} 中没有 pcapng 文件", [], device_id, threshold, audit_log)
     
     print(f"[-] 正在分析验证样本 ({len(files)} 个文件)...")
     
     # 2. 提取验证样本的特征
+    Tracing.phase("extract", files=len(files))
     all_enum_times = []
     all_transfer_data = defaultdict(list)
     
     for f in files:
         path = os.path.join(auth_folder, f)
-        e_time, t_data = FeatureExtractor.process_pcap_file(path)
+        e_time, t_data = FeatureExtractor.extract_features(path)
         
         if e_time:
             all_enum_times.append(e_time)
@@ -111,49 +123,95 @@ def authenticate_device(auth_folder, db_file, device_id=None, threshold=70.0):
                 all_transfer_data[length].extend(times)
     
     # 3. 构建验证指纹
-    auth_fingerprint = {}
+    Tracing.phase("stats")
+    auth_fingerprint = build_auth_fingerprint(all_enum_times, all_transfer_data)
+    
+    if not auth_fingerprint["enumeration"] and not auth_fingerprint["transfers"]:
+        return _reject("未能提取到任何有效特征", files, device_id, threshold, audit_log)
     
+    # 4. 获取指纹数据库快照 (只读，注册写入期间也不会读到半成品)
+    Tracing.phase("db_load")
+    if not os.path.exists(db_file):
+        return _reject(f"数据库文件不存在: {db_file}", files, device_id, threshold, audit_log)
+
+    with FingerprintDB.get_store(db_file).snapshot() as db:
+        if not db:
+            return _reject("数据库为空，请先注册设备", files, device_id, threshold, audit_log)
+        if device_id and device_id not in db:
+            return _reject(f"设备 '{device_id}' 不在数据库中", files, device_id, threshold, audit_log)
+
+        Tracing.phase("score", devices=len(db))
+        passed, best_match_id, best_score, details = match_fingerprint(
+            auth_fingerprint, db, device_id=device_id, threshold=threshold
+        )
+        Tracing.phase(None)
+
+    Metrics.record_auth("local", passed, time.perf_counter() - t0)
+    Tracing.instant("verdict", passed=bool(passed), match_id=best_match_id, score=float(best_score))
+    if audit_log is not None:
+        Tracing.phase("audit")
+        audit_log.record(files, device_id, best_match_id, best_score, threshold, passed, details)
+    return passed, best_match_id, best_score
+
+
+@Profiler.timed("stats")
+def build_auth_fingerprint(all_enum_times, all_transfer_data, verbose=True):
+    """
+    由验证样本构建验证指纹（枚举时间 + 样本数最多的 3 个 endpoint）
+
+    参数:
+    - all_enum_times: 枚举时间样本列表
+    - all_transfer_data: {endpoint: [包间隔, ...]}
+    - verbose: 是否打印各项特征
+
+    返回:
+    - dict: {"enumeration": stats 或 None, "transfers": {endpoint: stats}}
+    """
+    auth_fingerprint = {}
+
     # 枚举指纹
     enum_stats = FeatureExtractor.calculate_stats(all_enum_times)
     if enum_stats:
         auth_fingerprint["enumeration"] = enum_stats
-        print(f"    [√] 验证样本枚举特征: 均值 {enum_stats['mean']:.4f}s")
+        if verbose:
+            print(f"    [√] 验证样本枚举特征: 均值 {enum_stats['mean']:.4f}s")
     else:
-        print("    [!] 警告: 未提取到枚举时间特征。")
+        if verbose:
+            print("    [!] 警告: 未提取到枚举时间特征。")
         auth_fingerprint["enumeration"] = None
-    
+
     # 传输指纹 (取 Top 3)
     auth_fingerprint["transfers"] = {}
     sorted_lens = sorted(all_transfer_data.items(), key=lambda x: len(x[1]), reverse=True)[:3]
-    
+
     for length, times in sorted_lens:
         stats = FeatureExtractor.calculate_stats(times)
         if stats:
             auth_fingerprint["transfers"][str(length)] = stats
-            print(f"    [√] 验证样本传输特征 (Endpoint={length}): 均值 {stats['mean']:.6f}s")
-    
-    if not auth_fingerprint["enumeration"] and not auth_fingerprint["transfers"]:
-        print("[错误] 未能提取到任何有效特征！")
-        return False, None, 0.0
-    
-    # 4. 加载指纹数据库
-    if not os.path.exists(db_file):
-        print(f"[错误] 数据库文件不存在: {db_file}")
-        return False, None, 0.0
-    
-    try:
-        with open(db_file, 'r') as f:
-            db = json.load(f)
-    except Exception as e:
-        print(f"[错误] 读取数据库失败: {e}")
-        return False, None, 0.0
-    
-    if not db:
-        print("[错误] 数据库为空，请先注册设备。")
-        return False, None, 0.0
-    
-    # 5. 执行匹配
-    print(f"\n[-] 正在与数据库中的设备指纹进行匹配 (阈值: {threshold})...")
+            if verbose:
+                print(f"    [√] 验证样本传输特征 (Endpoint={length}): 均值 {stats['mean']:.6f}s")
+    return auth_fingerprint
+
+
+@Profiler.timed("score")
+def match_fingerprint(auth_fingerprint, db, device_id=None, threshold=70.0, verbose=True):
+    """
+    将验证指纹与数据库（快照）中的设备指纹逐一比对
+
+    参数:
+    - auth_fingerprint: 验证样本指纹 {"enumeration": ..., "transfers": {...}}
+    - db: 数据库映射 {device_id: 条目}，可以是 FingerprintSnapshot
+    - device_id: 指定设备（一对一），None 表示一对多
+    - threshold: 相似度阈值
+    - verbose: 是否打印逐设备比对过程与判定结果（错误信息始终输出）
+
+    返回:
+    - tuple: (是否通过, 最佳匹配设备ID, 相似度分数, 各设备比对详情)
+    """
+    log = print if verbose else (lambda *args, **kwargs: None)
+
+    # 1. 执行匹配
+    log(f"\n[-] 正在与数据库中的设备指纹进行匹配 (阈值: {threshold})...")
     
     best_match_id = None
     best_score = 0.0
@@ -163,14 +221,15 @@ def authenticate_device(auth_folder, db_file, device_id=None, threshold=70.0):
     if device_id:
         if device_id not in db:
             print(f"[错误] 设备 '{device_id}' 不在数据库中。")
-            return False, None, 0.0
+            return False, None, 0.0, {}
         compare_list = {device_id: db[device_id]}
     else:
         compare_list = db
+    Profiler.current().count("db_devices", len(compare_list))
     
     # 逐个设备比对
     for dev_id, dev_data in compare_list.items():
-        print(f"\n  检查设备: {dev_id}")
+        log(f"\n  检查设备: {dev_id}")
         registered_fp = dev_data.get("fingerprint", {})
         
         # 计算枚举特征相似度
@@ -180,10 +239,11 @@ def authenticate_device(auth_folder, db_file, device_id=None, threshold=70.0):
                 auth_fingerprint["enumeration"],
                 registered_fp["enumeration"]
             )
-            print(f"    - 枚举特征相似度: {enum_sim:.1f}%")
+            log(f"    - 枚举特征相似度: {enum_sim:.1f}%")
         
         # 计算传输特征相似度
         transfer_sims = []
+        transfer_by_endpoint = {}
         auth_transfers = auth_fingerprint.get("transfers", {})
         reg_transfers = registered_fp.get("transfers", {})
         
@@ -194,7 +254,8 @@ def authenticate_device(auth_folder, db_file, device_id=None, threshold=70.0):
             for ep in common_endpoints:
                 sim = calculate_similarity(auth_transfers[ep], reg_transfers[ep])
                 transfer_sims.append(sim)
-                print(f"    - 传输特征 Endpoint {ep} 相似度: {sim:.1f}%")
+                transfer_by_endpoint[ep] = sim
+                log(f"    - 传输特征 Endpoint {ep} 相似度: {sim:.1f}%")
         
         # 计算综合相似度
         # 权重: 枚举特征30%，传输特征70%
@@ -207,11 +268,12 @@ def authenticate_device(auth_folder, db_file, device_id=None, threshold=70.0):
         else:
             overall_sim = 0.0
         
-        print(f"    => 综合相似度: {overall_sim:.1f}%")
+        log(f"    => 综合相似度: {overall_sim:.1f}%")
         
         match_details[dev_id] = {
             "enum_similarity": enum_sim,
             "transfer_similarities": transfer_sims,
+            "transfer_by_endpoint": transfer_by_endpoint,
             "overall_similarity": overall_sim
         }
         
@@ -220,24 +282,24 @@ def authenticate_device(auth_folder, db_file, device_id=None, threshold=70.0):
             best_score = overall_sim
             best_match_id = dev_id
     
-    # 6. 判定结果
-    print("\n" + "=" * 60)
+    # 2. 判定结果
+    log("\n" + "=" * 60)
     if best_score >= threshold:
-        print(f"[✓] 认证通过！")
-        print(f"    匹配设备: {best_match_id}")
-        print(f"    相似度: {best_score:.1f}%")
-        print(f"    注册时间: {db[best_match_id].get('reg_time', 'N/A')}")
-        print("=" * 60)
-        return True, best_match_id, best_score
+        log(f"[✓] 认证通过！")
+        log(f"    匹配设备: {best_match_id}")
+        log(f"    相似度: {best_score:.1f}%")
+        log(f"    注册时间: {db[best_match_id].get('reg_time', 'N/A')}")
+        log("=" * 60)
+        return True, best_match_id, best_score, match_details
     else:
-        print(f"[✗] 认证失败！")
+        log(f"[✗] 认证失败！")
         if best_match_id:
-            print(f"    最接近的设备: {best_match_id}")
-            print(f"    相似度: {best_score:.1f}% (未达到阈值 {threshold}%)")
+            log(f"    最接近的设备: {best_match_id}")
+            log(f"    相似度: {best_score:.1f}% (未达到阈值 {threshold}%)")
         else:
-            print(f"    未找到匹配的设备")
-        print("=" * 60)
-        return False, best_match_id, best_score
+            log(f"    未找到匹配的设备")
+        log("=" * 60)
+        return False, best_match_id, best_score, match_details
 
 
 if __name__ == "__main__":
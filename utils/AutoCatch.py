@@ -1,18 +1,75 @@
+import contextlib
 import os
+import shutil
 import time
 import subprocess
 import sys
+from utils import Convergence, FeatureExtractor, LiveExtractor, PcapFile, Readiness, Tracing, Usbmon, Workload
 
+IS_WINDOWS = sys.platform == 'win32'
 
+# 平台默认值：Windows 使用 USBPcap，Linux 使用 usbmon (usbmon0 = 所有总线)
+if IS_WINDOWS:
+    DEFAULT_TSHARK_PATH = r"C:\Program Files\Wireshark\tshark.exe"
+    DEFAULT_INTERFACE = "USBPcap3"
+else:
+    DEFAULT_TSHARK_PATH = shutil.which("tshark") or "/usr/bin/tshark"
+    DEFAULT_INTERFACE = "usbmon0"
+
+
+def _wait_linux_target(known_devices, mount_point, timeout, usb_port=None, wait_device=None):
+    """
+    Linux: 识别新插入的 USB 设备 (bus/address) 并等待其挂载
+
+    参数:
+    - usb_port: sysfs 物理端口名 (如 "1-2")，多端口同时采集时只认该端口上的新设备
+    - wait_device: 可选 func(known_devices, timeout, port) -> UsbDevice 或 None，
+                   替代默认的 Usbmon.wait_for_new_device（如 Hotplug 守护进程的内核事件）
+
+    返回:
+    - (挂载点, UsbDevice)，超时时挂载点为 None
+    """
+    start = time.monotonic()
+    wait_device = wait_device or (lambda known, t, port: Usbmon.wait_for_new_device(known, timeout=t, port=port))
+    device = wait_device(known_devices, timeout, usb_port)
+    if device is None:
+        return None, None
+    print(f"        检测到新设备: Bus {device.bus:03d} Device {device.devnum:03d} "
+          f"ID {device.vendor_id}:{device.product_id} {device.product}")
+    Tracing.phase("mount_wait", device=f"{device.bus}-{device.devnum}")
+
+    remaining = max(timeout - (time.monotonic() - start), 0)
+    if mount_point:
+        if Readiness.wait_until(lambda: os.path.ismount(mount_point), timeout=remaining) is None:
+            return None, device
+        return mount_point, device
+    return Usbmon.wait_for_mount(device, timeout=remaining), device
+
+
+@Tracing.traced("capture", "capture")
 def run_single_capture(
-        tshark_path=r"C:\Program Files\Wireshark\tshark.exe",
-        interface="USBPcap3",
+        tshark_path=DEFAULT_TSHARK_PATH,
+        interface=DEFAULT_INTERFACE,
         output_base_folder="devices",
         sub_folder="enroll",  # 子文件夹：enroll 或 auth
         file_name="capture.pcapng",
         target_size_mb=50,
         drive_letter="E",
-        confirm_callback=None  # GUI模式回调函数
+        confirm_callback=None,  # GUI模式回调函数
+        live=False,  # 实时模式：抓包同时流式提取特征
+        startup_timeout=15.0,  # 等待 tshark 就绪的最长时间（秒）
+        insert_timeout=60.0,  # 等待 U 盘插入并挂载的最长时间（秒）
+        quiet_period=0.5,  # 包流静默多久视为传输结束（秒）
+        mount_point=None,  # Linux: U 盘挂载点，None 则按新插入设备自动查找
+        backend="tshark",  # 抓包后端: "tshark" 或 "usbmon" (Linux 直接读取 /dev/usbmonN)
+        header_only=False,  # 只保存 USB 包头 (快照长度 64 字节)
+        device_filter=False,  # 只保留被测设备 (bus/address) 的包
+        workload=None,  # I/O 负载: None (legacy) / 预置名称 / dict，见 Workload.PRESETS
+        usb_port=None,  # Linux: 只识别该物理端口 (sysfs 名称，如 "1-2") 上插入的设备
+        io_slot=None,  # 可选上下文管理器，I/O 测试期间持有（多端口并发采集的资源限制）
+        adaptive=None,  # 自适应采集长度: None/False 关闭 / True 默认条件 / dict，见 Convergence.AdaptiveSpec
+        wait_device=None,  # Linux: 自定义新设备识别 func(known, timeout, port)，见 _wait_linux_target
+        cycles=1  # 同一次抓包中的插拔次数，>1 时结束后按插拔切分为多个样本
 ):
     """
     执行【单次】抓包与USB流量读写测试（包含枚举阶段捕获）。
@@ -22,11 +79,28 @@ def run_single_capture(
     - file_name: 保存的文件名
     - confirm_callback: GUI模式回调函数 func(title, message) -> bool
                         返回True继续，False取消。None则使用input()
+    - live: 通过管道读取 tshark 逐包输出并实时累积特征，停止抓包时直接写入特征缓存，
+            后续注册/认证无需再从磁盘解析该 pcapng
+    - startup_timeout / insert_timeout / quiet_period: 事件驱动等待的超时与静默判据，
+            tshark 输出 "Capturing on" 即开始、盘符出现即开始读写、包流静默即停止
+    - mount_point / backend: Linux 闸机使用；interface 为 usbmonN，
+            设备按新出现的 bus/address 识别，I/O 测试在其挂载点上进行
+    - header_only / device_filter: 特征只用到时间戳与 USB 包头，丢弃 50MB 的数据负载
+            与根集线器上其他设备的流量，采集文件与解析时间可缩小几个数量级。
+            被测设备在 Linux 下由 sysfs 识别，否则取 Bulk 流量最多的设备
+    - workload: I/O 测试负载；legacy 为 target_size_mb 大小、1MB 顺序写、每块 fsync
+    - usb_port / io_slot: 供 MultiCapture 多端口并发采集使用
+    - wait_device: 供 Hotplug 无人值守守护进程使用，由内核热插拔事件识别新设备
+    - cycles: 抓包只启动一次，期间按提示拔插 U 盘 cycles 次，结束后由
+            FeatureExtractor.split_session_capture 切分为 <文件名>_1.pcapng ... 等样本。
+            每次插拔设备地址都会变化，因此该模式不做按设备过滤，也不使用自适应长度
+    - adaptive: 负载循环执行，实时统计中各主要 endpoint 的均值/标准差置信区间足够窄
+            或达到最长时间时停止 I/O 测试（需要实时提取，开启时自动启用 live）
     """
 
     # --- 0. 环境检查与路径构建 ---
-    if not os.path.exists(tshark_path):
-        print(f"[严重错误] 找不到 tshark.exe: {tshark_path}")
+    if backend == "tshark" and not os.path.exists(tshark_path):
+        print(f"[严重错误] 找不到 tshark: {tshark_path}")
         return False
 
     # 构建完整路径: devices/enroll/capture_1.pcapng
@@ -39,24 +113,33 @@ def run_single_capture(
         print(f"[-] 正在创建目录: {target_dir}")
         os.makedirs(target_dir, exist_ok=True)
 
-    # 清理旧文件
-    if os.path.exists(full_save_path):
-        try:
-            os.remove(full_save_path)
-        except:
-            pass
+    # 清理旧文件（连同旧的特征缓存，避免采集失败时误用上一次的特征）
+    for old_path in (full_save_path, FeatureExtractor.feature_cache_path(full_save_path)):
+        if os.path.exists(old_path):
+            try:
+                os.remove(old_path)
+            except:
+                pass
 
-    # 确定盘符
-    if drive_letter is None:
+    adaptive_spec = Convergence.resolve(adaptive)
+    if cycles > 1:
+        device_filter = False
+        adaptive_spec = None
+    if adaptive_spec is not None and not live:
+        print("[-] 自适应采集依赖实时特征提取，已自动开启 live 模式。")
+        live = True
+
+    # 确定盘符 (Linux 下可由挂载点自动识别)
+    use_mount = not IS_WINDOWS or mount_point is not None
+    if not use_mount and drive_letter is None:
         print("[错误] 未指定盘符。")
         return False
 
-    usb_file_path = f"{drive_letter}:\\traffic_test_temp.dat"
-
     # ================= 采集流程开始 =================
     print(f"\n--- 开始采集任务: {sub_folder}/{file_name} ---")
 
     # 1. 强制拔出检查
+    Tracing.phase("confirm_unplugged", file=file_name)
     print("Step 1: 请确保 U 盘【已拔出】。")
     if confirm_callback:
         # GUI模式：使用回调函数
@@ -67,56 +150,153 @@ def run_single_capture(
         # CLI模式：使用input()
         input("        确认拔出后，按回车键开始抓包...")
 
+    # 记录插入前的设备，用于识别新设备的 bus/address
+    known_devices = Usbmon.list_usb_devices() if use_mount else {}
+
     # 2. 启动 Tshark (捕获枚举)
+    Tracing.phase("tshark_startup", interface=interface, backend=backend)
     print(f"Step 2: 启动监听接口 {interface}...")
-    capture_cmd = [tshark_path, '-i', interface, '-F', 'pcapng', '-w', full_save_path]
-    proc = subprocess.Popen(capture_cmd, stderr=subprocess.PIPE)
+    snap_args = ['-s', str(PcapFile.HEADER_SNAPLEN)] if header_only else []
+    live_extractor = None
+    device_gate = None  # 负责按设备过滤的实时组件
+    if backend == "usbmon":
+        proc = Usbmon.UsbmonCapture(
+            Usbmon.bus_of_interface(interface),
+            snaplen=0 if header_only else Usbmon.DEFAULT_SNAPLEN,
+            live=live,
+            device_filter=device_filter
+        ).start(full_save_path)
+        stderr_watcher = proc
+        traffic = proc.activity
+        device_gate = proc
+        if live:
+            live_extractor = proc
+    elif live:
+        live_extractor = LiveExtractor.LiveExtractor(device_filter=device_filter)
+        proc = live_extractor.start_capture(tshark_path, interface, full_save_path, extra_args=snap_args)
+        stderr_watcher = live_extractor.stderr_watcher
+        traffic = live_extractor.activity
+        device_gate = live_extractor
+    else:
+        capture_cmd = [tshark_path, '-i', interface] + snap_args + ['-F', 'pcapng', '-w', full_save_path]
+        proc = subprocess.Popen(capture_cmd, stderr=subprocess.PIPE)
+        stderr_watcher = Readiness.StderrWatcher(proc.stderr)
+        traffic = Readiness.FileGrowthMonitor(full_save_path)
 
-    time.sleep(2)  # 等待引擎启动
-    if proc.poll() is not None:
-        print("[错误] Tshark 进程启动失败！")
+    # 等待引擎输出 "Capturing on"，而不是固定等待
+    t0 = time.monotonic()
+    if not stderr_watcher.wait_ready(proc, timeout=startup_timeout):
+        print(f"[错误] 抓包引擎启动失败 ({interface})！")
+        if stderr_watcher.tail():
+            print(f"        {stderr_watcher.tail()}")
+        if proc.poll() is None:
+            proc.kill()
         return False
+    print(f"        抓包引擎就绪 ({time.monotonic() - t0:.2f}s)")
 
-    # 3. 提示插入
-    print(f"Step 3: >>> 请现在插入 U 盘 ({drive_letter}盘) <<<")
-    print("        正在捕获枚举数据 (等待 10 秒)...")
-    time.sleep(10)
+    for cycle in range(1, cycles + 1):
+        # 多次插拔：等待上一次的设备拔出，再重新记录已有设备
+        if cycle > 1:
+            Tracing.phase("remove_wait", cycle=cycle)
+            print(f"\n=== 第 {cycle - 1}/{cycles} 次完成，请【拔出】U 盘 (抓包继续进行) ===")
+            if use_mount:
+                removed = lambda: (device.bus, device.devnum) not in Usbmon.list_usb_devices()
+            else:
+                removed = lambda: not os.path.exists(target_root)
+            if Readiness.wait_until(removed, timeout=insert_timeout, subsystem='usb') is None:
+                print("[错误] 超时未检测到 U 盘拔出。")
+                proc.terminate()
+                return False
+            known_devices = Usbmon.list_usb_devices() if use_mount else {}
 
-    # 4. 检测盘符上线
-    if not os.path.exists(f"{drive_letter}:\\"):
-        print(f"[错误] 超时未检测到盘符 {drive_letter}:，请确认U盘插入正确。")
-        proc.terminate()
-        return False
+        # 3. 提示插入
+        Tracing.phase("insert_wait", cycle=cycle)
+        round_text = f" (第 {cycle}/{cycles} 次)" if cycles > 1 else ""
+        if use_mount:
+            print(f"Step 3: >>> 请现在插入 U 盘{round_text} (挂载点: {mount_point or '自动识别'}) <<<")
+            print(f"        正在捕获枚举数据 (等待设备挂载，最长 {insert_timeout:.0f} 秒)...")
+        else:
+            print(f"Step 3: >>> 请现在插入 U 盘{round_text} ({drive_letter}盘) <<<")
+            print(f"        正在捕获枚举数据 (等待盘符出现，最长 {insert_timeout:.0f} 秒)...")
 
-    try:
-        # 5. 执行读写 (捕获传输特征)
-        print(f"Step 4: 正在进行 I/O 测试 ({target_size_mb}MB)...", end='')
-
-        chunk_size = 1024 * 1024
-        chunk_data = os.urandom(chunk_size)
-
-        # 写入
-        with open(usb_file_path, 'wb') as f:
-            for mb in range(target_size_mb):
-                f.write(chunk_data)
-                f.flush()
-                os.fsync(f.fileno())
-
-        # 稍作停顿
-        time.sleep(0.5)
-
-        # 删除
-        if os.path.exists(usb_file_path):
-            os.remove(usb_file_path)
-        print(" 完成！")
-        time.sleep(2)  # 确保删除指令被抓到
-
-    except Exception as e:
-        print(f"\n[异常] I/O 操作出错: {e}")
-        proc.kill()
-        return False
+        # 4. 检测盘符 / 挂载点上线
+        t0 = time.monotonic()
+        device = None
+        if use_mount:
+            target_root, device = _wait_linux_target(known_devices, mount_point, insert_timeout, usb_port, wait_device)
+            if target_root is None:
+                reason = "新 USB 设备" if device is None else "设备挂载"
+                print(f"[错误] 超时未检测到{reason}，请确认U盘插入正确并已自动挂载。")
+                proc.terminate()
+                return False
+        else:
+            target_root = f"{drive_letter}:\\"
+            if Readiness.wait_for_path(target_root, timeout=insert_timeout) is None:
+                print(f"[错误] 超时未检测到盘符 {drive_letter}:，请确认U盘插入正确。")
+                proc.terminate()
+                return False
+        print(f"        检测到 {target_root} ({time.monotonic() - t0:.2f}s)")
+        usb_file_path = os.path.join(target_root, Workload.TEMP_FILE_NAME)
+
+        # 已知 bus/address 时立即开始按设备过滤
+        target_device = (device.bus, device.devnum) if device is not None else None
+        if device_filter and device_gate is not None and target_device is not None:
+            device_gate.set_device(target_device)
+
+        try:
+            # 5. 执行读写 (捕获传输特征)
+            spec = Workload.resolve(workload, total_mb=target_size_mb)
+            Tracing.phase("io_workload", workload=spec.describe())
+            monitor = None
+            with io_slot if io_slot is not None else contextlib.nullcontext():
+                if adaptive_spec is None:
+                    print(f"Step 4: 正在进行 I/O 测试 ({spec.describe()})...", end='')
+                    io_stats = Workload.run_workload(target_root, spec, keep_file=True)
+                else:
+                    print(f"Step 4: 正在进行自适应 I/O 测试 ({spec.describe()}; {adaptive_spec.describe()})...", end='')
+                    io_start = time.time()
+
+                    def identify_early(elapsed, report):
+                        # 设备未识别时暂存的包不进入统计：I/O 开始后按已有 Bulk 流量提前识别
+                        if device_filter and target_device is None and not report["samples"] and elapsed >= 1.0:
+                            device_gate.set_device(None, window=(io_start, time.time()), required=False)
+
+                    monitor = Convergence.ConvergenceMonitor(live_extractor.live_stats, adaptive_spec,
+                                                             on_check=identify_early).start()
+                    try:
+                        io_stats = Workload.run_workload(target_root, spec, stop_event=monitor.stop_event,
+                                                         keep_file=True, repeat=True)
+                    finally:
+                        monitor.stop()
+            io_window = (io_stats["start"], io_stats["end"])
+            if io_stats["errors"]:
+                raise OSError(io_stats["errors"][0])
+
+            # 等待写回流量结束
+            Tracing.phase("traffic_quiet")
+            traffic.wait_quiet(quiet_period=quiet_period, timeout=5.0)
+
+            # 删除
+            if os.path.exists(usb_file_path):
+                os.remove(usb_file_path)
+            write_mbps, read_mbps = Workload.throughput(io_stats)
+            print(f" 完成！(写 {write_mbps:.1f} MB/s" + (f", 读 {read_mbps:.1f} MB/s)" if io_stats["bytes_read"] else ")"))
+            if monitor is not None:
+                print(f"        自适应停止: {monitor.summary()}, 写入 {io_stats['bytes_written'] / Workload.MB:.0f} MB")
+            # 确保删除指令被抓到：包流静默后再停止
+            traffic.wait_quiet(quiet_period=quiet_period, timeout=5.0)
+
+            # 未能从系统识别设备时，由 I/O 测试的 Bulk 流量推断
+            if device_filter and device_gate is not None:
+                target_device = device_gate.set_device(target_device, window=io_window)
+
+        except Exception as e:
+            print(f"\n[异常] I/O 操作出错: {e}")
+            proc.kill()
+            return False
 
     # 6. 停止抓包
+    Tracing.phase("capture_stop")
     print("Step 5: 停止抓包...")
     proc.terminate()
     try:
@@ -124,6 +304,54 @@ def run_single_capture(
     except subprocess.TimeoutExpired:
         proc.kill()
 
+    if live_extractor is not None:
+        Tracing.phase("live_finish")
+        enum_val, transfer_data = live_extractor.finish()
+        if cycles > 1:
+            live_extractor = None  # 实时累加器只记录第一次枚举，多次插拔改由文件切分
+
+    # 7. 压缩采集文件：只保留被测设备的包头（usbmon 后端已在源头过滤，此处统一处理 tshark 的输出）
+    if (header_only or device_filter) and os.path.exists(full_save_path):
+        if not device_filter:
+            compact_device = False
+        elif target_device is not None:
+            compact_device = target_device
+        else:
+            # 实时组件推断失败时已放弃过滤，文件保持一致；否则在文件上推断
+            compact_device = None if device_gate is None else False
+        Tracing.phase("compact")
+        report = PcapFile.compact_capture(full_save_path, device=compact_device, header_only=header_only,
+                                          window=io_window)
+        if report is not None:
+            dev_text = "Bus {:03d} Device {:03d}".format(*report["device"]) if report["device"] else "全部设备"
+            print(f"    [√] 采集文件已压缩 ({dev_text}): {report['packets_in']} -> {report['packets_out']} 包, "
+                  f"{report['bytes_in'] / 1024:.1f} KB -> {report['bytes_out'] / 1024:.1f} KB")
+
+    if live_extractor is not None:
+        Tracing.phase("save_features")
+        if os.path.exists(full_save_path):
+            FeatureExtractor.save_features(full_save_path, enum_val, transfer_data)
+        stats = live_extractor.live_stats()
+        print(f"    [√] 实时特征已就绪: 枚举时间 {enum_val}, "
+              f"{len(stats['transfers'])} 个 endpoint, {live_extractor.accumulator.matched_count} 个传输样本")
+        produced = Workload.yield_report(live_extractor.accumulator, io_stats["start"], io_stats["end"])
+        print(f"    [√] 负载样本产出: {produced['rate']:.0f} 个/秒 "
+              f"(每秒: {', '.join(str(n) for n in produced['per_second'])})")
+
+    # 8. 多次插拔：切分为每次插拔一个样本
+    if cycles > 1 and os.path.exists(full_save_path):
+        name_format = file_name[:-len(FeatureExtractor.PCAP_SUFFIX)] if file_name.endswith(
+            FeatureExtractor.PCAP_SUFFIX) else file_name
+        Tracing.phase("split")
+        paths = FeatureExtractor.split_session_capture(full_save_path, name_format=name_format + "_{}.pcapng")
+        if not paths:
+            print("    [!] 未能从抓包中切分出插拔会话。")
+            return False
+        if len(paths) != cycles:
+            print(f"    [!] 切分出 {len(paths)} 次插拔，与预期的 {cycles} 次不一致，请检查样本。")
+        print(f"    [√] 一次抓包得到 {len(paths)} 个样本: {sub_folder}\\{os.path.basename(paths[0])} ...")
+        return True
+
     # 结果确认
     if os.path.exists(full_save_path):
         f_size = os.path.getsize(full_save_path) / (1024 * 1024)
@@ -136,4 +364,4 @@ def run_single_capture(
 
 if __name__ == "__main__":
     # 默认调试调用
-    run_single_capture(sub_folder="debug_test", drive_letter="E")
\ No newline at end of file
+    run_single_capture(sub_folder="debug_test", drive_letter="E")
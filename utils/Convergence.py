@@ -0,0 +1,197 @@
+"""
+自适应采集长度
+固定 50MB 的 I/O 测试对高速 U 盘过长、对低速 U 盘可能不足。自适应模式下：
+- I/O 负载循环执行，直到被要求停止
+- 后台线程周期性读取实时累加器的在线统计 (FeatureAccumulator.live_stats，Welford 均值/方差)
+- 每个主要 endpoint 的均值与标准差置信区间相对宽度都达到目标时停止；达到最长时间时也停止
+"""
+
+import threading
+import time
+from statistics import NormalDist
+
+
+class AdaptiveSpec:
+    """
+    自适应停止条件
+
+    参数:
+    - mean_width: 均值置信区间的目标相对宽度 (区间全宽 / 均值)
+    - std_width: 标准差置信区间的目标相对宽度 (区间全宽 / 标准差)
+    - confidence: 置信水平
+    - min_samples: 每个主要 endpoint 至少需要的样本数
+    - min_share: 样本占比不低于该值的 endpoint 视为主要 endpoint，其余不参与判定
+    - min_seconds: I/O 测试的最短时间（秒）
+    - max_seconds: I/O 测试的最长时间（秒），未收敛也停止
+    - check_interval: 检查间隔（秒）
+    """
+
+    def __init__(self, mean_width=0.02, std_width=0.10, confidence=0.95, min_samples=300, min_share=0.1,
+                 min_seconds=2.0, max_seconds=30.0, check_interval=0.25):
+        if not 0 < confidence < 1:
+            raise ValueError(f"置信水平须在 (0, 1) 之间: {confidence}")
+        if max_seconds < min_seconds:
+            raise ValueError("max_seconds 不能小于 min_seconds")
+        self.mean_width = mean_width
+        self.std_width = std_width
+        self.confidence = confidence
+        self.min_samples = int(min_samples)
+        self.min_share = min_share
+        self.min_seconds = min_seconds
+        self.max_seconds = max_seconds
+        self.check_interval = check_interval
+
+    @classmethod
+    def from_dict(cls, cfg):
+        return cls(**cfg)
+
+    def to_dict(self):
+        return {"mean_width": self.mean_width, "std_width": self.std_width, "confidence": self.confidence,
+                "min_samples": self.min_samples, "min_share": self.min_share, "min_seconds": self.min_seconds,
+                "max_seconds": self.max_seconds, "check_interval": self.check_interval}
+
+    def describe(self):
+        return (f"均值 CI ≤ {self.mean_width:.0%}, 标准差 CI ≤ {self.std_width:.0%} "
+                f"({self.confidence:.0%}), 最长 {self.max_seconds:.0f}s")
+
+    @property
+    def z(self):
+        return NormalDist().inv_cdf(0.5 + self.confidence / 2)
+
+
+def resolve(adaptive=None):
+    """
+    解析自适应配置
+
+    参数:
+    - adaptive: None/False (关闭) / True (默认条件) / dict / AdaptiveSpec
+
+    返回:
+    - AdaptiveSpec 或 None
+    """
+    if adaptive is None or adaptive is False:
+        return None
+    if isinstance(adaptive, AdaptiveSpec):
+        return adaptive
+    if adaptive is True:
+        return AdaptiveSpec()
+    return AdaptiveSpec.from_dict(adaptive)
+
+
+def interval_widths(stat, z):
+    """
+    单个 endpoint 的置信区间相对宽度
+
+    参数:
+    - stat: live_stats()["transfers"] 中的一项 {"mean", "std", "count"}
+    - z: 正态分位数
+
+    返回:
+    - (均值区间相对宽度, 标准差区间相对宽度)，样本不足时为 inf
+    """
+    n, mean, std = stat["count"], stat["mean"], stat["std"]
+    if n < 2 or mean <= 0:
+        return float("inf"), float("inf")
+    mean_width = 2 * z * std / (n ** 0.5) / mean
+    # 标准差的近似区间: s ± z·s/√(2(n-1))
+    std_width = 2 * z / ((2 * (n - 1)) ** 0.5)
+    return mean_width, std_width
+
+
+def evaluate(stats, spec):
+    """
+    判断在线统计是否已收敛
+
+    参数:
+    - stats: FeatureAccumulator.live_stats() 的返回值
+    - spec: AdaptiveSpec
+
+    返回:
+    - dict: {"converged": bool, "samples": 总样本数,
+             "endpoints": {endpoint: {"count", "mean_width", "std_width", "ok"}}}
+    """
+    transfers = stats["transfers"]
+    total = sum(s["count"] for s in transfers.values())
+    z = spec.z
+    endpoints = {}
+    for key, stat in transfers.items():
+        if not total or stat["count"] / total < spec.min_share:
+            continue
+        mean_width, std_width = interval_widths(stat, z)
+        endpoints[key] = {
+            "count": stat["count"],
+            "mean_width": mean_width,
+            "std_width": std_width,
+            "ok": stat["count"] >= spec.min_samples and mean_width <= spec.mean_width and std_width <= spec.std_width
+        }
+    converged = bool(endpoints) and all(e["ok"] for e in endpoints.values())
+    return {"converged": converged, "samples": total, "endpoints": endpoints}
+
+
+class ConvergenceMonitor:
+    """
+    后台收敛检测：满足停止条件时置位 stop_event (交给 Workload.run_workload)
+
+    用法:
+        monitor = ConvergenceMonitor(extractor.live_stats, spec).start()
+        Workload.run_workload(target, workload, stop_event=monitor.stop_event, repeat=True)
+        monitor.stop()
+        print(monitor.reason, monitor.report)
+    """
+
+    def __init__(self, stats_fn, spec, stop_event=None, on_check=None):
+        """
+        参数:
+        - stats_fn: 无参函数，返回 live_stats() 格式的统计
+        - stop_event: 满足条件时置位的 threading.Event，None 则新建
+        - on_check: 可选回调 func(elapsed, report)，每次检查后调用（进度显示、按需识别设备等）
+        """
+        self.stats_fn = stats_fn
+        self.spec = spec
+        self.stop_event = stop_event or threading.Event()
+        self.on_check = on_check
+        self.reason = None  # "converged" / "timeout" / "stopped"
+        self.report = {"converged": False, "samples": 0, "endpoints": {}}
+        self.elapsed = 0.0
+        self._finished = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._start = time.monotonic()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        spec = self.spec
+        while not self._finished.wait(spec.check_interval):
+            self.elapsed = time.monotonic() - self._start
+            self.report = evaluate(self.stats_fn(), spec)
+            if self.on_check:
+                self.on_check(self.elapsed, self.report)
+            if self.elapsed >= spec.max_seconds:
+                self.reason = "timeout"
+            elif self.elapsed >= spec.min_seconds and self.report["converged"]:
+                self.reason = "converged"
+            else:
+                continue
+            self.stop_event.set()
+            return
+
+    def stop(self):
+        """ 负载结束后调用；未触发停止条件时 reason 记为 "stopped" """
+        self._finished.set()
+        if self._thread is not None:
+            self._thread.join(timeout=max(self.spec.check_interval * 4, 1.0))
+        self.elapsed = time.monotonic() - self._start
+        if self.reason is None:
+            self.reason = "stopped"
+        return self
+
+    def summary(self):
+        """ 单行摘要，如 "已收敛 (3.2s, 1840 个样本, 0x81: 均值 ±1.1%)" """
+        text = {"converged": "已收敛", "timeout": "达到最长时间", "stopped": "负载结束"}[self.reason or "stopped"]
+        parts = [f"{key:#04x}: 均值 ±{e['mean_width'] / 2:.1%}"
+                 for key, e in self.report["endpoints"].items() if e["mean_width"] != float("inf")]
+        detail = f", {', '.join(parts)}" if parts else ""
+        return f"{text} ({self.elapsed:.1f}s, {self.report['samples']} 个样本{detail})"
@@ -1,9 +1,13 @@
 import pyshark
 import numpy as np
 from collections import defaultdict
+import json
 import os
 import sys
 import asyncio
+import threading
+import time
+from utils import Metrics, PcapFile, Profiler, Tracing
 
 # --- [Windows 兼容性修复 1] ---
 # 必须在导入 asyncio 后立即设置策略，解决 TShark 退出码问题
@@ -38,143 +42,816 @@ def calculate_stats(data_list):
     }
 
 
+def transfer_type_name(raw_val):
+    """ 将 transfer_type 字段值 (0x03 / 3 / '0x03') 转换为类型名 """
+    s_val = str(raw_val).lower()
+    # USB 传输类型规范: 0x00=Iso, 0x01=Interrupt, 0x02=Control, 0x03=Bulk
+    if s_val in ['0x03', '0x3', '3']: return 'BULK'
+    if s_val in ['0x02', '0x2', '2']: return 'CONTROL'
+    if s_val in ['0x01', '0x1', '1']: return 'INTERRUPT'
+    if s_val in ['0x00', '0x0', '0']: return 'ISOCHRONOUS'
+    return s_val
+
+
 def get_transfer_type_safe(pkt):
     """ 安全获取 transfer_type """
     if not hasattr(pkt, 'usb'): return None
     try:
-        raw_val = pkt.usb.transfer_type
-        s_val = str(raw_val).lower()
-        # USB 传输类型规范: 0x00=Iso, 0x01=Interrupt, 0x02=Control, 0x03=Bulk
-        if s_val in ['0x03', '0x3', '3']: return 'BULK'
-        if s_val in ['0x02', '0x2', '2']: return 'CONTROL'
-        if s_val in ['0x01', '0x1', '1']: return 'INTERRUPT'
-        if s_val in ['0x00', '0x0', '0']: return 'ISOCHRONOUS'
-        return s_val
+        return transfer_type_name(pkt.usb.transfer_type)
     except:
         return None
 
 
+class FeatureAccumulator:
+    """
+    逐包累积特征的状态机（文件解析与实时流解析共用）
+
+    - feed(timestamp, t_type, endpoint) 按到达顺序送入每个 USB 包
+    - live_stats() 随时返回当前的枚举时间与各 endpoint 的在线统计 (均值/标准差/样本数)
+    - result() 返回与 process_pcap_file 相同的 (enum_val, transfer_raw_data)
+    """
+
+    def __init__(self, verbose=True, log=None):
+        """
+        参数:
+        - verbose: 是否输出调试信息
+        - log: 调试信息的输出函数 func(message)，None 表示 print
+        """
+        self.verbose = verbose
+        self.log = log or print
+        self.enum_start_time = None
+        self.enum_end_time = None
+        self.enum_val = None
+
+        self.transfer_raw_data = defaultdict(list)
+        self.pending_requests = {}
+        # 在线统计 (Welford): endpoint -> [count, mean, M2]
+        self.running = {}
+        # 每秒产生的传输样本数: int(timestamp) -> count (Workload.yield_report 使用)
+        self.samples_per_second = defaultdict(int)
+
+        self.packet_index = 0
+        self.bulk_count = 0
+        self.submit_count = 0
+        self.complete_count = 0
+        self.matched_count = 0
+
+    def _log(self, message):
+        if self.verbose:
+            self.log(message)
+
+    def feed(self, timestamp, t_type, endpoint):
+        """
+        送入一个 USB 包
+
+        参数:
+        - timestamp: 抓包时间戳 (秒, float)
+        - t_type: 'CONTROL' / 'BULK' / ... (见 transfer_type_name)
+        - endpoint: endpoint 地址，'0x81' 形式的字符串或整数，可为 None
+        """
+        # 策略：找到紧邻Bulk包之前的最后一批Control传输
+        # 1. 追踪Control包序列
+        if t_type == 'CONTROL':
+            if self.enum_end_time is None:  # 还没遇到Bulk包
+                # 如果上一个也是Control，继续；否则重新开始计时
+                if self.enum_start_time is None or (timestamp - self.enum_start_time) > 2.0:
+                    # 开始新的Control包序列
+                    self.enum_start_time = timestamp
+
+        # 2. 遇到第1个Bulk包时，计算枚举时间
+        elif t_type == 'BULK' and self.enum_end_time is None:
+            self.enum_end_time = timestamp
+            if self.enum_start_time:
+                duration = self.enum_end_time - self.enum_start_time
+                # 放宽合理范围：0.001秒到5秒（原来是0.01-2.0）
+                # 这样可以捕获更多的枚举情况
+                if 0.001 < duration < 5.0:
+                    self.enum_val = duration
+                    self._log(f"    [调试] 枚举时间: {duration:.4f}s")
+                else:
+                    self._log(f"    [调试] 枚举时间被过滤: {duration:.4f}s (范围: 0.001-5.0s)")
+            else:
+                self._log(f"    [调试] 未找到Control包，无法计算枚举时间")
+
+        # 3. 提取传输数据 - 简化方法：使用包间时间间隔
+        if t_type == 'BULK':
+            self.bulk_count += 1
+            if endpoint:
+                # 计算与上一个相同endpoint的包的时间差
+                if endpoint in self.pending_requests:
+                    last_time = self.pending_requests[endpoint]
+                    delta = timestamp - last_time
+
+                    # 使用endpoint作为"长度"分组
+                    if delta > 0 and delta < 1.0:  # 过滤掉异常大的间隔
+                        try:
+                            key = int(endpoint, 16) if isinstance(endpoint, str) else endpoint
+                        except ValueError:
+                            key = None
+                        if key is not None:
+                            self.matched_count += 1
+                            self.samples_per_second[int(timestamp)] += 1
+                            self.transfer_raw_data[key].append(delta)
+                            self._update_running(key, delta)
+
+                self.pending_requests[endpoint] = timestamp
+
+    def _update_running(self, key, value):
+        state = self.running.get(key)
+        if state is None:
+            state = self.running[key] = [0, 0.0, 0.0]
+        state[0] += 1
+        d = value - state[1]
+        state[1] += d / state[0]
+        state[2] += d * (value - state[1])
+
+    def live_stats(self):
+        """
+        当前在线统计（未做百分位过滤，仅用于实时观察与收敛判断）
+
+        返回:
+        - dict: {"enumeration": enum_val, "transfers": {endpoint: {"mean", "std", "count"}}}
+        """
+        transfers = {}
+        for key, (n, mean, m2) in self.running.items():
+            transfers[key] = {"mean": mean, "std": (m2 / n) ** 0.5 if n else 0.0, "count": n}
+        return {"enumeration": self.enum_val, "transfers": transfers}
+
+    def result(self):
+        return self.enum_val, self.transfer_raw_data
+
+    def log_summary(self):
+        self._log(f"    [调试] 总包数: {self.packet_index}, 枚举时间: {self.enum_val}, 传输分组数: {len(self.transfer_raw_data)}")
+        self._log(f"    [调试] Bulk包: {self.bulk_count}, Submit: {self.submit_count}, Complete: {self.complete_count}, 匹配: {self.matched_count}")
+        if self.transfer_raw_data:
+            for length, times in list(self.transfer_raw_data.items())[:3]:
+                self._log(f"    [调试] 长度{length}: {len(times)}个样本")
+
+
+class DeviceGate:
+    """
+    实时路径的设备过滤：只把目标设备 (bus, address) 的包送入累加器
+
+    设备识别之前（插入、枚举阶段）的包先暂存，set_device() 后按过滤条件补送；
+    同一总线上地址 0 的包（SET_ADDRESS 之前的枚举请求）始终保留。
+    """
+
+    def __init__(self, sink, enabled=True):
+        """
+        参数:
+        - sink: func(timestamp, t_type, endpoint)，通常为 FeatureAccumulator.feed
+        - enabled: False 时不做过滤，直接转发
+        """
+        self.sink = sink
+        self.enabled = enabled
+        self.device = None
+        self._held = []
+
+    def feed(self, timestamp, t_type, endpoint, bus=None, address=None):
+        if not self.enabled:
+            self.sink(timestamp, t_type, endpoint)
+        elif self.device is None:
+            self._held.append((timestamp, t_type, endpoint, bus, address))
+        elif bus == self.device[0] and address in (0, self.device[1]):
+            self.sink(timestamp, t_type, endpoint)
+
+    def accepts(self, bus, address):
+        """ 包是否会被送入累加器（设备未识别时暂按接受处理） """
+        if not self.enabled or self.device is None:
+            return True
+        return bus == self.device[0] and address in (0, self.device[1])
+
+    def infer_device(self, window=None):
+        """
+        从暂存包中推断被测设备：Bulk 包最多的 (bus, address)，无 Bulk 包返回 None
+
+        参数:
+        - window: 可选 (start, end) 时间范围，只统计被测设备 I/O 测试期间的包
+                  （同一集线器上多台设备先后做 I/O 时避免误判）
+        """
+        counts = defaultdict(int)
+        for timestamp, t_type, _, bus, address in self._held:
+            if window is not None and not window[0] <= timestamp <= window[1]:
+                continue
+            if t_type == 'BULK' and bus is not None:
+                counts[(bus, address)] += 1
+        return max(counts, key=counts.get) if counts else None
+
+    def set_device(self, bus, address):
+        """ 设定目标设备并补送暂存的包 """
+        self.device = (bus, address)
+        held, self._held = self._held, []
+        for packet in held:
+            self.feed(*packet)
+
+    def release(self):
+        """ 无法识别设备时放弃过滤，暂存的包原样送出 """
+        self.enabled = False
+        held, self._held = self._held, []
+        for packet in held:
+            self.sink(*packet[:3])
+
+
+class PcapExtractor:
+    """
+    可重入的 pcapng 特征提取器
+
+    不修改任何全局状态：tshark 解析使用自己创建的事件循环（不调用 asyncio.set_event_loop），
+    日志与进度通过注入的回调输出，不直接写 sys.stdout。同一实例可在线程池中被多个线程同时使用。
+
+    用法:
+        extractor = PcapExtractor(log=logger.info, progress=lambda path, n: ...)
+        enum_val, transfer_data = extractor.extract(pcap_path)
+    """
+
+    def __init__(self, log=None, progress=None, verbose=True, progress_interval=10000):
+        """
+        参数:
+        - log: 日志输出函数 func(message)，None 表示 print
+        - progress: 可选进度回调 func(pcap_path, packet_count)，每 progress_interval 个包及解析结束时调用
+        - verbose: 是否输出逐文件的调试信息（错误信息始终输出）
+        """
+        self.log = log or print
+        self.progress = progress
+        self.verbose = verbose
+        self.progress_interval = progress_interval
+
+    def _info(self, message):
+        if self.verbose:
+            self.log(message)
+
+    def _accumulator(self):
+        return FeatureAccumulator(verbose=self.verbose, log=self.log)
+
+    def _tick(self, pcap_path, acc, final=False):
+        if self.progress and (final or acc.packet_index % self.progress_interval == 0):
+            self.progress(pcap_path, acc.packet_index)
+
+    @staticmethod
+    def _count(profile, acc):
+        """ 文件解析结束时把累加器的计数一次性记入 Profile（逐包循环内不插桩） """
+        if profile:
+            profile.count("packets", acc.packet_index)
+            profile.count("bulk_packets", acc.bulk_count)
+            profile.count("matched_packets", acc.matched_count)
+
+    def process(self, pcap_path):
+        """ 解析单个 pcap 文件，返回 (enum_val, transfer_data)，失败返回 (None, None) """
+        if not os.path.exists(pcap_path): return None, None
+
+        self._info(f"[-] 正在分析特征: {os.path.basename(pcap_path)} ...")
+        with Tracing.span("parse", "extract", file=os.path.basename(pcap_path)):
+            return self._process(pcap_path)
+
+    def _process(self, pcap_path):
+        # USBPcap / Linux usbmon 链路类型直接解析包头，其余格式交给 tshark
+        profile = Profiler.current()
+        with profile.stage("open"):
+            try:
+                native = PcapFile.read_linktypes(pcap_path) <= set(PcapFile.USB_LINKTYPES)
+            except (OSError, PcapFile.PcapFormatError):
+                native = False
+        if profile:
+            profile.count("files")
+            profile.count("bytes", os.path.getsize(pcap_path))
+        if native:
+            return self.process_native(pcap_path)
+        return self.process_tshark(pcap_path)
+
+    def process_native(self, pcap_path):
+        """ 不经过 tshark，直接读取 pcap/pcapng 中的 USB 包头 (USBPcap / usbmon) """
+        acc = self._accumulator()
+        profile = Profiler.current()
+        t0 = time.perf_counter()
+        try:
+            with profile.stage("parse"):
+                for timestamp, usb in PcapFile.iter_usb_packets(pcap_path):
+                    acc.packet_index += 1
+                    self._tick(pcap_path, acc)
+                    if usb is None:
+                        continue
+                    acc.feed(timestamp, usb["t_type"], usb["endpoint"])
+        except (OSError, PcapFile.PcapFormatError, PcapFile.UnsupportedLinkType) as e:
+            self.log(f"    [!] 解析出错: {e}")
+            return None, None
+        Metrics.record_parse("native", time.perf_counter() - t0, acc.packet_index)
+        self._count(profile, acc)
+        self._tick(pcap_path, acc, final=True)
+        acc.log_summary()
+        return acc.result()
+
+    def process_tshark(self, pcap_path):
+        """ 通过 pyshark/tshark 解析（非 USB 链路类型） """
+        # 每次解析使用独立的事件循环，只显式传给 pyshark，不设置为线程/进程的当前循环，
+        # 因此多个线程可同时解析，也不会影响调用方已有的事件循环
+        loop = asyncio.new_event_loop()
+        cap = None
+        profile = Profiler.current()
+        try:
+            # keep_packets=False 防止内存爆炸
+            cap = pyshark.FileCapture(pcap_path, keep_packets=False, eventloop=loop)
+            acc = self._accumulator()
+
+            # tshark 在取第一个包时才启动：到第一个包为止计入 tshark_startup，其余计入 parse
+            t0 = t_first = time.perf_counter()
+            Tracing.phase("tshark_startup")
+            for pkt in cap:
+                if not acc.packet_index:
+                    t_first = time.perf_counter()
+                    profile.record("tshark_startup", t_first - t0)
+                    Tracing.phase("tshark_packets")
+                acc.packet_index += 1
+                self._tick(pcap_path, acc)
+
+                if not hasattr(pkt, 'usb'): continue
+
+                t_type = get_transfer_type_safe(pkt)
+
+                try:
+                    timestamp = float(pkt.sniff_timestamp)
+                except (AttributeError, TypeError, ValueError):
+                    continue
+
+                acc.feed(timestamp, t_type, getattr(pkt.usb, 'endpoint_address', None))
+
+            t_end = time.perf_counter()
+            Metrics.record_parse("tshark", t_end - t0, acc.packet_index)
+            if profile:
+                profile.record("parse", t_end - t_first)
+                self._count(profile, acc)
+            self._tick(pcap_path, acc, final=True)
+            acc.log_summary()
+            return acc.result()
+
+        except Exception as e:
+            import traceback
+            self.log(f"    [!] 解析出错: {e}")
+            self.log(f"    [!] 详细信息:\n{traceback.format_exc()}")
+            return None, None
+        finally:
+            if cap is not None:
+                try:
+                    cap.close()
+                except Exception:
+                    pass
+            if not loop.is_closed():
+                loop.close()
+
+    def extract(self, pcap_path, use_cache=True):
+        """
+        带缓存的特征提取：优先读取缓存，否则解析 pcapng 并写入缓存
+
+        返回值与 process 相同: (enum_val, transfer_data)
+        """
+        with Tracing.span("extract", "extract", file=os.path.basename(pcap_path)):
+            return self._extract(pcap_path, use_cache)
+
+    def _extract(self, pcap_path, use_cache):
+        profile = Profiler.current()
+        if use_cache:
+            Tracing.phase("cache_load")
+            with profile.stage("cache_load"):
+                cached = load_cached_features(pcap_path)
+            Metrics.record_cache("disk", cached is not None)
+            if cached is not None:
+                profile.count("cache_hits")
+                self._info(f"[-] 使用缓存特征: {os.path.basename(pcap_path)}")
+                return cached
+            profile.count("cache_misses")
+
+        Tracing.phase(None)
+        enum_val, transfer_data = self.process(pcap_path)
+        if use_cache and transfer_data is not None:
+            Tracing.phase("cache_save")
+            with profile.stage("cache_save"):
+                save_features(pcap_path, enum_val, transfer_data, log=self.log)
+        return enum_val, transfer_data
+
+
 def process_pcap_file(pcap_path):
     """ 解析单个 pcap 文件 """
-    if not os.path.exists(pcap_path): return None, None
-
-    print(f"[-] 正在分析特征: {os.path.basename(pcap_path)} ...")
+    return PcapExtractor().process(pcap_path)
+
+
+def process_pcap_native(pcap_path):
+    """ 不经过 tshark，直接读取 pcap/pcapng 中的 USB 包头 (USBPcap / usbmon) """
+    return PcapExtractor().process_native(pcap_path)
+
+
+# --- 多次插拔分段：一次连续抓包中的多个枚举样本 ---
+# 与 FeatureAccumulator 的判定一致，但在整列数组上向量化执行
+
+TRANSFER_CODES = {'ISOCHRONOUS': 0, 'INTERRUPT': 1, 'CONTROL': 2, 'BULK': 3}
+CONTROL_CODE = TRANSFER_CODES['CONTROL']
+BULK_CODE = TRANSFER_CODES['BULK']
+
+
+def load_usb_columns(pcap_path):
+    """
+    读取 USB 包头为列数组（每个包一行，包头不完整的包类型为 -1）
+
+    返回:
+    - dict: {"ts": float64, "type": int8, "endpoint": int16, "bus": int32, "address": int32}
+    """
+    ts, types, endpoints, buses, addresses = [], [], [], [], []
+    for timestamp, usb in PcapFile.iter_usb_packets(pcap_path):
+        ts.append(timestamp)
+        if usb is None:
+            types.append(-1)
+            endpoints.append(-1)
+            buses.append(-1)
+            addresses.append(-1)
+            continue
+        types.append(TRANSFER_CODES.get(usb["t_type"], -1))
+        endpoints.append(int(usb["endpoint"], 16))
+        buses.append(usb["bus"])
+        addresses.append(usb["device"])
+    return {
+        "ts": np.asarray(ts, dtype=np.float64),
+        "type": np.asarray(types, dtype=np.int8),
+        "endpoint": np.asarray(endpoints, dtype=np.int16),
+        "bus": np.asarray(buses, dtype=np.int32),
+        "address": np.asarray(addresses, dtype=np.int32)
+    }
 
-    # --- [关键修复 2] 暴力重建 Event Loop ---
-    # 无论之前发生了什么，每次解析文件前都强行创建一个新的 Loop
-    # 这样可以完美解决 "no running event loop" 问题
-    new_loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(new_loop)
 
-    cap = None
+def segment_columns(columns, min_gap=1.0):
+    """
+    将连续抓包切分为多次插拔的会话
+
+    每次插拔的设备以 (bus, address) 区分：某个设备的 Bulk 包满足以下条件时开始新会话：
+    - 与该设备上一个 Bulk 包间隔超过 min_gap（首次出现视为无穷大）
+    - 两者之间同一总线上出现过默认地址 0 的 Control 包（新设备枚举）；
+      文件中没有地址 0 的包时退化为该总线上的任意 Control 包
+    - 两者之间该设备自身地址上也有 Control 包（枚举后期的描述符请求）
+    重新插拔后地址通常会变化，地址复用时由间隔与枚举请求区分。
+    会话范围从上一会话设备的最后一个 Bulk 包之后开始，到下一会话的范围起点为止。
+
+    返回:
+    - list of (起始包序号, 第一个 Bulk 包序号, 结束包序号 [不含], (bus, address))
+    """
+    ts, types, buses, addresses = columns["ts"], columns["type"], columns["bus"], columns["address"]
+    bulk_idx = np.flatnonzero(types == BULK_CODE)
+    if not len(bulk_idx):
+        return []
+    bulk_bus = buses[bulk_idx].astype(np.int64)
+    keys = bulk_bus * 256 + addresses[bulk_idx]
+
+    control = types == CONTROL_CODE
+    marker = control & (addresses == 0)
+    if not marker.any():
+        marker = control
+    # 每个 Bulk 包之前、同一总线上的枚举请求累计数
+    enum_count = np.zeros(len(bulk_idx), dtype=np.int64)
+    for bus in np.unique(bulk_bus):
+        on_bus = bulk_bus == bus
+        enum_count[on_bus] = np.cumsum(marker & (buses == bus))[bulk_idx[on_bus]]
+
+    # 同一设备的上一个 Bulk 包 (在 bulk_idx 中的位置，-1 表示首次出现)
+    order = np.argsort(keys, kind='stable')
+    repeated = np.flatnonzero(keys[order][1:] == keys[order][:-1]) + 1
+    prev = np.full(len(bulk_idx), -1, dtype=np.int64)
+    prev[order[repeated]] = order[repeated - 1]
+
+    has_prev = prev >= 0
+    gap = np.full(len(bulk_idx), np.inf)
+    gap[has_prev] = ts[bulk_idx[has_prev]] - ts[bulk_idx[prev[has_prev]]]
+    enumerated = enum_count - np.where(has_prev, enum_count[np.maximum(prev, 0)], 0) > 0
+    heads = np.flatnonzero((gap > min_gap) & enumerated)
+
+    # 该设备自身地址上也要有 Control 包（描述符/SET_CONFIGURATION），排除恰好在他人枚举后才开始传输的旁路设备
+    if len(heads):
+        n = len(ts)
+        ctrl_idx = np.flatnonzero(control)
+        composite = np.sort((buses[ctrl_idx].astype(np.int64) * 256 + addresses[ctrl_idx]) * (n + 1) + ctrl_idx)
+        since = np.where(has_prev[heads], bulk_idx[np.maximum(prev[heads], 0)], -1)
+        base = keys[heads] * (n + 1)
+        own = np.searchsorted(composite, base + bulk_idx[heads]) - np.searchsorted(composite, base + since + 1)
+        heads = heads[own > 0]
+    if not len(heads):
+        # 没有抓到枚举（抓包开始时设备已插入）：整个文件作为 Bulk 包最多的设备的一个会话
+        values, counts = np.unique(keys, return_counts=True)
+        heads = np.array([np.flatnonzero(keys == values[np.argmax(counts)])[0]])
+
+    segments = []
+    lo = 0
+    for k, pos in enumerate(heads):
+        key = keys[pos]
+        stop = heads[k + 1] if k + 1 < len(heads) else len(bulk_idx)
+        same = np.flatnonzero(keys[pos:stop] == key)
+        last_bulk = bulk_idx[pos + same[-1]]
+        hi = int(last_bulk) + 1 if k + 1 < len(heads) else len(ts)
+        segments.append((lo, int(bulk_idx[pos]), hi, (int(key // 256), int(key % 256))))
+        lo = hi
+    return segments
+
+
+def segment_mask(columns, segment):
+    """ 会话范围内属于该会话设备的包（同一总线上地址 0 的枚举请求始终保留） """
+    lo, _, hi, (bus, address) = segment
+    addresses = columns["address"][lo:hi]
+    return (columns["bus"][lo:hi] == bus) & ((addresses == 0) | (addresses == address))
+
+
+def _enumeration_time(control_ts, bulk_ts):
+    """ 与 FeatureAccumulator 相同的枚举时间：Control 序列起点（间隔超过 2 秒重新计时）到第一个 Bulk 包 """
+    if not len(control_ts):
+        return None
+    start = 0
+    while True:
+        nxt = int(np.searchsorted(control_ts, control_ts[start] + 2.0, side='right'))
+        if nxt >= len(control_ts):
+            break
+        start = nxt
+    duration = float(bulk_ts - control_ts[start])
+    return duration if 0.001 < duration < 5.0 else None
+
+
+def segment_features(columns, segment):
+    """
+    单个会话的特征（只使用该会话设备的包）
+
+    返回:
+    - (enum_val, transfer_data)，与 process_pcap_file 对切分出的该会话文件的结果一致
+    """
+    lo, first_bulk, hi, _ = segment
+    keep = segment_mask(columns, segment)
+    ts = columns["ts"][lo:hi][keep]
+    types = columns["type"][lo:hi][keep]
+    endpoints = columns["endpoint"][lo:hi][keep]
+    head = int(np.count_nonzero(keep[:first_bulk - lo]))  # 第一个 Bulk 包在过滤后的位置
+
+    enum_val = _enumeration_time(ts[:head][types[:head] == CONTROL_CODE], ts[head])
+
+    bulk = types[head:] == BULK_CODE
+    bulk_ts, bulk_ep = ts[head:][bulk], endpoints[head:][bulk]
+    order = np.argsort(bulk_ep, kind='stable')  # 同一 endpoint 内保持到达顺序
+    ep_sorted, ts_sorted = bulk_ep[order], bulk_ts[order]
+    delta = np.diff(ts_sorted)
+    valid = (ep_sorted[1:] == ep_sorted[:-1]) & (delta > 0) & (delta < 1.0)
+    valid_ep, valid_delta = ep_sorted[1:][valid], delta[valid]
+
+    transfer_data = defaultdict(list)
+    for ep in np.unique(valid_ep):
+        transfer_data[int(ep)] = valid_delta[valid_ep == ep].tolist()
+    return enum_val, transfer_data
+
+
+def _segments_of(columns, min_gap):
+    segments = []
+    for segment in segment_columns(columns, min_gap):
+        enum_val, transfer_data = segment_features(columns, segment)
+        lo, _, hi, device = segment
+        segments.append({"segment": segment, "device": device, "start": float(columns["ts"][lo]),
+                         "end": float(columns["ts"][hi - 1]), "enumeration": enum_val,
+                         "transfers": transfer_data})
+    return segments
+
+
+def _load_columns_safe(pcap_path):
     try:
-        # keep_packets=False 防止内存爆炸
-        # eventloop=new_loop 显式指定我们刚创建的 loop
-        cap = pyshark.FileCapture(pcap_path, keep_packets=False, eventloop=new_loop)
+        return load_usb_columns(pcap_path)
+    except (OSError, PcapFile.PcapFormatError, PcapFile.UnsupportedLinkType) as e:
+        print(f"    [!] 解析出错: {e}")
+        return None
+
 
-        enum_start_time = None
-        enum_end_time = None
-        enum_val = None
+def process_pcap_segments(pcap_path, min_gap=1.0):
+    """
+    解析包含多次插拔的连续抓包
 
-        transfer_raw_data = defaultdict(list)
-        pending_requests = {}
+    返回:
+    - list of dict: {"segment", "device", "start", "end", "enumeration", "transfers"}；
+      解析失败时返回 None
+    """
+    columns = _load_columns_safe(pcap_path)
+    return None if columns is None else _segments_of(columns, min_gap)
 
 
-        packet_index = 0
-        bulk_count = 0
-        submit_count = 0
-        complete_count = 0
-        matched_count = 0
+def split_session_capture(pcap_path, name_format="capture_{}.pcapng", min_gap=1.0, remove_source=True):
+    """
+    将连续抓包切分为每次插拔一个 pcapng 样本（只含该次插拔的设备），并直接写入各自的特征缓存
 
+    参数:
+    - name_format: 输出文件名模板（同目录，序号从 1 开始）
+    - remove_source: 切分后删除原连续抓包（避免被当作一个样本重复计入）
 
-        for pkt in cap:
-            packet_index += 1
+    返回:
+    - list: 输出文件路径；无法切分时返回 None
+    """
+    columns = _load_columns_safe(pcap_path)
+    segments = _segments_of(columns, min_gap) if columns is not None else None
+    if not segments:
+        return None
+    folder = os.path.dirname(os.path.abspath(pcap_path))
+    paths = [os.path.join(folder, name_format.format(i)) for i in range(1, len(segments) + 1)]
 
-            if not hasattr(pkt, 'usb'): continue
+    assignment = np.full(len(columns["ts"]), -1, dtype=np.int32)
+    for i, seg in enumerate(segments):
+        lo, _, hi, _ = seg["segment"]
+        assignment[lo:hi][segment_mask(columns, seg["segment"])] = i
+    PcapFile.split_capture(pcap_path, assignment, paths)
 
-            t_type = get_transfer_type_safe(pkt)
-            
-            try:
-                timestamp = float(pkt.sniff_timestamp)
-            except:
-                continue
+    for path, seg in zip(paths, segments):
+        save_features(path, seg["enumeration"], seg["transfers"])
+        enum_text = f"{seg['enumeration']:.4f}s" if seg["enumeration"] else "无"
+        samples = sum(len(v) for v in seg["transfers"].values())
+        print(f"    [√] {os.path.basename(path)}: Bus {seg['device'][0]:03d} Device {seg['device'][1]:03d}, "
+              f"枚举时间 {enum_text}, {samples} 个传输样本")
+    if remove_source and os.path.abspath(pcap_path) not in map(os.path.abspath, paths):
+        os.remove(pcap_path)
+    return paths
 
-            # 策略：找到紧邻Bulk包之前的最后一批Control传输
-            # 1. 追踪Control包序列
-            if t_type == 'CONTROL':
-                if enum_end_time is None:  # 还没遇到Bulk包
-                    # 如果上一个也是Control，继续；否则重新开始计时
-                    if enum_start_time is None or (timestamp - enum_start_time) > 2.0:
-                        # 开始新的Control包序列
-                        enum_start_time = timestamp
-
-            # 2. 遇到第1个Bulk包时，计算枚举时间
-            elif t_type == 'BULK' and enum_end_time is None:
-                enum_end_time = timestamp
-                if enum_start_time:
-                    duration = enum_end_time - enum_start_time
-                    # 放宽合理范围：0.001秒到5秒（原来是0.01-2.0）
-                    # 这样可以捕获更多的枚举情况
-                    if 0.001 < duration < 5.0:
-                        enum_val = duration
-                        print(f"    [调试] 枚举时间: {duration:.4f}s")
-                    else:
-                        print(f"    [调试] 枚举时间被过滤: {duration:.4f}s (范围: 0.001-5.0s)")
-                else:
-                    print(f"    [调试] 未找到Control包，无法计算枚举时间")
 
+# --- 特征缓存 (与 pcapng 同目录的 .features.json 旁路文件) ---
+# 原始 pcapng 被保留策略删除后，注册/认证仍可直接使用缓存的特征
+PCAP_SUFFIX = ".pcapng"
+FEATURE_SUFFIX = ".features.json"
 
 
+def feature_cache_path(pcap_path):
+    """ pcapng 文件对应的特征缓存路径 """
+    if pcap_path.endswith(PCAP_SUFFIX):
+        pcap_path = pcap_path[:-len(PCAP_SUFFIX)]
+    return pcap_path + FEATURE_SUFFIX
 
-            # 3. 提取传输数据 - 简化方法：使用包间时间间隔
-            if t_type == 'BULK':
-                bulk_count += 1
-                try:
-                    timestamp = float(pkt.sniff_timestamp)
-                    endpoint = getattr(pkt.usb, 'endpoint_address', None)
-                    
-                    if endpoint:
-                        # 计算与上一个相同endpoint的包的时间差
-                        if endpoint in pending_requests:
-                            last_time = pending_requests[endpoint]
-                            delta = timestamp - last_time
-                            
-                            # 使用endpoint作为"长度"分组
-                            if delta > 0 and delta < 1.0:  # 过滤掉异常大的间隔
-                                matched_count += 1
-                                transfer_raw_data[int(endpoint, 16) if isinstance(endpoint, str) else endpoint].append(delta)
-                        
-                        pending_requests[endpoint] = timestamp
-                except Exception as e:
-                    continue
 
+def save_features(pcap_path, enum_val, transfer_data, log=None):
+    """ 保存提取结果到特征缓存（记录源文件大小/修改时间用于校验） """
+    try:
+        st = os.stat(pcap_path)
+        source = {"size": st.st_size, "mtime": st.st_mtime}
+    except OSError:
+        source = None
+    record = {
+        "source_file": os.path.basename(pcap_path),
+        "source": source,
+        "enum_time": enum_val,
+        "transfers": {str(k): list(v) for k, v in (transfer_data or {}).items()}
+    }
+    cache_path = feature_cache_path(pcap_path)
+    # 临时文件名区分进程与线程：多个线程同时提取同一文件时互不覆盖
+    tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(record, f)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        (log or print)(f"    [!] 特征缓存写入失败: {e}")
 
 
-        cap.close()
-        print(f"    [调试] 总包数: {packet_index}, 枚举时间: {enum_val}, 传输分组数: {len(transfer_raw_data)}")
-        print(f"    [调试] Bulk包: {bulk_count}, Submit: {submit_count}, Complete: {complete_count}, 匹配: {matched_count}")
-        if transfer_raw_data:
-            for length, times in list(transfer_raw_data.items())[:3]:
-                print(f"    [调试] 长度{length}: {len(times)}个样本")
-        return enum_val, transfer_raw_data
+def _read_cache(cache_path):
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return None
 
 
+def mark_retained(pcap_path):
+    """
+    标记特征缓存为"已保留"：保留策略删除原始 pcapng 前调用
 
+    只有带此标记的孤立缓存才被视为样本；原始文件因其他原因丢失时，
+    残留的缓存不会被注册/认证使用。
 
-    except Exception as e:
-        import traceback
-        print(f"    [!] 解析出错: {e}")
-        print(f"    [!] 详细信息:\n{traceback.format_exc()}")
-        if cap:
-            try:
-                cap.close()
-            except:
-                pass
-        return None, None
-    finally:
-        # 清理 Loop
-        try:
-            if new_loop and not new_loop.is_closed():
-                new_loop.close()
-        except:
-            pass
\ No newline at end of file
+    返回:
+    - bool: 是否标记成功
+    """
+    cache_path = feature_cache_path(pcap_path)
+    record = _read_cache(cache_path)
+    if record is None:
+        return False
+    record["retained"] = True
+    tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(record, f)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"    [!] 特征缓存标记失败: {e}")
+        return False
+    return True
+
+
+def is_retained(cache_path):
+    """ 特征缓存是否由保留策略标记为保留 """
+    record = _read_cache(cache_path)
+    return bool(record and record.get("retained"))
+
+
+def load_cached_features(pcap_path):
+    """
+    读取特征缓存
+
+    返回:
+    - (enum_val, transfer_data) 或 None (无缓存/缓存与源文件不一致/未标记保留的孤立缓存)
+    """
+    cache_path = feature_cache_path(pcap_path)
+    if not os.path.exists(cache_path):
+        return None
+    record = _read_cache(cache_path)
+    if record is None:
+        return None
+
+    if os.path.exists(pcap_path):
+        # 源文件仍在时校验是否被覆盖 (AutoCatch 会复用同名文件)
+        source = record.get("source")
+        st = os.stat(pcap_path)
+        if not source or source["size"] != st.st_size or source["mtime"] != st.st_mtime:
+            return None
+    elif not record.get("retained"):
+        return None
+
+    transfer_data = defaultdict(list)
+    for k, v in record.get("transfers", {}).items():
+        transfer_data[int(k)] = v
+    return record.get("enum_time"), transfer_data
+
+
+def extract_features(pcap_path, use_cache=True):
+    """
+    带缓存的特征提取：优先读取缓存，否则解析 pcapng 并写入缓存
+
+    返回值与 process_pcap_file 相同: (enum_val, transfer_data)
+    """
+    return PcapExtractor().extract(pcap_path, use_cache)
+
+
+def _extract_worker(pcap_path, verbose, use_cache, profiled=False):
+    """
+    进程池工作函数：返回可跨进程传递的结果
+
+    profiled=True 时在单独的 Profile 中解析，返回 (enum_val, transfer_data, profile_dict)
+    """
+    if not profiled:
+        e_time, t_data = PcapExtractor(verbose=verbose).extract(pcap_path, use_cache)
+        return e_time, dict(t_data) if t_data else None
+    with Profiler.profiling(detached=True) as profile:
+        e_time, t_data = _extract_worker(pcap_path, verbose, use_cache)
+    return e_time, t_data, profile.as_dict()
+
+
+def extract_many(pcap_paths, workers=None, verbose=True, use_cache=True, profiles=None):
+    """
+    并行提取多个文件的特征（进程池，workers=1 时在当前进程顺序执行）
+
+    参数:
+    - workers: 解析进程数，None 表示全部 CPU 核心
+    - verbose: 是否输出逐文件的调试信息
+    - profiles: 可选列表，启用计时 (Profiler.profiling) 时按文件顺序追加每个文件的 Profile 数据
+
+    返回:
+    - list: 与 pcap_paths 顺序一致的 (enum_val, transfer_data)，解析出错的文件为 (None, None)
+    """
+    workers = min(workers or os.cpu_count() or 1, max(len(pcap_paths), 1))
+    # 进程池中没有调用方的 contextvar：启用计时时由工作函数各自计时并传回，在此合并；
+    # 导出指标时同样需要传回（工作进程的指标记录在它自己的注册表里）
+    profile = Profiler.current()
+    remote_metrics = workers > 1 and Metrics.exporting()
+    profiled = bool(profile) or remote_metrics
+    if workers <= 1:
+        raw = [_extract_worker(path, verbose, use_cache, profiled) for path in pcap_paths]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        raw = []
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_extract_worker, path, verbose, use_cache, profiled) for path in pcap_paths]
+            for path, future in zip(pcap_paths, futures):
+                try:
+                    raw.append(future.result())
+                except Exception as e:
+                    print(f"    [!] 解析失败 {os.path.basename(path)}: {e}")
+                    raw.append((None, None, {}) if profiled else (None, None))
+    if not profiled:
+        return raw
+
+    results = []
+    for e_time, t_data, stats in raw:
+        profile.merge(stats)
+        if remote_metrics:
+            Metrics.record_profile(stats)
+        if profiles is not None:
+            profiles.append(stats)
+        results.append((e_time, t_data))
+    return results
+
+
+def list_samples(folder):
+    """
+    列出文件夹中可用的样本（以 pcapng 文件名表示）
+
+    包括现存的 .pcapng 文件，以及保留策略删除原始文件时标记保留的特征缓存；
+    原始文件已不存在、又未被标记的孤立缓存会被忽略。
+    """
+    if not os.path.isdir(folder):
+        return []
+    entries = os.listdir(folder)
+    names = {f for f in entries if f.endswith(PCAP_SUFFIX)}
+    for f in entries:
+        if not f.endswith(FEATURE_SUFFIX):
+            continue
+        name = f[:-len(FEATURE_SUFFIX)] + PCAP_SUFFIX
+        if name not in names and is_retained(os.path.join(folder, f)):
+            names.add(name)
+    return sorted(names)
@@ -0,0 +1,269 @@
+"""
+指纹数据库快照模块
+提供写时复制 (Copy-on-Write) 的指纹库访问：
+- 读者持有不可变、带版本号的快照，注册过程中不会看到写了一半的数据
+- 写者在副本上修改，先写临时文件再 rename 原子替换，然后切换内存指针
+- 旧快照在最后一个读者释放后才被回收
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from types import MappingProxyType
+from utils import Profiler
+
+
+def _freeze(obj):
+    """ 递归转换为只读结构 (dict → MappingProxyType, list → tuple) """
+    if isinstance(obj, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in obj.items()})
+    if isinstance(obj, (list, tuple)):
+        return tuple(_freeze(v) for v in obj)
+    return obj
+
+
+def _thaw(obj):
+    """ _freeze 的逆操作，得到可修改、可 JSON 序列化的副本 """
+    if isinstance(obj, MappingProxyType) or isinstance(obj, dict):
+        return {k: _thaw(v) for k, v in obj.items()}
+    if isinstance(obj, tuple):
+        return [_thaw(v) for v in obj]
+    return obj
+
+
+def atomic_write_json(path, data):
+    """
+    原子写入 JSON 文件：写入同目录临时文件 → fsync → os.replace
+
+    读者在任何时刻打开 path 时，要么读到旧的完整文件，要么读到新的完整文件。
+    """
+    path = os.path.abspath(path)
+    target_dir = os.path.dirname(path)
+    if not os.path.exists(target_dir):
+        os.makedirs(target_dir, exist_ok=True)
+
+    tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=4, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+
+def load_db_file(db_file):
+    """ 读取数据库文件，不存在或损坏时返回空字典 """
+    if not os.path.exists(db_file):
+        return {}
+    try:
+        with open(db_file, 'r', encoding='utf-8') as f:
+            db = json.load(f)
+        return db if isinstance(db, dict) else {}
+    except Exception as e:
+        print(f"[警告] 读取数据库失败: {e}")
+        return {}
+
+
+class FingerprintSnapshot:
+    """
+    不可变的指纹库快照
+
+    属性:
+    - version: 单调递增的版本号
+    - devices: 只读映射 {device_id: 条目}，条目结构与 JSON 数据库一致
+    """
+
+    def __init__(self, devices, version, file_stamp=None):
+        self.version = version
+        self.devices = _freeze(devices)
+        self.created_at = time.time()
+        self._file_stamp = file_stamp
+        self._refs = 0
+        self._retired = False
+        self._released = False
+        self._release_hooks = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.devices)
+
+    def __contains__(self, device_id):
+        return device_id in self.devices
+
+    def __getitem__(self, device_id):
+        return self.devices[device_id]
+
+    def get(self, device_id, default=None):
+        return self.devices.get(device_id, default)
+
+    def __iter__(self):
+        return iter(self.devices)
+
+    def keys(self):
+        return self.devices.keys()
+
+    def values(self):
+        return self.devices.values()
+
+    def items(self):
+        return self.devices.items()
+
+    def to_dict(self):
+        """ 返回可修改的深拷贝 """
+        return _thaw(self.devices)
+
+    def on_release(self, hook):
+        """ 注册回收回调：快照退役且最后一个读者释放后调用 hook(snapshot) """
+        with self._lock:
+            if not self._released:
+                self._release_hooks.append(hook)
+                return
+        hook(self)
+
+    @property
+    def released(self):
+        return self._released
+
+    def _acquire(self):
+        with self._lock:
+            self._refs += 1
+
+    def _release(self):
+        with self._lock:
+            self._refs -= 1
+            done = self._retired and self._refs <= 0 and not self._released
+            if done:
+                self._released = True
+        if done:
+            self._run_release_hooks()
+
+    def _retire(self):
+        with self._lock:
+            self._retired = True
+            done = self._refs <= 0 and not self._released
+            if done:
+                self._released = True
+        if done:
+            self._run_release_hooks()
+
+    def _run_release_hooks(self):
+        hooks, self._release_hooks = self._release_hooks, []
+        for hook in hooks:
+            try:
+                hook(self)
+            except Exception as e:
+                print(f"[警告] 快照回收回调出错: {e}")
+
+
+class FingerprintStore:
+    """
+    写时复制的指纹库
+
+    用法:
+        store = get_store(db_file)
+        with store.snapshot() as snap:        # 读：不阻塞、不受写入影响
+            for dev_id, entry in snap.items(): ...
+
+        store.update(lambda db: db.update({...}))   # 写：复制 → 修改 → 原子发布
+    """
+
+    def __init__(self, db_file):
+        self.db_file = os.path.abspath(db_file)
+        self._write_lock = threading.Lock()   # 串行化写者
+        self._swap_lock = threading.Lock()    # 仅保护指针读取/切换，临界区极短
+        self._version = 0
+        self._current = None
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.db_file)
+            return st.st_mtime_ns, st.st_size, st.st_ino
+        except OSError:
+            return None
+
+    def _publish(self, devices, stamp):
+        """ 内存指针切换，旧快照退役 """
+        with self._swap_lock:
+            self._version += 1
+            new_snap = FingerprintSnapshot(devices, self._version, stamp)
+            old_snap, self._current = self._current, new_snap
+        if old_snap is not None:
+            old_snap._retire()
+        return new_snap
+
+    def _current_or_reload(self):
+        stamp = self._file_stamp()
+        with self._swap_lock:
+            snap = self._current
+        if snap is not None and snap._file_stamp == stamp:
+            return snap
+
+        # 文件被其他进程修改（或首次加载），重新编译快照
+        with self._write_lock:
+            stamp = self._file_stamp()
+            with self._swap_lock:
+                snap = self._current
+            if snap is not None and snap._file_stamp == stamp:
+                return snap
+            return self._publish(load_db_file(self.db_file), stamp)
+
+    def current(self):
+        """ 返回当前快照（不增加引用计数，仅用于短暂读取元数据） """
+        return self._current_or_reload()
+
+    @contextmanager
+    def snapshot(self):
+        """ 获取当前快照并持有引用，退出 with 块时释放 """
+        with Profiler.current().stage("db_load"):
+            while True:
+                snap = self._current_or_reload()
+                snap._acquire()
+                # 取指针与加引用之间快照可能已被回收，此时重新获取
+                if not snap.released:
+                    break
+                snap._release()
+        try:
+            yield snap
+        finally:
+            snap._release()
+
+    def update(self, mutator):
+        """
+        以写时复制方式修改数据库
+
+        参数:
+        - mutator: func(db_dict) -> 任意值，在可修改副本上原地修改
+
+        返回:
+        - mutator 的返回值
+        """
+        with self._write_lock, Profiler.current().stage("db_write"):
+            # 以磁盘最新内容为基准，兼容其他进程的写入
+            db = load_db_file(self.db_file)
+            result = mutator(db)
+            atomic_write_json(self.db_file, db)
+            self._publish(db, self._file_stamp())
+        return result
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(db_file):
+    """ 获取（并缓存）指定数据库文件对应的 FingerprintStore """
+    key = os.path.abspath(db_file)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = FingerprintStore(key)
+            _stores[key] = store
+        return store
@@ -0,0 +1,310 @@
+"""
+文件夹监视增量认证
+操作员把验证抓包放入 devices/auth 后，authenticate_device 每次都会重新解析文件夹中的全部文件（包括过期文件）。
+监视模式只处理新写完的文件：
+- 事件源: Linux 下通过 ctypes 直接使用 inotify，其他平台或不可用时退回轮询
+- 完成判定: 收到 IN_CLOSE_WRITE (tshark 退出关闭文件) / IN_MOVED_TO (原子改名放入)，
+            或文件大小与修改时间在 settle 秒内不再变化
+- 评分: 每个新文件单独认证，或按会话（连续到达、间隔不超过 session_gap 的一组文件）合并认证
+- 结果以流的形式逐条产出 (生成器 / 回调)，每条只解析本次的新文件，耗时与文件夹中已有文件数无关
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import time
+from collections import defaultdict
+from utils import Authenticate, FeatureExtractor, FingerprintDB, Metrics, Profiler
+
+# --- inotify (include/uapi/linux/inotify.h) ---
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+class InotifySource:
+    """ 基于 inotify 的文件夹事件源 """
+
+    MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+    def __init__(self, folder):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        # 没有 inotify 的平台在取函数时抛出 AttributeError
+        init1, add_watch = libc.inotify_init1, libc.inotify_add_watch
+        self.fd = init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        if add_watch(self.fd, os.fsencode(folder), self.MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch {folder}: {os.strerror(errno)}")
+
+    def poll(self, timeout):
+        """
+        返回:
+        - list: [(文件名, 是否已写完)]；写完指 IN_CLOSE_WRITE / IN_MOVED_TO
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            _, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0").decode("utf-8", errors="replace")
+            offset += length
+            if name:
+                events.append((name, bool(mask & (IN_CLOSE_WRITE | IN_MOVED_TO))))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingSource:
+    """ 轮询文件夹的事件源（无 inotify 时使用），只报告大小或修改时间变化的文件 """
+
+    def __init__(self, folder, interval=0.5):
+        self.folder = folder
+        self.interval = interval
+        self._stamps = self._scan()
+
+    def _scan(self):
+        stamps = {}
+        try:
+            with os.scandir(self.folder) as entries:
+                for entry in entries:
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    stamps[entry.name] = (st.st_size, st.st_mtime_ns)
+        except OSError:
+            pass
+        return stamps
+
+    def poll(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        stamps = self._scan()
+        changed = [(name, False) for name, stamp in stamps.items() if self._stamps.get(name) != stamp]
+        self._stamps = stamps
+        return changed
+
+    def close(self):
+        pass
+
+
+def default_source(folder):
+    """ 优先 inotify，不可用时退回轮询 """
+    try:
+        return InotifySource(folder)
+    except (OSError, AttributeError) as e:
+        print(f"[-] inotify 不可用 ({e})，使用轮询监视")
+        return PollingSource(folder)
+
+
+def _stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+class FolderWatcher:
+    """
+    监视文件夹并对新写完的验证文件增量认证
+
+    用法:
+        watcher = FolderWatcher("devices/auth", "usb_fingerprint_db.json")
+        for result in watcher.watch(stop_event):
+            print(result)
+    """
+
+    def __init__(self, folder, db_file, device_id=None, threshold=70.0, session=False, settle=2.0,
+                 session_gap=5.0, include_existing=False, audit_log=None, source=None, verbose=False):
+        """
+        参数:
+        - session: False 每个文件单独认证；True 按会话合并认证
+        - settle: 没有写完事件时，文件大小保持不变多少秒视为写完
+        - session_gap: 会话模式下，最后一个文件写完后再等待多少秒没有新文件即结束该会话
+        - include_existing: 是否处理启动时已存在的文件（默认只处理新文件）
+        - audit_log: AuditLog 实例，不为 None 时记录每次判定
+        - source: 事件源 (InotifySource / PollingSource)，None 时自动选择
+        """
+        self.folder = folder
+        self.db_file = db_file
+        self.device_id = device_id
+        self.threshold = threshold
+        self.session = session
+        self.settle = settle
+        self.session_gap = session_gap
+        self.audit_log = audit_log
+        self.extractor = FeatureExtractor.PcapExtractor(verbose=verbose)
+        self.source = source or default_source(folder)
+        self._pending = {}   # 文件名 -> [stamp, 最近变化时间, 是否已写完]
+        self._done = set()   # 已处理的 (文件名, stamp)
+        self._session = []   # 会话模式下已写完、等待合并的文件
+        self._session_last = 0.0
+        if include_existing:
+            for name in FeatureExtractor.list_samples(folder):
+                if os.path.exists(os.path.join(folder, name)):
+                    self._pending[name] = [None, 0.0, False]
+        else:
+            for name in os.listdir(folder):
+                if name.endswith(FeatureExtractor.PCAP_SUFFIX):
+                    self._done.add((name, _stamp(os.path.join(folder, name))))
+
+    def _on_event(self, name, closed, now):
+        if not name.endswith(FeatureExtractor.PCAP_SUFFIX):
+            return  # 特征缓存、临时文件等
+        state = self._pending.setdefault(name, [None, now, False])
+        state[1] = now
+        state[2] = state[2] or closed
+
+    def _completed(self, now):
+        """ 检查等待中的文件，返回本轮新写完的文件路径 """
+        completed = []
+        for name, state in list(self._pending.items()):
+            path = os.path.join(self.folder, name)
+            stamp = _stamp(path)
+            if stamp is None:
+                del self._pending[name]  # 已被删除/改名
+                continue
+            if stamp != state[0]:
+                state[0] = stamp
+                if not state[2]:
+                    state[1] = now
+            if state[2] or now - state[1] >= self.settle:
+                del self._pending[name]
+                key = (name, stamp)
+                if key not in self._done:
+                    self._done.add(key)
+                    completed.append(path)
+        return completed
+
+    def score(self, paths, detected=None):
+        """
+        认证一组验证文件
+
+        返回:
+        - dict: {"time", "files", "passed", "match_id", "score", "latency_ms", "details"}，
+          无法认证时含 "error"；启用计时 (Profiler.profiling) 时另含本次的 "profile"
+        """
+        if Profiler.current():
+            with Profiler.profiling() as profile:
+                record = self._score(paths, detected)
+            record["profile"] = profile.as_dict()
+            return record
+        return self._score(paths, detected)
+
+    def _score(self, paths, detected):
+        detected = detected or time.monotonic()
+        all_enum_times = []
+        all_transfer_data = defaultdict(list)
+        for path in paths:
+            e_time, t_data = self.extractor.extract(path)
+            if e_time:
+                all_enum_times.append(e_time)
+            for length, times in (t_data or {}).items():
+                all_transfer_data[length].extend(times)
+
+        record = {"time": time.strftime("%Y-%m-%d %H:%M:%S"), "files": [os.path.basename(p) for p in paths],
+                  "passed": False, "match_id": None, "score": 0.0}
+        fingerprint = Authenticate.build_auth_fingerprint(all_enum_times, all_transfer_data, verbose=False)
+        if not fingerprint["enumeration"] and not fingerprint["transfers"]:
+            record["error"] = "未能提取到任何有效特征"
+        else:
+            with FingerprintDB.get_store(self.db_file).snapshot() as db:
+                if not db:
+                    record["error"] = "数据库为空"
+                elif self.device_id and self.device_id not in db:
+                    record["error"] = "设备不在数据库中"
+                else:
+                    passed, match_id, score, details = Authenticate.match_fingerprint(
+                        fingerprint, db, device_id=self.device_id, threshold=self.threshold, verbose=False)
+                    record.update(passed=bool(passed), match_id=match_id, score=float(score), details=details)
+                    if self.audit_log is not None:
+                        self.audit_log.record(record["files"], self.device_id, match_id, score,
+                                              self.threshold, passed, details)
+        if "error" in record and self.audit_log is not None:
+            self.audit_log.record_rejection(record["files"], self.device_id, self.threshold, record["error"])
+        latency = time.monotonic() - detected
+        record["latency_ms"] = latency * 1000
+        Metrics.record_auth("watch", None if "error" in record else record["passed"], latency)
+        return record
+
+    def watch(self, stop_event=None, max_results=None):
+        """
+        持续监视，逐条产出认证结果（生成器）
+
+        参数:
+        - stop_event: threading.Event，置位后在下一轮检查时退出（会话模式下先认证未结束的会话）
+        - max_results: 产出该数量的结果后退出
+        """
+        stop_event = stop_event or threading.Event()
+        produced = 0
+        interval = max(min(self.settle, self.session_gap) / 4, 0.05)
+        try:
+            while True:
+                stopping = stop_event.is_set()
+                now = time.monotonic()
+                for name, closed in self.source.poll(0 if stopping else interval):
+                    self._on_event(name, closed, now)
+                completed = self._completed(now)
+
+                batches = []
+                if self.session:
+                    if completed:
+                        self._session.extend(completed)
+                        self._session_last = now
+                    if self._session and (stopping or now - self._session_last >= self.session_gap):
+                        batches.append(self._session)
+                        self._session = []
+                else:
+                    batches.extend([path] for path in completed)
+
+                for batch in batches:
+                    yield self.score(batch, detected=now)
+                    produced += 1
+                    if max_results is not None and produced >= max_results:
+                        return
+                if stopping:
+                    return
+        finally:
+            self.source.close()
+
+    def run(self, stop_event=None, max_results=None, on_result=None):
+        """ 阻塞运行，每条结果交给 on_result (默认打印)，Ctrl+C 退出；返回全部结果 """
+        on_result = on_result or print_result
+        results = []
+        try:
+            for result in self.watch(stop_event, max_results):
+                results.append(result)
+                on_result(result)
+        except KeyboardInterrupt:
+            print("\n[-] 停止监视。")
+        return results
+
+
+def print_result(result):
+    files = ", ".join(result["files"])
+    if "error" in result:
+        print(f"[!] {files}: {result['error']}")
+        return
+    verdict = "[放行]" if result["passed"] else "[阻止]"
+    print(f"{verdict} {files}: {result['match_id'] or '无匹配'} ({result['score']:.1f}%), "
+          f"{result['latency_ms']:.0f} ms")
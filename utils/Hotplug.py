@@ -0,0 +1,425 @@
+"""
+热插拔触发的无人值守认证守护进程
+闸机上没有操作员回答"已拔出？"的提示，由内核热插拔事件驱动整个流程：
+- 端口空闲（上一台设备已拔出）时立即启动抓包，等待下一次插入，枚举阶段完整落在抓包内
+- 收到 USB 设备 add 事件即识别 bus/address，挂载后执行 I/O 负载，包流静默后停止
+- 采集结束自动认证并写入审计日志，再等待该设备拔出 (remove 事件) 后重新布防
+事件源可替换：pyudev、原生 netlink (NETLINK_KOBJECT_UEVENT)，或用于测试的模拟事件源。
+"""
+
+import os
+import queue
+import shutil
+import socket
+import sys
+import threading
+import time
+from collections import namedtuple
+from utils import AuditLog, Authenticate, AutoCatch, Retention, Usbmon
+
+try:
+    import pyudev
+except ImportError:
+    pyudev = None
+
+NETLINK_KOBJECT_UEVENT = 15
+
+# action: "add" / "remove" / ...；devpath: /devices/... (不含 /sys)；time: 收到事件的 time.time()
+HotplugEvent = namedtuple("HotplugEvent", "action devpath bus devnum vendor_id product_id serial product time")
+
+
+def _port_of(devpath):
+    """ '/devices/pci0000:00/.../usb1/1-2' -> '1-2' """
+    return os.path.basename(devpath.rstrip('/'))
+
+
+def event_from_properties(props, received=None):
+    """
+    由 uevent 属性构造 HotplugEvent；非 USB 设备节点 (接口、hub) 返回 None
+
+    参数:
+    - props: {"ACTION", "DEVPATH", "SUBSYSTEM", "DEVTYPE", "BUSNUM", "DEVNUM", "PRODUCT", "TYPE", ...}
+    """
+    if props.get("SUBSYSTEM") != "usb" or props.get("DEVTYPE") != "usb_device":
+        return None
+    if props.get("TYPE", "").split('/')[0] == "9":
+        return None  # bDeviceClass 09: hub
+    try:
+        bus = int(props.get("BUSNUM", ""), 10)
+        devnum = int(props.get("DEVNUM", ""), 10)
+    except ValueError:
+        return None
+    # PRODUCT=idVendor/idProduct/bcdDevice (十六进制，无前导 0)
+    vendor, product_id = "", ""
+    parts = props.get("PRODUCT", "").split('/')
+    if len(parts) >= 2:
+        try:
+            vendor, product_id = f"{int(parts[0], 16):04x}", f"{int(parts[1], 16):04x}"
+        except ValueError:
+            pass
+    return HotplugEvent(props.get("ACTION", ""), props.get("DEVPATH", ""), bus, devnum,
+                        props.get("ID_VENDOR_ID", vendor), props.get("ID_MODEL_ID", product_id),
+                        props.get("ID_SERIAL_SHORT", ""), props.get("ID_MODEL", ""),
+                        received if received is not None else time.time())
+
+
+def parse_uevent(message):
+    """
+    解析内核 uevent 报文: b"add@/devices/...\\0ACTION=add\\0DEVPATH=...\\0..."
+
+    返回:
+    - dict 属性；libudev 转发的报文 (b"libudev" 开头) 或无法解析时返回 None
+    """
+    if message.startswith(b"libudev"):
+        return None
+    fields = message.split(b"\0")
+    if not fields or b"@" not in fields[0]:
+        return None
+    props = {}
+    for field in fields[1:]:
+        key, sep, value = field.partition(b"=")
+        if sep:
+            props[key.decode("ascii", "replace")] = value.decode("utf-8", "replace")
+    return props
+
+
+def to_usb_device(event):
+    """ 将事件转换为 Usbmon.UsbDevice（sysfs 节点存在时以 sysfs 为准） """
+    sysfs_path = "/sys" + event.devpath
+    dev = Usbmon.read_device(sysfs_path) if os.path.isdir(sysfs_path) else None
+    if dev is not None:
+        return dev
+    return Usbmon.UsbDevice(event.bus, event.devnum, sysfs_path, event.vendor_id, event.product_id,
+                            event.serial, event.product)
+
+
+# ==================== 事件源 ====================
+
+class EventSource:
+    """
+    热插拔事件源接口
+
+    - start() 开始接收（布防前调用，之后的事件不会丢失）
+    - get(timeout) 返回下一个 HotplugEvent，超时返回 None
+    - close()
+    """
+
+    def start(self):
+        return self
+
+    def get(self, timeout=None):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class SimulatedEventSource(EventSource):
+    """
+    模拟事件源（测试用）
+
+    用法:
+        source = SimulatedEventSource()
+        source.add(1, 5, port="1-2")      # 插入 Bus 001 Device 005
+        source.remove(1, 5, port="1-2")   # 拔出
+    """
+
+    def __init__(self, events=()):
+        self._queue = queue.Queue()
+        for event in events:
+            self.inject(event)
+
+    def inject(self, event):
+        self._queue.put(event)
+
+    def _event(self, action, bus, devnum, port, vendor_id, product_id, serial, product):
+        port = port or f"{bus}-{devnum}"
+        devpath = f"/devices/simulated/usb{bus}/{port}"
+        self.inject(HotplugEvent(action, devpath, bus, devnum, vendor_id, product_id, serial, product, time.time()))
+
+    def add(self, bus, devnum, port=None, vendor_id="0000", product_id="0000", serial="", product="Simulated"):
+        self._event("add", bus, devnum, port, vendor_id, product_id, serial, product)
+
+    def remove(self, bus, devnum, port=None):
+        self._event("remove", bus, devnum, port, "", "", "", "")
+
+    def get(self, timeout=None):
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class NetlinkEventSource(EventSource):
+    """ 直接订阅内核 uevent 广播 (NETLINK_KOBJECT_UEVENT，组 1)，无需 pyudev """
+
+    def __init__(self):
+        self._sock = None
+
+    def start(self):
+        if not hasattr(socket, "AF_NETLINK"):
+            raise OSError("当前平台不支持 netlink")
+        self._sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_KOBJECT_UEVENT)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1024 * 1024)
+        self._sock.bind((0, 1))
+        return self
+
+    def get(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+            self._sock.settimeout(remaining)
+            try:
+                message = self._sock.recv(65536)
+            except (socket.timeout, BlockingIOError):  # timeout=0 时为非阻塞
+                return None
+            props = parse_uevent(message)
+            event = event_from_properties(props) if props else None
+            if event is not None:
+                return event
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+
+class PyudevEventSource(EventSource):
+    """ 通过 pyudev 接收 udev 处理后的事件（带 ID_SERIAL_SHORT 等属性） """
+
+    def __init__(self):
+        if pyudev is None:
+            raise ImportError("未安装 pyudev")
+        self._monitor = None
+
+    def start(self):
+        self._monitor = pyudev.Monitor.from_netlink(pyudev.Context())
+        self._monitor.filter_by('usb', 'usb_device')
+        self._monitor.start()
+        return self
+
+    def get(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+            device = self._monitor.poll(timeout=remaining)
+            if device is None:
+                return None
+            event = event_from_properties(dict(device.properties, ACTION=device.action))
+            if event is not None:
+                return event
+
+    def close(self):
+        self._monitor = None
+
+
+def default_source():
+    """ pyudev 可用时使用 pyudev，否则使用原生 netlink (仅 Linux) """
+    if not sys.platform.startswith('linux'):
+        raise OSError("热插拔守护进程仅支持 Linux")
+    return PyudevEventSource() if pyudev is not None else NetlinkEventSource()
+
+
+# ==================== 守护进程 ====================
+
+class HotplugDaemon:
+    """
+    无人值守认证守护进程
+
+    用法:
+        daemon = HotplugDaemon("usb_fingerprint_db.json", base_folder="/srv/devices",
+                               capture_kwargs={"interface": "usbmon0", "live": True})
+        daemon.run()          # Ctrl+C 或 daemon.stop() 结束
+    """
+
+    def __init__(self, db_file, base_folder="devices", sub_folder="hotplug", source=None, device_id=None,
+                 threshold=70.0, usb_port=None, arm_timeout=600.0, audit_db=None, retention=None,
+                 capture_kwargs=None, on_result=None, retry_delay=1.0, max_retry_delay=60.0):
+        """
+        参数:
+        - source: EventSource，None 则按平台选择 (default_source)
+        - sub_folder: 每次采集保存在 base_folder/sub_folder/<时间戳>/
+        - device_id / threshold: 同 Authenticate.authenticate_device
+        - usb_port: 只响应该物理端口 (sysfs 名称，如 "1-2") 上的设备
+        - arm_timeout: 布防后无设备插入时重新布防的间隔（秒），避免空闲抓包无限增长
+        - audit_db: 审计日志路径，None 则不记录
+        - retention: 保留策略配置 (同 Retention.from_config)，None 则不清理
+        - capture_kwargs: 透传给 AutoCatch.run_single_capture 的其他参数
+        - on_result: 可选回调 func(result_dict)，每次认证后调用
+        - retry_delay / max_retry_delay: 采集失败（抓包启动失败等）后重新布防前的等待，
+          连续失败时按指数增长直到上限，成功一次后复位
+        """
+        self.db_file = db_file
+        self.base_folder = os.path.abspath(base_folder)
+        self.sub_folder = sub_folder
+        self.source = source
+        self.device_id = device_id
+        self.threshold = threshold
+        self.usb_port = usb_port
+        self.arm_timeout = arm_timeout
+        self.audit_db = audit_db
+        self.retention = retention
+        self.capture_kwargs = dict(capture_kwargs or {})
+        self.on_result = on_result
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+
+        self.stop_event = threading.Event()
+        self.results = []
+        self.failures = 0     # 连续采集失败次数
+        self._present = None  # 当前插着、等待拔出的设备 (bus, devnum)
+        self._armed_at = None
+        self._idle = False    # 本次布防在 arm_timeout 内无设备插入
+
+    def stop(self):
+        self.stop_event.set()
+
+    # --- 事件处理 ---
+
+    def _next_event(self, timeout):
+        """ 在 stop_event 置位前等待下一个事件（分段等待以便及时响应停止） """
+        deadline = time.monotonic() + timeout
+        while not self.stop_event.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            event = self.source.get(timeout=min(remaining, 0.5))
+            if event is not None:
+                if self.usb_port is None or _port_of(event.devpath) == self.usb_port:
+                    return event
+        return None
+
+    def _wait_removed(self):
+        """ 等待上一台设备拔出（run_single_capture 的确认回调：端口空闲即布防） """
+        if self._present is None:
+            return not self.stop_event.is_set()
+        print(f"[-] 等待设备拔出 (Bus {self._present[0]:03d} Device {self._present[1]:03d})...")
+        while not self.stop_event.is_set():
+            if self._present not in Usbmon.list_usb_devices() and os.path.isdir(Usbmon.SYSFS_USB_DEVICES):
+                break  # 事件可能在上一次采集期间已经发生
+            event = self._next_event(1.0)
+            if event is not None and event.action == "remove" and (event.bus, event.devnum) == self._present:
+                break
+        self._present = None
+        return not self.stop_event.is_set()
+
+    def _arm(self, title, message):
+        if not self._wait_removed():
+            return False
+        # 布防之前的 add 事件对应的设备枚举没有被抓到，丢弃
+        while True:
+            stale = self.source.get(timeout=0)
+            if stale is None:
+                break
+            if stale.action == "add":
+                print(f"    [!] 布防前插入的设备 (Bus {stale.bus:03d} Device {stale.devnum:03d}) "
+                      f"枚举未被捕获，请重新插拔")
+        self._armed_at = time.time()
+        return True
+
+    def _wait_device(self, known, timeout, port):
+        """ run_single_capture 的 wait_device：由 add 事件识别新设备 """
+        deadline = time.monotonic() + timeout
+        while True:
+            event = self._next_event(max(deadline - time.monotonic(), 0))
+            if event is None:
+                self._idle = not self.stop_event.is_set()
+                return None
+            if event.action != "add" or (event.bus, event.devnum) in known:
+                continue
+            self._present = (event.bus, event.devnum)
+            print(f"        热插拔事件: 布防后 {event.time - self._armed_at:.2f}s")
+            return to_usb_device(event)
+
+    # --- 主循环 ---
+
+    def _authenticate(self, folder):
+        audit_log = AuditLog.AuditLog(self.audit_db) if self.audit_db else None
+        try:
+            return Authenticate.authenticate_device(
+                auth_folder=folder,
+                db_file=self.db_file,
+                device_id=self.device_id,
+                threshold=self.threshold,
+                audit_log=audit_log
+            )
+        finally:
+            if audit_log is not None:
+                audit_log.close()
+
+    def run_once(self):
+        """
+        布防、采集并认证一次
+
+        返回:
+        - dict {"folder", "device", "passed", "match_id", "score", "seconds"}；
+          无设备插入 (arm_timeout) 或采集失败时返回 None
+        """
+        stamp = time.strftime("%Y%m%d_%H%M%S")
+        folder = os.path.join(self.base_folder, self.sub_folder, stamp)
+        suffix = 1
+        while os.path.exists(folder):
+            suffix += 1
+            folder = os.path.join(self.base_folder, self.sub_folder, f"{stamp}_{suffix}")
+        stamp = os.path.basename(folder)
+        self._idle = False
+        t0 = time.monotonic()
+        ok = AutoCatch.run_single_capture(
+            output_base_folder=self.base_folder,
+            sub_folder=os.path.join(self.sub_folder, stamp),
+            file_name="capture.pcapng",
+            confirm_callback=self._arm,
+            insert_timeout=self.arm_timeout,
+            usb_port=self.usb_port,
+            wait_device=self._wait_device,
+            **self.capture_kwargs
+        )
+        if not ok:
+            # 超时或失败的采集（可能是长时间的根集线器流量）连同文件夹一起删除
+            shutil.rmtree(folder, ignore_errors=True)
+            return None
+
+        passed, match_id, score = self._authenticate(folder)
+        result = {"folder": folder, "device": self._present, "passed": passed, "match_id": match_id,
+                  "score": score, "seconds": time.monotonic() - t0}
+        verdict = "[放行]" if passed else "[阻止]"
+        print(f"{verdict} 设备 {match_id or '未知'}, 相似度 {score:.2f}, 用时 {result['seconds']:.1f}s")
+        if self.retention is not None:
+            Retention.from_config(self.base_folder, self.retention).enforce()
+        if self.on_result:
+            self.on_result(result)
+        return result
+
+    def run(self, max_captures=None):
+        """
+        循环执行直到 stop() / Ctrl+C
+
+        参数:
+        - max_captures: 完成该数量的认证后退出，None 表示不限
+        """
+        if self.source is None:
+            self.source = default_source()
+        self.source.start()
+        print(f"\n>>> 无人值守认证已启动 ({type(self.source).__name__}"
+              + (f", 端口 {self.usb_port}" if self.usb_port else "") + ")")
+        try:
+            while not self.stop_event.is_set():
+                result = self.run_once()
+                if result is not None:
+                    self.failures = 0
+                    self.results.append(result)
+                    if max_captures is not None and len(self.results) >= max_captures:
+                        break
+                elif not self._idle and not self.stop_event.is_set():
+                    # 抓包启动失败等：退避后再布防，避免接口故障时反复重启抓包
+                    self.failures += 1
+                    delay = min(self.retry_delay * 2 ** (self.failures - 1), self.max_retry_delay)
+                    print(f"[!] 采集失败 (连续 {self.failures} 次)，{delay:.1f}s 后重新布防")
+                    self.stop_event.wait(delay)
+        except KeyboardInterrupt:
+            print("\n[-] 收到中断，停止守护进程。")
+        finally:
+            self.source.close()
+        return self.results
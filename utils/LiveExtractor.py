@@ -0,0 +1,201 @@
+"""
+实时流式特征提取模块
+在抓包进行的同时，通过管道读取 tshark 的逐包字段输出，实时更新枚举与各 endpoint 的统计：
+- start_capture(): 启动 tshark 抓包 (-w 保存 pcapng 的同时 -P 输出字段)
+- start_replay():  用 tshark -r 把已录制的 pcapng 回放进同一条管道（用于测试与对比）
+- start_stream():  从任意文本流读取（例如预先导出的字段文本）
+I/O 测试结束、抓包停止时特征已经就绪，无需再从磁盘重新解析 pcapng。
+"""
+
+import subprocess
+import threading
+from utils import FeatureExtractor, Readiness
+
+# tshark -T fields 输出的字段（顺序即列顺序）
+LIVE_FIELDS = ("frame.time_epoch", "usb.transfer_type", "usb.endpoint_address", "usb.bus_id", "usb.device_address")
+
+
+def build_field_args(fields=LIVE_FIELDS):
+    """ 构建 tshark 字段输出参数 """
+    args = ['-T', 'fields', '-E', 'separator=/t', '-E', 'occurrence=f']
+    for field in fields:
+        args += ['-e', field]
+    return args
+
+
+def parse_field_line(line):
+    """
+    解析一行 tshark 字段输出
+
+    返回:
+    - (timestamp, t_type, endpoint, bus, address) 或 None (非 USB 包 / 格式错误)
+      bus / address 缺失时为 None
+    """
+    parts = line.rstrip('\r\n').split('\t')
+    if len(parts) < 3 or not parts[1]:
+        return None
+    try:
+        timestamp = float(parts[0])
+    except ValueError:
+        return None
+    bus = _parse_int(parts[3]) if len(parts) > 3 else None
+    address = _parse_int(parts[4]) if len(parts) > 4 else None
+    return timestamp, FeatureExtractor.transfer_type_name(parts[1]), parts[2] or None, bus, address
+
+
+def _parse_int(value):
+    try:
+        return int(value, 0)
+    except ValueError:
+        return None
+
+
+class LiveExtractor:
+    """
+    管道式实时特征提取器
+
+    用法:
+        extractor = LiveExtractor()
+        proc = extractor.start_capture(tshark_path, interface, save_path)
+        ...                                # I/O 测试期间可随时 extractor.live_stats()
+        proc.terminate()
+        enum_val, transfer_data = extractor.finish()
+    """
+
+    def __init__(self, verbose=False, on_packet=None, device_filter=False):
+        """
+        参数:
+        - verbose: 是否输出累加器的调试信息
+        - on_packet: 可选回调 func(timestamp, t_type, endpoint)，每个 USB 包调用一次
+        - device_filter: 只累积被测设备的包（见 set_device）
+        """
+        self.accumulator = FeatureExtractor.FeatureAccumulator(verbose=verbose)
+        self.gate = FeatureExtractor.DeviceGate(self.accumulator.feed, enabled=device_filter)
+        self.on_packet = on_packet
+        self.proc = None
+        self.stderr_watcher = None
+        # 包到达时间，用于静默检测 (Readiness.ActivityMonitor.wait_quiet)
+        self.activity = Readiness.ActivityMonitor()
+        self._lock = threading.Lock()
+        self._reader = None
+
+    # ==================== 数据源 ====================
+
+    def _spawn(self, cmd):
+        self.proc = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            bufsize=1
+        )
+        self.stderr_watcher = Readiness.StderrWatcher(self.proc.stderr)
+        self.start_stream(self.proc.stdout)
+        return self.proc
+
+    def start_capture(self, tshark_path, interface, save_path=None, extra_args=()):
+        """
+        启动实时抓包
+
+        参数:
+        - save_path: 同时保存的 pcapng 路径，None 则只做实时提取
+        - extra_args: 追加到 tshark 命令行的参数
+
+        返回:
+        - subprocess.Popen: tshark 进程
+        """
+        cmd = [tshark_path, '-i', interface, '-l']
+        if save_path:
+            cmd += ['-F', 'pcapng', '-w', save_path, '-P']
+        cmd += list(extra_args) + build_field_args()
+        return self._spawn(cmd)
+
+    def start_replay(self, pcap_path, tshark_path='tshark'):
+        """ 将已录制的 pcapng 通过 tshark -r 回放进管道 """
+        return self._spawn([tshark_path, '-r', pcap_path, '-l'] + build_field_args())
+
+    def start_stream(self, stream):
+        """ 在后台线程中读取字段文本流 (每行一个包) """
+        self._reader = threading.Thread(target=self._read_stream, args=(stream,), daemon=True)
+        self._reader.start()
+
+    def _read_stream(self, stream):
+        for line in stream:
+            self.feed_line(line)
+
+    # ==================== 累积 ====================
+
+    def feed_line(self, line):
+        parsed = parse_field_line(line)
+        with self._lock:
+            self.accumulator.packet_index += 1
+            if parsed is None:
+                return
+            self.gate.feed(*parsed)
+            accepted = self.gate.accepts(*parsed[3:])
+        if not accepted:
+            return
+        # 只有被测设备的包计入活动：同一总线上其他设备的流量不推迟静默判定
+        self.activity.touch()
+        if self.on_packet:
+            self.on_packet(*parsed[:3])
+
+    def set_device(self, device=None, window=None, required=True):
+        """
+        设定被测设备 (bus, address)，之后只累积该设备的包
+
+        参数:
+        - device: None 时按已收到的 Bulk 流量推断；推断失败则放弃过滤
+        - window: 推断时只统计该 (start, end) 时间范围内的包
+        - required: False 时推断失败保持暂存（稍后再试），不放弃过滤
+
+        返回:
+        - 实际使用的 (bus, address) 或 None
+        """
+        with self._lock:
+            if not self.gate.enabled:
+                return None
+            if self.gate.device is not None:
+                return self.gate.device
+            device = device or self.gate.infer_device(window)
+            if device is None:
+                if required:
+                    self.gate.release()
+            else:
+                self.gate.set_device(*device)
+            return device
+
+    def live_stats(self):
+        """ 当前的实时统计 (见 FeatureAccumulator.live_stats) """
+        with self._lock:
+            return self.accumulator.live_stats()
+
+    def finish(self, timeout=30):
+        """
+        等待数据流结束（进程退出 / 流 EOF）并返回最终特征
+
+        返回:
+        - (enum_val, transfer_raw_data)，与 FeatureExtractor.process_pcap_file 一致
+        """
+        if self.proc is not None:
+            try:
+                self.proc.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+                self.proc.wait()
+        if self._reader is not None:
+            self._reader.join(timeout=timeout)
+        if self.stderr_watcher is not None:
+            self.stderr_watcher.join(timeout=1)
+        if self.gate.enabled and self.gate.device is None:
+            self.set_device()
+        with self._lock:
+            self.accumulator.log_summary()
+            return self.accumulator.result()
+
+
+def replay_capture(pcap_path, tshark_path='tshark'):
+    """ 回放已录制的 pcapng 并返回实时路径提取出的特征（结果应与 process_pcap_file 一致） """
+    extractor = LiveExtractor()
+    extractor.start_replay(pcap_path, tshark_path)
+    return extractor.finish()
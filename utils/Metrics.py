@@ -0,0 +1,455 @@
+"""
+Prometheus 指标导出
+闸机站点的吞吐与延迟需要接入监控面板。本模块提供进程内指标注册表，以 Prometheus 文本格式导出：
+- 本地 HTTP 端点: start_http_server(port) 提供 GET /metrics（认证服务的 /metrics 同样可用）
+- textfile collector: write_textfile(path) / TextfileExporter 定期原子写入 *.prom 文件，由 node_exporter 采集
+
+更新路径无锁：每个线程写自己的计数单元（只有所属线程写入，GIL 下无需加锁），
+导出时再把所有线程的单元相加。已退出线程的单元在新线程首次写入时（以及导出时）并入累计值，
+因此单元数只与同时存活的线程数有关：即使从不导出，也不会随处理过的请求线程增多而膨胀。
+
+内置指标:
+    usb_auth_latency_seconds{source}          认证判定延迟（直方图）
+    usb_parse_latency_seconds{backend}        单个文件解析耗时（直方图）
+    usb_packets_processed_total               解析的包数
+    usb_feature_cache_requests_total{cache,result}  特征缓存查询（命中/未命中）
+    usb_feature_cache_hit_ratio{cache}        特征缓存命中率
+    usb_auth_decisions_total{source,result}   判定次数（pass / fail / error）
+    usb_db_devices                            指纹库中的设备数
+
+用法:
+    Metrics.track_db("usb_fingerprint_db.json")
+    Metrics.start_http_server(9108)
+    curl http://127.0.0.1:9108/metrics
+"""
+
+import bisect
+import math
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+AUTH_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+PARSE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class _Cells:
+    """ 每线程一个计数单元 (list)，只有所属线程写入；sum() 汇总所有线程 """
+
+    def __init__(self, size):
+        self.size = size
+        self._local = threading.local()
+        self._lock = threading.Lock()   # 只在线程首次写入与导出时使用
+        self._cells = []                # [(线程, 单元)]
+        self._retired = [0] * size      # 已退出线程的累计值
+
+    def cell(self):
+        cell = getattr(self._local, "cell", None)
+        if cell is None:
+            cell = self._local.cell = [0] * self.size
+            with self._lock:
+                self._compact()
+                self._cells.append((threading.current_thread(), cell))
+        return cell
+
+    def _compact(self):
+        # 已退出线程不会再写入，其单元并入累计值（调用方持有 _lock）
+        alive = []
+        for thread, cell in self._cells:
+            if thread.is_alive():
+                alive.append((thread, cell))
+            else:
+                self._retired = [a + b for a, b in zip(self._retired, cell)]
+        self._cells = alive
+
+    def sum(self):
+        with self._lock:
+            self._compact()
+            total = list(self._retired)
+            for _, cell in self._cells:
+                for i, value in enumerate(cell):
+                    total[i] += value
+        return total
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        return repr(value)
+    return str(value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels_text(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._children_lock = threading.Lock()
+
+    def labels(self, *values, **kwargs):
+        """ 取带标签的子指标（首次创建时加锁，之后为一次字典查找） """
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name}: 需要标签 {self.labelnames}")
+            with self._children_lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _default(self):
+        if self.labelnames:
+            raise ValueError(f"{self.name}: 需要先指定标签 {self.labelnames}")
+        return self.labels()
+
+    def _items(self):
+        with self._children_lock:
+            return sorted(self._children.items())
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in self._items():
+            lines.extend(self._sample_lines(values, child))
+        return lines
+
+
+class _CounterChild:
+    def __init__(self):
+        self._cells = _Cells(1)
+
+    def inc(self, amount=1):
+        self._cells.cell()[0] += amount
+
+    def value(self):
+        return self._cells.sum()[0]
+
+
+class Counter(_Metric):
+    """ 单调递增计数 """
+
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+    def value(self, *values):
+        return self.labels(*values).value()
+
+    def _sample_lines(self, values, child):
+        return [f"{self.name}{_labels_text(self.labelnames, values)} {_format_value(child.value())}"]
+
+
+class _GaugeChild:
+    def __init__(self):
+        self._value = 0.0
+        self._function = None
+        self._lock = threading.Lock()
+
+    def set(self, value):
+        self._value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set_function(self, func):
+        """ 导出时调用 func() 取值（如数据库设备数） """
+        self._function = func
+
+    def value(self):
+        if self._function is not None:
+            try:
+                return self._function()
+            except Exception:
+                return float("nan")
+        return self._value
+
+
+class Gauge(_Metric):
+    """ 可增可减的瞬时值，或导出时计算的值 """
+
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self._default().set(value)
+
+    def set_function(self, func):
+        self._default().set_function(func)
+
+    def value(self, *values):
+        return self.labels(*values).value()
+
+    def _sample_lines(self, values, child):
+        return [f"{self.name}{_labels_text(self.labelnames, values)} {_format_value(child.value())}"]
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # 单元布局: 各桶计数 (非累积, 最后一个为 +Inf) | 总次数 | 总和
+        self._cells = _Cells(len(buckets) + 3)
+
+    def observe(self, value):
+        cell = self._cells.cell()
+        cell[bisect.bisect_left(self.buckets, value)] += 1
+        cell[-2] += 1
+        cell[-1] += value
+
+    def snapshot(self):
+        """ 返回 (累积桶计数, 次数, 总和) """
+        total = self._cells.sum()
+        cumulative, running = [], 0
+        for count in total[:-2]:
+            running += count
+            cumulative.append(running)
+        return cumulative, total[-2], total[-1]
+
+
+class Histogram(_Metric):
+    """ 分桶直方图（Prometheus histogram，le 为上界） """
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=AUTH_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+    def _sample_lines(self, values, child):
+        cumulative, count, total = child.snapshot()
+        lines = []
+        for bound, value in zip(self.buckets + (float("inf"),), cumulative):
+            le = ("le", _format_value(float(bound)))
+            lines.append(f"{self.name}_bucket{_labels_text(self.labelnames, values, le)} {value}")
+        labels = _labels_text(self.labelnames, values)
+        lines.append(f"{self.name}_count{labels} {count}")
+        lines.append(f"{self.name}_sum{labels} {_format_value(float(total))}")
+        return lines
+
+
+class Registry:
+    """ 指标注册表 """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"指标已存在: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=AUTH_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def expose(self):
+        """ Prometheus 文本格式 """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+AUTH_LATENCY = REGISTRY.histogram("usb_auth_latency_seconds", "认证判定延迟（从开始解析到得出判定）",
+                                  ("source",), AUTH_BUCKETS)
+PARSE_LATENCY = REGISTRY.histogram("usb_parse_latency_seconds", "单个采集文件的解析耗时",
+                                   ("backend",), PARSE_BUCKETS)
+PACKETS = REGISTRY.counter("usb_packets_processed_total", "解析的 USB 包数")
+CACHE_REQUESTS = REGISTRY.counter("usb_feature_cache_requests_total", "特征缓存查询次数",
+                                  ("cache", "result"))
+CACHE_HIT_RATIO = REGISTRY.gauge("usb_feature_cache_hit_ratio", "特征缓存命中率", ("cache",))
+DECISIONS = REGISTRY.counter("usb_auth_decisions_total", "认证判定次数", ("source", "result"))
+DB_DEVICES = REGISTRY.gauge("usb_db_devices", "指纹库中的设备数")
+
+_exporting = False
+
+
+def _hit_ratio(cache):
+    hits = CACHE_REQUESTS.value(cache, "hit")
+    total = hits + CACHE_REQUESTS.value(cache, "miss")
+    return hits / total if total else 0.0
+
+
+for _cache in ("disk", "memory"):
+    CACHE_HIT_RATIO.labels(_cache).set_function(lambda cache=_cache: _hit_ratio(cache))
+
+
+# ==================== 插桩辅助 ====================
+
+def record_parse(backend, seconds, packets):
+    """ 记录一个文件的解析（backend: native / tshark） """
+    PARSE_LATENCY.labels(backend).observe(seconds)
+    PACKETS.inc(packets)
+
+
+def record_cache(cache, hit):
+    """ 记录一次特征缓存查询（cache: disk / memory） """
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def record_auth(source, passed, seconds=None):
+    """
+    记录一次认证判定
+
+    参数:
+    - source: 入口 (local / server / watch / cli)
+    - passed: True / False，None 表示出错
+    - seconds: 判定延迟，None 表示不计入延迟直方图
+    """
+    result = "error" if passed is None else ("pass" if passed else "fail")
+    DECISIONS.labels(source, result).inc()
+    if seconds is not None:
+        AUTH_LATENCY.labels(source).observe(seconds)
+
+
+def record_profile(profile):
+    """
+    把其他进程传回的 Profiler 数据 (as_dict) 计入指标
+
+    进程池中的解析记录在工作进程自己的注册表里，导出进程看不到；
+    工作进程以 Profile 传回后由此补记（只含解析与磁盘缓存）。
+    """
+    stages = profile.get("stages", {})
+    counters = profile.get("counters", {})
+    parse = stages.get("parse")
+    if parse:
+        backend = "tshark" if "tshark_startup" in stages else "native"
+        seconds = parse["seconds"] + stages.get("tshark_startup", {}).get("seconds", 0.0)
+        PARSE_LATENCY.labels(backend).observe(seconds / max(parse["calls"], 1))
+    if counters.get("packets"):
+        PACKETS.inc(counters["packets"])
+    for key, result in (("cache_hits", "hit"), ("cache_misses", "miss")):
+        if counters.get(key):
+            CACHE_REQUESTS.labels("disk", result).inc(counters[key])
+
+
+def track_db(db_file):
+    """ usb_db_devices 在导出时读取该数据库的当前快照 """
+    from utils import FingerprintDB
+    store = FingerprintDB.get_store(db_file)
+    DB_DEVICES.set_function(lambda: len(store.current()) if os.path.exists(db_file) else 0)
+
+
+def exporting():
+    """ 是否已启动导出（HTTP 端点或 textfile）；进程池调用方据此决定是否传回解析计时 """
+    return _exporting
+
+
+# ==================== 导出 ====================
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        data = self.server.registry.expose().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+def start_http_server(port, host="127.0.0.1", registry=REGISTRY):
+    """
+    在后台线程提供 GET /metrics
+
+    返回:
+    - ThreadingHTTPServer，调用 shutdown() 停止；port=0 时实际端口见 server.server_address
+    """
+    global _exporting
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.registry = registry
+    threading.Thread(target=server.serve_forever, name="MetricsHTTP", daemon=True).start()
+    _exporting = True
+    return server
+
+
+def write_textfile(path, registry=REGISTRY):
+    """ 原子写入 textfile collector 文件（先写临时文件再替换，采集方不会读到半个文件） """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(registry.expose())
+    os.replace(tmp_path, path)
+
+
+class TextfileExporter:
+    """ 定期写入 textfile collector 文件，stop() 时再写一次最终值 """
+
+    def __init__(self, path, interval=15.0, registry=REGISTRY):
+        global _exporting
+        self.path = path
+        self.interval = interval
+        self.registry = registry
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="MetricsTextfile", daemon=True)
+        _exporting = True
+        self._thread.start()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self._write()
+
+    def _write(self):
+        try:
+            write_textfile(self.path, self.registry)
+        except OSError as e:
+            print(f"[!] 指标文件写入失败: {e}")
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self._write()
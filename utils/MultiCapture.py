@@ -0,0 +1,211 @@
+"""
+多端口并发采集模块
+一台工位同时为多个 U 盘采集注册样本：
+- 每个端口一个工作线程，各自的抓包进程、I/O 负载与输出文件夹 (root/<设备ID>/)
+- 资源限制：同时进行 I/O 测试的设备总数，以及同一控制器 (USBPcapN / usbmonN) 上的并发数，
+  避免主机 USB 控制器饱和导致包间隔特征失真
+- 采集完成后以 Register.run_bulk_registration 一次注册全部设备
+同一接口上有多台设备时自动开启按设备过滤 (device_filter)。
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from utils import AutoCatch, Register
+
+
+class PortSpec:
+    """
+    一个采集端口
+
+    参数:
+    - device_id: 设备ID（输出子文件夹名、注册ID）
+    - interface: 抓包接口 (USBPcapN / usbmonN)，同一接口即同一 USB 控制器
+    - drive_letter: Windows 盘符
+    - mount_point: Linux 挂载点，None 则自动识别
+    - usb_port: Linux sysfs 物理端口名 (如 "1-2")，多台设备同时插入时据此区分；
+      Linux 下有多个端口时必须指定
+    - count: 采集次数
+    """
+
+    def __init__(self, device_id, interface, drive_letter=None, mount_point=None, usb_port=None, count=3):
+        self.device_id = device_id
+        self.interface = interface
+        self.drive_letter = drive_letter
+        self.mount_point = mount_point
+        self.usb_port = usb_port
+        self.count = count
+
+    @classmethod
+    def from_dict(cls, cfg):
+        return cls(**cfg)
+
+
+class _IoSlot:
+    """ I/O 测试期间同时持有全局与控制器两级信号量 """
+
+    def __init__(self, global_sem, controller_sem, label):
+        self.global_sem = global_sem
+        self.controller_sem = controller_sem
+        self.label = label
+        self.waited = 0.0
+
+    def __enter__(self):
+        t0 = time.monotonic()
+        self.controller_sem.acquire()
+        self.global_sem.acquire()
+        self.waited = time.monotonic() - t0
+        if self.waited > 0.5:
+            print(f"\n    [{self.label}] 等待 I/O 配额 {self.waited:.1f}s")
+        return self
+
+    def __exit__(self, *exc):
+        self.global_sem.release()
+        self.controller_sem.release()
+
+
+class MultiCaptureOrchestrator:
+    """
+    多端口并发采集编排器
+
+    用法:
+        ports = [PortSpec("SanDisk_32G", "USBPcap1", drive_letter="E"),
+                 PortSpec("Kingston_16G", "USBPcap2", drive_letter="F")]
+        orch = MultiCaptureOrchestrator(ports, base_folder="devices")
+        orch.run()
+        orch.register("usb_fingerprint_db.json")
+    """
+
+    def __init__(self, ports, base_folder="devices", sub_folder="enroll_multi", max_active_io=2,
+                 per_controller_io=1, confirm_callback=None, capture_kwargs=None):
+        """
+        参数:
+        - ports: PortSpec 列表（或其 dict 配置）
+        - max_active_io: 全站同时进行 I/O 测试的设备数上限
+        - per_controller_io: 同一抓包接口 (控制器) 上同时进行 I/O 测试的设备数上限
+        - confirm_callback: 同 AutoCatch.run_single_capture；None 时在控制台逐个确认
+        - capture_kwargs: 透传给 run_single_capture 的其他参数 (live / header_only / workload ...)
+        """
+        self.ports = [p if isinstance(p, PortSpec) else PortSpec.from_dict(p) for p in ports]
+        ids = [p.device_id for p in self.ports]
+        if len(set(ids)) != len(ids):
+            raise ValueError("设备ID重复")
+        missing = [p.device_id for p in self.ports if not p.usb_port]
+        if not AutoCatch.IS_WINDOWS and len(self.ports) > 1 and missing:
+            # Linux 下按 sysfs 中新出现的设备识别目标（不分总线），多台设备只能靠物理端口区分
+            raise ValueError(f"多端口采集须为每个端口指定 usb_port: {', '.join(missing)}")
+        self.base_folder = os.path.abspath(base_folder)
+        self.sub_folder = sub_folder
+        self.confirm_callback = confirm_callback
+        self.capture_kwargs = dict(capture_kwargs or {})
+        self.max_active_io = max(1, max_active_io)
+        self.per_controller_io = max(1, per_controller_io)
+
+        self._global_sem = threading.Semaphore(self.max_active_io)
+        self._controller_sems = {p.interface: threading.Semaphore(self.per_controller_io)
+                                 for p in self.ports}
+        self._prompt_lock = threading.Lock()
+        self.results = {}
+
+    @property
+    def root_folder(self):
+        """ 各设备子文件夹所在目录 (Register.run_bulk_registration 的根目录) """
+        return os.path.join(self.base_folder, self.sub_folder)
+
+    def _confirm_for(self, port):
+        """ 多个端口线程共享一个操作员：确认提示逐个进行 """
+        def confirm(title, message):
+            with self._prompt_lock:
+                text = f"[{port.device_id} @ {port.interface}] {message}"
+                if self.confirm_callback:
+                    return self.confirm_callback(title, text)
+                input(f"        {text}，按回车继续...")
+                return True
+        return confirm
+
+    def _run_port(self, port):
+        shared = sum(1 for p in self.ports if p.interface == port.interface) > 1
+        kwargs = dict(self.capture_kwargs)
+        if shared:
+            kwargs["device_filter"] = True  # 同一控制器上的其他被测设备也会被抓到
+        if port.drive_letter:
+            kwargs["drive_letter"] = port.drive_letter
+        if port.mount_point or not AutoCatch.IS_WINDOWS:
+            kwargs["mount_point"] = port.mount_point
+
+        result = {"interface": port.interface, "captured": 0, "failed": 0, "seconds": 0.0}
+        t0 = time.monotonic()
+        for i in range(1, port.count + 1):
+            print(f"\n=== [{port.device_id}] 采集进度: {i}/{port.count} ===")
+            slot = _IoSlot(self._global_sem, self._controller_sems[port.interface], port.device_id)
+            ok = AutoCatch.run_single_capture(
+                interface=port.interface,
+                output_base_folder=self.root_folder,
+                sub_folder=port.device_id,
+                file_name=f"capture_{i}.pcapng",
+                confirm_callback=self._confirm_for(port),
+                usb_port=port.usb_port,
+                io_slot=slot,
+                **kwargs
+            )
+            result["captured" if ok else "failed"] += 1
+        result["seconds"] = time.monotonic() - t0
+        return result
+
+    def run(self, max_ports=None):
+        """
+        并发执行所有端口的采集
+
+        参数:
+        - max_ports: 同时工作的端口数（抓包进程数）上限，None 表示全部端口
+
+        返回:
+        - dict: {device_id: {"interface", "captured", "failed", "seconds"}}
+        """
+        workers = max(1, min(max_ports or len(self.ports), len(self.ports)))
+        print(f"\n>>> 多端口并发采集: {len(self.ports)} 个端口, 同时 {workers} 个抓包, "
+              f"I/O 并发上限 {self.max_active_io} (每控制器 {self.per_controller_io})")
+        t0 = time.monotonic()
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="MultiCapture") as pool:
+            futures = {port.device_id: pool.submit(self._run_port, port) for port in self.ports}
+            for dev_id, fut in futures.items():
+                try:
+                    self.results[dev_id] = fut.result()
+                except Exception as e:
+                    print(f"    [!] 端口 {dev_id} 采集异常: {e}")
+                    self.results[dev_id] = {"interface": None, "captured": 0, "failed": 0,
+                                            "seconds": 0.0, "error": str(e)}
+        elapsed = time.monotonic() - t0
+
+        total = sum(r["captured"] for r in self.results.values())
+        print("\n" + "=" * 60)
+        print(f"{'设备ID':<24}{'接口':<12}{'成功':>6}{'失败':>6}{'耗时(s)':>10}")
+        for dev_id, r in self.results.items():
+            print(f"{dev_id:<24}{str(r['interface']):<12}{r['captured']:>6}{r['failed']:>6}{r['seconds']:>10.1f}")
+        print("=" * 60)
+        print(f"[完成] 共 {total} 个样本, 总耗时 {elapsed:.1f}s")
+        return self.results
+
+    def register(self, db_file, workers=None):
+        """ 将本次采集到样本的设备批量注册 (返回值同 Register.run_bulk_registration) """
+        devices = [dev_id for dev_id, r in self.results.items() if r["captured"] > 0]
+        if not devices:
+            print("[错误] 没有采集成功的设备，跳过注册。")
+            return {}
+        return Register.run_bulk_registration(self.root_folder, db_file, workers=workers, devices=devices)
+
+
+def run_multi_enrollment(ports, db_file, base_folder="devices", max_active_io=2, per_controller_io=1,
+                         confirm_callback=None, **capture_kwargs):
+    """
+    [接口函数] 多端口并发采集并批量注册
+
+    返回:
+    - (采集结果, 注册结果)
+    """
+    orch = MultiCaptureOrchestrator(ports, base_folder=base_folder, max_active_io=max_active_io,
+                                    per_controller_io=per_controller_io, confirm_callback=confirm_callback,
+                                    capture_kwargs=capture_kwargs)
+    captures = orch.run()
+    return captures, orch.register(db_file)
@@ -0,0 +1,418 @@
+"""
+pcap / pcapng 文件读写模块（纯 Python，不依赖 tshark）
+只解析特征提取用到的 USB 头部字段：
+- LINKTYPE_USBPCAP (249):           Windows USBPcap
+- LINKTYPE_USB_LINUX (189):         Linux usbmon，48 字节头
+- LINKTYPE_USB_LINUX_MMAPPED (220): Linux usbmon (mmap 接口)，64 字节头
+同时提供 pcapng 写入器，供 Linux usbmon 二进制接口直接落盘。
+"""
+
+import math
+import os
+import struct
+from utils import FeatureExtractor
+
+LINKTYPE_USB_LINUX = 189
+LINKTYPE_USBPCAP = 249
+LINKTYPE_USB_LINUX_MMAPPED = 220
+USB_LINKTYPES = (LINKTYPE_USBPCAP, LINKTYPE_USB_LINUX, LINKTYPE_USB_LINUX_MMAPPED)
+
+# USBPcap 包头: headerLen, irpId, status, function, info, bus, device, endpoint, transfer, dataLength
+USBPCAP_HEADER = struct.Struct("<HQIHBHHBBI")
+# usbmon 包头: id, type(S/C/E), xfer_type, epnum, devnum, busnum, flag_setup, flag_data,
+#             ts_sec, ts_usec, status, length, len_cap, setup[8]
+USBMON_HEADER = struct.Struct("<QBBBBHccqiiII8s")
+USBMON_MMAPPED_HEADER_LEN = 64
+
+# 只保存包头时的快照长度：足以容纳 USBPcap (27/28 字节) 与 usbmon mmap (64 字节) 包头
+HEADER_SNAPLEN = 64
+
+# pcapng 块类型
+_SHB = 0x0A0D0D0A
+_IDB = 0x00000001
+_SPB = 0x00000003
+_EPB = 0x00000006
+_BYTE_ORDER_MAGIC = 0x1A2B3C4D
+_OPT_IF_TSRESOL = 9
+
+# 经典 pcap 魔数 -> (字节序, 时间戳分辨率)
+_PCAP_MAGIC = {
+    b"\xd4\xc3\xb2\xa1": ("<", 1e-6),
+    b"\xa1\xb2\xc3\xd4": (">", 1e-6),
+    b"\x4d\x3c\xb2\xa1": ("<", 1e-9),
+    b"\xa1\xb2\x3c\x4d": (">", 1e-9),
+}
+
+
+class PcapFormatError(Exception):
+    """ 文件不是可识别的 pcap / pcapng """
+
+
+class UnsupportedLinkType(Exception):
+    """ 文件中包含非 USB 链路类型 """
+
+
+# ==================== 读取 ====================
+
+def iter_packets(pcap_path):
+    """
+    逐包读取 pcap / pcapng
+
+    返回:
+    - 生成器，每项为 (linktype, timestamp, data, orig_len)
+      data 为实际保存的字节（截断抓包时 len(data) < orig_len）
+    """
+    for linktype, ticks, resolution, data, orig_len in _iter_raw(pcap_path):
+        yield linktype, ticks * resolution, data, orig_len
+
+
+def _iter_raw(pcap_path):
+    """ 逐包读取，时间戳保持为整数刻度 (ticks, 每刻度秒数)，改写文件时不损失精度 """
+    with open(pcap_path, 'rb') as f:
+        head = f.read(4)
+        f.seek(0)
+        if head == struct.pack("<I", _SHB):
+            yield from _iter_pcapng(f)
+        elif head in _PCAP_MAGIC:
+            yield from _iter_pcap(f)
+        else:
+            raise PcapFormatError(f"无法识别的文件格式: {os.path.basename(pcap_path)}")
+
+
+def _iter_pcap(f):
+    header = f.read(24)
+    endian, resolution = _PCAP_MAGIC[header[:4]]
+    linktype = struct.unpack(endian + "I", header[20:24])[0] & 0x0FFFFFFF
+    record = struct.Struct(endian + "IIII")
+    while True:
+        rec = f.read(record.size)
+        if len(rec) < record.size:
+            return
+        ts_sec, ts_frac, incl_len, orig_len = record.unpack(rec)
+        data = f.read(incl_len)
+        if len(data) < incl_len:
+            return  # 文件尾部被截断（例如抓包进程被强制终止）
+        yield linktype, ts_sec * round(1 / resolution) + ts_frac, resolution, data, orig_len
+
+
+def _iter_pcapng(f):
+    endian = "<"
+    interfaces = []  # [(linktype, 时间戳分辨率)]
+    while True:
+        head = f.read(8)
+        if len(head) < 8:
+            return
+        block_type = struct.unpack("<I", head[:4])[0]
+        if block_type == _SHB:
+            # 新的 Section：重新确定字节序，接口列表清空
+            magic = f.read(4)
+            endian = "<" if struct.unpack("<I", magic)[0] == _BYTE_ORDER_MAGIC else ">"
+            total_len = struct.unpack(endian + "I", head[4:8])[0]
+            body = f.read(total_len - 12)
+            interfaces = []
+            continue
+
+        block_type, total_len = struct.unpack(endian + "II", head)
+        if total_len < 12:
+            raise PcapFormatError(f"损坏的 pcapng 块 (长度 {total_len})")
+        body = f.read(total_len - 8)
+        if len(body) < total_len - 8:
+            return  # 文件尾部被截断
+
+        if block_type == _IDB:
+            linktype = struct.unpack(endian + "H", body[:2])[0]
+            interfaces.append((linktype, _parse_tsresol(body[8:-4], endian)))
+        elif block_type == _EPB:
+            if len(body) < 24:
+                raise PcapFormatError(f"损坏的 Enhanced Packet Block (长度 {total_len})")
+            if_id, ts_high, ts_low, cap_len, orig_len = struct.unpack(endian + "IIIII", body[:20])
+            if if_id >= len(interfaces):
+                raise PcapFormatError(f"数据包引用了未定义的接口 {if_id}")
+            linktype, resolution = interfaces[if_id]
+            yield linktype, (ts_high << 32) | ts_low, resolution, body[20:20 + cap_len], orig_len
+        elif block_type == _SPB:
+            # Simple Packet Block 没有时间戳，特征提取无法使用
+            continue
+
+
+def _parse_tsresol(options, endian):
+    """ 解析 IDB 选项中的 if_tsresol，缺省为微秒 """
+    pos = 0
+    while pos + 4 <= len(options):
+        code, length = struct.unpack(endian + "HH", options[pos:pos + 4])
+        if code == 0:
+            break
+        if code == _OPT_IF_TSRESOL and length >= 1:
+            value = options[pos + 4]
+            if value & 0x80:
+                return 2.0 ** -(value & 0x7F)
+            return 10.0 ** -value
+        pos += 4 + ((length + 3) & ~3)
+    return 1e-6
+
+
+def decode_usb(linktype, data):
+    """
+    解析 USB 包头
+
+    返回:
+    - dict: {"t_type", "endpoint", "bus", "device", "event"} 或 None (包头不完整)
+      endpoint 为 '0x81' 形式的字符串，与 tshark 的 usb.endpoint_address 一致；
+      event 为 usbmon 的 'S'/'C'/'E'，USBPcap 为 None
+    """
+    if linktype == LINKTYPE_USBPCAP:
+        if len(data) < USBPCAP_HEADER.size:
+            return None
+        _, _, _, _, _, bus, device, endpoint, transfer, _ = USBPCAP_HEADER.unpack_from(data)
+        return {"t_type": FeatureExtractor.transfer_type_name(transfer), "endpoint": f"0x{endpoint:02x}",
+                "bus": bus, "device": device, "event": None}
+
+    if linktype in (LINKTYPE_USB_LINUX, LINKTYPE_USB_LINUX_MMAPPED):
+        if len(data) < USBMON_HEADER.size:
+            return None
+        fields = USBMON_HEADER.unpack_from(data)
+        event, xfer_type, epnum, devnum, busnum = fields[1:6]
+        return {"t_type": FeatureExtractor.transfer_type_name(xfer_type), "endpoint": f"0x{epnum:02x}",
+                "bus": busnum, "device": devnum, "event": chr(event)}
+
+    raise UnsupportedLinkType(f"不支持的链路类型: {linktype}")
+
+
+def usb_header_length(linktype, data):
+    """ USB 包头长度（只保存包头时的截断位置） """
+    if linktype == LINKTYPE_USBPCAP:
+        # headerLen 字段包含控制传输的 stage 字节等扩展部分
+        return struct.unpack_from("<H", data)[0] if len(data) >= 2 else len(data)
+    if linktype == LINKTYPE_USB_LINUX:
+        return USBMON_HEADER.size
+    if linktype == LINKTYPE_USB_LINUX_MMAPPED:
+        return USBMON_MMAPPED_HEADER_LEN
+    raise UnsupportedLinkType(f"不支持的链路类型: {linktype}")
+
+
+def read_linktypes(pcap_path):
+    """ 文件中出现的链路类型集合（只读取文件头/接口描述块） """
+    linktypes = set()
+    with open(pcap_path, 'rb') as f:
+        head = f.read(4)
+        f.seek(0)
+        if head in _PCAP_MAGIC:
+            header = f.read(24)
+            endian = _PCAP_MAGIC[header[:4]][0]
+            return {struct.unpack(endian + "I", header[20:24])[0] & 0x0FFFFFFF}
+        if head != struct.pack("<I", _SHB):
+            raise PcapFormatError(f"无法识别的文件格式: {os.path.basename(pcap_path)}")
+        endian = "<"
+        while True:
+            block = f.read(8)
+            if len(block) < 8:
+                break
+            if struct.unpack("<I", block[:4])[0] == _SHB:
+                endian = "<" if struct.unpack("<I", f.read(4))[0] == _BYTE_ORDER_MAGIC else ">"
+                f.seek(struct.unpack(endian + "I", block[4:8])[0] - 12, os.SEEK_CUR)
+                continue
+            block_type, total_len = struct.unpack(endian + "II", block)
+            if block_type == _IDB:
+                linktypes.add(struct.unpack(endian + "H", f.read(2))[0])
+                f.seek(total_len - 10, os.SEEK_CUR)
+            elif block_type in (_EPB, _SPB):
+                break  # 接口描述块总在数据包之前
+            else:
+                f.seek(total_len - 8, os.SEEK_CUR)
+    return linktypes
+
+
+def iter_usb_packets(pcap_path):
+    """
+    逐包读取并解析 USB 包头
+
+    返回:
+    - 生成器，每项为 (timestamp, usb_info)，usb_info 见 decode_usb (包头不完整时为 None)
+    """
+    for linktype, timestamp, data, _ in iter_packets(pcap_path):
+        yield timestamp, decode_usb(linktype, data)
+
+
+def dominant_device(pcap_path, window=None):
+    """
+    推断被测设备：Bulk 包最多的 (bus, address)
+
+    I/O 测试期间被测 U 盘的 Bulk 流量远多于根集线器上的其他设备，
+    Windows 下无法从系统得到 USBPcap 的设备地址时以此识别。
+
+    参数:
+    - window: 可选 (start, end) 时间范围，只统计被测设备 I/O 测试期间的包
+
+    返回:
+    - (bus, address) 或 None
+    """
+    counts = {}
+    for timestamp, usb in iter_usb_packets(pcap_path):
+        if window is not None and not window[0] <= timestamp <= window[1]:
+            continue
+        if usb is not None and usb["t_type"] == 'BULK':
+            key = (usb["bus"], usb["device"])
+            counts[key] = counts.get(key, 0) + 1
+    return max(counts, key=counts.get) if counts else None
+
+
+def device_matches(usb, device):
+    """ 包是否属于目标设备；地址 0 为 SET_ADDRESS 之前的枚举请求，同一总线上一并保留 """
+    return usb["bus"] == device[0] and usb["device"] in (0, device[1])
+
+
+def compact_capture(pcap_path, device=None, header_only=True, output_path=None, window=None):
+    """
+    压缩采集文件：只保留目标设备的包，并截断到 USB 包头
+
+    参数:
+    - device: (bus, address)，None 时用 dominant_device() 推断；False 表示不过滤设备
+    - header_only: 是否丢弃包头之后的数据
+    - output_path: 输出路径，None 表示原地替换
+    - window: 推断设备时使用的时间范围 (见 dominant_device)
+
+    返回:
+    - dict: {"device", "packets_in", "packets_out", "bytes_in", "bytes_out"}；
+      文件不是单一 USB 链路类型时返回 None（原文件保持不变）
+    """
+    linktypes = read_linktypes(pcap_path)
+    if len(linktypes) != 1 or not linktypes <= set(USB_LINKTYPES):
+        return None
+    if device is None:
+        device = dominant_device(pcap_path, window)
+
+    output_path = output_path or pcap_path
+    tmp_path = output_path + ".tmp"
+    report = {"device": device or None, "packets_in": 0, "packets_out": 0,
+              "bytes_in": os.path.getsize(pcap_path), "bytes_out": 0}
+    writer = None
+    try:
+        for linktype, ticks, resolution, data, orig_len in _iter_raw(pcap_path):
+            report["packets_in"] += 1
+            if writer is None:
+                snaplen = HEADER_SNAPLEN if header_only else 0
+                writer = PcapngWriter(tmp_path, linktype, snaplen, tsresol=_tsresol_code(resolution))
+            usb = decode_usb(linktype, data)
+            if usb is None:
+                continue  # 包头本身不完整，无法使用
+            if device and not device_matches(usb, device):
+                continue
+            if header_only:
+                data = data[:usb_header_length(linktype, data)]
+            writer.write_ticks(ticks, data, orig_len)
+            report["packets_out"] += 1
+        if writer is None:
+            return None
+        writer.close()
+        os.replace(tmp_path, output_path)
+    finally:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    report["bytes_out"] = os.path.getsize(output_path)
+    return report
+
+
+def split_capture(pcap_path, assignment, output_paths):
+    """
+    将采集文件的包分配到多个输出文件（时间戳按原始刻度无损写出）
+
+    参数:
+    - assignment: 每个包的输出文件序号（按文件中的包顺序），-1 表示丢弃
+    - output_paths: 输出路径列表
+
+    返回:
+    - list: 每个输出文件的包数
+    """
+    counts = [0] * len(output_paths)
+    writers = [None] * len(output_paths)
+    try:
+        for index, (linktype, ticks, resolution, data, orig_len) in enumerate(_iter_raw(pcap_path)):
+            if index >= len(assignment):
+                break
+            k = assignment[index]
+            if k < 0:
+                continue
+            if writers[k] is None:
+                writers[k] = PcapngWriter(output_paths[k], linktype, tsresol=_tsresol_code(resolution))
+            writers[k].write_ticks(ticks, data, orig_len)
+            counts[k] += 1
+    finally:
+        for writer in writers:
+            if writer is not None:
+                writer.close()
+    return counts
+
+
+def _tsresol_code(resolution):
+    """ 每刻度秒数 -> pcapng if_tsresol 选项值 """
+    for code in range(0, 10):
+        if abs(resolution - 10.0 ** -code) < 10.0 ** -code * 1e-6:
+            return code
+    return 0x80 | round(-math.log2(resolution))
+
+
+# ==================== 写入 ====================
+
+def _pad4(data):
+    return data + b"\x00" * (-len(data) % 4)
+
+
+class PcapngWriter:
+    """
+    最小 pcapng 写入器（单接口，默认微秒时间戳）
+
+    用法:
+        with PcapngWriter("capture.pcapng", LINKTYPE_USB_LINUX) as w:
+            w.write(timestamp, data, orig_len)
+    """
+
+    def __init__(self, path, linktype, snaplen=0, tsresol=6):
+        """
+        参数:
+        - snaplen: 写入接口描述块的快照长度，0 表示不限
+        - tsresol: 时间戳分辨率 (pcapng if_tsresol 编码，6 = 微秒，9 = 纳秒)
+        """
+        self.path = path
+        self.f = open(path, 'wb')
+        self.count = 0
+        self.ticks_per_second = 2 ** (tsresol & 0x7F) if tsresol & 0x80 else 10 ** tsresol
+        shb_body = struct.pack("<IHHq", _BYTE_ORDER_MAGIC, 1, 0, -1)
+        self._block(_SHB, shb_body)
+        tsresol = struct.pack("<HHB", _OPT_IF_TSRESOL, 1, tsresol) + b"\x00" * 3
+        idb_body = struct.pack("<HHI", linktype, 0, snaplen) + tsresol + struct.pack("<HH", 0, 0)
+        self._block(_IDB, idb_body)
+
+    def _block(self, block_type, body):
+        total_len = 12 + len(body)
+        self.f.write(struct.pack("<II", block_type, total_len) + body + struct.pack("<I", total_len))
+
+    def write(self, timestamp, data, orig_len=None):
+        """ 写入一个包；timestamp 为秒 (float) 或 (秒, 微秒) 元组 """
+        if isinstance(timestamp, tuple):
+            ticks = timestamp[0] * self.ticks_per_second + timestamp[1] * self.ticks_per_second // 1000000
+        else:
+            ticks = int(round(timestamp * self.ticks_per_second))
+        self.write_ticks(ticks, data, orig_len)
+
+    def write_ticks(self, ticks, data, orig_len=None):
+        """ 写入一个包；时间戳为按 tsresol 计的整数刻度 """
+        if orig_len is None:
+            orig_len = len(data)
+        body = struct.pack("<IIIII", 0, ticks >> 32, ticks & 0xFFFFFFFF, len(data), orig_len) + _pad4(data)
+        self._block(_EPB, body)
+        self.count += 1
+
+    def flush(self):
+        self.f.flush()
+
+    def close(self):
+        if not self.f.closed:
+            self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,226 @@
+"""
+流水线分阶段计时与计数
+认证慢时需要知道时间花在哪里：打开文件 / tshark 启动 / 逐包解析 / 特征缓存 / 统计 / 数据库加载 / 评分。
+- 各阶段由 with Profiler.current().stage("parse"): ... 计时，计数由 count("packets", n) 累加
+- 只有在 profiling() 块内才会记录；未启用时 current() 返回空实现，每个插桩点只多一次
+  contextvar 读取，逐包循环内不做任何插桩（包数等由累加器的现有计数在文件结束时一次性加入）
+- 进程池中的解析结果以 as_dict() 传回后 merge() 到调用方的 Profile
+
+用法:
+    with Profiler.profiling() as prof:
+        Authenticate.authenticate_device("devices/auth", "usb_fingerprint_db.json")
+    Profiler.print_report(prof)
+"""
+
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+# 报告中各阶段的显示顺序与名称（未列出的阶段按名称排在后面）
+STAGES = {
+    "open": "打开文件/识别格式",
+    "tshark_startup": "tshark 启动",
+    "parse": "逐包解析",
+    "cache_load": "读取特征缓存",
+    "cache_save": "写入特征缓存",
+    "stats": "统计特征",
+    "db_load": "加载数据库",
+    "score": "指纹评分",
+    "db_write": "写入数据库",
+}
+COUNTERS = {
+    "files": "文件数",
+    "bytes": "文件字节数",
+    "packets": "总包数",
+    "bulk_packets": "Bulk 包",
+    "matched_packets": "匹配的 Bulk 包间隔",
+    "cache_hits": "特征缓存命中",
+    "cache_misses": "特征缓存未命中",
+    "db_devices": "比对设备数",
+}
+
+_current = contextvars.ContextVar("usb_profile", default=None)
+
+
+class _Stage:
+    __slots__ = ("profile", "name", "start")
+
+    def __init__(self, profile, name):
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profile.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class Profile:
+    """ 一次（或多次合并的）注册/认证的阶段耗时与计数，线程安全 """
+
+    enabled = True
+
+    def __init__(self):
+        self.stages = {}    # 阶段 -> [总秒数, 次数]
+        self.counters = {}  # 计数名 -> 值
+        self._lock = threading.Lock()
+
+    def __bool__(self):
+        return True
+
+    def stage(self, name):
+        """ 计时上下文管理器 """
+        return _Stage(self, name)
+
+    def record(self, name, seconds, calls=1):
+        with self._lock:
+            entry = self.stages.get(name)
+            if entry is None:
+                self.stages[name] = [seconds, calls]
+            else:
+                entry[0] += seconds
+                entry[1] += calls
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def merge(self, other):
+        """ 合并另一个 Profile 或其 as_dict() 结果 """
+        data = other.as_dict() if isinstance(other, Profile) else other
+        for name, stage in data.get("stages", {}).items():
+            self.record(name, stage["seconds"], stage["calls"])
+        for name, value in data.get("counters", {}).items():
+            self.count(name, value)
+
+    def as_dict(self):
+        """
+        返回:
+        - dict: {"stages": {阶段: {"seconds", "calls"}}, "counters": {...}, "rates": {...}}
+          rates 含 packets_per_second（总包数 / 逐包解析耗时）
+        """
+        with self._lock:
+            stages = {name: {"seconds": s, "calls": n} for name, (s, n) in self.stages.items()}
+            counters = dict(self.counters)
+        rates = {}
+        parse = sum(stages[name]["seconds"] for name in ("parse", "tshark_startup") if name in stages)
+        if parse and counters.get("packets"):
+            rates["packets_per_second"] = counters["packets"] / parse
+        if parse and counters.get("bytes"):
+            rates["mb_per_second"] = counters["bytes"] / 1024 / 1024 / parse
+        lookups = counters.get("cache_hits", 0) + counters.get("cache_misses", 0)
+        if lookups:
+            rates["cache_hit_rate"] = counters.get("cache_hits", 0) / lookups
+        return {"stages": stages, "counters": counters, "rates": rates}
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _NullProfile:
+    """ 未启用时的空实现：所有方法都不做任何事 """
+
+    enabled = False
+    _stage = _NullStage()
+
+    def __bool__(self):
+        return False
+
+    def stage(self, name):
+        return self._stage
+
+    def record(self, name, seconds, calls=1):
+        pass
+
+    def count(self, name, value=1):
+        pass
+
+    def merge(self, other):
+        pass
+
+
+NULL = _NullProfile()
+
+
+def current():
+    """ 当前上下文的 Profile，未启用时返回空实现 NULL """
+    profile = _current.get()
+    return NULL if profile is None else profile
+
+
+@contextmanager
+def profiling(profile=None, detached=False):
+    """
+    在 with 块内启用计时（对当前线程/协程上下文生效）
+
+    嵌套使用时内层结束后合并到外层，因此可以同时得到单次结果与整体汇总；
+    detached=True 时不合并（由调用方自行 merge，如进程池传回的结果）。
+    """
+    profile = profile if profile is not None else Profile()
+    outer = _current.get()
+    token = _current.set(profile)
+    try:
+        yield profile
+    finally:
+        _current.reset(token)
+        if outer is not None and outer is not profile and not detached:
+            outer.merge(profile)
+
+
+def timed(stage):
+    """ 装饰器：启用时把函数的耗时记入指定阶段 """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            profile = _current.get()
+            if profile is None:
+                return func(*args, **kwargs)
+            with profile.stage(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def format_report(profile, title="性能分析"):
+    """ 生成分阶段耗时与计数的文本报告 """
+    data = profile.as_dict() if isinstance(profile, Profile) else profile
+    stages = data["stages"]
+    total = sum(s["seconds"] for s in stages.values())
+    order = [name for name in STAGES if name in stages] + sorted(set(stages) - set(STAGES))
+
+    lines = ["", "=" * 64, f"[{title}]", f"{'阶段':<20}{'次数':>8}{'总耗时(ms)':>14}{'平均(ms)':>12}{'占比':>8}"]
+    for name in order:
+        s = stages[name]
+        label = STAGES.get(name, name)
+        share = s["seconds"] / total * 100 if total else 0.0
+        lines.append(f"{label:<20}{s['calls']:>8}{s['seconds'] * 1000:>14.2f}"
+                     f"{s['seconds'] * 1000 / max(s['calls'], 1):>12.3f}{share:>7.1f}%")
+    lines.append("-" * 64)
+    counters = data["counters"]
+    for name in [n for n in COUNTERS if n in counters] + sorted(set(counters) - set(COUNTERS)):
+        lines.append(f"{COUNTERS.get(name, name):<20}{counters[name]:>12}")
+    rates = data.get("rates", {})
+    if "packets_per_second" in rates:
+        lines.append(f"{'解析吞吐':<20}{rates['packets_per_second']:>12.0f} 包/秒")
+    if "mb_per_second" in rates:
+        lines.append(f"{'':<20}{rates['mb_per_second']:>12.1f} MB/秒")
+    if "cache_hit_rate" in rates:
+        lines.append(f"{'缓存命中率':<20}{rates['cache_hit_rate'] * 100:>11.1f}%")
+    lines.append("=" * 64)
+    return "\n".join(lines)
+
+
+def print_report(profile, title="性能分析", file=None):
+    print(format_report(profile, title), file=file)
@@ -0,0 +1,196 @@
+"""
+采集就绪检测模块
+用事件代替固定的 sleep 等待，让单次采集的耗时取决于设备本身而非最坏情况估计：
+- StderrWatcher:    读取 tshark stderr，出现 "Capturing on" 即认为抓包引擎已就绪
+- wait_until:       通用条件等待 (Linux 下若安装了 pyudev 则由 udev 事件唤醒，否则短间隔轮询)
+- wait_for_path:    等待 U 盘盘符 / 挂载点出现
+- ActivityMonitor:  实时包流的静默检测 (一段时间内没有新包即认为传输结束)
+- FileGrowthMonitor: 非实时模式下以 pcapng 文件大小停止增长作为静默判据
+"""
+
+import collections
+import os
+import sys
+import threading
+import time
+
+try:
+    import pyudev
+except ImportError:
+    pyudev = None
+
+
+class StderrWatcher:
+    """ 后台读取子进程 stderr，检测就绪标志行 """
+
+    def __init__(self, stream, ready_marker="Capturing on"):
+        self.ready = threading.Event()
+        self.closed = threading.Event()
+        self.lines = collections.deque(maxlen=50)
+        self._marker = ready_marker
+        self._thread = threading.Thread(target=self._run, args=(stream,), daemon=True)
+        self._thread.start()
+
+    def _run(self, stream):
+        try:
+            for line in stream:
+                if isinstance(line, bytes):
+                    line = line.decode('utf-8', errors='replace')
+                line = line.rstrip()
+                self.lines.append(line)
+                if self._marker in line:
+                    self.ready.set()
+        finally:
+            self.closed.set()
+
+    def wait_ready(self, proc, timeout=15.0):
+        """
+        等待就绪标志；进程提前退出或超时返回 False
+
+        参数:
+        - proc: 被监视的 subprocess.Popen
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.ready.wait(timeout=0.05):
+                return True
+            if proc.poll() is not None:
+                return False
+        return self.ready.is_set()
+
+    def join(self, timeout=1.0):
+        self._thread.join(timeout=timeout)
+
+    def tail(self):
+        return "\n".join(self.lines)
+
+
+def _close_monitor(monitor):
+    """ 关闭 pyudev netlink 监视器；没有 close() 的 pyudev 版本在释放最后一个引用时由 libudev 关闭套接字 """
+    close = getattr(monitor, "close", None)
+    if close is not None:
+        close()
+
+
+def wait_until(predicate, timeout=30.0, interval=0.1, stop_event=None, subsystem='block'):
+    """
+    等待 predicate() 返回真值（Linux 下若安装了 pyudev，对应 subsystem 的 udev 事件会立即唤醒复查）
+
+    返回:
+    - predicate 的真值结果；超时或被 stop_event 取消时返回 None
+    """
+    start = time.monotonic()
+    monitor = None
+    if pyudev is not None and sys.platform.startswith('linux'):
+        try:
+            monitor = pyudev.Monitor.from_netlink(pyudev.Context())
+            monitor.filter_by(subsystem)
+            monitor.start()
+        except Exception:
+            monitor = None
+
+    try:
+        while True:
+            result = predicate()
+            if result:
+                return result
+            remaining = timeout - (time.monotonic() - start)
+            if remaining <= 0 or (stop_event is not None and stop_event.is_set()):
+                return None
+            if monitor is not None:
+                # 有设备事件时立即醒来复查；挂载本身可能稍晚于事件，因此仍保留短超时
+                monitor.poll(timeout=min(interval * 5, remaining))
+            else:
+                time.sleep(min(interval, remaining))
+    finally:
+        if monitor is not None:
+            _close_monitor(monitor)
+            monitor = None
+
+
+def wait_for_path(path, timeout=30.0, interval=0.1, stop_event=None):
+    """
+    等待路径出现（U 盘盘符 / 挂载点）
+
+    返回:
+    - float: 实际等待的秒数；超时或被 stop_event 取消时返回 None
+    """
+    start = time.monotonic()
+    if wait_until(lambda: os.path.exists(path), timeout, interval, stop_event) is None:
+        return None
+    return time.monotonic() - start
+
+
+class ActivityMonitor:
+    """ 记录最近一次包到达的时间，用于静默检测 """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self.last_activity = None
+        self.count = 0
+
+    def touch(self):
+        with self._cond:
+            self.last_activity = time.monotonic()
+            self.count += 1
+            self._cond.notify_all()
+
+    def wait_quiet(self, quiet_period=0.5, timeout=10.0):
+        """
+        等待连续 quiet_period 秒没有新包
+
+        返回:
+        - bool: 达到静默返回 True，超时返回 False
+        """
+        start = time.monotonic()
+        deadline = start + timeout
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                # 从未收到过包时，从开始等待的时刻算起
+                last = self.last_activity if self.last_activity is not None else start
+                quiet_for = now - last
+                if quiet_for >= quiet_period:
+                    return True
+                if now >= deadline:
+                    return False
+                self._cond.wait(timeout=min(quiet_period - quiet_for, deadline - now))
+
+    def wait_activity(self, since_count, timeout=10.0):
+        """ 等待出现新包（包计数超过 since_count） """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self.count <= since_count:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(timeout=remaining)
+            return True
+
+
+class FileGrowthMonitor:
+    """ 以文件大小是否继续增长判断包流是否静默（非实时模式使用） """
+
+    def __init__(self, path, interval=0.1):
+        self.path = path
+        self.interval = interval
+
+    def _size(self):
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return -1
+
+    def wait_quiet(self, quiet_period=0.5, timeout=10.0):
+        deadline = time.monotonic() + timeout
+        last_size = self._size()
+        stable_since = time.monotonic()
+        while time.monotonic() < deadline:
+            time.sleep(self.interval)
+            size = self._size()
+            if size != last_size:
+                last_size = size
+                stable_since = time.monotonic()
+            elif time.monotonic() - stable_since >= quiet_period:
+                return True
+        return False
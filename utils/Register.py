@@ -1,11 +1,62 @@
-import json
 import os
 import time
-from utils import FeatureExtractor
+from utils import FeatureExtractor, FingerprintDB, Profiler, Tracing
 from collections import defaultdict
 
 
-def run_registration(device_id, enroll_folder, db_file):
+def _printer(verbose):
+    """ verbose=False 时返回不输出的 print 替身 """
+    return print if verbose else (lambda *args, **kwargs: None)
+
+
+@Profiler.timed("stats")
+def build_fingerprint(all_enum_times, all_transfer_data, verbose=True):
+    """
+    由聚合后的样本数据构建指纹结构
+
+    参数:
+    - all_enum_times: 枚举时间样本列表
+    - all_transfer_data: {endpoint: [包间隔, ...]}
+    - verbose: 是否打印各项特征
+
+    返回:
+    - dict: {"enumeration": stats 或 None, "transfers": {endpoint: stats}}
+    """
+    log = _printer(verbose)
+    fingerprint = {}
+
+    # --- A. 枚举指纹 (Enumeration Time) ---
+    # 对应论文: 提取枚举时间序列 [cite: 35, 46]
+    log(f"    [调试] 收集到的枚举时间样本: {all_enum_times}")
+    enum_stats = FeatureExtractor.calculate_stats(all_enum_times)
+    if enum_stats:
+        fingerprint["enumeration"] = enum_stats
+        log(f"    [√] 枚举指纹就绪: 均值 {enum_stats['mean']:.4f}s")
+    else:
+        log("    [!] 警告: 未提取到有效的枚举时间 (可能采集时未包含插入动作)。")
+        fingerprint["enumeration"] = None
+
+    # --- B. 传输指纹 (Transfer Time) ---
+    # 对应论文: 按长度分组，取 Top 3 [cite: 50, 171]
+    fingerprint["transfers"] = {}
+
+    # 排序：按样本数量降序，取前 3 名
+    sorted_lens = sorted(all_transfer_data.items(), key=lambda x: len(x[1]), reverse=True)[:3]
+
+    if not sorted_lens:
+        log("    [!] 警告: 未提取到有效的传输/读写数据。")
+
+    for length, times in sorted_lens:
+        stats = FeatureExtractor.calculate_stats(times)
+        if stats:
+            fingerprint["transfers"][str(length)] = stats
+            log(f"    [√] 传输指纹 (Len={length}): 均值 {stats['mean']:.6f}s")
+
+    return fingerprint
+
+
+@Tracing.traced("register", "register")
+def run_registration(device_id, enroll_folder, db_file, workers=1, verbose=True):
     """
     [接口函数] 执行设备注册流程
 
@@ -13,100 +64,185 @@ def run_registration(device_id, enroll_folder, db_file):
     - device_id: 设备名称/ID (作为数据库的主键)
     - enroll_folder: 存放 .pcapng 文件的文件夹路径
     - db_file: 指纹数据库的保存路径 (.json)
+    - workers: 解析进程数，1 表示在当前进程顺序解析，None 表示全部 CPU 核心
+    - verbose: 是否输出解析过程与特征信息（错误信息始终输出）
 
     返回:
     - bool: 成功返回 True, 失败返回 False
     """
-    print(f"\n>>> 开始计算指纹特征 (设备ID: {device_id}) ...")
+    log = _printer(verbose)
+    log(f"\n>>> 开始计算指纹特征 (设备ID: {device_id}) ...")
 
     # 1. 检查数据文件
     if not os.path.exists(enroll_folder):
         print(f"[错误] 找不到数据文件夹: {enroll_folder}")
         return False
 
-    files = [f for f in os.listdir(enroll_folder) if f.endswith(".pcapng")]
+    # 包括原始 pcapng 已被保留策略删除、仅剩特征缓存的样本
+    files = FeatureExtractor.list_samples(enroll_folder)
     if not files:
         print(f"[错误] {enroll_folder} 中没有 pcapng 文件，无法注册。")
         return False
 
-    print(f"[-] 正在聚合 {len(files)} 个样本的特征...")
+    log(f"[-] 正在聚合 {len(files)} 个样本的特征...")
 
     # 2. 聚合所有样本的数据
     all_enum_times = []
     all_transfer_data = defaultdict(list)
 
-    for f in files:
-        path = os.path.join(enroll_folder, f)
-        # 调用 FeatureExtractor
-        e_time, t_data = FeatureExtractor.process_pcap_file(path)
-
+    paths = [os.path.join(enroll_folder, f) for f in files]
+    Tracing.phase("extract", files=len(files))
+    results = FeatureExtractor.extract_many(paths, workers=workers, verbose=verbose)
+    for f, (e_time, t_data) in zip(files, results):
         if e_time:
             all_enum_times.append(e_time)
-            print(f"    [调试] {f}: 枚举时间 = {e_time:.4f}s")
+            log(f"    [调试] {f}: 枚举时间 = {e_time:.4f}s")
         else:
-            print(f"    [调试] {f}: 无枚举时间")
+            log(f"    [调试] {f}: 无枚举时间")
 
         if t_data:
             for length, times in t_data.items():
                 all_transfer_data[length].extend(times)
 
     # 3. 构建指纹结构
-    fingerprint = {}
+    Tracing.phase("stats")
+    fingerprint = build_fingerprint(all_enum_times, all_transfer_data, verbose)
 
-    # --- A. 枚举指纹 (Enumeration Time) ---
-    # 对应论文: 提取枚举时间序列 [cite: 35, 46]
-    print(f"    [调试] 收集到的枚举时间样本: {all_enum_times}")
-    enum_stats = FeatureExtractor.calculate_stats(all_enum_times)
-    if enum_stats:
-        fingerprint["enumeration"] = enum_stats
-        print(f"    [√] 枚举指纹就绪: 均值 {enum_stats['mean']:.4f}s")
-    else:
-        print("    [!] 警告: 未提取到有效的枚举时间 (可能采集时未包含插入动作)。")
-        fingerprint["enumeration"] = None
-
-    # --- B. 传输指纹 (Transfer Time) ---
-    # 对应论文: 按长度分组，取 Top 3 [cite: 50, 171]
-    fingerprint["transfers"] = {}
-
-    # 排序：按样本数量降序，取前 3 名
-    sorted_lens = sorted(all_transfer_data.items(), key=lambda x: len(x[1]), reverse=True)[:3]
-
-    if not sorted_lens:
-        print("    [!] 警告: 未提取到有效的传输/读写数据。")
-
-    for length, times in sorted_lens:
-        stats = FeatureExtractor.calculate_stats(times)
-        if stats:
-            fingerprint["transfers"][str(length)] = stats
-            print(f"    [√] 传输指纹 (Len={length}): 均值 {stats['mean']:.6f}s")
-
-    # 4. 存入数据库
-    # 确保目录存在
-    db_dir = os.path.dirname(os.path.abspath(db_file))
-    if not os.path.exists(db_dir):
-        os.makedirs(db_dir)
-
-    # 读取旧数据
-    try:
-        if os.path.exists(db_file):
-            with open(db_file, 'r') as f:
-                db = json.load(f)
-        else:
-            db = {}
-    except:
-        db = {}
-
-    # 更新条目
-    db[device_id] = {
+    # 4. 存入数据库 (写时复制：原子替换文件并发布新快照，认证读者不受影响)
+    entry = {
         "fingerprint": fingerprint,
         "reg_time": time.strftime("%Y-%m-%d %H:%M:%S"),
         "samples_count": len(files),
         "source_files": files
     }
 
-    # 写入
-    with open(db_file, 'w') as f:
-        json.dump(db, f, indent=4)
+    def apply(db):
+        db[device_id] = entry
+
+    Tracing.phase("db_write")
+    FingerprintDB.get_store(db_file).update(apply)
+
+    log(f"[成功] 设备 '{device_id}' 注册完成！数据库已更新。")
+    return True
+
+
+def run_bulk_registration(root_folder, db_file, workers=None, devices=None, verbose=True):
+    """
+    [接口函数] 批量注册：root_folder 下每个子文件夹对应一个设备
+
+    目录结构:
+        root_folder/
+          SanDisk_32G/   capture_1.pcapng capture_2.pcapng ...
+          Kingston_16G/  capture_1.pcapng ...
+
+    所有文件在进程池中并行解析，全部指纹构建完成后以一次数据库事务
+    (一次写时复制 + 原子替换) 提交。
 
-    print(f"[成功] 设备 '{device_id}' 注册完成！数据库已更新。")
-    return True
\ No newline at end of file
+    参数:
+    - root_folder: 根目录，子文件夹名即设备ID
+    - db_file: 指纹数据库的保存路径 (.json)
+    - workers: 解析进程数，None 表示使用全部 CPU 核心
+    - devices: 可选设备ID列表，只注册这些子文件夹 (None 表示全部)
+    - verbose: 是否输出解析进度、特征信息与汇总表（错误信息始终输出）
+
+    返回:
+    - dict: {device_id: {"status", "files", "parsed", "enum_samples", "endpoints"}}
+            status 为 "registered" / "no_features" / "no_files"；
+            启用计时 (Profiler.profiling) 时每个设备另含 "profile"
+    """
+    log = _printer(verbose)
+    log(f"\n>>> 开始批量注册 (根目录: {root_folder}) ...")
+
+    if not os.path.isdir(root_folder):
+        print(f"[错误] 找不到根目录: {root_folder}")
+        return {}
+
+    # 1. 扫描设备子文件夹
+    device_files = {}
+    for name in sorted(os.listdir(root_folder)):
+        dev_dir = os.path.join(root_folder, name)
+        if not os.path.isdir(dev_dir) or (devices is not None and name not in devices):
+            continue
+        device_files[name] = FeatureExtractor.list_samples(dev_dir)
+
+    if not device_files:
+        print(f"[错误] {root_folder} 中没有设备子文件夹。")
+        return {}
+
+    jobs = [(dev_id, os.path.join(root_folder, dev_id, f))
+            for dev_id, files in device_files.items() for f in files]
+    workers = workers or os.cpu_count() or 1
+    log(f"[-] 发现 {len(device_files)} 个设备, {len(jobs)} 个样本, 使用 {workers} 个解析进程...")
+
+    # 2. 并行解析所有样本（与认证共用 extract_many：计时与指标由工作进程传回合并）
+    profile = Profiler.current()
+    device_profiles = {dev_id: Profiler.Profile() for dev_id in device_files} if profile else {}
+    file_profiles = []
+    results = FeatureExtractor.extract_many([path for _, path in jobs], workers=workers, verbose=verbose,
+                                            profiles=file_profiles)
+    parsed = {dev_id: [] for dev_id in device_files}
+    for (dev_id, _), result in zip(jobs, results):
+        parsed[dev_id].append(result)
+    for (dev_id, _), stats in zip(jobs, file_profiles):
+        if dev_id in device_profiles:
+            device_profiles[dev_id].merge(stats)
+
+    # 3. 逐设备构建指纹
+    summary = {}
+    entries = {}
+    reg_time = time.strftime("%Y-%m-%d %H:%M:%S")
+    for dev_id, files in device_files.items():
+        info = {"status": "no_files", "files": len(files), "parsed": 0,
+                "enum_samples": 0, "endpoints": 0}
+        summary[dev_id] = info
+        if not files:
+            continue
+
+        all_enum_times = []
+        all_transfer_data = defaultdict(list)
+        for e_time, t_data in parsed[dev_id]:
+            if e_time or t_data:
+                info["parsed"] += 1
+            if e_time:
+                all_enum_times.append(e_time)
+            if t_data:
+                for length, times in t_data.items():
+                    all_transfer_data[length].extend(times)
+
+        log(f"\n[-] 设备 {dev_id}:")
+        if profile:
+            with Profiler.profiling() as built:
+                fingerprint = build_fingerprint(all_enum_times, all_transfer_data, verbose)
+            device_profiles[dev_id].merge(built)
+        else:
+            fingerprint = build_fingerprint(all_enum_times, all_transfer_data, verbose)
+        info["enum_samples"] = len(all_enum_times)
+        info["endpoints"] = len(fingerprint["transfers"])
+        if not fingerprint["enumeration"] and not fingerprint["transfers"]:
+            info["status"] = "no_features"
+            continue
+
+        info["status"] = "registered"
+        entries[dev_id] = {
+            "fingerprint": fingerprint,
+            "reg_time": reg_time,
+            "samples_count": len(files),
+            "source_files": files
+        }
+
+    for dev_id, dev_profile in device_profiles.items():
+        summary[dev_id]["profile"] = dev_profile.as_dict()
+
+    # 4. 单次事务提交
+    if entries:
+        FingerprintDB.get_store(db_file).update(lambda db: db.update(entries))
+
+    # 5. 汇总
+    log("\n" + "=" * 60)
+    log(f"{'设备ID':<24}{'状态':<14}{'文件':>6}{'有效':>6}{'枚举':>6}{'端点':>6}")
+    for dev_id, info in summary.items():
+        log(f"{dev_id:<24}{info['status']:<14}{info['files']:>6}{info['parsed']:>6}"
+              f"{info['enum_samples']:>6}{info['endpoints']:>6}")
+    log("=" * 60)
+    log(f"[成功] 批量注册完成: {len(entries)}/{len(summary)} 个设备写入数据库。")
+    return summary
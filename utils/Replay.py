@@ -0,0 +1,273 @@
+"""
+回放驱动的认证负载生成器
+不需要实体 U 盘，用已录制的 pcapng 评估提取与评分流水线所需的硬件：
+- 每个录制文件预先渲染为 tshark 字段行，模拟设备按原始时间间隔（或加速倍率）送入
+  LiveExtractor.feed_line —— 与实时抓包完全相同的解析、设备过滤与累积路径
+- 数据流结束后执行设备识别、验证指纹构建与共享矩阵评分 (SharedFingerprint)，
+  即认证服务的判定路径
+- 多个模拟设备并发运行（每个设备一个线程，与实时抓包的读取线程一致）
+报告吞吐、判定延迟百分位、每个模拟设备的 CPU 时间与特征内存占用。
+
+用法:
+    python -m utils.Replay usb_fingerprint_db.json devices/auth/*.pcapng --devices 16 --speed 10
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+import numpy as np
+from utils import Authenticate, FeatureExtractor, FingerprintDB, LiveExtractor, PcapFile, SharedFingerprint
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# 超前于计划时间少于该值时不睡眠（避免定时器精度主导回放节奏）
+MIN_SLEEP = 0.002
+
+
+class Recording:
+    """ 预渲染的录制文件：字段行与相对时间偏移（秒） """
+
+    def __init__(self, path, lines, offsets):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.lines = lines
+        self.offsets = offsets
+
+    @classmethod
+    def load(cls, path):
+        lines, stamps = [], []
+        for timestamp, usb in PcapFile.iter_usb_packets(path):
+            if usb is None:
+                continue
+            transfer = _transfer_field(usb["t_type"])
+            lines.append(f"{timestamp:.9f}\t{transfer}\t{usb['endpoint']}\t{usb['bus']}\t{usb['device']}\n")
+            stamps.append(timestamp)
+        offsets = np.asarray(stamps, dtype=np.float64)
+        if len(offsets):
+            offsets -= offsets[0]
+        return cls(path, lines, offsets)
+
+    @property
+    def duration(self):
+        return float(self.offsets[-1]) if len(self.offsets) else 0.0
+
+
+def _transfer_field(t_type):
+    """ 类型名 -> tshark usb.transfer_type 的输出形式 ('BULK' -> '0x03') """
+    code = FeatureExtractor.TRANSFER_CODES.get(t_type)
+    return f"0x{code:02x}" if code is not None else t_type
+
+
+def _retained_bytes(transfer_data):
+    """ 累积的包间隔列表占用的内存（列表对象 + float 对象） """
+    float_size = sys.getsizeof(0.0)
+    return sum(sys.getsizeof(v) + len(v) * float_size for v in transfer_data.values())
+
+
+def _peak_rss_mb():
+    """ 进程峰值常驻内存 (MB)，不支持的平台返回 None """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def replay_session(recording, reader, speed=1.0, threshold=70.0, device_filter=True):
+    """
+    回放一次录制并完成认证判定
+
+    参数:
+    - reader: SharedFingerprint.FingerprintMatrixReader
+    - speed: 回放倍率，1.0 为实时，0 表示不限速
+
+    返回:
+    - dict: {"packets", "stream_seconds", "lag", "latency", "seconds", "cpu", "memory", "passed", "match_id", "score"}
+      lag 为数据流结束时落后于计划时间的秒数（>0 表示处理能力不足）；
+      seconds 为整个会话（数据流 + 判定）的耗时，cpu 为同一区间内本线程的 CPU 时间
+    """
+    extractor = LiveExtractor.LiveExtractor(device_filter=device_filter)
+    lines, offsets = recording.lines, recording.offsets
+    cpu0 = time.thread_time()
+    t0 = time.perf_counter()
+    if speed:
+        for line, offset in zip(lines, offsets):
+            delay = t0 + offset / speed - time.perf_counter()
+            if delay > MIN_SLEEP:
+                time.sleep(delay)
+            extractor.feed_line(line)
+    else:
+        for line in lines:
+            extractor.feed_line(line)
+    t_stream = time.perf_counter()
+    lag = max(t_stream - (t0 + recording.duration / speed), 0.0) if speed else 0.0
+
+    # 与 AutoCatch 相同：抓包结束后识别设备、取出特征，再构建验证指纹并评分
+    if device_filter:
+        extractor.set_device()
+    enum_val, transfer_data = extractor.finish()
+    fingerprint = Authenticate.build_auth_fingerprint([enum_val] if enum_val else [], transfer_data,
+                                                      verbose=False)
+    passed, match_id, score, _ = SharedFingerprint.match_with_matrix(fingerprint, reader.matrix(),
+                                                                     threshold=threshold)
+    t_done = time.perf_counter()
+    return {"packets": len(lines), "stream_seconds": t_stream - t0, "lag": lag, "latency": t_done - t_stream,
+            "seconds": t_done - t0, "cpu": time.thread_time() - cpu0, "memory": _retained_bytes(transfer_data),
+            "passed": passed, "match_id": match_id, "score": score}
+
+
+def run_load(recording_paths, db_file, devices=4, speed=1.0, sessions=1, ramp=0.0, threshold=70.0,
+             device_filter=True, verbose=True):
+    """
+    多个模拟设备并发回放
+
+    参数:
+    - recording_paths: 录制的 pcapng 列表，模拟设备按序轮流使用
+    - devices: 同时运行的模拟设备数
+    - speed: 回放倍率，1.0 为实时，0 表示不限速
+    - sessions: 每个模拟设备连续回放的次数（一次即一次插入认证）
+    - ramp: 模拟设备依次启动的总时长（秒），0 表示同时启动
+
+    返回:
+    - dict: 汇总报告，见 summarize()
+    """
+    recordings = [Recording.load(path) for path in recording_paths]
+    recordings = [r for r in recordings if r.lines]
+    if not recordings:
+        raise ValueError("没有可回放的 USB 录制文件")
+
+    publisher = SharedFingerprint.FingerprintMatrixPublisher()
+    try:
+        publisher.sync(FingerprintDB.get_store(db_file))
+        results = [[] for _ in range(devices)]
+        errors = []
+
+        def device_worker(index):
+            reader = SharedFingerprint.FingerprintMatrixReader(publisher.control_name)
+            try:
+                if ramp and devices > 1:
+                    time.sleep(ramp * index / (devices - 1))
+                for n in range(sessions):
+                    recording = recordings[(index + n) % len(recordings)]
+                    result = replay_session(recording, reader, speed, threshold, device_filter)
+                    result["recording"] = recording.name
+                    results[index].append(result)
+            except Exception as e:
+                errors.append(f"模拟设备 {index + 1}: {e}")
+            finally:
+                reader.close()
+
+        if verbose:
+            print(f">>> 回放负载: {devices} 个模拟设备 x {sessions} 次, 倍率 "
+                  f"{'不限速' if not speed else f'{speed:g}x'}, {len(recordings)} 个录制文件")
+        cpu0 = time.process_time()
+        t0 = time.perf_counter()
+        threads = [threading.Thread(target=device_worker, args=(i,), daemon=True) for i in range(devices)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        wall = time.perf_counter() - t0
+        process_cpu = time.process_time() - cpu0
+    finally:
+        publisher.close()
+
+    report = summarize(results, wall, process_cpu)
+    report["errors"] = errors
+    if verbose:
+        print_report(report)
+    return report
+
+
+def summarize(results, wall, process_cpu):
+    """
+    汇总各模拟设备的结果
+
+    返回:
+    - dict: {"wall", "sessions", "packets", "packets_per_second", "decisions_per_second",
+             "latency_ms": {p50, p90, p99, max}, "max_lag", "process_cpu", "cpu_utilization",
+             "peak_rss_mb", "devices": [每个设备的汇总]}
+    """
+    flat = [r for device in results for r in device]
+    latencies = np.array([r["latency"] for r in flat]) * 1000 if flat else np.zeros(1)
+    packets = sum(r["packets"] for r in flat)
+    per_device = []
+    for index, device in enumerate(results):
+        if not device:
+            continue
+        stream = sum(r["stream_seconds"] for r in device)
+        busy = sum(r["seconds"] for r in device)
+        cpu = sum(r["cpu"] for r in device)
+        per_device.append({
+            "device": index + 1,
+            "sessions": len(device),
+            "packets": sum(r["packets"] for r in device),
+            "packets_per_second": sum(r["packets"] for r in device) / stream if stream else 0.0,
+            "latency_p50_ms": float(np.percentile([r["latency"] * 1000 for r in device], 50)),
+            "max_lag": max(r["lag"] for r in device),
+            "cpu": cpu,
+            "cpu_utilization": cpu / busy if busy else 0.0,
+            "memory_kb": max(r["memory"] for r in device) / 1024,
+            "matches": sorted({str(r["match_id"]) for r in device}),
+            "passed": sum(1 for r in device if r["passed"])
+        })
+    return {
+        "wall": wall,
+        "sessions": len(flat),
+        "packets": packets,
+        "packets_per_second": packets / wall if wall else 0.0,
+        "decisions_per_second": len(flat) / wall if wall else 0.0,
+        "latency_ms": {f"p{q}": float(np.percentile(latencies, q)) for q in (50, 90, 99)}
+                      | {"max": float(latencies.max())},
+        "max_lag": max((r["lag"] for r in flat), default=0.0),
+        "process_cpu": process_cpu,
+        "cpu_utilization": process_cpu / wall if wall else 0.0,
+        "peak_rss_mb": _peak_rss_mb(),
+        "devices": per_device
+    }
+
+
+def print_report(report):
+    print("\n" + "=" * 96)
+    print(f"{'设备':<6}{'会话':>6}{'包数':>10}{'包/秒':>10}{'延迟p50(ms)':>13}{'最大落后(s)':>12}"
+          f"{'CPU(s)':>9}{'CPU%':>7}{'内存(KB)':>10}  匹配")
+    for d in report["devices"]:
+        print(f"{d['device']:<6}{d['sessions']:>6}{d['packets']:>10}{d['packets_per_second']:>10.0f}"
+              f"{d['latency_p50_ms']:>13.2f}{d['max_lag']:>12.3f}{d['cpu']:>9.2f}"
+              f"{d['cpu_utilization'] * 100:>6.1f}%{d['memory_kb']:>10.1f}  "
+              f"{','.join(d['matches'])} ({d['passed']}/{d['sessions']} 通过)")
+    print("=" * 96)
+    lat = report["latency_ms"]
+    print(f"[汇总] {report['sessions']} 次判定, 用时 {report['wall']:.2f}s, "
+          f"{report['packets_per_second']:.0f} 包/秒, {report['decisions_per_second']:.2f} 次判定/秒")
+    print(f"       判定延迟 p50 {lat['p50']:.2f} ms, p90 {lat['p90']:.2f} ms, p99 {lat['p99']:.2f} ms, "
+          f"最大 {lat['max']:.2f} ms; 最大落后 {report['max_lag']:.3f}s")
+    rss = f", 峰值内存 {report['peak_rss_mb']:.1f} MB" if report["peak_rss_mb"] is not None else ""
+    print(f"       进程 CPU {report['process_cpu']:.2f}s ({report['cpu_utilization'] * 100:.0f}% 单核){rss}")
+    for err in report.get("errors", []):
+        print(f"    [!] {err}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="回放录制的 pcapng，对认证流水线施加负载")
+    parser.add_argument("db_file", help="指纹数据库")
+    parser.add_argument("recordings", nargs="+", help="录制的 pcapng 文件")
+    parser.add_argument("--devices", type=int, default=4, help="同时运行的模拟设备数")
+    parser.add_argument("--speed", type=float, default=1.0, help="回放倍率 (1 为实时, 0 为不限速)")
+    parser.add_argument("--sessions", type=int, default=1, help="每个模拟设备的回放次数")
+    parser.add_argument("--ramp", type=float, default=0.0, help="模拟设备依次启动的总时长 (秒)")
+    parser.add_argument("--threshold", type=float, default=70.0, help="认证阈值")
+    parser.add_argument("--no-device-filter", action="store_true", help="不做按设备过滤")
+    args = parser.parse_args(argv)
+    report = run_load(args.recordings, args.db_file, devices=args.devices, speed=args.speed,
+                      sessions=args.sessions, ramp=args.ramp, threshold=args.threshold,
+                      device_filter=not args.no_device_filter)
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
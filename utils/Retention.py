@@ -0,0 +1,221 @@
+"""
+采集文件保留策略模块
+跟踪 devices/ 下的采集文件 (.pcapng) 及其特征缓存 (.features.json)，
+按文件夹 / 设备执行容量与时间预算：
+- 超出预算时从最旧的采集开始删除原始 pcapng
+- 删除前先确保特征已提取并缓存，注册与认证仍可直接使用缓存特征
+- 正在写入的文件（最近修改过）不会被处理
+"""
+
+import os
+import time
+from utils import FeatureExtractor
+
+# 孤立特征缓存默认保留天数
+DEFAULT_FEATURE_MAX_AGE_DAYS = 180
+
+
+class RetentionPolicy:
+    """
+    单个存储桶（文件夹或设备子文件夹）的保留预算
+
+    参数:
+    - max_mb: 原始 pcapng 总大小上限 (MB)，None 表示不限
+    - max_age_days: 原始 pcapng 最长保留天数，None 表示不限
+    - keep_features: 删除 pcapng 前是否提取并保留特征缓存
+    - feature_max_age_days: 孤立特征缓存（原始文件已删）的最长保留天数，默认 180 天，None 表示永久保留
+    """
+
+    def __init__(self, max_mb=None, max_age_days=None, keep_features=True,
+                 feature_max_age_days=DEFAULT_FEATURE_MAX_AGE_DAYS):
+        self.max_mb = max_mb
+        self.max_age_days = max_age_days
+        self.keep_features = keep_features
+        self.feature_max_age_days = feature_max_age_days
+
+    @classmethod
+    def from_dict(cls, cfg):
+        return cls(
+            max_mb=cfg.get("max_mb"),
+            max_age_days=cfg.get("max_age_days"),
+            keep_features=cfg.get("keep_features", True),
+            feature_max_age_days=cfg.get("feature_max_age_days", DEFAULT_FEATURE_MAX_AGE_DAYS)
+        )
+
+
+class RetentionManager:
+    """
+    采集文件保留管理器
+
+    目录约定:
+        base_folder/<folder>/*.pcapng              → 存储桶 (folder, None)
+        base_folder/<folder>/<device_id>/*.pcapng  → 存储桶 (folder, device_id)
+
+    用法:
+        manager = RetentionManager("devices", RetentionPolicy(max_mb=2048, max_age_days=30))
+        report = manager.enforce()
+    """
+
+    def __init__(self, base_folder, default_policy, folder_policies=None, device_policy=None,
+                 min_idle_seconds=60):
+        """
+        参数:
+        - base_folder: 数据根目录
+        - default_policy: 默认策略
+        - folder_policies: {folder: RetentionPolicy}，按顶层文件夹覆盖 (如 "auth" 更严格)
+        - device_policy: 设备子文件夹使用的策略，None 时沿用所在文件夹的策略
+        - min_idle_seconds: 最近这段时间内修改过的文件视为仍在写入，不处理
+        """
+        self.base_folder = base_folder
+        self.default_policy = default_policy
+        self.folder_policies = folder_policies or {}
+        self.device_policy = device_policy
+        self.min_idle_seconds = min_idle_seconds
+
+    def policy_for(self, folder, device):
+        if device is not None and self.device_policy is not None:
+            return self.device_policy
+        return self.folder_policies.get(folder, self.default_policy)
+
+    def scan(self):
+        """
+        扫描并跟踪所有采集文件
+
+        返回:
+        - dict: {(folder, device): [记录, ...]}，记录为
+                {"path", "name", "size", "mtime", "has_pcap", "has_features"}
+                每个存储桶内按修改时间升序 (最旧在前)
+        """
+        buckets = {}
+        if not os.path.isdir(self.base_folder):
+            return buckets
+
+        for folder in sorted(os.listdir(self.base_folder)):
+            folder_path = os.path.join(self.base_folder, folder)
+            if not os.path.isdir(folder_path):
+                continue
+            self._scan_dir(buckets, (folder, None), folder_path)
+            for device in sorted(os.listdir(folder_path)):
+                device_path = os.path.join(folder_path, device)
+                if os.path.isdir(device_path):
+                    self._scan_dir(buckets, (folder, device), device_path)
+        return buckets
+
+    def _scan_dir(self, buckets, key, path):
+        records = []
+        for name in FeatureExtractor.list_samples(path):
+            pcap_path = os.path.join(path, name)
+            cache_path = FeatureExtractor.feature_cache_path(pcap_path)
+            has_pcap = os.path.exists(pcap_path)
+            stat_path = pcap_path if has_pcap else cache_path
+            try:
+                st = os.stat(stat_path)
+            except OSError:
+                continue
+            records.append({
+                "path": pcap_path,
+                "name": name,
+                "size": st.st_size if has_pcap else 0,
+                "mtime": st.st_mtime,
+                "has_pcap": has_pcap,
+                "has_features": os.path.exists(cache_path)
+            })
+        if records:
+            records.sort(key=lambda r: r["mtime"])
+            buckets[key] = records
+
+    def usage(self):
+        """ 各存储桶的原始 pcapng 占用 (字节) """
+        return {key: sum(r["size"] for r in records) for key, records in self.scan().items()}
+
+    def _drop_pcap(self, record, policy, dry_run, report):
+        if policy.keep_features and not record["has_features"] and not dry_run:
+            _, t_data = FeatureExtractor.extract_features(record["path"])
+            if t_data is None:
+                print(f"    [!] 特征提取失败，仍按预算删除: {record['name']}")
+            else:
+                report["features_cached"] += 1
+        if policy.keep_features and not dry_run:
+            # 标记为保留：只有标记过的孤立缓存才会继续作为样本使用
+            FeatureExtractor.mark_retained(record["path"])
+        if not dry_run:
+            try:
+                os.remove(record["path"])
+            except OSError as e:
+                print(f"    [!] 无法删除 {record['path']}: {e}")
+                return
+            if not policy.keep_features:
+                cache_path = FeatureExtractor.feature_cache_path(record["path"])
+                if os.path.exists(cache_path):
+                    os.remove(cache_path)
+        record["has_pcap"] = False
+        report["deleted"].append(record["path"])
+        report["freed_bytes"] += record["size"]
+
+    def enforce(self, dry_run=False):
+        """
+        执行保留策略
+
+        参数:
+        - dry_run: 只计算将被删除的文件，不实际删除
+
+        返回:
+        - dict: {"deleted": [路径...], "freed_bytes", "features_cached", "features_expired"}
+        """
+        report = {"deleted": [], "freed_bytes": 0, "features_cached": 0, "features_expired": 0}
+        now = time.time()
+
+        for (folder, device), records in self.scan().items():
+            policy = self.policy_for(folder, device)
+            candidates = [r for r in records
+                          if r["has_pcap"] and now - r["mtime"] >= self.min_idle_seconds]
+
+            # 1. 时间预算
+            if policy.max_age_days is not None:
+                for r in candidates:
+                    if now - r["mtime"] > policy.max_age_days * 86400:
+                        self._drop_pcap(r, policy, dry_run, report)
+
+            # 2. 容量预算：从最旧的开始删除
+            if policy.max_mb is not None:
+                limit = policy.max_mb * 1024 * 1024
+                total = sum(r["size"] for r in records if r["has_pcap"])
+                for r in candidates:
+                    if total <= limit:
+                        break
+                    if r["has_pcap"]:
+                        self._drop_pcap(r, policy, dry_run, report)
+                        total -= r["size"]
+
+            # 3. 过期的孤立特征缓存
+            if policy.feature_max_age_days is not None:
+                for r in records:
+                    if r["has_pcap"] or now - r["mtime"] <= policy.feature_max_age_days * 86400:
+                        continue
+                    cache_path = FeatureExtractor.feature_cache_path(r["path"])
+                    if not dry_run and os.path.exists(cache_path):
+                        os.remove(cache_path)
+                    report["features_expired"] += 1
+
+        if report["deleted"] or report["features_expired"]:
+            action = "将删除" if dry_run else "已删除"
+            print(f"[清理] 保留策略{action} {len(report['deleted'])} 个采集文件 "
+                  f"({report['freed_bytes'] / (1024 * 1024):.1f} MB)，"
+                  f"新缓存特征 {report['features_cached']} 个，过期特征 {report['features_expired']} 个")
+        return report
+
+
+def from_config(base_folder, cfg):
+    """
+    由配置字典创建 RetentionManager
+
+    配置示例:
+        {"max_mb": 2048, "max_age_days": 30, "keep_features": true,
+         "folders": {"auth": {"max_mb": 512, "max_age_days": 7}},
+         "device": {"max_mb": 256}}
+    """
+    cfg = cfg or {}
+    folder_policies = {name: RetentionPolicy.from_dict(c) for name, c in cfg.get("folders", {}).items()}
+    device_policy = RetentionPolicy.from_dict(cfg["device"]) if cfg.get("device") else None
+    return RetentionManager(base_folder, RetentionPolicy.from_dict(cfg),
+                            folder_policies=folder_policies, device_policy=device_policy)
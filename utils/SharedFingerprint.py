@@ -0,0 +1,340 @@
+"""
+共享内存指纹矩阵模块
+将指纹库快照编译为紧凑的 numpy 矩阵，一次性发布到 multiprocessing.shared_memory，
+多个评分进程零拷贝挂载同一份数据：
+- 发布者 (主进程): FingerprintMatrixPublisher.sync(store) 在数据库版本变化时重新发布
+- 读者 (工作进程): FingerprintMatrixReader(control_name).matrix() 按版本号握手，自动切换到新数据块
+- 评分: score_matrix() 对所有设备做向量化相似度计算，结果与 Authenticate.match_fingerprint 一致
+"""
+
+import json
+import os
+import struct
+import threading
+import numpy as np
+from multiprocessing import resource_tracker, shared_memory
+from utils import Profiler
+
+# 控制块布局: seq(u64, 写入中为奇数) | version(u64) | data_name(64s)
+_CONTROL_FMT = "<QQ64s"
+_CONTROL_SIZE = struct.calcsize(_CONTROL_FMT)
+
+# 数据块头部: magic | version | 设备数 N | 端点数 E | 元数据(JSON)长度
+_DATA_MAGIC = 0x55534246  # "USBF"
+_HEADER_FMT = "<IQIII"
+_HEADER_SIZE = 32  # 预留对齐到 8 字节
+
+
+def _attach(name):
+    """ 挂载已有共享内存块（不由 resource_tracker 跟踪，避免读者退出时误删） """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+    # Python < 3.13 没有 track 参数：正常挂载后撤销 POSIX 下自动进行的登记
+    shm = shared_memory.SharedMemory(name=name)
+    if os.name == "posix":
+        resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+def _unlink(shm):
+    """
+    发布者解除链接
+
+    同一 resource_tracker 按名称去重登记，同进程或子进程中的读者撤销登记时
+    也会撤销发布者的登记；解除链接前重新登记，unlink() 的撤销与之配对。
+    """
+    if os.name != "posix":
+        shm.unlink()
+        return
+    resource_tracker.register(shm._name, "shared_memory")
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        resource_tracker.unregister(shm._name, "shared_memory")
+        raise
+
+
+def compile_snapshot(devices):
+    """
+    将数据库映射编译为矩阵
+
+    参数:
+    - devices: {device_id: 条目}，可以是 FingerprintSnapshot
+
+    返回:
+    - tuple: (device_ids, endpoints, enum[N,2], transfers[N,E,2])
+             缺失的特征用 NaN 表示，最后一维为 (mean, std)
+    """
+    device_ids = list(devices.keys())
+    endpoints = sorted({ep for entry in devices.values()
+                        for ep in ((entry.get("fingerprint") or {}).get("transfers") or {})})
+    ep_index = {ep: i for i, ep in enumerate(endpoints)}
+
+    enum = np.full((len(device_ids), 2), np.nan)
+    transfers = np.full((len(device_ids), len(endpoints), 2), np.nan)
+    for row, dev_id in enumerate(device_ids):
+        fp = devices[dev_id].get("fingerprint") or {}
+        if fp.get("enumeration"):
+            enum[row] = (fp["enumeration"]["mean"], fp["enumeration"]["std"])
+        for ep, stats in (fp.get("transfers") or {}).items():
+            if stats:
+                transfers[row, ep_index[ep]] = (stats["mean"], stats["std"])
+    return device_ids, endpoints, enum, transfers
+
+
+class FingerprintMatrix:
+    """ 挂载在共享内存上的只读指纹矩阵（numpy 视图，零拷贝） """
+
+    def __init__(self, shm):
+        self._shm = shm
+        magic, version, n, e, meta_len = struct.unpack_from(_HEADER_FMT, shm.buf, 0)
+        if magic != _DATA_MAGIC:
+            raise ValueError(f"共享内存块 {shm.name} 不是指纹矩阵")
+        meta = json.loads(bytes(shm.buf[_HEADER_SIZE:_HEADER_SIZE + meta_len]).decode('utf-8'))
+        offset = _HEADER_SIZE + ((meta_len + 7) // 8) * 8
+
+        self.version = version
+        self.device_ids = meta["device_ids"]
+        self.endpoints = meta["endpoints"]
+        self.enum = np.ndarray((n, 2), dtype=np.float64, buffer=shm.buf, offset=offset)
+        offset += self.enum.nbytes
+        self.transfers = np.ndarray((n, e, 2), dtype=np.float64, buffer=shm.buf, offset=offset)
+        self.enum.flags.writeable = False
+        self.transfers.flags.writeable = False
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    def close(self):
+        # 先释放 numpy 视图，否则 SharedMemory.close() 会因导出的缓冲区报错
+        self.enum = self.transfers = None
+        self._shm.close()
+
+
+def _create_block(version, devices):
+    """ 创建并填充数据块，返回 SharedMemory """
+    device_ids, endpoints, enum, transfers = compile_snapshot(devices)
+    meta = json.dumps({"device_ids": device_ids, "endpoints": endpoints}).encode('utf-8')
+    meta_padded = ((len(meta) + 7) // 8) * 8
+    size = _HEADER_SIZE + meta_padded + enum.nbytes + transfers.nbytes
+
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    struct.pack_into(_HEADER_FMT, shm.buf, 0, _DATA_MAGIC, version,
+                     len(device_ids), len(endpoints), len(meta))
+    shm.buf[_HEADER_SIZE:_HEADER_SIZE + len(meta)] = meta
+    offset = _HEADER_SIZE + meta_padded
+    shm.buf[offset:offset + enum.nbytes] = enum.tobytes()
+    offset += enum.nbytes
+    shm.buf[offset:offset + transfers.nbytes] = transfers.tobytes()
+    return shm
+
+
+class FingerprintMatrixPublisher:
+    """
+    在主进程中发布指纹矩阵
+
+    用法:
+        publisher = FingerprintMatrixPublisher()
+        publisher.sync(FingerprintDB.get_store(db_file))   # 数据库变化后再次调用即可
+        # 把 publisher.control_name 传给工作进程
+        ...
+        publisher.close()
+    """
+
+    def __init__(self):
+        self._control = shared_memory.SharedMemory(create=True, size=_CONTROL_SIZE)
+        struct.pack_into(_CONTROL_FMT, self._control.buf, 0, 0, 0, b"")
+        self._data = None
+        self._seq = 0
+        self._lock = threading.Lock()
+        self.version = 0
+
+    @property
+    def control_name(self):
+        return self._control.name
+
+    def publish(self, devices, version):
+        """ 发布新版本的数据块，并通过控制块通知读者 """
+        with self._lock:
+            new_data = _create_block(version, devices)
+            name = new_data.name.encode('utf-8')
+
+            # seqlock: 写入期间 seq 为奇数，读者检测到后重试
+            self._seq += 1
+            struct.pack_into("<Q", self._control.buf, 0, self._seq)
+            struct.pack_into("<Q64s", self._control.buf, 8, version, name)
+            self._seq += 1
+            struct.pack_into("<Q", self._control.buf, 0, self._seq)
+
+            # 旧块解除链接：已挂载的读者仍可用到关闭为止
+            old_data, self._data = self._data, new_data
+            self.version = version
+        if old_data is not None:
+            old_data.close()
+            _unlink(old_data)
+
+    def sync(self, store):
+        """ 若 FingerprintStore 的快照版本已变化，则重新发布 """
+        with store.snapshot() as snap:
+            if snap.version != self.version:
+                self.publish(snap, snap.version)
+                print(f"[-] 指纹矩阵已发布: 版本 {snap.version}, {len(snap)} 个设备")
+        return self.version
+
+    def close(self):
+        with self._lock:
+            for shm in (self._data, self._control):
+                if shm is None:
+                    continue
+                shm.close()
+                try:
+                    _unlink(shm)
+                except FileNotFoundError:
+                    pass
+            self._data = None
+
+
+class FingerprintMatrixReader:
+    """
+    在工作进程中挂载指纹矩阵
+
+    每次调用 matrix() 都会读取控制块的版本号（无锁、无序列化），
+    版本变化时才挂载新数据块并释放旧块。
+    """
+
+    def __init__(self, control_name):
+        self._control = _attach(control_name)
+        self._matrix = None
+
+    def _read_control(self):
+        while True:
+            seq1, = struct.unpack_from("<Q", self._control.buf, 0)
+            version, name = struct.unpack_from("<Q64s", self._control.buf, 8)
+            seq2, = struct.unpack_from("<Q", self._control.buf, 0)
+            if seq1 == seq2 and seq1 % 2 == 0:
+                return version, name.rstrip(b"\0").decode('utf-8')
+
+    def matrix(self):
+        """ 返回当前版本的 FingerprintMatrix；尚未发布时返回 None """
+        while True:
+            version, name = self._read_control()
+            if not name:
+                return None
+            if self._matrix is not None and self._matrix.version == version:
+                return self._matrix
+            try:
+                new_matrix = FingerprintMatrix(_attach(name))
+            except FileNotFoundError:
+                # 读取控制块后发布者恰好又切换了版本，旧块已解除链接，重新握手
+                continue
+            if self._matrix is not None:
+                self._matrix.close()
+            self._matrix = new_matrix
+            return self._matrix
+
+    def close(self):
+        if self._matrix is not None:
+            self._matrix.close()
+            self._matrix = None
+        self._control.close()
+
+
+def _similarity(m1, s1, m2, s2):
+    """ 向量化版 Authenticate.calculate_similarity，缺失值(NaN)得 0 分 """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_avg = (m1 + m2) / 2
+        abs_diff = np.abs(m1 - m2)
+        std_avg = (s1 + s2) / 2
+        std_avg = np.where(std_avg == 0, 0.001, std_avg)
+
+        relative_score = np.maximum(0, 100 - abs_diff / mean_avg * 200)
+        normalized_score = np.maximum(0, 100 - abs_diff / std_avg * 20)
+        sim = np.minimum(relative_score, normalized_score)
+
+        cv1 = np.where(m1 > 0, s1 / m1, 0)
+        cv2 = np.where(m2 > 0, s2 / m2, 0)
+        sim = np.where((cv1 + cv2) / 2 > 1.5, sim * 0.8, sim)
+        sim = np.where(mean_avg == 0, 0.0, sim)
+    return np.nan_to_num(sim, nan=0.0)
+
+
+def score_matrix(auth_fingerprint, matrix):
+    """
+    对矩阵中的全部设备计算综合相似度
+
+    参数:
+    - auth_fingerprint: 验证指纹 {"enumeration": ..., "transfers": {...}}
+    - matrix: FingerprintMatrix
+
+    返回:
+    - tuple: (enum_sims[N], transfer_sims[N,E] (无共同端点处为 NaN), overall[N])
+    """
+    n = len(matrix.device_ids)
+    enum_fp = auth_fingerprint.get("enumeration")
+    if enum_fp:
+        enum_sims = _similarity(enum_fp["mean"], enum_fp["std"],
+                                matrix.enum[:, 0], matrix.enum[:, 1])
+    else:
+        enum_sims = np.zeros(n)
+
+    probe = np.full((len(matrix.endpoints), 2), np.nan)
+    for i, ep in enumerate(matrix.endpoints):
+        stats = (auth_fingerprint.get("transfers") or {}).get(ep)
+        if stats:
+            probe[i] = (stats["mean"], stats["std"])
+    common = ~np.isnan(probe[:, 0])[None, :] & ~np.isnan(matrix.transfers[:, :, 0])
+    transfer_sims = np.where(
+        common,
+        _similarity(probe[None, :, 0], probe[None, :, 1],
+                    matrix.transfers[:, :, 0], matrix.transfers[:, :, 1]),
+        np.nan
+    )
+
+    counts = common.sum(axis=1)
+    with np.errstate(invalid='ignore'):
+        transfer_mean = np.where(counts > 0, np.nansum(transfer_sims, axis=1) / np.maximum(counts, 1), 0.0)
+    has_enum = enum_sims > 0
+    has_transfer = counts > 0
+    overall = np.select(
+        [has_enum & has_transfer, has_enum, has_transfer],
+        [0.3 * enum_sims + 0.7 * transfer_mean, enum_sims, transfer_mean],
+        default=0.0
+    )
+    return enum_sims, transfer_sims, overall
+
+
+@Profiler.timed("score")
+def match_with_matrix(auth_fingerprint, matrix, device_id=None, threshold=70.0):
+    """
+    使用共享矩阵执行匹配，返回值与 Authenticate.match_fingerprint 相同:
+    (是否通过, 最佳匹配设备ID, 相似度分数, 各设备比对详情)
+    """
+    if matrix is None or not matrix.device_ids:
+        return False, None, 0.0, {}
+    enum_sims, transfer_sims, overall = score_matrix(auth_fingerprint, matrix)
+
+    rows = range(len(matrix.device_ids))
+    if device_id:
+        if device_id not in matrix.device_ids:
+            return False, None, 0.0, {}
+        rows = [matrix.device_ids.index(device_id)]
+
+    details = {}
+    best_match_id, best_score = None, 0.0
+    for row in rows:
+        dev_id = matrix.device_ids[row]
+        sims = transfer_sims[row]
+        by_endpoint = {ep: float(sims[i]) for i, ep in enumerate(matrix.endpoints) if not np.isnan(sims[i])}
+        details[dev_id] = {
+            "enum_similarity": float(enum_sims[row]),
+            "transfer_similarities": list(by_endpoint.values()),
+            "transfer_by_endpoint": by_endpoint,
+            "overall_similarity": float(overall[row])
+        }
+        if overall[row] > best_score:
+            best_score = float(overall[row])
+            best_match_id = dev_id
+    return best_score >= threshold, best_match_id, best_score, details
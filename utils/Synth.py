@@ -0,0 +1,554 @@
+"""
+合成 USB 抓包生成器（测试数据与基准）
+仓库中没有示例抓包，真实抓包又需要 Windows + USBPcap 或 Linux usbmon 与实体 U 盘。
+本模块按模拟设备画像直接写出合法的 pcapng，在普通 Linux 机器上即可得到任意规模的样本：
+- 链路类型: USBPcap (249) / usbmon 48 字节包头 (189) / usbmon mmap 64 字节包头 (220)
+- CONTROL 枚举阶段: 地址 0 上读取设备描述符、SET_ADDRESS、读取配置与字符串描述符、
+  SET_CONFIGURATION、GET_MAX_LUN，总时长服从画像的枚举时间分布
+- 随后在指定 endpoint 上的 BULK 传输，每次传输写出提交/完成两个包（与真实抓包一致），
+  设备响应时间与主机间隔按画像的分布采样
+- 文件按目标大小生成 (KB 到 GB)：逐块向量化采样、流式写出，内存占用与文件大小无关
+- 随机种子与起始时间相同时生成的文件逐字节相同
+
+用法:
+    python -m utils.Synth devices/synth/capture_1.pcapng --profile usb2_stick --size 20MB
+    python -m utils.Synth --dataset devices/synth --captures 5 --size 5MB --format usbmon
+"""
+
+import argparse
+import json
+import math
+import os
+import struct
+import sys
+import time
+import numpy as np
+from functools import lru_cache
+from utils import PcapFile
+
+FORMATS = {
+    "usbpcap": PcapFile.LINKTYPE_USBPCAP,
+    "usbmon": PcapFile.LINKTYPE_USB_LINUX,
+    "usbmon-mmapped": PcapFile.LINKTYPE_USB_LINUX_MMAPPED,
+}
+
+# USB 传输类型 (USBPcap 与 usbmon 编码相同)
+CONTROL = 2
+BULK = 3
+
+# 每块采样的传输数（决定内存占用上限）
+CHUNK = 65536
+
+# 内置模拟设备画像（时间单位: 秒）
+PROFILES = {
+    "usb2_stick": {
+        "description": "USB 2.0 U 盘",
+        "vid": 0x0951, "pid": 0x1666, "product": "DataTraveler 3.0", "max_packet": 512,
+        "enumeration": {"mean": 0.12, "cv": 0.05},
+        "gap": {"mean": 0.0002, "cv": 0.5},
+        "endpoints": {
+            "0x02": {"latency": {"mean": 0.0011, "cv": 0.3}, "weight": 0.8, "size": 4096},
+            "0x81": {"latency": {"mean": 0.0009, "cv": 0.3}, "weight": 0.2, "size": 512},
+        },
+    },
+    "usb3_stick": {
+        "description": "USB 3.0 U 盘",
+        "vid": 0x0781, "pid": 0x5583, "product": "Ultra Fit", "max_packet": 1024,
+        "enumeration": {"mean": 0.085, "cv": 0.06},
+        "gap": {"mean": 0.00008, "cv": 0.5},
+        "endpoints": {
+            "0x02": {"latency": {"mean": 0.00035, "cv": 0.35}, "weight": 0.75, "size": 16384},
+            "0x81": {"latency": {"mean": 0.0003, "cv": 0.35}, "weight": 0.25, "size": 1024},
+        },
+    },
+    "slow_stick": {
+        "description": "低速 U 盘 (廉价闪存)",
+        "vid": 0x058F, "pid": 0x6387, "product": "Mass Storage", "max_packet": 512,
+        "enumeration": {"mean": 0.21, "cv": 0.08},
+        "gap": {"mean": 0.0004, "cv": 0.6},
+        "endpoints": {
+            "0x02": {"latency": {"mean": 0.0032, "cv": 0.4}, "weight": 0.7, "size": 4096},
+            "0x81": {"latency": {"mean": 0.0024, "cv": 0.4}, "weight": 0.3, "size": 512},
+        },
+    },
+    "card_reader": {
+        "description": "读卡器 (不同的 endpoint 地址)",
+        "vid": 0x05E3, "pid": 0x0749, "product": "USB3.0 Card Reader", "max_packet": 512,
+        "enumeration": {"mean": 0.35, "cv": 0.1, "dist": "normal"},
+        "gap": {"mean": 0.0003, "cv": 1.0, "dist": "exponential"},
+        "endpoints": {
+            "0x01": {"latency": {"mean": 0.0016, "cv": 0.25}, "weight": 0.6, "size": 8192},
+            "0x82": {"latency": {"mean": 0.0012, "cv": 0.25}, "weight": 0.4, "size": 512},
+        },
+    },
+}
+
+
+class Timing:
+    """ 时间分布（秒）：lognormal / normal / exponential / uniform / constant，由均值与变异系数描述 """
+
+    DISTRIBUTIONS = ("lognormal", "normal", "exponential", "uniform", "constant")
+
+    def __init__(self, mean, cv=0.0, dist="lognormal"):
+        if dist not in self.DISTRIBUTIONS:
+            raise ValueError(f"未知的分布: {dist} (可选: {', '.join(self.DISTRIBUTIONS)})")
+        if mean <= 0:
+            raise ValueError(f"时间均值必须为正: {mean}")
+        self.mean = float(mean)
+        self.cv = float(cv)
+        self.dist = dist
+
+    @classmethod
+    def from_spec(cls, spec):
+        """ 数字（常数）、{"mean", "cv", "dist"} 或 "dist:mean:cv" 形式的字符串 """
+        if isinstance(spec, Timing):
+            return spec
+        if isinstance(spec, (int, float)):
+            return cls(spec, 0.0, "constant")
+        if isinstance(spec, str):
+            parts = spec.split(":")
+            return cls(float(parts[1]), float(parts[2]) if len(parts) > 2 else 0.0, parts[0])
+        return cls(spec["mean"], spec.get("cv", 0.0), spec.get("dist", "lognormal"))
+
+    def scaled(self, factor):
+        return Timing(self.mean * factor, self.cv, self.dist)
+
+    def sample(self, rng, n):
+        mean, cv = self.mean, self.cv
+        if self.dist == "exponential":
+            return rng.exponential(mean, n)
+        if self.dist == "constant" or cv == 0:
+            return np.full(n, mean)
+        if self.dist == "lognormal":
+            sigma2 = math.log1p(cv * cv)
+            return rng.lognormal(math.log(mean) - sigma2 / 2, math.sqrt(sigma2), n)
+        if self.dist == "uniform":
+            half = min(cv * math.sqrt(3), 1.0) * mean
+            return rng.uniform(mean - half, mean + half, n)
+        return np.maximum(rng.normal(mean, cv * mean, n), mean * 0.01)
+
+    def as_dict(self):
+        return {"mean": self.mean, "cv": self.cv, "dist": self.dist}
+
+
+class DeviceProfile:
+    """ 模拟设备画像：枚举时间、主机间隔与各 BULK endpoint 的响应时间分布 """
+
+    def __init__(self, name, enumeration, gap, endpoints, vid=0x0951, pid=0x1666, product="USB Flash Disk",
+                 max_packet=512, session_jitter=0.03, description=""):
+        """
+        参数:
+        - enumeration / gap: Timing 或其描述 (见 Timing.from_spec)
+        - endpoints: {endpoint 地址: {"latency": Timing, "weight": 传输占比, "size": 每次传输字节数}}
+        - session_jitter: 每个文件对各均值施加的随机偏移（对数标准差），模拟同一设备多次采集的差异
+        """
+        if not endpoints:
+            raise ValueError(f"设备画像 {name} 没有 BULK endpoint")
+        self.name = name
+        self.description = description
+        self.enumeration = Timing.from_spec(enumeration)
+        self.gap = Timing.from_spec(gap)
+        self.endpoints = {}
+        for address, spec in endpoints.items():
+            address = int(address, 16) if isinstance(address, str) else int(address)
+            self.endpoints[address] = {"latency": Timing.from_spec(spec["latency"]),
+                                       "weight": float(spec.get("weight", 1.0)),
+                                       "size": int(spec.get("size", max_packet))}
+        self.vid = vid
+        self.pid = pid
+        self.product = product
+        self.max_packet = max_packet
+        self.session_jitter = session_jitter
+
+    @classmethod
+    def from_dict(cls, name, spec):
+        spec = dict(spec)
+        return cls(name, spec.pop("enumeration"), spec.pop("gap"), spec.pop("endpoints"), **spec)
+
+    def as_dict(self):
+        return {"description": self.description, "vid": self.vid, "pid": self.pid, "product": self.product,
+                "max_packet": self.max_packet, "session_jitter": self.session_jitter,
+                "enumeration": self.enumeration.as_dict(), "gap": self.gap.as_dict(),
+                "endpoints": {f"0x{address:02x}": {"latency": ep["latency"].as_dict(), "weight": ep["weight"],
+                                                   "size": ep["size"]}
+                              for address, ep in self.endpoints.items()}}
+
+    def with_endpoints(self, addresses):
+        """ 改用指定的 endpoint；画像中没有的地址沿用同方向（否则第一个）endpoint 的参数 """
+        endpoints = {}
+        for address in addresses:
+            if address in self.endpoints:
+                endpoints[address] = self.endpoints[address]
+                continue
+            same_dir = [ep for a, ep in self.endpoints.items() if (a & 0x80) == (address & 0x80)]
+            endpoints[address] = (same_dir or list(self.endpoints.values()))[0]
+        profile = DeviceProfile.from_dict(self.name, self.as_dict())
+        profile.endpoints = endpoints
+        return profile
+
+    def session(self, rng):
+        """ 为一个文件抽取本次采集的画像（各均值乘以随机偏移） """
+        if not self.session_jitter:
+            return self
+
+        def jitter():
+            return float(rng.lognormal(0.0, self.session_jitter))
+
+        profile = DeviceProfile.from_dict(self.name, self.as_dict())
+        profile.enumeration = self.enumeration.scaled(jitter())
+        profile.gap = self.gap.scaled(jitter())
+        for ep in profile.endpoints.values():
+            ep["latency"] = ep["latency"].scaled(jitter())
+        return profile
+
+
+def load_profiles(path=None):
+    """ 内置画像，及 path (JSON: {名称: 画像描述}) 中的自定义画像（同名覆盖） """
+    specs = dict(PROFILES)
+    if path:
+        with open(path, 'r', encoding='utf-8') as f:
+            specs.update(json.load(f))
+    return {name: DeviceProfile.from_dict(name, spec) for name, spec in specs.items()}
+
+
+def parse_size(value):
+    """ '64KB' / '1.5GB' / 1048576 -> 字节数 (1024 进制) """
+    if isinstance(value, (int, float)):
+        return int(value)
+    text = value.strip().upper().rstrip("B")
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(float(text))
+
+
+# ==================== 包编码 ====================
+
+@lru_cache(maxsize=64)
+def _payload(length):
+    """ 传输数据（固定图案，同长度复用同一对象） """
+    pattern = bytes(range(256))
+    return (pattern * (length // 256 + 1))[:length]
+
+
+class _UsbpcapEncoder:
+    """ USBPcap 包: 27 字节包头（控制传输 28 字节，多一个 stage 字节） + 数据 """
+
+    linktype = PcapFile.LINKTYPE_USBPCAP
+    header_size = PcapFile.USBPCAP_HEADER.size
+
+    def __init__(self, bus):
+        self.bus = bus
+
+    def pair(self, irp, transfer, endpoint, device, submit_ticks, complete_ticks, ticks_per_second,
+             length, setup=None):
+        """ 一次传输的 (请求包, 完成包)，每项为 (ticks, data, 包头长度) """
+        function = 0x0008 if transfer == CONTROL else 0x0009
+        is_in = bool(endpoint & 0x80)
+        out_data = b"" if is_in else _payload(length)
+        in_data = _payload(length) if is_in else b""
+        stage = transfer == CONTROL
+        request = self._packet(irp, function, 0, device, endpoint, transfer, setup if stage else out_data,
+                               0 if stage else None)
+        complete = self._packet(irp, function, 1, device, endpoint, transfer, in_data, 3 if stage else None)
+        return (submit_ticks,) + request, (complete_ticks,) + complete
+
+    def _packet(self, irp, function, info, device, endpoint, transfer, data, stage):
+        header_len = self.header_size + (stage is not None)
+        head = PcapFile.USBPCAP_HEADER.pack(header_len, irp, 0, function, info, self.bus, device, endpoint,
+                                            transfer, len(data))
+        if stage is not None:
+            head += bytes((stage,))
+        return head + data, header_len
+
+
+class _UsbmonEncoder:
+    """ Linux usbmon 包: 48 字节包头（mmap 接口 64 字节）+ 数据，提交 'S' / 完成 'C' """
+
+    def __init__(self, bus, mmapped=False):
+        self.bus = bus
+        self.linktype = PcapFile.LINKTYPE_USB_LINUX_MMAPPED if mmapped else PcapFile.LINKTYPE_USB_LINUX
+        self.header_size = PcapFile.USBMON_MMAPPED_HEADER_LEN if mmapped else PcapFile.USBMON_HEADER.size
+        self._padding = bytes(self.header_size - PcapFile.USBMON_HEADER.size)
+
+    def pair(self, urb, transfer, endpoint, device, submit_ticks, complete_ticks, ticks_per_second,
+             length, setup=None):
+        is_in = bool(endpoint & 0x80)
+        submit = self._packet(urb, b"S", transfer, endpoint, device, submit_ticks, ticks_per_second,
+                              -115, length, b"" if is_in else _payload(length), setup)
+        complete = self._packet(urb, b"C", transfer, endpoint, device, complete_ticks, ticks_per_second,
+                                0, length if is_in or transfer == BULK else 0,
+                                _payload(length) if is_in else b"", None)
+        return submit, complete
+
+    def _packet(self, urb, event, transfer, endpoint, device, ticks, ticks_per_second, status, length, data, setup):
+        # flag_setup 为 0 表示包头带有 setup 包；flag_data 为 '=' 表示带有数据，'<' / '>' 表示无数据
+        flag_setup = b"\x00" if setup is not None else b"-"
+        flag_data = b"=" if data else (b"<" if endpoint & 0x80 else b">")
+        sec, frac = divmod(ticks, ticks_per_second)
+        head = PcapFile.USBMON_HEADER.pack(urb, event[0], transfer, endpoint, device, self.bus, flag_setup,
+                                           flag_data, sec, frac * 1000000 // ticks_per_second, status, length,
+                                           len(data), setup or bytes(8))
+        return ticks, head + self._padding + data, self.header_size
+
+
+def _encoder(fmt, bus):
+    if fmt == "usbpcap":
+        return _UsbpcapEncoder(bus)
+    if fmt in ("usbmon", "usbmon-mmapped"):
+        return _UsbmonEncoder(bus, mmapped=fmt == "usbmon-mmapped")
+    raise ValueError(f"未知的格式: {fmt} (可选: {', '.join(FORMATS)})")
+
+
+# ==================== 枚举阶段 ====================
+
+def _string_descriptor(text):
+    data = text.encode("utf-16-le")
+    return bytes((len(data) + 2, 3)) + data
+
+
+def _enumeration_requests(profile, address):
+    """
+    标准枚举序列
+
+    返回:
+    - list: [(设备地址, endpoint, setup 包, 响应长度)]
+    """
+    endpoints = sorted(profile.endpoints)
+    config_len = 9 + 9 + 7 * len(endpoints)
+    product = _string_descriptor(profile.product)
+    serial = _string_descriptor(f"{profile.vid:04X}{profile.pid:04X}0001")
+
+    def setup(request_type, request, value, index, length):
+        return struct.pack("<BBHHH", request_type, request, value, index, length)
+
+    return [
+        (0, 0x80, setup(0x80, 0x06, 0x0100, 0, 64), 18),               # GET_DESCRIPTOR (设备)
+        (0, 0x00, setup(0x00, 0x05, address, 0, 0), 0),                # SET_ADDRESS
+        (address, 0x80, setup(0x80, 0x06, 0x0100, 0, 18), 18),
+        (address, 0x80, setup(0x80, 0x06, 0x0200, 0, 9), 9),          # GET_DESCRIPTOR (配置)
+        (address, 0x80, setup(0x80, 0x06, 0x0200, 0, config_len), config_len),
+        (address, 0x80, setup(0x80, 0x06, 0x0300, 0, 255), 4),         # GET_DESCRIPTOR (字符串)
+        (address, 0x80, setup(0x80, 0x06, 0x0302, 0x0409, 255), len(product)),
+        (address, 0x80, setup(0x80, 0x06, 0x0303, 0x0409, 255), len(serial)),
+        (address, 0x00, setup(0x00, 0x09, 1, 0, 0), 0),                # SET_CONFIGURATION
+        (address, 0x80, setup(0xA1, 0xFE, 0, 0, 1), 1),                # GET_MAX_LUN (Mass Storage)
+    ]
+
+
+# ==================== 生成 ====================
+
+def generate(path, profile="usb2_stick", size="10MB", fmt="usbpcap", header_only=False, seed=None,
+             transfers=None, bus=1, address=5, endpoints=None, start_time=None, tsresol=6, profiles=None):
+    """
+    [接口函数] 生成一个合成抓包文件
+
+    参数:
+    - profile: 画像名称 (见 PROFILES / load_profiles) 或 DeviceProfile
+    - size: 目标文件大小（字节数或 '64KB' / '2GB'），写满后在传输边界结束；None 表示只按 transfers
+    - fmt: "usbpcap" / "usbmon" / "usbmon-mmapped"
+    - header_only: 只保存包头（与 header_only 采集一致：截断数据，保留原始长度）
+    - seed: 随机种子（整数或整数列表），相同种子生成相同文件
+    - transfers: 最多写入的 BULK 传输数
+    - endpoints: 可选 endpoint 地址列表，替换画像中的 BULK endpoint
+    - start_time: 第一个包的 Unix 时间戳，None 表示当前时间
+    - tsresol: 时间戳分辨率 (6 = 微秒, 9 = 纳秒)
+    - profiles: load_profiles() 的结果（按名称查找画像）
+
+    返回:
+    - dict: {"path", "profile", "format", "bytes", "packets", "transfers", "duration", "enumeration",
+             "endpoints": {endpoint: {"transfers", "latency_mean"}}}
+    """
+    if size is None and transfers is None:
+        raise ValueError("size 与 transfers 至少指定一个")
+    if not isinstance(profile, DeviceProfile):
+        catalog = profiles or load_profiles()
+        if profile not in catalog:
+            raise ValueError(f"未知的设备画像: {profile} (可选: {', '.join(catalog)})")
+        profile = catalog[profile]
+    if endpoints:
+        profile = profile.with_endpoints(endpoints)
+
+    rng = np.random.default_rng(seed)
+    session = profile.session(rng)
+    encoder = _encoder(fmt, bus)
+    target = parse_size(size) if size is not None else None
+    snaplen = PcapFile.HEADER_SNAPLEN if header_only else 0
+    start_time = time.time() if start_time is None else start_time
+
+    addresses = list(session.endpoints)
+    eps = [session.endpoints[a] for a in addresses]
+    weights = np.array([ep["weight"] for ep in eps], dtype=np.float64)
+    weights /= weights.sum()
+    counts = np.zeros(len(eps), dtype=np.int64)
+
+    # 枚举时间 = 第一个控制请求到第一个 BULK 请求（与 FeatureAccumulator 的定义一致）
+    enumeration = float(np.clip(session.enumeration.sample(rng, 1)[0], 0.005, 4.5))
+
+    with PcapFile.PcapngWriter(path, encoder.linktype, snaplen, tsresol) as writer:
+        tps = writer.ticks_per_second
+        base = int(round(start_time * tps))
+        written = writer.f.tell()
+        last = base
+
+        def emit(packet):
+            nonlocal written, last
+            ticks, data, header_len = packet
+            last = max(last, ticks)
+            orig_len = len(data)
+            if header_only:
+                data = data[:header_len]
+            writer.write_ticks(ticks, data, orig_len)
+            written += 32 + ((len(data) + 3) & ~3)
+
+        requests = _enumeration_requests(session, address)
+        step = enumeration / len(requests)
+        service = min(step * 0.4, 0.0005)
+        urb = 0x1000
+        for i, (device, endpoint, setup, length) in enumerate(requests):
+            submit = base + int(round(i * step * tps))
+            for packet in encoder.pair(urb, CONTROL, endpoint, device, submit,
+                                       submit + max(int(round(service * tps)), 1), tps, length, setup):
+                emit(packet)
+            urb += 1
+
+        t = enumeration
+        done = 0
+        while True:
+            n = CHUNK if transfers is None else min(CHUNK, transfers - done)
+            if n <= 0:
+                break
+            which = rng.choice(len(eps), n, p=weights)
+            latency = np.empty(n)
+            for k, ep in enumerate(eps):
+                mask = which == k
+                latency[mask] = ep["latency"].sample(rng, int(mask.sum()))
+            gap = session.gap.sample(rng, n)
+            cycle = latency + gap
+            submit = t + np.concatenate(([0.0], np.cumsum(cycle[:-1])))
+            submit_ticks = base + np.rint(submit * tps).astype(np.int64)
+            complete_ticks = np.maximum(base + np.rint((submit + latency) * tps).astype(np.int64), submit_ticks + 1)
+            t = float(submit[-1] + cycle[-1])
+
+            for i in range(n):
+                k = int(which[i])
+                for packet in encoder.pair(urb, BULK, addresses[k], address, int(submit_ticks[i]),
+                                           int(complete_ticks[i]), tps, eps[k]["size"]):
+                    emit(packet)
+                urb += 1
+                counts[k] += 1
+                done += 1
+                if target is not None and written >= target:
+                    break
+            if target is not None and written >= target:
+                break
+        packets = writer.count
+        duration = (last - base) / tps
+
+    return {
+        "path": path,
+        "profile": profile.name,
+        "format": fmt,
+        "bytes": os.path.getsize(path),
+        "packets": packets,
+        "transfers": done,
+        "duration": duration,
+        "enumeration": enumeration,
+        "endpoints": {f"0x{a:02x}": {"transfers": int(counts[k]), "latency_mean": eps[k]["latency"].mean}
+                      for k, a in enumerate(addresses)},
+    }
+
+
+def generate_dataset(folder, profiles=None, captures=5, size="5MB", seed=0, catalog=None, verbose=True, **kwargs):
+    """
+    [接口函数] 为多个画像各生成若干采集文件
+
+    目录结构与 Register.run_bulk_registration 一致: folder/<画像名>/capture_N.pcapng。
+    每个文件的种子为 [seed, 画像序号, N]，用不同的 seed 再生成一份即可作为验证样本。
+
+    参数:
+    - profiles: 画像名称列表，None 表示全部
+    - captures: 每个画像的文件数
+    - 其余参数同 generate
+
+    返回:
+    - dict: {画像名: [generate 的结果, ...]}
+    """
+    catalog = catalog or load_profiles()
+    names = list(profiles or catalog)
+    results = {}
+    for index, name in enumerate(names):
+        device_dir = os.path.join(folder, name)
+        os.makedirs(device_dir, exist_ok=True)
+        results[name] = []
+        for n in range(1, captures + 1):
+            info = generate(os.path.join(device_dir, f"capture_{n}.pcapng"), name, size=size,
+                            seed=[seed, index, n], profiles=catalog, **kwargs)
+            results[name].append(info)
+            if verbose:
+                _print_result(info)
+    return results
+
+
+def _print_result(info):
+    print(f"[√] {info['path']}: {info['bytes'] / 1024 / 1024:.2f} MB, {info['packets']} 包, "
+          f"{info['transfers']} 次传输, 时长 {info['duration']:.2f}s, 枚举 {info['enumeration']:.4f}s")
+
+
+def _parse_endpoints(text):
+    return [int(part, 16) if part.lower().startswith("0x") else int(part) for part in text.split(",") if part]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="生成合成 USB 抓包 (pcapng)，用于测试与基准")
+    parser.add_argument("output", nargs="?", help="输出文件 (与 --dataset 二选一)")
+    parser.add_argument("--profile", default="usb2_stick", help="设备画像 (默认 usb2_stick)")
+    parser.add_argument("--profile-file", help="自定义画像 JSON ({名称: 画像描述}，格式同 --list-profiles 的输出)")
+    parser.add_argument("--list-profiles", action="store_true", help="列出可用画像 (JSON) 后退出")
+    parser.add_argument("--size", default="10MB", help="目标文件大小，如 64KB / 200MB / 2GB (默认 10MB)")
+    parser.add_argument("--transfers", type=int, help="最多写入的 BULK 传输数")
+    parser.add_argument("--format", default="usbpcap", choices=list(FORMATS), help="链路类型 (默认 usbpcap)")
+    parser.add_argument("--header-only", action="store_true", help="只保存包头")
+    parser.add_argument("--endpoints", help="BULK endpoint 列表，如 0x02,0x81")
+    parser.add_argument("--bus", type=int, default=1, help="总线号")
+    parser.add_argument("--address", type=int, default=5, help="枚举后的设备地址")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子 (相同种子生成相同文件)")
+    parser.add_argument("--ns", action="store_true", help="纳秒时间戳 (默认微秒)")
+    parser.add_argument("--dataset", help="批量生成: 每个画像一个子文件夹")
+    parser.add_argument("--profiles", help="--dataset 使用的画像 (逗号分隔，默认全部)")
+    parser.add_argument("--captures", type=int, default=5, help="--dataset 每个画像的文件数")
+    args = parser.parse_args(argv)
+
+    try:
+        catalog = load_profiles(args.profile_file)
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        print(f"[错误] 无法加载画像文件: {e}")
+        return 1
+    if args.list_profiles:
+        print(json.dumps({name: p.as_dict() for name, p in catalog.items()}, indent=2, ensure_ascii=False))
+        return 0
+
+    options = dict(fmt=args.format, header_only=args.header_only, transfers=args.transfers, bus=args.bus,
+                   address=args.address, tsresol=9 if args.ns else 6,
+                   endpoints=_parse_endpoints(args.endpoints) if args.endpoints else None)
+    try:
+        if args.dataset:
+            profiles = args.profiles.split(",") if args.profiles else None
+            generate_dataset(args.dataset, profiles, captures=args.captures, size=args.size,
+                             seed=args.seed or 0, catalog=catalog, **options)
+        elif args.output:
+            folder = os.path.dirname(args.output)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            _print_result(generate(args.output, args.profile, size=args.size, seed=args.seed, profiles=catalog,
+                                   **options))
+        else:
+            parser.error("需要指定输出文件或 --dataset")
+    except ValueError as e:
+        print(f"[错误] {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
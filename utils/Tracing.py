@@ -0,0 +1,216 @@
+"""
+采集-认证时间线追踪 (Chrome trace-event JSON)
+一次"采集到判定"耗时 40 秒时，用时间线查看各阶段：tshark 启动、等待插入、挂载检测、I/O 负载、
+停止抓包、解析、评分。输出的 JSON 可直接载入 chrome://tracing 或 https://ui.perfetto.dev。
+
+- 默认关闭：未启用时每个插桩点只有一次 contextvar 读取
+- span(name): 计时区间（嵌套区间显示为层级）；@traced(name) 装饰整个函数
+- phase(name): 在当前区间内切换阶段（上一阶段自动结束，区间结束时最后一个阶段也结束），
+  适合长函数中顺序执行、带提前 return 的步骤，无需为每一步改缩进
+- 启用范围为 tracing() 块所在的线程/上下文；事件追加到列表（GIL 下原子），结束时一次写出
+
+用法:
+    with Tracing.tracing("traces/auth.json"):
+        AutoCatch.run_single_capture(...)
+        Authenticate.authenticate_device(...)
+"""
+
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+_current = contextvars.ContextVar("usb_trace", default=None)
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "cat", "args", "start", "phase")
+
+    def __init__(self, tracer, name, cat, args):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.phase = None  # (名称, 开始时间, 参数)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.tracer._stack().append(self)
+        return self
+
+    def set_phase(self, name, args):
+        now = time.perf_counter()
+        self._end_phase(now)
+        if name is not None:
+            self.phase = (name, now, args)
+
+    def _end_phase(self, now):
+        if self.phase is not None:
+            name, start, args = self.phase
+            self.tracer._complete(name, self.cat, start, now, args)
+            self.phase = None
+
+    def __exit__(self, exc_type, exc, tb):
+        now = time.perf_counter()
+        self._end_phase(now)
+        stack = self.tracer._stack()
+        if stack and stack[-1] is self:
+            stack.pop()
+        args = self.args
+        if exc_type is not None:
+            args = dict(args or {}, error=f"{exc_type.__name__}: {exc}")
+        self.tracer._complete(self.name, self.cat, self.start, now, args)
+        return False
+
+
+class Tracer:
+    """ 一次会话的事件收集器 """
+
+    def __init__(self, name="session"):
+        self.name = name
+        self.pid = os.getpid()
+        self.origin = time.perf_counter()
+        self.wall_start = time.time()
+        self.events = []
+        self._threads = {}
+        self._local = threading.local()
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _tid(self):
+        tid = threading.get_ident()
+        if tid not in self._threads:
+            self._threads[tid] = threading.current_thread().name
+        return tid
+
+    def _us(self, t):
+        return round((t - self.origin) * 1e6, 3)
+
+    def _complete(self, name, cat, start, end, args):
+        event = {"name": name, "cat": cat or "usb", "ph": "X", "ts": self._us(start),
+                 "dur": round((end - start) * 1e6, 3), "pid": self.pid, "tid": self._tid()}
+        if args:
+            event["args"] = args
+        self.events.append(event)
+
+    def span(self, name, cat=None, **args):
+        return _Span(self, name, cat, args or None)
+
+    def instant(self, name, cat=None, **args):
+        event = {"name": name, "cat": cat or "usb", "ph": "i", "s": "t", "ts": self._us(time.perf_counter()),
+                 "pid": self.pid, "tid": self._tid()}
+        if args:
+            event["args"] = args
+        self.events.append(event)
+
+    def phase(self, name, **args):
+        stack = self._stack()
+        if stack:
+            stack[-1].set_phase(name, args or None)
+
+    def to_dict(self):
+        metadata = [{"name": "process_name", "ph": "M", "pid": self.pid, "args": {"name": self.name}}]
+        metadata += [{"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid, "args": {"name": name}}
+                     for tid, name in list(self._threads.items())]
+        return {"traceEvents": metadata + sorted(self.events, key=lambda e: e["ts"]),
+                "displayTimeUnit": "ms",
+                "otherData": {"session": self.name,
+                              "start": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.wall_start))}}
+
+    def save(self, path):
+        """ 写出 trace 文件；path 为已存在的文件夹时在其中按会话名与时间命名 """
+        if os.path.isdir(path):
+            stamp = time.strftime("%Y%m%d_%H%M%S", time.localtime(self.wall_start))
+            safe = "".join(c if c.isalnum() or c in "-_" else "_" for c in self.name)
+            path = os.path.join(path, f"trace_{stamp}_{safe}.json")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        return path
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def active():
+    """ 当前上下文的 Tracer，未启用时为 None """
+    return _current.get()
+
+
+def span(name, cat=None, **args):
+    """ 计时区间（未启用时返回空上下文） """
+    tracer = _current.get()
+    if tracer is None:
+        return _NULL_SPAN
+    return tracer.span(name, cat, **args)
+
+
+def phase(name, **args):
+    """ 在当前区间内开始新阶段（结束上一阶段）；name=None 只结束当前阶段 """
+    tracer = _current.get()
+    if tracer is not None:
+        tracer.phase(name, **args)
+
+
+def instant(name, cat=None, **args):
+    tracer = _current.get()
+    if tracer is not None:
+        tracer.instant(name, cat, **args)
+
+
+def traced(name, cat=None):
+    """ 装饰器：启用时把整个函数记为一个区间 """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            tracer = _current.get()
+            if tracer is None:
+                return func(*args, **kwargs)
+            with tracer.span(name, cat):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def tracing(path=None, name="session"):
+    """
+    在 with 块内启用追踪，结束时写出到 path（None 则不写，可由返回的 Tracer 自行处理）
+
+    已在追踪中时复用外层 Tracer（事件记入同一时间线，由外层负责写出）
+    """
+    outer = _current.get()
+    if outer is not None:
+        yield outer
+        return
+    tracer = Tracer(name)
+    token = _current.set(tracer)
+    try:
+        with tracer.span(name, "session"):
+            yield tracer
+    finally:
+        _current.reset(token)
+        if path:
+            try:
+                saved = tracer.save(path)
+                print(f"[-] 时间线已保存: {saved}")
+            except OSError as e:
+                print(f"[!] 时间线写入失败: {e}")
@@ -0,0 +1,331 @@
+"""
+Linux usbmon 抓包后端
+生产环境的闸机为 Linux，没有 USBPcap / 盘符：
+- 设备识别: 通过 sysfs 找到新插入设备的 bus/address，再由块设备找到挂载点
+- 抓包:     tshark -i usbmonN（AutoCatch 默认后端），或本模块的 UsbmonCapture
+            直接读取 /dev/usbmonN 二进制接口并写出 pcapng (LINKTYPE_USB_LINUX)
+使用前需要加载内核模块并具有 root 权限: sudo modprobe usbmon
+"""
+
+import ctypes
+import os
+import re
+import select
+import subprocess
+import threading
+import time
+from collections import namedtuple
+from utils import FeatureExtractor, PcapFile, Readiness
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+SYSFS_USB_DEVICES = "/sys/bus/usb/devices"
+SYSFS_BLOCK = "/sys/block"
+MOUNTS_FILE = "/proc/self/mounts"
+
+# --- usbmon 二进制接口 ioctl (include/uapi/linux/usb/mon.h 未导出，按 Documentation/usb/usbmon.rst) ---
+MON_IOC_MAGIC = 0x92
+_IOC_NONE, _IOC_WRITE, _IOC_READ = 0, 1, 2
+
+
+class _MonGetArg(ctypes.Structure):
+    _fields_ = [("hdr", ctypes.c_void_p), ("data", ctypes.c_void_p), ("alloc", ctypes.c_size_t)]
+
+
+def _ioc(direction, nr, size):
+    return (direction << 30) | (size << 16) | (MON_IOC_MAGIC << 8) | nr
+
+
+MON_IOCG_STATS = _ioc(_IOC_READ, 3, 8)
+MON_IOCT_RING_SIZE = _ioc(_IOC_NONE, 4, 0)
+MON_IOCX_GET = _ioc(_IOC_WRITE, 6, ctypes.sizeof(_MonGetArg))
+RING_SIZE = 1200 * 1024  # 内核允许的最大环形缓冲区，50MB I/O 测试时减少丢包
+
+# 默认每个包保存的数据字节数（包头之后）
+DEFAULT_SNAPLEN = 65536
+
+UsbDevice = namedtuple("UsbDevice", "bus devnum sysfs_path vendor_id product_id serial product")
+
+
+# ==================== 设备识别 ====================
+
+def _read_attr(path, name, default=None):
+    try:
+        with open(os.path.join(path, name), 'r', encoding='utf-8', errors='replace') as f:
+            return f.read().strip()
+    except OSError:
+        return default
+
+
+def list_usb_devices():
+    """
+    列出当前所有 USB 设备（不含 hub）
+
+    返回:
+    - dict: {(bus, devnum): UsbDevice}
+    """
+    devices = {}
+    if not os.path.isdir(SYSFS_USB_DEVICES):
+        return devices
+    for name in os.listdir(SYSFS_USB_DEVICES):
+        if ':' in name:
+            continue  # 接口节点
+        dev = read_device(os.path.join(SYSFS_USB_DEVICES, name))
+        if dev is not None:
+            devices[(dev.bus, dev.devnum)] = dev
+    return devices
+
+
+def read_device(path):
+    """ 读取 sysfs 设备节点，非 USB 设备或 hub 返回 None """
+    busnum = _read_attr(path, "busnum")
+    devnum = _read_attr(path, "devnum")
+    if busnum is None or devnum is None or _read_attr(path, "bDeviceClass") == "09":
+        return None
+    return UsbDevice(int(busnum), int(devnum), os.path.realpath(path),
+                     _read_attr(path, "idVendor", ""), _read_attr(path, "idProduct", ""),
+                     _read_attr(path, "serial", ""), _read_attr(path, "product", ""))
+
+
+def wait_for_new_device(known, timeout=60.0, stop_event=None, port=None):
+    """
+    等待新的 USB 设备出现
+
+    参数:
+    - known: 插入前的 list_usb_devices() 结果
+    - port: 可选 sysfs 物理端口名 (如 "1-2" / "3-1.4")，只接受插在该端口上的设备
+
+    返回:
+    - UsbDevice 或 None (超时/取消)
+    """
+    def new_device():
+        for key, dev in sorted(list_usb_devices().items()):
+            if key in known:
+                continue
+            if port is None or os.path.basename(dev.sysfs_path) == port:
+                return dev
+        return None
+    return Readiness.wait_until(new_device, timeout, stop_event=stop_event, subsystem='usb')
+
+
+def block_devices(device):
+    """ 属于该 USB 设备的块设备及其分区名 (如 ['sdb', 'sdb1']) """
+    names = []
+    if not os.path.isdir(SYSFS_BLOCK):
+        return names
+    prefix = device.sysfs_path.rstrip('/') + '/'
+    for name in sorted(os.listdir(SYSFS_BLOCK)):
+        path = os.path.join(SYSFS_BLOCK, name)
+        if not os.path.realpath(path).startswith(prefix):
+            continue
+        names.append(name)
+        names.extend(sorted(p for p in os.listdir(path) if p.startswith(name)))
+    return names
+
+
+def _unescape_mount(field):
+    # /proc/mounts 中空格、制表符、换行与反斜杠以八进制转义 (\040)，其余字符（如中文卷标）原样保留
+    return re.sub(r'\\([0-7]{3})', lambda m: chr(int(m.group(1), 8)), field)
+
+
+def find_mount_point(device):
+    """ 该 USB 设备（任一分区）的挂载点，未挂载返回 None """
+    dev_nodes = {"/dev/" + name for name in block_devices(device)}
+    if not dev_nodes:
+        return None
+    try:
+        with open(MOUNTS_FILE, 'r', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and os.path.realpath(parts[0]) in dev_nodes:
+                    return _unescape_mount(parts[1])
+    except OSError:
+        pass
+    return None
+
+
+def wait_for_mount(device, timeout=30.0, stop_event=None):
+    """ 等待 USB 设备被挂载（桌面环境自动挂载或 udev 规则），返回挂载点或 None """
+    return Readiness.wait_until(lambda: find_mount_point(device), timeout, stop_event=stop_event)
+
+
+def bus_of_interface(interface):
+    """ 'usbmon3' -> 3，'usbmon0' 表示所有总线 """
+    if interface and interface.startswith("usbmon"):
+        try:
+            return int(interface[len("usbmon"):])
+        except ValueError:
+            pass
+    return 0
+
+
+# ==================== 二进制接口抓包 ====================
+
+class UsbmonCapture:
+    """
+    直接读取 /dev/usbmonN 的抓包器，结果写为 pcapng (LINKTYPE_USB_LINUX)
+
+    提供与 subprocess.Popen 相同的 poll / terminate / wait / kill 接口，
+    以及与 Readiness.StderrWatcher 相同的 wait_ready / tail，AutoCatch 可与 tshark 统一处理。
+    live=True 时在读取线程中直接累积特征，finish() 返回 (enum_val, transfer_data)。
+    """
+
+    def __init__(self, bus=0, snaplen=DEFAULT_SNAPLEN, live=False, device_filter=False):
+        """
+        参数:
+        - bus: 总线号，0 表示所有总线 (/dev/usbmon0)
+        - snaplen: 每个包在 48 字节包头之后最多保存的数据字节数，0 表示只保存包头
+        - live: 是否实时累积特征
+        - device_filter: set_device() 之后在源头丢弃其他设备的包（不写盘、不累积）
+        """
+        self.bus = bus
+        self.snaplen = snaplen
+        self.ready = threading.Event()
+        self.activity = Readiness.ActivityMonitor()
+        self.accumulator = FeatureExtractor.FeatureAccumulator(verbose=False) if live else None
+        self.gate = FeatureExtractor.DeviceGate(
+            self.accumulator.feed if live else (lambda *packet: None), enabled=device_filter)
+        self.error = None
+        self.packet_count = 0
+        self.dropped = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._done = threading.Event()
+        self._thread = None
+
+    @property
+    def device_path(self):
+        return f"/dev/usbmon{self.bus}"
+
+    def start(self, save_path):
+        """ 在后台线程开始抓包 """
+        self._thread = threading.Thread(target=self._run, args=(save_path,), name="UsbmonCapture", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self, save_path):
+        try:
+            if fcntl is None:
+                raise OSError("usbmon 仅支持 Linux")
+            fd = os.open(self.device_path, os.O_RDONLY)
+        except OSError as e:
+            self.error = f"无法打开 {self.device_path}: {e} (需要 root 权限并执行 modprobe usbmon)"
+            self._done.set()
+            return
+
+        try:
+            try:
+                fcntl.ioctl(fd, MON_IOCT_RING_SIZE, RING_SIZE)
+            except OSError:
+                pass  # 使用内核默认缓冲区
+            self._capture_loop(fd, save_path)
+            stats = bytearray(8)
+            fcntl.ioctl(fd, MON_IOCG_STATS, stats)
+            self.dropped = int.from_bytes(stats[4:8], 'little')
+        except OSError as e:
+            self.error = f"usbmon 读取失败: {e}"
+        finally:
+            os.close(fd)
+            self._done.set()
+
+    def _capture_loop(self, fd, save_path):
+        header_size = PcapFile.USBMON_HEADER.size
+        hdr_buf = ctypes.create_string_buffer(header_size)
+        data_buf = ctypes.create_string_buffer(max(self.snaplen, 1))
+        arg = _MonGetArg(ctypes.addressof(hdr_buf), ctypes.addressof(data_buf), self.snaplen)
+        poller = select.poll()
+        poller.register(fd, select.POLLIN)
+
+        with PcapFile.PcapngWriter(save_path, PcapFile.LINKTYPE_USB_LINUX, header_size + self.snaplen) as writer:
+            self.ready.set()
+            while not self._stop.is_set():
+                if not poller.poll(100):
+                    continue
+                fcntl.ioctl(fd, MON_IOCX_GET, arg)
+                header = bytearray(hdr_buf.raw)
+                fields = PcapFile.USBMON_HEADER.unpack_from(header)
+                if not self.gate.accepts(fields[5], fields[4]):
+                    continue  # 源头过滤：其他设备的包
+                ts_sec, ts_usec, length, len_cap = fields[8], fields[9], fields[11], fields[12]
+                captured = min(len_cap, self.snaplen)
+                # 与 libpcap 一致：len_cap 改写为实际保存的字节数
+                header[40:44] = captured.to_bytes(4, 'little')
+                writer.write((ts_sec, ts_usec), bytes(header) + data_buf.raw[:captured], header_size + length)
+                self._on_packet(ts_sec + ts_usec * 1e-6, header)
+
+    def _on_packet(self, timestamp, header):
+        self.activity.touch()
+        with self._lock:
+            self.packet_count += 1
+            if self.accumulator is None:
+                return
+            self.accumulator.packet_index += 1
+            usb = PcapFile.decode_usb(PcapFile.LINKTYPE_USB_LINUX, header)
+            self.gate.feed(timestamp, usb["t_type"], usb["endpoint"], usb["bus"], usb["device"])
+
+    def set_device(self, device=None, window=None, required=True):
+        """ 设定被测设备 (bus, address)，用法同 LiveExtractor.set_device """
+        with self._lock:
+            if not self.gate.enabled:
+                return None
+            if self.gate.device is not None:
+                return self.gate.device
+            device = device or self.gate.infer_device(window)
+            if device is None:
+                if required:
+                    self.gate.release()
+            else:
+                self.gate.set_device(*device)
+            return device
+
+    # --- 与 StderrWatcher 相同的就绪接口 ---
+
+    def wait_ready(self, proc=None, timeout=15.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and not self._done.is_set():
+            if self.ready.wait(timeout=0.05):
+                return True
+        return self.ready.is_set()
+
+    def tail(self):
+        return self.error or ""
+
+    # --- 与 subprocess.Popen 相同的停止接口 ---
+
+    def poll(self):
+        if not self._done.is_set():
+            return None
+        return 1 if self.error else 0
+
+    def terminate(self):
+        self._stop.set()
+
+    kill = terminate
+
+    def wait(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise subprocess.TimeoutExpired(self.device_path, timeout)
+        return self.poll()
+
+    # --- 与 LiveExtractor 相同的结果接口 ---
+
+    def live_stats(self):
+        with self._lock:
+            return self.accumulator.live_stats() if self.accumulator else {"enumeration": None, "transfers": {}}
+
+    def finish(self, timeout=30):
+        """ 停止抓包并返回实时累积的特征 (enum_val, transfer_data) """
+        self.terminate()
+        self._done.wait(timeout)
+        if self.dropped:
+            print(f"    [!] usbmon 缓冲区溢出，丢失 {self.dropped} 个事件")
+        if self.gate.enabled and self.gate.device is None:
+            self.set_device()
+        with self._lock:
+            if self.accumulator is None:
+                return None, None
+            self.accumulator.log_summary()
+            return self.accumulator.result()
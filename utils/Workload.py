@@ -0,0 +1,359 @@
+"""
+采集阶段的 I/O 负载引擎
+传输特征来自 I/O 测试期间的 Bulk 包间隔，负载决定了单位时间内能得到多少样本：
+- 模式:     write (只写) / readback (写入后读回)
+- 访问顺序: sequential / random
+- 块大小、队列深度 (并发 worker 数)、直接 I/O (Linux O_DIRECT / macOS F_NOCACHE)
+- 每个 worker 使用预分配、可复用的缓冲区，不在循环中生成随机数据
+run_workload() 返回吞吐统计；yield_report() 结合抓包累加器给出每秒产生的传输样本数，
+用于挑选在最短时间内得到稳定指纹的负载。
+"""
+
+import mmap
+import os
+import random
+import sys
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+MB = 1024 * 1024
+DIRECT_ALIGN = 4096  # 直接 I/O 要求块大小与偏移按逻辑块对齐
+TEMP_FILE_NAME = "traffic_test_temp.dat"
+
+
+class WorkloadSpec:
+    """
+    一种 I/O 负载
+
+    参数:
+    - mode: "write" 只写 / "readback" 写入后读回
+    - pattern: "sequential" 顺序 / "random" 随机块顺序
+    - block_size: 每次 I/O 的字节数
+    - total_mb: 文件大小 (MB)
+    - queue_depth: 并发 worker 数（每个 worker 同时只有一个 I/O 在途）
+    - direct: 是否尝试绕过页缓存（不支持时自动退回普通 I/O）
+    - sync: "block" 每块 fsync / "end" 写完后 fsync 一次
+    - seed: random 模式的随机种子，固定后每次访问顺序相同
+    - preallocate: 先分配完整大小的文件再写入；False 时每轮从空文件开始追加写入
+      （与旧版循环相同，只支持顺序、队列深度 1）
+    """
+
+    def __init__(self, mode="write", pattern="sequential", block_size=MB, total_mb=50,
+                 queue_depth=1, direct=False, sync="block", seed=0, preallocate=True):
+        if mode not in ("write", "readback"):
+            raise ValueError(f"未知的负载模式: {mode}")
+        if pattern not in ("sequential", "random"):
+            raise ValueError(f"未知的访问顺序: {pattern}")
+        if sync not in ("block", "end"):
+            raise ValueError(f"未知的同步策略: {sync}")
+        if not preallocate and (pattern != "sequential" or int(queue_depth) > 1):
+            raise ValueError("追加写入只支持顺序访问、队列深度 1")
+        self.mode = mode
+        self.pattern = pattern
+        self.block_size = int(block_size)
+        self.total_mb = total_mb
+        self.queue_depth = max(1, int(queue_depth))
+        self.direct = direct
+        self.sync = sync
+        self.seed = seed
+        self.preallocate = preallocate
+
+    @classmethod
+    def from_dict(cls, cfg):
+        return cls(**cfg)
+
+    def to_dict(self):
+        return {"mode": self.mode, "pattern": self.pattern, "block_size": self.block_size,
+                "total_mb": self.total_mb, "queue_depth": self.queue_depth, "direct": self.direct,
+                "sync": self.sync, "seed": self.seed, "preallocate": self.preallocate}
+
+    def describe(self):
+        size = f"{self.block_size // 1024}KB" if self.block_size < MB else f"{self.block_size // MB}MB"
+        flags = [self.mode, self.pattern, f"块 {size}", f"QD{self.queue_depth}"]
+        if self.direct:
+            flags.append("direct")
+        if not self.preallocate:
+            flags.append("append")
+        return f"{self.total_mb}MB, " + ", ".join(flags)
+
+    def block_count(self):
+        return max(1, self.total_mb * MB // self.block_size)
+
+
+# 预置负载：legacy 与旧版 AutoCatch 的固定循环一致（1MB 顺序追加写，每块 fsync，不预分配）
+PRESETS = {
+    "legacy": dict(mode="write", pattern="sequential", block_size=MB, queue_depth=1, sync="block",
+                   preallocate=False),
+    "seq_readback": dict(mode="readback", pattern="sequential", block_size=256 * 1024, queue_depth=1,
+                         direct=True, sync="end"),
+    "random_qd4": dict(mode="readback", pattern="random", block_size=64 * 1024, queue_depth=4,
+                       direct=True, sync="end"),
+}
+
+
+def resolve(workload=None, total_mb=50):
+    """
+    解析负载配置
+
+    参数:
+    - workload: None (legacy) / 预置名称 / dict / WorkloadSpec
+    - total_mb: 配置中未指定文件大小时使用
+    """
+    if isinstance(workload, WorkloadSpec):
+        return workload
+    if workload is None:
+        workload = "legacy"
+    if isinstance(workload, str):
+        if workload not in PRESETS:
+            raise ValueError(f"未知的预置负载: {workload} (可选: {', '.join(PRESETS)})")
+        workload = PRESETS[workload]
+    cfg = dict(workload)
+    cfg.setdefault("total_mb", total_mb)
+    return WorkloadSpec.from_dict(cfg)
+
+
+# ==================== 执行 ====================
+
+def _open_flags(write, append=False):
+    flags = os.O_RDWR | os.O_CREAT if write else os.O_RDONLY
+    if write and append:
+        flags |= os.O_APPEND
+    return flags | getattr(os, 'O_BINARY', 0)
+
+
+def _open(path, write, direct, append=False):
+    """ 打开文件；返回 (fd, 是否实际使用直接 I/O) """
+    flags = _open_flags(write, append)
+    if direct and hasattr(os, 'O_DIRECT'):
+        try:
+            return os.open(path, flags | os.O_DIRECT), True
+        except OSError:
+            pass  # 文件系统不支持 (如 tmpfs)，退回普通 I/O
+    fd = os.open(path, flags)
+    if direct and fcntl is not None and hasattr(fcntl, 'F_NOCACHE'):
+        try:
+            fcntl.fcntl(fd, fcntl.F_NOCACHE, 1)
+            return fd, True
+        except OSError:
+            pass
+    return fd, False
+
+
+def _alloc_buffer(size, fill):
+    """ 页对齐的缓冲区（mmap 匿名映射），直接 I/O 可直接使用 """
+    buf = mmap.mmap(-1, size)
+    if fill:
+        buf.write(os.urandom(size))  # 随机数据，避免主控压缩/去重
+        buf.seek(0)
+    return buf
+
+
+def _drop_cache(fd):
+    """ 读回前丢弃页缓存，确保读请求真正到达设备 """
+    if hasattr(os, 'posix_fadvise'):
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        except OSError:
+            pass
+
+
+def _run_phase(path, spec, offsets, buffers, write, stop_event):
+    """ 以 queue_depth 个 worker 执行一轮读或写，返回 (字节数, 实际是否直接 I/O, 错误列表) """
+    lock = threading.Lock()
+    cursor = [0]
+    done = [0]
+    errors = []
+    direct_used = [spec.direct]
+
+    def next_offset():
+        with lock:
+            if cursor[0] >= len(offsets):
+                return None
+            offset = offsets[cursor[0]]
+            cursor[0] += 1
+            return offset
+
+    def worker(buf):
+        fd = None
+        try:
+            fd, direct = _open(path, write, spec.direct, append=write and not spec.preallocate)
+            if not direct:
+                direct_used[0] = False
+            if not write and not direct:
+                _drop_cache(fd)
+            with memoryview(buf) as view:
+                while stop_event is None or not stop_event.is_set():
+                    offset = next_offset()
+                    if offset is None:
+                        break
+                    os.lseek(fd, offset, os.SEEK_SET)
+                    if write:
+                        n = os.write(fd, view)
+                        if spec.sync == "block":
+                            os.fsync(fd)
+                    else:
+                        n = os.readv(fd, [view]) if hasattr(os, 'readv') else _read_into(fd, view)
+                    with lock:
+                        done[0] += n
+            if write and spec.sync == "end":
+                os.fsync(fd)
+        except OSError as e:
+            errors.append(e)
+        finally:
+            if fd is not None:
+                os.close(fd)
+
+    threads = [threading.Thread(target=worker, args=(buf,), daemon=True) for buf in buffers]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return done[0], direct_used[0], errors
+
+
+def _read_into(fd, view):
+    data = os.read(fd, len(view))
+    view[:len(data)] = data
+    return len(data)
+
+
+def run_workload(target_dir, spec, stop_event=None, file_name=TEMP_FILE_NAME, keep_file=False, repeat=False):
+    """
+    在目标目录（U 盘挂载点/盘符）执行负载
+
+    参数:
+    - stop_event: 可选 threading.Event，置位后各 worker 在当前块完成后停止
+    - keep_file: 结束后保留测试文件（由调用方删除，以便删除动作也被抓到）
+    - repeat: 在同一文件上重复执行，直到 stop_event 置位（自适应采集，见 Convergence）
+
+    返回:
+    - dict: {"spec", "path", "start", "end", "bytes_written", "bytes_read",
+             "write_seconds", "read_seconds", "direct", "stopped", "passes", "errors"}
+    """
+    if repeat and stop_event is None:
+        raise ValueError("repeat 模式需要 stop_event")
+    spec = resolve(spec)
+    block_size = spec.block_size
+    if spec.direct and block_size % DIRECT_ALIGN:
+        block_size = max(DIRECT_ALIGN, block_size // DIRECT_ALIGN * DIRECT_ALIGN)
+        spec = WorkloadSpec.from_dict(dict(spec.to_dict(), block_size=block_size))
+
+    path = os.path.join(target_dir, file_name)
+    offsets = [i * block_size for i in range(spec.block_count())]
+    if spec.pattern == "random":
+        random.Random(spec.seed).shuffle(offsets)
+
+    if spec.preallocate:
+        # 预分配文件：worker 循环中只有 I/O
+        fd = os.open(path, _open_flags(True))
+        try:
+            size = len(offsets) * block_size
+            if hasattr(os, 'posix_fallocate'):
+                try:
+                    os.posix_fallocate(fd, 0, size)
+                except OSError:
+                    os.ftruncate(fd, size)
+            else:
+                os.ftruncate(fd, size)
+        finally:
+            os.close(fd)
+    buffers = [_alloc_buffer(block_size, fill=True) for _ in range(spec.queue_depth)]
+
+    stats = {"spec": spec.to_dict(), "path": path, "start": time.time(), "bytes_written": 0,
+             "bytes_read": 0, "write_seconds": 0.0, "read_seconds": 0.0, "direct": spec.direct,
+             "stopped": False, "passes": 0, "errors": []}
+
+    def stopped():
+        return stop_event is not None and stop_event.is_set()
+
+    try:
+        while True:
+            if not spec.preallocate:
+                # 追加写入：每轮从空文件开始，文件随写入增长
+                os.close(os.open(path, _open_flags(True) | os.O_TRUNC))
+            t0 = time.perf_counter()
+            written, direct, errors = _run_phase(path, spec, offsets, buffers, True, stop_event)
+            stats["write_seconds"] += time.perf_counter() - t0
+            stats["bytes_written"] += written
+            stats["direct"] = stats["direct"] and direct
+            stats["errors"] += [str(e) for e in errors]
+
+            if spec.mode == "readback" and not stopped() and not errors:
+                t0 = time.perf_counter()
+                read, direct, errors = _run_phase(path, spec, offsets, buffers, False, stop_event)
+                stats["read_seconds"] += time.perf_counter() - t0
+                stats["bytes_read"] += read
+                stats["direct"] = stats["direct"] and direct
+                stats["errors"] += [str(e) for e in errors]
+            stats["passes"] += 1
+            if not repeat or stopped() or stats["errors"]:
+                break
+    finally:
+        for buf in buffers:
+            buf.close()
+        stats["end"] = time.time()
+        stats["stopped"] = stop_event is not None and stop_event.is_set()
+        if not keep_file and os.path.exists(path):
+            os.remove(path)
+    return stats
+
+
+def throughput(stats):
+    """ 读/写吞吐 (MB/s) """
+    write = stats["bytes_written"] / MB / stats["write_seconds"] if stats["write_seconds"] else 0.0
+    read = stats["bytes_read"] / MB / stats["read_seconds"] if stats["read_seconds"] else 0.0
+    return write, read
+
+
+# ==================== 样本产出 ====================
+
+def yield_report(accumulator, start, end):
+    """
+    负载期间每秒产生的传输样本数
+
+    参数:
+    - accumulator: FeatureExtractor.FeatureAccumulator (实时累积或解析后)
+    - start / end: 负载的起止时间 (time.time()，与抓包时间戳同一时钟)
+
+    返回:
+    - dict: {"samples", "seconds", "rate", "per_second": [每秒样本数...]}
+    """
+    first, last = int(start), int(end)
+    per_second = [accumulator.samples_per_second.get(sec, 0) for sec in range(first, last + 1)]
+    seconds = max(end - start, 1e-9)
+    samples = sum(per_second)
+    return {"samples": samples, "seconds": seconds, "rate": samples / seconds, "per_second": per_second}
+
+
+def compare_workloads(target_dir, specs, stop_event=None):
+    """
+    在同一目录依次运行多种负载并打印吞吐对比（本地临时目录即可测试）
+
+    参数:
+    - specs: {名称: 负载配置}，值可为预置名称 / dict / WorkloadSpec
+
+    返回:
+    - dict: {名称: run_workload 的统计}
+    """
+    results = {}
+    print(f"{'负载':<16}{'配置':<48}{'写 MB/s':>10}{'读 MB/s':>10}  direct")
+    for name, workload in specs.items():
+        spec = resolve(workload)
+        stats = run_workload(target_dir, spec, stop_event=stop_event)
+        write, read = throughput(stats)
+        print(f"{name:<16}{spec.describe():<48}{write:>10.1f}{read:>10.1f}  {stats['direct']}")
+        for err in stats["errors"]:
+            print(f"    [!] {err}")
+        results[name] = stats
+    return results
+
+
+if __name__ == "__main__":
+    import tempfile
+    folder = sys.argv[1] if len(sys.argv) > 1 else tempfile.mkdtemp()
+    compare_workloads(folder, {name: dict(cfg, total_mb=16) for name, cfg in PRESETS.items()})
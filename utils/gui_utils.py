@@ -1,58 +1,387 @@
 """
 GUI辅助工具模块
-提供日志重定向、线程管理、路径验证等功能
+提供日志重定向（批量日志输出）、线程管理、任务队列、路径验证等功能
 """
 
 import sys
 import os
+import queue
 import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import tkinter as tk
 from tkinter import scrolledtext
 
 
 class TextRedirector:
-    """将stdout/stderr重定向到Text组件"""
+    """将stdout/stderr重定向到日志（写入 LogSink 队列，由 Tk 线程批量刷新）"""
     
-    def __init__(self, text_widget, tag="stdout"):
-        self.text_widget = text_widget
+    def __init__(self, sink, tag="stdout"):
+        self.sink = sink
         self.tag = tag
         
     def write(self, message):
-        if message.strip():  # 忽略空行
-            self.text_widget.configure(state='normal')
-            self.text_widget.insert(tk.END, message, self.tag)
-            self.text_widget.see(tk.END)  # 自动滚动到底部
-            self.text_widget.configure(state='disabled')
-            self.text_widget.update_idletasks()
+        self.sink.write(message, self.tag)
     
     def flush(self):
         pass
 
 
-def run_in_thread(func, on_complete=None, on_error=None):
+# 日志级别：按行首标记推断，用于过滤与着色
+LOG_LEVELS = {'debug': 10, 'info': 20, 'success': 20, 'warning': 30, 'error': 40}
+LEVEL_TAGS = {'debug': 'debug', 'info': 'stdout', 'success': 'success', 'warning': 'warning', 'error': 'error'}
+
+
+def classify_line(line, tag="stdout"):
+    """根据行内标记推断日志级别"""
+    if tag == "stderr" or "[错误]" in line or "[✗]" in line:
+        return 'error'
+    if "[调试]" in line:
+        return 'debug'
+    if "[警告]" in line or "[!]" in line:
+        return 'warning'
+    if "[√]" in line or "[✓]" in line or "[成功]" in line:
+        return 'success'
+    return 'info'
+
+
+class LogSink:
     """
-    在后台线程执行函数，避免GUI冻结
+    线程安全的批量日志输出
     
-    Args:
-        func: 要执行的函数
-        on_complete: 完成后的回调函数（在主线程执行）
-        on_error: 出错时的回调函数（在主线程执行）
+    - 任意线程调用 write()/log() 只把完整的行放入队列，不接触控件
+    - Tk 线程通过 root.after() 定时取出，按级别过滤后合并为少量 insert 调用一次性写入
+    - 控件最多保留 max_lines 行（环形缓冲，超出时删除最早的行）；
+      一次积压超过 max_lines 行时直接丢弃最早的行，只记录省略行数
+    
+    用法:
+        sink = LogSink(log_text, max_lines=5000)
+        sys.stdout = TextRedirector(sink, "stdout")
     """
-    def wrapper():
+    
+    def __init__(self, text_widget, max_lines=5000, level='debug', interval=100):
+        self.text_widget = text_widget
+        self.max_lines = max_lines
+        self.level = level
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._records = []        # (级别, 标签, 行文本)
+        self._partial = {}        # 线程 id -> 未以换行结束的片段
+        self._dropped = 0
+        self._closed = False
+        self.text_widget.tag_config('debug', foreground='#808080')
+        self.text_widget.after(self.interval, self._drain)
+    
+    def write(self, text, tag="stdout"):
+        """写入文本（任意线程），按换行切分为记录"""
+        if not text:
+            return
+        key = threading.get_ident()
+        with self._lock:
+            text = self._partial.pop(key, "") + text
+            lines = text.split("\n")
+            if lines[-1]:
+                self._partial[key] = lines[-1]
+            for line in lines[:-1]:
+                if line.strip():  # 忽略空行
+                    self._append(classify_line(line, tag), tag, line)
+    
+    def log(self, message, level='info'):
+        """带时间戳写入一条消息（任意线程）"""
+        timestamp = datetime.now().strftime("%H:%M:%S")
+        with self._lock:
+            self._append(level, LEVEL_TAGS.get(level, 'stdout'), f"[{timestamp}] {message}")
+    
+    def _append(self, level, tag, line):
+        self._records.append((level, tag, line))
+        # 积压远超可显示的行数时丢弃最早的记录，避免 Tk 线程一次处理过多
+        excess = len(self._records) - 2 * self.max_lines
+        if excess > 0:
+            del self._records[:excess]
+            self._dropped += excess
+    
+    def set_level(self, level):
+        """设置最低显示级别 (debug/info/warning/error)，只影响之后的记录"""
+        self.level = level
+    
+    def clear(self):
+        """清空控件与队列（Tk 线程）"""
+        with self._lock:
+            self._records = []
+            self._dropped = 0
+        clear_log_widget(self.text_widget)
+    
+    def close(self):
+        self._closed = True
+    
+    def _drain(self):
+        with self._lock:
+            records, self._records = self._records, []
+            dropped, self._dropped = self._dropped, 0
+        if records or dropped:
+            try:
+                self._flush(records, dropped)
+            except tk.TclError:
+                return  # 窗口已销毁
+        if not self._closed:
+            self.text_widget.after(self.interval, self._drain)
+    
+    def _flush(self, records, dropped):
+        minimum = LOG_LEVELS.get(self.level, 0)
+        records = [r for r in records if LOG_LEVELS.get(r[0], 20) >= minimum]
+        if len(records) > self.max_lines:
+            dropped += len(records) - self.max_lines
+            records = records[-self.max_lines:]
+        
+        # 相邻同标签的行合并为一次 insert
+        chunks = []
+        if dropped:
+            chunks.append(('warning', f"[...省略 {dropped} 行日志...]\n"))
+        for _, tag, line in records:
+            if chunks and chunks[-1][0] == tag:
+                chunks[-1] = (tag, chunks[-1][1] + line + "\n")
+            else:
+                chunks.append((tag, line + "\n"))
+        if not chunks:
+            return
+        
+        widget = self.text_widget
+        args = []
+        for tag, text in chunks:
+            args.extend((text, tag))
+        widget.configure(state='normal')
+        widget.insert(tk.END, *args)
+        # 环形缓冲：只保留最后 max_lines 行
+        lines = int(widget.index('end-1c').split('.')[0])
+        if lines > self.max_lines + 1:
+            widget.delete('1.0', f'{lines - self.max_lines}.0')
+        widget.see(tk.END)  # 自动滚动到底部
+        widget.configure(state='disabled')
+
+
+class JobCancelled(Exception):
+    """ 任务被取消（任务函数可在检查点抛出以提前结束） """
+
+
+class Job:
+    """
+    任务队列中的一个任务
+
+    任务函数在工作线程中以 func(job) 调用，可通过:
+    - job.report(progress, message) 报告进度 (progress 为 0~1 或 None)
+    - job.cancelled / job.check_cancelled() 在检查点响应取消
+    """
+
+    QUEUED, RUNNING, DONE, FAILED, CANCELLED = "排队中", "运行中", "完成", "失败", "已取消"
+
+    def __init__(self, manager, job_id, name, func, exclusive, callbacks):
+        self.manager = manager
+        self.id = job_id
+        self.name = name
+        self.func = func
+        self.exclusive = exclusive
+        self.callbacks = callbacks
+        self.state = Job.QUEUED
+        self.progress = None
+        self.message = ""
+        self.result = None
+        self.error = None
+        self.cancel_event = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    @property
+    def finished(self):
+        return self.state in (Job.DONE, Job.FAILED, Job.CANCELLED)
+
+    def check_cancelled(self):
+        if self.cancelled:
+            raise JobCancelled()
+
+    def report(self, progress=None, message=None):
+        """ 报告进度（任意线程调用，回调在 Tk 线程执行） """
+        self.manager._post(self._apply_progress, progress, message)
+
+    def _apply_progress(self, progress, message):
+        if progress is not None:
+            self.progress = progress
+        if message is not None:
+            self.message = message
+        on_progress = self.callbacks.get("on_progress")
+        if on_progress:
+            on_progress(self)
+        self.manager._changed(self)
+
+
+class JobManager:
+    """
+    GUI 任务队列：有界工作线程池 + 排队
+
+    - 所有回调（完成/出错/取消/进度/列表变化）只在 Tk 线程中执行：工作线程把回调放入队列，
+      Tk 线程通过 root.after() 定时取出执行，工作线程不直接操作任何控件
+    - exclusive 相同的任务互斥执行（如占用同一抓包接口的采集任务），其余任务可并发
+    - 排队中的任务取消后直接移出队列；运行中的任务置位取消标志，由任务在检查点响应
+
+    用法:
+        jobs = JobManager(root, max_workers=2, on_change=refresh)
+        jobs.submit("注册 SanDisk", lambda job: Register.run_registration(...), on_complete=show)
+    """
+
+    def __init__(self, root, max_workers=2, on_change=None, poll_interval=50):
+        self.root = root
+        self.max_workers = max_workers
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="GuiJob")
+        self._events = queue.Queue()
+        self._lock = threading.Lock()
+        self._jobs = []           # 全部任务（按提交顺序）
+        self._pending = []        # 排队中的任务
+        self._running = 0
+        self._busy = set()        # 正在运行的 exclusive 键
+        self._next_id = 1
+        self._closed = False
+        self.root.after(self.poll_interval, self._drain)
+
+    # ---------- Tk 线程 ----------
+
+    def submit(self, name, func, on_complete=None, on_error=None, on_cancel=None, on_progress=None, exclusive=None):
+        """
+        提交任务（在 Tk 线程调用）
+
+        参数:
+        - func: func(job) -> 结果，在工作线程执行
+        - on_complete(result) / on_error(exception) / on_cancel(job) / on_progress(job): Tk 线程回调
+        - exclusive: 互斥键，相同键的任务不会同时运行
+
+        返回:
+        - Job
+        """
+        callbacks = {"on_complete": on_complete, "on_error": on_error, "on_cancel": on_cancel,
+                     "on_progress": on_progress}
+        with self._lock:
+            job = Job(self, self._next_id, name, func, exclusive, callbacks)
+            self._next_id += 1
+            self._jobs.append(job)
+            self._pending.append(job)
+        self._changed(job)
+        self._dispatch()
+        return job
+
+    def cancel(self, job):
+        """ 取消任务：排队中的立即取消，运行中的置位取消标志 """
+        job.cancel_event.set()
+        with self._lock:
+            queued = job in self._pending
+            if queued:
+                self._pending.remove(job)
+        if queued:
+            self._finish(job, Job.CANCELLED)
+        else:
+            self._changed(job)
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs)
+
+    def get(self, job_id):
+        with self._lock:
+            return next((job for job in self._jobs if job.id == job_id), None)
+
+    def active(self):
+        """ 排队中与运行中的任务数 """
+        with self._lock:
+            return len(self._pending) + self._running
+
+    def clear_finished(self):
+        with self._lock:
+            self._jobs = [job for job in self._jobs if not job.finished]
+        self._changed(None)
+
+    def shutdown(self, cancel=True):
+        """ 关闭窗口时调用：取消全部任务，不等待运行中的任务结束 """
+        self._closed = True
+        if cancel:
+            for job in self.jobs():
+                job.cancel_event.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _drain(self):
+        # 执行工作线程投递的回调
+        while True:
+            try:
+                func, args = self._events.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                func(*args)
+            except Exception as e:
+                print(f"[错误] 任务回调失败: {e}")
+        if not self._closed:
+            self.root.after(self.poll_interval, self._drain)
+
+    def _changed(self, job):
+        if self.on_change:
+            self.on_change(job)
+
+    def _finish(self, job, state, result=None, error=None):
+        job.state = state
+        job.result = result
+        job.error = error
+        if state == Job.DONE:
+            job.progress = 1.0
+            callback, arg = job.callbacks.get("on_complete"), result
+        elif state == Job.FAILED:
+            callback, arg = job.callbacks.get("on_error"), error
+            if callback is None:
+                print(f"[错误] 任务 '{job.name}' 失败: {error}")
+        else:
+            callback, arg = job.callbacks.get("on_cancel"), job
+        self._changed(job)
+        if callback:
+            callback(arg)
+
+    # ---------- 任意线程 ----------
+
+    def call_in_tk(self, func, *args):
+        """ 从工作线程请求在 Tk 线程执行 func(*args) """
+        self._post(func, *args)
+
+    def _post(self, func, *args):
+        self._events.put((func, args))
+
+    def _dispatch(self):
+        """ 在并发上限与互斥约束内启动排队中的任务 """
+        with self._lock:
+            while self._running < self.max_workers and not self._closed:
+                job = next((j for j in self._pending if j.exclusive is None or j.exclusive not in self._busy), None)
+                if job is None:
+                    break
+                self._pending.remove(job)
+                self._running += 1
+                if job.exclusive is not None:
+                    self._busy.add(job.exclusive)
+                job.state = Job.RUNNING
+                self._post(self._changed, job)
+                self._executor.submit(self._run, job)
+
+    def _run(self, job):
         try:
-            result = func()
-            if on_complete:
-                on_complete(result)
+            job.check_cancelled()
+            result = job.func(job)
+            state, error = (Job.CANCELLED, None) if job.cancelled else (Job.DONE, None)
+        except JobCancelled:
+            state, result, error = Job.CANCELLED, None, None
         except Exception as e:
-            if on_error:
-                on_error(e)
-            else:
-                print(f"[错误] 线程执行失败: {e}")
-    
-    thread = threading.Thread(target=wrapper, daemon=True)
-    thread.start()
-    return thread
+            state, result, error = Job.FAILED, None, e
+        with self._lock:
+            self._running -= 1
+            if job.exclusive is not None:
+                self._busy.discard(job.exclusive)
+        self._post(self._finish, job, state, result, error)
+        self._dispatch()
 
 
 def validate_path(path, must_exist=True, is_dir=False):
@@ -143,28 +472,13 @@ def clear_log_widget(log_widget):
     log_widget.configure(state='disabled')
 
 
-def log_message(log_widget, message, level='info'):
+def log_message(log_sink, message, level='info'):
     """
-    向日志组件添加消息
+    向日志添加消息（任意线程可调用）
     
     Args:
-        log_widget: 日志文本框
+        log_sink: LogSink（日志文本框需已挂接 LogSink）
         message: 消息内容
-        level: 日志级别 (info/success/warning/error)
+        level: 日志级别 (debug/info/success/warning/error)
     """
-    tag_map = {
-        'info': 'stdout',
-        'success': 'success',
-        'warning': 'warning',
-        'error': 'error'
-    }
-    
-    tag = tag_map.get(level, 'stdout')
-    timestamp = datetime.now().strftime("%H:%M:%S")
-    formatted_msg = f"[{timestamp}] {message}\n"
-    
-    log_widget.configure(state='normal')
-    log_widget.insert(tk.END, formatted_msg, tag)
-    log_widget.see(tk.END)
-    log_widget.configure(state='disabled')
-    log_widget.update_idletasks()
+    log_sink.log(message, level)